@@ -14,6 +14,71 @@ class Settings(BaseSettings):
     
     # OpenAI - Default None se non configurato
     openai_api_key: Optional[str] = None
+    openai_base_url: Optional[str] = None  # Solo per server compatibili (es. benchmark)
+    ai_run_poll_interval_seconds: float = 2.0
+    
+    # Cache risposte chat
+    chat_cache_ttl_seconds: int = 600
+    chat_cache_max_entries: int = 500
+    chat_cache_similarity_threshold: float = 0.85
+    chat_cache_catalog_check_seconds: int = 30
+    
+    # Limiti run OpenAI
+    ai_max_concurrent_runs: int = 8
+    ai_max_queue: int = 32
+    ai_queue_timeout_seconds: float = 10.0
+    ai_user_requests_per_hour: int = 60
+    ai_user_tokens_per_hour: int = 50000
+    ai_tool_output_max_items: int = 5
+
+    # Profiler query MongoDB per richiesta
+    db_profiler_enabled: bool = True
+    db_n_plus_one_threshold: int = 5
+    db_profiler_strict: bool = False  # In test: solleva eccezione sui pattern N+1
+    slow_query_threshold_ms: int = 100
+    slow_query_sample_rate: float = 1.0
+    slow_query_max_writes_per_minute: int = 30
+    slow_query_collection_size_bytes: int = 10 * 1024 * 1024
+
+    # Catalogo spazi in memoria
+    space_catalog_enabled: bool = True
+    space_catalog_poll_seconds: float = 1.0  # Solo se i change stream non sono disponibili
+
+    # Coalescing richieste identiche sugli endpoint di lettura
+    coalesce_enabled: bool = True
+    coalesce_ttl_seconds: float = 2.0  # 0 = solo condivisione del calcolo in corso
+    coalesce_max_entries: int = 256
+
+    # Compressione risposte (br se il modulo brotli è installato, altrimenti gzip)
+    response_compression_min_bytes: int = 1024
+    response_compression_gzip_level: int = 6
+    response_compression_brotli_quality: int = 4
+
+    # Export in streaming (righe per batch letto da MongoDB)
+    export_batch_size: int = 500
+
+    # Calendario live (SSE da change stream)
+    live_calendar_enabled: bool = True
+    live_queue_size: int = 100  # Eventi in attesa per connessione prima del resync
+    live_heartbeat_seconds: float = 15.0
+    live_replay_size: int = 1000  # Eventi recenti riproducibili con Last-Event-ID
+
+    # Sincronizzazione delta del calendario (/calendar/changes)
+    calendar_changes_settle_seconds: float = 2.0  # Scritture più recenti escluse fino al prossimo pull
+    calendar_changes_page_size: int = 500
+
+    # Prenotazioni ricorrenti
+    series_max_occurrences: int = 200  # Un semestre settimanale sta ampiamente nel limite
+    campus_timezone: str = "Europe/Rome"  # Ora locale in cui si espandono le serie senza fuso proprio
+
+    # Import orari semestrali (CSV o ICS)
+    timetable_import_batch_size: int = 500  # Documenti per insert_many
+    timetable_import_max_errors: int = 500  # Errori riportati per riga (gli altri solo contati)
+
+    # Feed ICS per spazio e per utente (/calendar/{space_id}.ics)
+    ics_feed_past_days: int = 30
+    ics_feed_future_days: int = 180
+    ics_feed_cache_size: int = 500  # Feed tenuti in memoria (LRU)
     
     # Email - Optional
     smtp_server: str = "smtp.gmail.com"
@@ -25,6 +90,12 @@ class Settings(BaseSettings):
     caldav_url: Optional[str] = None
     caldav_username: Optional[str] = None
     caldav_password: Optional[str] = None
+    caldav_sync_interval_seconds: float = 60.0
+    caldav_sync_batch_size: int = 100  # Modifiche per lotto (una lettura e un bulk_write)
+    caldav_sync_concurrency: int = 4  # Richieste CalDAV contemporanee
+    caldav_sync_max_retries: int = 3
+    caldav_sync_retry_base_seconds: float = 0.5  # Backoff esponenziale sugli errori 5xx/429/rete
+    caldav_sync_timeout_seconds: float = 15.0
     
     # Sicurezza
     environment: str = "development"
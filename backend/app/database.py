@@ -7,11 +7,15 @@ class Database:
 
 db = Database()
 
-async def get_database():
-    """Restituisce l'istanza del database"""
+async def get_database(profiled: bool = True):
+    """Restituisce l'istanza del database (non profilata per letture lunghe in streaming)"""
     if db.client is None:
         raise RuntimeError("Database non connesso. Chiama connect_to_mongo() prima.")
-    return db.client[settings.database_name]
+    if not profiled:
+        return db.client[settings.database_name]
+    # Import locale: il package services importa a sua volta database
+    from .services.query_profiler import query_profiler
+    return query_profiler.wrap(db.client[settings.database_name])
 
 async def connect_to_mongo():
     """Connette al database MongoDB"""
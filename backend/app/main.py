@@ -1,23 +1,43 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from .database import connect_to_mongo, close_mongo_connection
-from .routes import auth, spaces, bookings, chat, materials, calendar
+from .routes import auth, spaces, bookings, chat, materials, calendar, admin, exports
+from .services.index_manager import index_manager
+from .services.slow_query_log import slow_query_log
+from .repositories.space_catalog import space_catalog
+from .services.calendar_live import calendar_live
+from .services.caldav_sync import caldav_sync
+from .services.space_snapshots import space_snapshots
 from .middleware.logging_middleware import LoggingMiddleware
 from .middleware.rate_limiting import RateLimitMiddleware
+from .middleware.query_profiler import QueryProfilerMiddleware
+from .middleware.batch_loader import BatchLoaderMiddleware
+from .middleware.compression import CompressionMiddleware
+from .responses import FastJSONResponse
 import os
 
 app = FastAPI(
     title="ClassRent API", 
     version="1.0.0",
-    description="Sistema di prenotazione aule universitarie con AI integrata"
+    description="Sistema di prenotazione aule universitarie con AI integrata",
+    default_response_class=FastJSONResponse
 )
 
+# Batch loader per richiesta (ID risolti con una sola query $in)
+app.add_middleware(BatchLoaderMiddleware)
+
+# Profiler query MongoDB (vede solo il lavoro delle route)
+app.add_middleware(QueryProfilerMiddleware)
+
 # Rate Limiting Middleware
 app.add_middleware(RateLimitMiddleware, calls=100, period=60)
 
 # Logging Middleware  
 app.add_middleware(LoggingMiddleware)
 
+# Compressione br/gzip sopra la soglia configurata
+app.add_middleware(CompressionMiddleware)
+
 # CORS - Configurazione più sicura
 allowed_origins = [
     "http://localhost:3000",
@@ -40,9 +60,30 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_db_client():
     await connect_to_mongo()
+    try:
+        await index_manager.ensure_indexes()
+    except Exception as e:
+        print(f"⚠️ Verifica indici non riuscita: {e}")
+    try:
+        await slow_query_log.ensure_collection()
+    except Exception as e:
+        print(f"⚠️ Collection query lente non disponibile: {e}")
+    try:
+        await space_catalog.start()
+    except Exception as e:
+        print(f"⚠️ Catalogo spazi non disponibile, letture da MongoDB: {e}")
+    await space_snapshots.start()
+    await calendar_live.start()
+    try:
+        await caldav_sync.start()
+    except Exception as e:
+        print(f"⚠️ Sincronizzazione CalDAV non avviata: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await caldav_sync.stop()
+    await calendar_live.stop()
+    await space_catalog.stop()
     await close_mongo_connection()
 
 # Routes
@@ -52,6 +93,8 @@ app.include_router(bookings.router, prefix="/bookings", tags=["bookings"])
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
 app.include_router(materials.router, prefix="/materials", tags=["materials"])
 app.include_router(calendar.router, prefix="/calendar", tags=["calendar"])  # NUOVO
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+app.include_router(exports.router, prefix="/exports", tags=["exports"])
 
 @app.get("/")
 async def root():
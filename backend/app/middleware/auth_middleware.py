@@ -1,7 +1,7 @@
 from fastapi import HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from ..services.auth_service import verify_token
-from ..database import get_database
+from ..repositories import users_repository
 from typing import Optional
 
 security = HTTPBearer()
@@ -21,8 +21,7 @@ async def get_current_user_optional(request: Request) -> Optional[dict]:
             return None
             
         email = verify_token(token)
-        db = await get_database()
-        user = await db.users.find_one({"email": email})
+        user = await users_repository.get_by_email(email)
         
         # Ritorna l'utente se esiste, senza controllo is_active
         return user
@@ -52,8 +51,7 @@ async def get_current_user_required(request: Request) -> dict:
             )
             
         email = verify_token(token)
-        db = await get_database()
-        user = await db.users.find_one({"email": email})
+        user = await users_repository.get_by_email(email)
         
         if user is None:
             raise HTTPException(
@@ -0,0 +1,10 @@
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from ..repositories.loaders import loader_scope
+
+class BatchLoaderMiddleware(BaseHTTPMiddleware):
+    """Apre lo scope dei batch loader: ID raggruppati e memorizzati per la durata della richiesta"""
+
+    async def dispatch(self, request: Request, call_next):
+        with loader_scope():
+            return await call_next(request)
@@ -0,0 +1,125 @@
+import gzip
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..config import settings
+
+try:
+    import brotli
+except ImportError:  # Opzionale: senza brotli si negozia solo gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript")
+# Server-Sent Events: heartbeat e delta devono arrivare subito, senza buffer del compressore
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Brotli se il client lo accetta e il modulo è installato, altrimenti gzip"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Comprime le risposte testuali sopra una soglia di dimensione, negoziando
+    br/gzip con Accept-Encoding. Le risposte in streaming vengono compresse
+    a blocchi senza bufferizzarle.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = settings.response_compression_min_bytes if minimum_size is None else minimum_size
+        self.gzip_level = settings.response_compression_gzip_level
+        self.brotli_quality = settings.response_compression_brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        mode: Optional[str] = None  # "passthrough" oppure "stream" dopo il primo blocco
+        compressor = None
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, mode, compressor
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or mode == "passthrough":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if mode is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                compressible = (
+                    "content-encoding" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    and not headers.get("content-type", "").startswith(UNCOMPRESSED_TYPES)
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if not compressible:
+                    mode = "passthrough"
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    # Risposta completa: compressione in un colpo solo
+                    compressed = self._compress(body, encoding)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                mode = "stream"
+                compressor = self._stream_compressor(encoding)
+                await send(start_message)
+
+            if encoding == "br":
+                chunk = compressor.process(body) + (compressor.flush() if more_body else compressor.finish())
+            else:
+                chunk = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    def _stream_compressor(self, encoding: str):
+        if encoding == "br":
+            return brotli.Compressor(quality=self.brotli_quality)
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
@@ -20,10 +20,18 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         # Calcola tempo di risposta
         process_time = time.time() - start_time
         
-        # Log della risposta
+        # Log della risposta (con i totali del profiler query, se presenti)
+        db_fields = ""
+        if "X-DB-Query-Count" in response.headers:
+            db_fields = (
+                f"DB queries: {response.headers['X-DB-Query-Count']} "
+                f"({response.headers['X-DB-Query-Time']}) - "
+            )
+
         logger.info(
             f"Response: {response.status_code} - "
             f"Process time: {process_time:.3f}s - "
+            f"{db_fields}"
             f"URL: {request.url}"
         )
         
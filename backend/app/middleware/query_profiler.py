@@ -0,0 +1,20 @@
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from ..services.query_profiler import query_profiler
+
+class QueryProfilerMiddleware(BaseHTTPMiddleware):
+    """Profila le query MongoDB di ogni richiesta ed espone i totali negli header"""
+
+    async def dispatch(self, request: Request, call_next):
+        if not query_profiler.enabled:
+            return await call_next(request)
+
+        with query_profiler.profile(f"{request.method} {request.url.path}") as profile:
+            response = await call_next(request)
+
+        response.headers["X-DB-Query-Count"] = str(profile.count)
+        response.headers["X-DB-Query-Time"] = f"{profile.total_ms:.1f}ms"
+        if profile.n_plus_one:
+            response.headers["X-DB-N-Plus-One"] = str(len(profile.n_plus_one))
+
+        return response
@@ -9,6 +9,11 @@ class BookingStatus(str, Enum):
     CANCELLED = "cancelled"
     COMPLETED = "completed"
 
+class SpaceSnapshot(BaseModel):
+    """Campi dello spazio mostrati con la prenotazione (None se lo spazio è stato eliminato)"""
+    name: Optional[str] = None
+    location: Optional[str] = None
+
 class Booking(BaseModel):
     user_id: str
     space_id: str
@@ -18,6 +23,27 @@ class Booking(BaseModel):
     status: BookingStatus = BookingStatus.PENDING
     materials_requested: List[str] = []
     notes: Optional[str]
+    space_snapshot: Optional[SpaceSnapshot] = None
+    created_at: datetime = datetime.utcnow()
+    updated_at: datetime = datetime.utcnow()
+
+class BookingSeries(BaseModel):
+    """Prenotazione ricorrente: regola RRULE a partire dalla prima occorrenza"""
+    user_id: str
+    space_id: str
+    rrule: str
+    start_datetime: datetime
+    end_datetime: datetime
+    exdates: List[datetime] = []
+    timezone: Optional[str] = None  # Fuso IANA della regola; None = fuso del campus
+    window_start: datetime
+    window_end: datetime
+    occurrence_count: int
+    purpose: str
+    status: BookingStatus = BookingStatus.CONFIRMED
+    materials_requested: List[str] = []
+    notes: Optional[str]
+    space_snapshot: Optional[SpaceSnapshot] = None
     created_at: datetime = datetime.utcnow()
     updated_at: datetime = datetime.utcnow()
 
@@ -29,6 +55,17 @@ class BookingCreate(BaseModel):
     materials_requested: List[str] = []
     notes: Optional[str]
 
+class BookingSeriesCreate(BaseModel):
+    space_id: str
+    start_datetime: datetime  # Prima occorrenza
+    end_datetime: datetime
+    rrule: str  # Es. "FREQ=WEEKLY;BYDAY=TU;UNTIL=20260130"
+    exdates: List[datetime] = []
+    timezone: Optional[str] = None  # Es. "Europe/Rome"; default il fuso del campus
+    purpose: str
+    materials_requested: List[str] = []
+    notes: Optional[str] = None
+
 class BookingUpdate(BaseModel):
     start_datetime: Optional[datetime]
     end_datetime: Optional[datetime]
@@ -22,6 +22,17 @@ class Space(BaseModel):
     booking_constraints: dict = {}  # es. {"max_duration": 120, "advance_booking_days": 7}
     is_active: bool = True
 
+class SpaceUpdate(BaseModel):
+    name: Optional[str] = None
+    type: Optional[str] = None
+    capacity: Optional[int] = None
+    materials: Optional[List[Material]] = None
+    location: Optional[str] = None
+    description: Optional[str] = None
+    available_hours: Optional[TimeSlot] = None
+    booking_constraints: Optional[dict] = None
+    is_active: Optional[bool] = None
+
 class SpaceResponse(BaseModel):
     id: str
     name: str
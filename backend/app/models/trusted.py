@@ -0,0 +1,77 @@
+"""
+Costruzione fidata delle risposte a partire da documenti delle nostre collection.
+
+I documenti sono validati una volta in scrittura (modelli di input e
+Booking); in lettura le route di elenco costruiscono direttamente righe
+con i soli campi del modello di risposta, senza istanziare e rivalidare un
+modello Pydantic per ogni riga. Il response_model della route resta per la
+documentazione OpenAPI. Un documento senza un campo obbligatorio non nullo
+passa invece dalla validazione completa, che lo rifiuta.
+"""
+
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Type, Union, get_args, get_origin
+from pydantic import BaseModel, ValidationError
+
+_REQUIRED = object()
+_NULLABLE = object()
+
+
+def _accepts_none(annotation: Any) -> bool:
+    return annotation is Any or annotation is type(None) or (
+        get_origin(annotation) is Union and type(None) in get_args(annotation)
+    )
+
+
+@lru_cache(maxsize=None)
+def _field_defaults(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    fields = []
+    for name, field in model.model_fields.items():
+        if field.is_required():
+            fields.append((name, _NULLABLE if _accepts_none(field.annotation) else _REQUIRED))
+        elif field.default_factory is not None:
+            fields.append((name, field.default_factory))
+        else:
+            fields.append((name, field.default))
+    return tuple(fields)
+
+
+def invalid_fields(error: ValidationError) -> str:
+    return ", ".join(".".join(str(part) for part in detail["loc"]) for detail in error.errors())
+
+
+def trusted_row(model: Type[BaseModel], document: Dict[str, Any], **values: Any) -> Dict[str, Any]:
+    """
+    Riga di risposta con i campi di model presi da values o dal documento.
+    I campi assenti prendono il default del modello (None per i campi
+    Optional senza default); se manca un campo obbligatorio non nullo la
+    riga si valida con il modello, che solleva ValidationError.
+    """
+    row = {}
+    for name, default in _field_defaults(model):
+        if name in values:
+            row[name] = values[name]
+        elif name in document:
+            row[name] = document[name]
+        elif default is _REQUIRED:
+            return model.model_validate(row | {
+                key: value for key, value in {**document, **values}.items() if key in model.model_fields
+            }).model_dump()
+        elif default is _NULLABLE:
+            row[name] = None
+        elif callable(default):
+            row[name] = default()
+        else:
+            row[name] = default
+    return row
+
+
+def trusted_rows(model: Type[BaseModel], documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Righe per documenti con "_id" ObjectId, esposto come campo id stringa; i documenti non validi si saltano"""
+    rows = []
+    for document in documents:
+        try:
+            rows.append(trusted_row(model, document, id=str(document["_id"])))
+        except ValidationError as e:
+            print(f"⚠️ Documento {document['_id']} escluso da {model.__name__}: {invalid_fields(e)}")
+    return rows
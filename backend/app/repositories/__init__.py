@@ -0,0 +1,34 @@
+"""
+Repositories package for ClassRent
+
+Accesso ai dati per collection con query a proiezione limitata:
+route e servizi leggono solo i campi di cui hanno bisogno.
+"""
+
+from .users import users_repository
+from .spaces import spaces_repository
+from .bookings import bookings_repository
+from .booking_series import booking_series_repository
+from .materials import materials_repository
+from .calendar_events import calendar_events_repository
+from .caldav_sync import caldav_items_repository, caldav_state_repository
+from .space_catalog import space_catalog
+from .versions import collection_versions
+from .loaders import loader_scope, spaces_loader, users_loader, bookings_loader
+
+__all__ = [
+    "users_repository",
+    "spaces_repository",
+    "bookings_repository",
+    "booking_series_repository",
+    "materials_repository",
+    "calendar_events_repository",
+    "caldav_items_repository",
+    "caldav_state_repository",
+    "space_catalog",
+    "collection_versions",
+    "loader_scope",
+    "spaces_loader",
+    "users_loader",
+    "bookings_loader"
+]
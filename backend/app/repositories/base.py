@@ -0,0 +1,89 @@
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+from bson import ObjectId
+from ..database import get_database
+from .versions import collection_versions
+
+
+def with_id(document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Sostituisce "_id" con il campo "id" stringa (formato usato dalle API)"""
+    if document is not None and "_id" in document:
+        document["id"] = str(document.pop("_id"))
+    return document
+
+
+class BaseRepository:
+    """
+    Accesso a una singola collection: ogni metodo dichiara la proiezione
+    dei campi che il chiamante usa davvero, così non si trasferiscono
+    documenti interi per leggerne uno o due campi.
+    """
+
+    collection_name: str = ""
+    # Ordine dell'ultima modifica per watermark(): le collection in sola inserzione usano solo _id
+    watermark_sort: List[Tuple[str, int]] = [("updated_at", -1), ("_id", -1)]
+
+    async def collection(self, profiled: bool = True):
+        db = await get_database(profiled)
+        return db[self.collection_name]
+
+    def written(self):
+        """Da chiamare dopo ogni scrittura: invalida gli ETag che dipendono dalla collection"""
+        collection_versions.bump(self.collection_name)
+
+    def object_id(self, value: Any) -> ObjectId:
+        # Solleva eccezione su ID non validi, come ObjectId(...) usato finora nelle route
+        return value if isinstance(value, ObjectId) else ObjectId(value)
+
+    def object_ids(self, values: List[Any]) -> List[ObjectId]:
+        """ObjectId validi tra quelli richiesti (gli ID malformati non esistono)"""
+        object_ids = []
+        for value in values:
+            try:
+                object_ids.append(self.object_id(value))
+            except Exception:
+                continue
+        return object_ids
+
+    async def get_many(self, ids: List[Any], projection: Optional[Dict[str, int]] = None) -> Dict[str, Dict[str, Any]]:
+        """Documenti per ID con una sola query $in, indicizzati per ID stringa"""
+        object_ids = self.object_ids(ids)
+        if not object_ids:
+            return {}
+        collection = await self.collection()
+        cursor = collection.find({"_id": {"$in": object_ids}}, projection)
+        return {str(document["_id"]): document async for document in cursor}
+
+    async def list_changes(self, filter_query: Dict[str, Any], limit: int,
+                           projection: Optional[Dict[str, int]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Pagina di modifiche in ordine (updated_at, _id) e se ce ne sono altre"""
+        collection = await self.collection()
+        cursor = collection.find(filter_query, projection).sort(
+            [("updated_at", 1), ("_id", 1)]
+        ).limit(limit + 1)
+        documents = await cursor.to_list(length=limit + 1)
+        return documents[:limit], len(documents) > limit
+
+    async def latest_change(self, filter_query: Dict[str, Any]) -> Optional[Tuple[Any, ObjectId]]:
+        """Ultima chiave (updated_at, _id) tra i documenti del filtro: cambia a ogni scrittura che li tocca"""
+        collection = await self.collection()
+        document = await collection.find_one(
+            filter_query, {"updated_at": 1}, sort=[("updated_at", -1), ("_id", -1)]
+        )
+        return (document.get("updated_at"), document["_id"]) if document else None
+
+    async def watermark(self) -> str:
+        """
+        Stato della collection letto dal database: ultima chiave di modifica
+        e numero stimato di documenti (per le cancellazioni). A differenza di
+        collection_versions vede anche le scritture di altri processi e script.
+        """
+        collection = await self.collection(profiled=False)
+        latest, count = await asyncio.gather(
+            collection.find_one({}, {"updated_at": 1}, sort=self.watermark_sort),
+            collection.estimated_document_count()
+        )
+        if latest is None:
+            return "-"
+        updated_at = latest.get("updated_at")
+        return f"{updated_at.isoformat() if updated_at else ''}:{latest['_id']}:{count}"
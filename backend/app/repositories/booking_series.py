@@ -0,0 +1,109 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from .base import BaseRepository
+from .bookings import ACTIVE_STATUSES
+
+# Campi necessari per espandere le occorrenze e mostrarle nel calendario
+SERIES_CALENDAR = {
+    "user_id": 1, "space_id": 1, "space_snapshot": 1, "rrule": 1, "start_datetime": 1, "end_datetime": 1,
+    "exdates": 1, "timezone": 1, "purpose": 1, "status": 1, "materials_requested": 1, "notes": 1, "updated_at": 1
+}
+# Solo espansione (verifica conflitti)
+SERIES_SLOTS = {"rrule": 1, "start_datetime": 1, "end_datetime": 1, "exdates": 1, "timezone": 1, "purpose": 1}
+SERIES_DETAIL = {**SERIES_CALENDAR, "window_start": 1, "window_end": 1, "occurrence_count": 1, "created_at": 1}
+
+
+class BookingSeriesRepository(BaseRepository):
+    """
+    Prenotazioni ricorrenti: un documento per serie con regola RRULE e date
+    escluse. window_start/window_end delimitano tutte le occorrenze, così le
+    serie che possono toccare un intervallo si trovano con una query sola.
+    """
+
+    collection_name = "booking_series"
+
+    async def insert(self, series: Dict[str, Any]) -> str:
+        collection = await self.collection()
+        result = await collection.insert_one(series)
+        self.written()
+        return str(result.inserted_id)
+
+    async def insert_many(self, series_list: List[Dict[str, Any]]) -> List[str]:
+        if not series_list:
+            return []
+        collection = await self.collection()
+        result = await collection.insert_many(series_list, ordered=False)
+        self.written()
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    async def delete_imported(self, import_id: str) -> int:
+        """Rimuove i documenti di un import orari non completato"""
+        collection = await self.collection()
+        result = await collection.delete_many({"import_id": import_id})
+        if result.deleted_count:
+            self.written()
+        return result.deleted_count
+
+    async def get_owned(self, series_id: Any, user_id: str,
+                        projection: Dict[str, int] = SERIES_DETAIL) -> Optional[Dict[str, Any]]:
+        collection = await self.collection()
+        return await collection.find_one({"_id": self.object_id(series_id), "user_id": user_id}, projection)
+
+    async def set_fields(self, series_id: Any, fields: Dict[str, Any], user_id: Optional[str] = None) -> int:
+        collection = await self.collection()
+        filter_query: Dict[str, Any] = {"_id": self.object_id(series_id)}
+        if user_id is not None:
+            filter_query["user_id"] = user_id
+        result = await collection.update_one(filter_query, {"$set": fields})
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def add_exdate(self, series_id: Any, user_id: str, occurrence: datetime) -> int:
+        """Esclude un'occorrenza dalla serie"""
+        collection = await self.collection()
+        result = await collection.update_one(
+            {"_id": self.object_id(series_id), "user_id": user_id},
+            {"$addToSet": {"exdates": occurrence}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def list_overlapping(self, start: datetime, end: datetime, space_id: Optional[str] = None,
+                               projection: Dict[str, int] = SERIES_CALENDAR,
+                               user_id: Optional[str] = None,
+                               space_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Serie attive la cui finestra interseca [start, end): le occorrenze si espandono dopo"""
+        filter_query: Dict[str, Any] = {
+            "status": {"$in": ACTIVE_STATUSES},
+            "window_start": {"$lt": end},
+            "window_end": {"$gt": start}
+        }
+        if space_id:
+            filter_query["space_id"] = space_id
+        elif space_ids is not None:
+            filter_query["space_id"] = {"$in": space_ids}
+        if user_id:
+            filter_query["user_id"] = user_id
+        collection = await self.collection()
+        return await collection.find(filter_query, projection).to_list(None)
+
+    async def refresh_space_snapshot(self, space_id: str, snapshot: Dict[str, Any]) -> int:
+        """Allinea lo snapshot delle serie di uno spazio modificato, come per le prenotazioni"""
+        collection = await self.collection(profiled=False)
+        result = await collection.update_many(
+            {"space_id": space_id, "space_snapshot": {"$exists": True, "$ne": snapshot}},
+            {"$set": {"space_snapshot": snapshot, "updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def list_for_user(self, user_id: str, projection: Dict[str, int] = SERIES_DETAIL) -> List[Dict[str, Any]]:
+        collection = await self.collection()
+        cursor = collection.find({"user_id": user_id}, projection).sort("window_start", -1)
+        return await cursor.to_list(None)
+
+
+booking_series_repository = BookingSeriesRepository()
@@ -0,0 +1,339 @@
+import base64
+import json
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateMany
+from .base import BaseRepository
+
+ACTIVE_STATUSES = ["pending", "confirmed"]
+
+# Proiezioni per caso d'uso
+BOOKING_OWNER = {"user_id": 1, "status": 1}
+BOOKING_SLOT = {"start_datetime": 1, "end_datetime": 1, "purpose": 1}
+BOOKING_SUMMARY = {
+    "space_id": 1, "space_snapshot": 1, "start_datetime": 1, "end_datetime": 1, "purpose": 1, "status": 1
+}
+# Campi di BookingResponse (e dei dati passati a calendario ed email)
+BOOKING_DETAIL = {
+    "user_id": 1, "space_id": 1, "space_snapshot": 1, "start_datetime": 1, "end_datetime": 1, "purpose": 1,
+    "status": 1, "materials_requested": 1, "notes": 1, "created_at": 1
+}
+# Campi del calendario derivato dalle prenotazioni (anche updated_at per la sincronizzazione delta)
+BOOKING_CALENDAR = {
+    "user_id": 1, "space_id": 1, "space_snapshot": 1, "start_datetime": 1, "end_datetime": 1, "purpose": 1,
+    "status": 1, "materials_requested": 1, "notes": 1, "updated_at": 1
+}
+
+
+def encode_cursor(booking: Dict[str, Any]) -> str:
+    """Cursore opaco con la chiave di ordinamento (start_datetime, _id) dell'ultima riga"""
+    payload = {"s": booking["start_datetime"].isoformat(), "i": str(booking["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Solleva ValueError se il cursore non è valido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["s"]), ObjectId(payload["i"])
+    except Exception:
+        raise ValueError("Cursore di paginazione non valido")
+
+
+def search_filter(user_id: Optional[str] = None, space_id: Optional[str] = None,
+                  statuses: Optional[List[str]] = None, start_from: Optional[datetime] = None,
+                  start_to: Optional[datetime] = None, material: Optional[str] = None) -> Dict[str, Any]:
+    """Filtro della ricerca prenotazioni: solo i criteri indicati"""
+    filter_query: Dict[str, Any] = {}
+    if user_id:
+        filter_query["user_id"] = user_id
+    if space_id:
+        filter_query["space_id"] = space_id
+    if statuses:
+        filter_query["status"] = statuses[0] if len(statuses) == 1 else {"$in": statuses}
+    if start_from or start_to:
+        filter_query["start_datetime"] = {}
+        if start_from:
+            filter_query["start_datetime"]["$gte"] = start_from
+        if start_to:
+            filter_query["start_datetime"]["$lt"] = start_to
+    if material:
+        filter_query["materials_requested"] = material
+    return filter_query
+
+
+def keyset_filter(filter_query: Dict[str, Any], after: Tuple[datetime, ObjectId], sort_direction: int) -> Dict[str, Any]:
+    """Righe successive a (start_datetime, _id) nell'ordine richiesto: costo indipendente dalla pagina"""
+    start, object_id = after
+    op = "$lt" if sort_direction < 0 else "$gt"
+    return {"$and": [filter_query, {"$or": [
+        {"start_datetime": {op: start}},
+        {"start_datetime": start, "_id": {op: object_id}}
+    ]}]}
+
+
+class BookingsRepository(BaseRepository):
+    collection_name = "bookings"
+
+    async def insert(self, booking: Dict[str, Any]) -> str:
+        collection = await self.collection()
+        result = await collection.insert_one(booking)
+        self.written()
+        return str(result.inserted_id)
+
+    async def insert_many(self, bookings: List[Dict[str, Any]]) -> List[str]:
+        """Inserimento in blocco (import orari): un round trip per lotto"""
+        if not bookings:
+            return []
+        collection = await self.collection()
+        result = await collection.insert_many(bookings, ordered=False)
+        self.written()
+        return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+    async def delete_imported(self, import_id: str) -> int:
+        """Rimuove i documenti di un import orari non completato"""
+        collection = await self.collection()
+        result = await collection.delete_many({"import_id": import_id})
+        if result.deleted_count:
+            self.written()
+        return result.deleted_count
+
+    async def get_by_id(self, booking_id: Any, projection: Dict[str, int] = BOOKING_DETAIL) -> Optional[Dict[str, Any]]:
+        collection = await self.collection()
+        return await collection.find_one({"_id": self.object_id(booking_id)}, projection)
+
+    async def get_owned(self, booking_id: Any, user_id: str,
+                        projection: Dict[str, int] = BOOKING_DETAIL) -> Optional[Dict[str, Any]]:
+        """Prenotazione solo se appartiene all'utente"""
+        collection = await self.collection()
+        return await collection.find_one({"_id": self.object_id(booking_id), "user_id": user_id}, projection)
+
+    async def set_fields(self, booking_id: Any, fields: Dict[str, Any], user_id: Optional[str] = None) -> int:
+        """Aggiorna i campi indicati; restituisce il numero di documenti modificati"""
+        collection = await self.collection()
+        filter_query: Dict[str, Any] = {"_id": self.object_id(booking_id)}
+        if user_id is not None:
+            filter_query["user_id"] = user_id
+        result = await collection.update_one(filter_query, {"$set": fields})
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def has_overlap(self, space_id: str, start: datetime, end: datetime,
+                          exclude_booking_id: Optional[Any] = None) -> bool:
+        """True se una prenotazione attiva dello spazio si sovrappone all'intervallo"""
+        collection = await self.collection()
+        filter_query: Dict[str, Any] = {
+            "space_id": space_id,
+            "status": {"$in": ACTIVE_STATUSES},
+            "$and": [
+                {"start_datetime": {"$lt": end}},
+                {"end_datetime": {"$gt": start}}
+            ]
+        }
+        if exclude_booking_id is not None:
+            filter_query["_id"] = {"$ne": self.object_id(exclude_booking_id)}
+        return await collection.find_one(filter_query, {"_id": 1}) is not None
+
+    async def busy_space_ids(self, space_ids: List[str], start: datetime, end: datetime) -> set:
+        """Spazi tra quelli indicati con una prenotazione attiva sovrapposta a [start, end), con una query"""
+        if not space_ids:
+            return set()
+        collection = await self.collection()
+        return set(await collection.distinct("space_id", {
+            "space_id": {"$in": space_ids},
+            "status": {"$in": ACTIVE_STATUSES},
+            "$and": [
+                {"start_datetime": {"$lt": end}},
+                {"end_datetime": {"$gt": start}}
+            ]
+        }))
+
+    async def list_overlapping(self, space_id: str, start: datetime, end: datetime,
+                               projection: Dict[str, int] = BOOKING_SLOT) -> List[Dict[str, Any]]:
+        """Prenotazioni attive dello spazio che si sovrappongono a [start, end), ordinate per inizio"""
+        collection = await self.collection()
+        cursor = collection.find({
+            "space_id": space_id,
+            "status": {"$in": ACTIVE_STATUSES},
+            "$and": [
+                {"start_datetime": {"$lt": end}},
+                {"end_datetime": {"$gt": start}}
+            ]
+        }, projection).sort("start_datetime", 1)
+        return await cursor.to_list(None)
+
+    async def list_for_user(self, user_id: str, status_filter: str = "all", sort_direction: int = -1,
+                            limit: int = 0, projection: Dict[str, int] = BOOKING_DETAIL) -> List[Dict[str, Any]]:
+        """Prenotazioni dell'utente: status_filter tra all, upcoming, past, cancelled"""
+        filter_query: Dict[str, Any] = {"user_id": user_id}
+        if status_filter == "upcoming":
+            filter_query["start_datetime"] = {"$gte": datetime.now()}
+            filter_query["status"] = {"$in": ["confirmed", "pending"]}
+        elif status_filter == "past":
+            filter_query["end_datetime"] = {"$lt": datetime.now()}
+        elif status_filter == "cancelled":
+            filter_query["status"] = "cancelled"
+
+        collection = await self.collection()
+        cursor = collection.find(filter_query, projection).sort("start_datetime", sort_direction)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(None)
+
+    async def search(self, filter_query: Dict[str, Any], after: Optional[Tuple[datetime, ObjectId]] = None,
+                     sort_direction: int = -1, limit: int = 50,
+                     projection: Dict[str, int] = BOOKING_DETAIL) -> Tuple[List[Dict[str, Any]], bool]:
+        """Una pagina ordinata per (start_datetime, _id) e se ci sono altre righe"""
+        if after is not None:
+            filter_query = keyset_filter(filter_query, after, sort_direction)
+
+        collection = await self.collection()
+        cursor = collection.find(filter_query, projection).sort(
+            [("start_datetime", sort_direction), ("_id", sort_direction)]
+        ).limit(limit + 1)
+        bookings = await cursor.to_list(None)
+        return bookings[:limit], len(bookings) > limit
+
+    async def export_cursor(self, filter_query: Dict[str, Any], after: Optional[Tuple[datetime, ObjectId]] = None,
+                            batch_size: int = 500, projection: Dict[str, int] = BOOKING_DETAIL):
+        """
+        Cursore per export in ordine (start_datetime, _id) crescente, letto a
+        batch dal server: la memoria non dipende dal numero di righe. Non
+        profilato, perché la durata di un export non è quella di una query.
+        """
+        if after is not None:
+            filter_query = keyset_filter(filter_query, after, 1)
+        collection = await self.collection(profiled=False)
+        return collection.find(filter_query, projection).sort(
+            [("start_datetime", 1), ("_id", 1)]
+        ).batch_size(batch_size)
+
+    async def occupancy_cursor(self, start: datetime, end: datetime, space_id: Optional[str] = None,
+                               after: Optional[Tuple[str, str]] = None, batch_size: int = 500):
+        """Prenotazioni attive e minuti prenotati per (spazio, giorno), ordinati e riprendibili da after"""
+        match: Dict[str, Any] = {"status": {"$in": ACTIVE_STATUSES}, "start_datetime": {"$gte": start, "$lt": end}}
+        if space_id:
+            match["space_id"] = space_id
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": match},
+            {"$project": {
+                "space_id": 1,
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$start_datetime"}},
+                "minutes": {"$divide": [{"$subtract": ["$end_datetime", "$start_datetime"]}, 60000]}
+            }},
+            {"$group": {
+                "_id": {"space_id": "$space_id", "day": "$day"},
+                "bookings": {"$sum": 1},
+                "booked_minutes": {"$sum": "$minutes"}
+            }},
+            {"$sort": {"_id.space_id": 1, "_id.day": 1}}
+        ]
+        if after is not None:
+            last_space, last_day = after
+            pipeline.append({"$match": {"$or": [
+                {"_id.space_id": {"$gt": last_space}},
+                {"_id.space_id": last_space, "_id.day": {"$gt": last_day}}
+            ]}})
+        collection = await self.collection(profiled=False)
+        return collection.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+
+    async def list_for_space_between(self, space_id: str, start: datetime, end: datetime,
+                                     projection: Dict[str, int] = BOOKING_SLOT) -> List[Dict[str, Any]]:
+        """Prenotazioni attive di uno spazio che iniziano nell'intervallo"""
+        collection = await self.collection()
+        cursor = collection.find({
+            "space_id": space_id,
+            "status": {"$in": ACTIVE_STATUSES},
+            "start_datetime": {"$gte": start, "$lt": end}
+        }, projection).sort("start_datetime", 1)
+        return await cursor.to_list(None)
+
+    async def list_calendar_between(self, start: datetime, end: datetime, space_id: Optional[str] = None,
+                                    user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Prenotazioni attive che iniziano nell'intervallo: la fonte del calendario"""
+        filter_query: Dict[str, Any] = {
+            "status": {"$in": ACTIVE_STATUSES},
+            "start_datetime": {"$gte": start, "$lt": end}
+        }
+        if space_id:
+            filter_query["space_id"] = space_id
+        if user_id:
+            filter_query["user_id"] = user_id
+        collection = await self.collection()
+        cursor = collection.find(filter_query, BOOKING_CALENDAR).sort("start_datetime", 1)
+        return await cursor.to_list(None)
+
+    async def backfill_updated_at(self) -> int:
+        """updated_at dove manca (prenotazioni legacy), altrimenti invisibili alla sincronizzazione delta"""
+        collection = await self.collection(profiled=False)
+        result = await collection.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": {"$ifNull": ["$created_at", "$start_datetime"]}}}]
+        )
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def missing_snapshot_batch(self, after: Optional[ObjectId], limit: int) -> List[Dict[str, Any]]:
+        """Prenotazioni senza space_snapshot in ordine di _id, a partire da after"""
+        filter_query: Dict[str, Any] = {"space_snapshot": {"$exists": False}}
+        if after is not None:
+            filter_query["_id"] = {"$gt": after}
+        collection = await self.collection(profiled=False)
+        cursor = collection.find(filter_query, {"space_id": 1}).sort("_id", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def set_space_snapshots(self, updates: Dict[str, Tuple[List[ObjectId], Dict[str, Any]]]) -> int:
+        """Un solo bulk_write per batch: per ogni spazio, snapshot sulle prenotazioni indicate"""
+        if not updates:
+            return 0
+        collection = await self.collection(profiled=False)
+        result = await collection.bulk_write([
+            UpdateMany({"_id": {"$in": ids}, "space_snapshot": {"$exists": False}}, {"$set": {"space_snapshot": snapshot}})
+            for ids, snapshot in updates.values()
+        ], ordered=False)
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def refresh_space_snapshot(self, space_id: str, snapshot: Dict[str, Any]) -> int:
+        """
+        Allinea lo snapshot delle prenotazioni di uno spazio modificato.
+        Idempotente: tocca solo le prenotazioni con uno snapshot diverso e ne
+        aggiorna updated_at, così la sincronizzazione delta vede il nuovo nome.
+        Quelle senza snapshot ($ne da solo le includerebbe) restano a backfill(),
+        a batch e senza toccare updated_at.
+        """
+        collection = await self.collection(profiled=False)
+        result = await collection.update_many(
+            {"space_id": space_id, "space_snapshot": {"$exists": True, "$ne": snapshot}},
+            {"$set": {"space_snapshot": snapshot, "updated_at": datetime.utcnow()}}
+        )
+        if result.modified_count:
+            self.written()
+        return result.modified_count
+
+    async def popular_materials(self, limit: int) -> List[Dict[str, Any]]:
+        collection = await self.collection()
+        pipeline = [
+            {"$project": {"materials_requested": 1}},
+            {"$unwind": "$materials_requested"},
+            {"$group": {
+                "_id": "$materials_requested",
+                "count": {"$sum": 1}
+            }},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+            {"$project": {
+                "material_name": "$_id",
+                "request_count": "$count",
+                "_id": 0
+            }}
+        ]
+        return await collection.aggregate(pipeline).to_list(None)
+
+
+bookings_repository = BookingsRepository()
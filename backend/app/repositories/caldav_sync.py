@@ -0,0 +1,96 @@
+from typing import Dict, Any, List, Iterable, Optional
+from datetime import datetime
+from pymongo import UpdateOne, DeleteOne
+from .base import BaseRepository
+
+STATE_ID = "state"
+
+
+class CalDavItemsRepository(BaseRepository):
+    """
+    Stato remoto degli eventi inviati al server CalDAV, uno per UID
+    (booking-<id> o series-<id>): href, ETag restituito dal server e hash
+    del contenuto inviato. Un hash uguale evita di rinviare eventi invariati.
+    """
+
+    collection_name = "caldav_items"
+
+    async def get_many_by_uid(self, uids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        uids = list(set(uids))
+        if not uids:
+            return {}
+        collection = await self.collection()
+        return {item["_id"]: item async for item in collection.find({"_id": {"$in": uids}})}
+
+    async def get_many_by_href(self, hrefs: Iterable[str]) -> List[Dict[str, Any]]:
+        hrefs = list(set(hrefs))
+        if not hrefs:
+            return []
+        collection = await self.collection()
+        return await collection.find({"href": {"$in": hrefs}}).to_list(None)
+
+    async def list_all(self) -> List[Dict[str, Any]]:
+        """Tutti gli eventi noti (confronto completo degli ETag se il server non ha sync token)"""
+        collection = await self.collection(profiled=False)
+        return await collection.find({}, {"href": 1, "etag": 1}).to_list(None)
+
+    async def apply(self, saved: List[Dict[str, Any]], deleted: List[str],
+                    rejected: Iterable[Dict[str, Any]] = ()) -> int:
+        """
+        Salva gli eventi inviati, elimina quelli rimossi dal server e segna da
+        rinviare (hash None, con l'ultimo errore) quelli rifiutati, con un solo
+        bulk_write.
+        """
+        operations = [
+            UpdateOne({"_id": item["_id"]}, {"$set": {**item, "last_error": None, "synced_at": datetime.utcnow()}},
+                      upsert=True)
+            for item in saved
+        ] + [DeleteOne({"_id": uid}) for uid in deleted] + [
+            UpdateOne({"_id": item["_id"]}, {"$set": {**item, "hash": None}}, upsert=True)
+            for item in rejected
+        ]
+        if not operations:
+            return 0
+        collection = await self.collection(profiled=False)
+        result = await collection.bulk_write(operations, ordered=False)
+        return result.upserted_count + result.modified_count + result.deleted_count
+
+    async def mark_stale(self, uids: Iterable[str], etags: Dict[str, Optional[str]]) -> int:
+        """Eventi modificati o eliminati sul server da altri: si rinviano al prossimo passaggio"""
+        operations = [
+            UpdateOne({"_id": uid}, {"$set": {"hash": None, "etag": etags.get(uid)}})
+            for uid in uids
+        ]
+        if not operations:
+            return 0
+        collection = await self.collection(profiled=False)
+        result = await collection.bulk_write(operations, ordered=False)
+        return result.modified_count
+
+    async def list_stale(self, limit: int, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Eventi da rinviare in ordine di UID, dopo after: ogni passaggio li scorre una volta"""
+        filter_query: Dict[str, Any] = {"hash": None}
+        if after is not None:
+            filter_query["_id"] = {"$gt": after}
+        collection = await self.collection(profiled=False)
+        return await collection.find(filter_query).sort("_id", 1).limit(limit).to_list(None)
+
+
+class CalDavStateRepository(BaseRepository):
+    """Un documento con watermark locale, ctag e sync token dell'ultimo passaggio"""
+
+    collection_name = "caldav_sync_state"
+
+    async def get(self) -> Dict[str, Any]:
+        collection = await self.collection(profiled=False)
+        return await collection.find_one({"_id": STATE_ID}) or {}
+
+    async def save(self, fields: Dict[str, Any]):
+        collection = await self.collection(profiled=False)
+        await collection.update_one(
+            {"_id": STATE_ID}, {"$set": {**fields, "updated_at": datetime.utcnow()}}, upsert=True
+        )
+
+
+caldav_items_repository = CalDavItemsRepository()
+caldav_state_repository = CalDavStateRepository()
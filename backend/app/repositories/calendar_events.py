@@ -0,0 +1,71 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from bson import ObjectId
+from .base import BaseRepository, with_id
+
+# Campi esposti dal calendario (niente status, created_at, updated_at)
+CALENDAR_EVENT = {
+    "booking_id": 1, "space_id": 1, "space_name": 1, "location": 1,
+    "start_datetime": 1, "end_datetime": 1, "purpose": 1,
+    "materials_requested": 1, "notes": 1, "created_by_email": 1, "event_type": 1
+}
+# Sincronizzazione delta: servono anche stato e chiave (updated_at, _id)
+CALENDAR_EVENT_CHANGE = {**CALENDAR_EVENT, "status": 1, "updated_at": 1}
+# Confronto con la prenotazione durante la riconciliazione
+CALENDAR_MIRROR = {"booking_id": 1, "space_id": 1, "start_datetime": 1, "end_datetime": 1, "status": 1}
+
+# Solo eventi di sistema (manutenzioni, chiusure): le prenotazioni si leggono da bookings.
+# Le vecchie copie delle prenotazioni (booking_id valorizzato) restano fino alla riconciliazione.
+SYSTEM_EVENTS = {"booking_id": None}
+
+
+class CalendarEventsRepository(BaseRepository):
+    collection_name = "calendar_events"
+
+    async def insert(self, event: Dict[str, Any]) -> str:
+        collection = await self.collection()
+        result = await collection.insert_one(event)
+        self.written()
+        return str(result.inserted_id)
+
+    async def list_active_between(self, start: datetime, end: datetime,
+                                  space_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Eventi di sistema attivi che iniziano nell'intervallo, ordinati per inizio, con campo "id" """
+        filter_query: Dict[str, Any] = {
+            **SYSTEM_EVENTS,
+            "start_datetime": {"$gte": start, "$lt": end},
+            "status": "active"
+        }
+        if space_id:
+            filter_query["space_id"] = space_id
+
+        collection = await self.collection()
+        cursor = collection.find(filter_query, CALENDAR_EVENT).sort("start_datetime", 1)
+        events = []
+        async for event in cursor:
+            event.setdefault("materials_requested", [])
+            event.setdefault("notes", "")
+            event.setdefault("event_type", "booking")
+            events.append(with_id(event))
+        return events
+
+    async def mirror_batch(self, after: Optional[ObjectId], limit: int) -> List[Dict[str, Any]]:
+        """Copie legacy delle prenotazioni in ordine di _id, a partire da after"""
+        filter_query: Dict[str, Any] = {"booking_id": {"$ne": None}}
+        if after is not None:
+            filter_query["_id"] = {"$gt": after}
+        collection = await self.collection(profiled=False)
+        cursor = collection.find(filter_query, CALENDAR_MIRROR).sort("_id", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def delete_many(self, ids: List[ObjectId]) -> int:
+        if not ids:
+            return 0
+        collection = await self.collection()
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        if result.deleted_count:
+            self.written()
+        return result.deleted_count
+
+
+calendar_events_repository = CalendarEventsRepository()
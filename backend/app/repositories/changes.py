@@ -0,0 +1,49 @@
+import base64
+import json
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+from bson import ObjectId
+
+Watermark = Tuple[datetime, ObjectId]
+
+
+def encode_watermark(marks: Dict[str, Watermark]) -> str:
+    """Token opaco con l'ultima chiave (updated_at, _id) consegnata per ogni collection"""
+    payload = {name: [updated_at.isoformat(), str(object_id)] for name, (updated_at, object_id) in marks.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()).decode().rstrip("=")
+
+
+def decode_watermark(token: str) -> Dict[str, Watermark]:
+    """Solleva ValueError se il token non è valido"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return {name: (datetime.fromisoformat(mark[0]), ObjectId(mark[1])) for name, mark in payload.items()}
+    except Exception:
+        raise ValueError("Token di sincronizzazione non valido")
+
+
+def changes_filter(since: Optional[Watermark], settled_before: datetime,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   space_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Documenti creati, modificati o annullati dopo il token (qualsiasi stato).
+    Le scritture più recenti di settled_before si escludono: una scrittura
+    ancora in corso con updated_at precedente non finisce dietro al token.
+    """
+    filter_query: Dict[str, Any] = {"updated_at": {"$lt": settled_before}}
+    if space_id:
+        filter_query["space_id"] = space_id
+    if start or end:
+        filter_query["start_datetime"] = {}
+        if start:
+            filter_query["start_datetime"]["$gte"] = start
+        if end:
+            filter_query["start_datetime"]["$lt"] = end
+    if since is None:
+        return filter_query
+    updated_at, object_id = since
+    return {"$and": [filter_query, {"$or": [
+        {"updated_at": {"$gt": updated_at}},
+        {"updated_at": updated_at, "_id": {"$gt": object_id}}
+    ]}]}
@@ -0,0 +1,102 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable
+from .spaces import spaces_repository, SPACE_BOOKING
+from .users import users_repository, USER_SESSION
+from .bookings import bookings_repository, BOOKING_OWNER
+
+# Stato dei loader della richiesta corrente (None fuori da una richiesta HTTP)
+_request_loaders: ContextVar[Optional[Dict[str, Dict[str, Any]]]] = ContextVar("request_loaders", default=None)
+
+
+@contextmanager
+def loader_scope():
+    """Apre uno scope di batching/memoizzazione, tipicamente una richiesta HTTP"""
+    token = _request_loaders.set({})
+    try:
+        yield
+    finally:
+        _request_loaders.reset(token)
+
+
+class BatchLoader:
+    """
+    Loader in stile DataLoader: gli ID richiesti nello stesso giro dell'event
+    loop vengono raccolti e risolti con una sola query $in; i risultati restano
+    memorizzati fino alla fine della richiesta. Fuori da uno scope ogni load
+    esegue direttamente la query, così servizi e script funzionano invariati.
+    """
+
+    def __init__(self, name: str, fetch_many: Callable[[List[str]], Awaitable[Dict[str, Dict[str, Any]]]]):
+        self.name = name
+        self.fetch_many = fetch_many
+
+    def _state(self) -> Optional[Dict[str, Any]]:
+        loaders = _request_loaders.get()
+        if loaders is None:
+            return None
+        if self.name not in loaders:
+            loaders[self.name] = {"futures": {}, "pending": [], "scheduled": False, "tasks": set()}
+        return loaders[self.name]
+
+    async def load(self, key: Any) -> Optional[Dict[str, Any]]:
+        key = str(key)
+        state = self._state()
+        if state is None:
+            return (await self.fetch_many([key])).get(key)
+
+        future = state["futures"].get(key) or self._enqueue(state, key)
+        return await future
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Optional[Dict[str, Any]]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prefetch(self, keys: Iterable[Any]):
+        """Accoda gli ID senza attendere: i load successivi in un ciclo trovano il risultato pronto"""
+        state = self._state()
+        if state is None:
+            return
+        for key in keys:
+            key = str(key)
+            if key not in state["futures"]:
+                self._enqueue(state, key)
+
+    def _enqueue(self, state: Dict[str, Any], key: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        state["futures"][key] = future
+        state["pending"].append(key)
+        if not state["scheduled"]:
+            state["scheduled"] = True
+            loop.call_soon(self._dispatch, state)
+        return future
+
+    def _dispatch(self, state: Dict[str, Any]):
+        keys, state["pending"], state["scheduled"] = state["pending"], [], False
+        task = asyncio.ensure_future(self._resolve(state, keys))
+        state["tasks"].add(task)
+        task.add_done_callback(state["tasks"].discard)
+
+    async def _resolve(self, state: Dict[str, Any], keys: List[str]):
+        try:
+            documents = await self.fetch_many(keys)
+        except Exception as e:
+            print(f"⚠️ Errore caricamento batch {self.name} ({len(keys)} ID): {e}")
+            for key in keys:
+                # Nessuna memoizzazione degli errori: un load successivo ritenta
+                future = state["futures"].pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key in keys:
+            future = state["futures"][key]
+            if not future.done():
+                future.set_result(documents.get(key))
+
+
+# Loader globali: la proiezione copre tutti gli usi (nome, vincoli, contatto, ruolo)
+spaces_loader = BatchLoader("spaces", lambda ids: spaces_repository.get_many(ids, SPACE_BOOKING))
+users_loader = BatchLoader("users", lambda ids: users_repository.get_many(ids, USER_SESSION))
+bookings_loader = BatchLoader("bookings", lambda ids: bookings_repository.get_many(ids, BOOKING_OWNER))
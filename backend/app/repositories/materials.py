@@ -0,0 +1,95 @@
+from typing import Dict, Any, List, Optional
+from .base import BaseRepository
+
+
+class MaterialsRepository(BaseRepository):
+    collection_name = "materials"
+
+    async def list_with_space_counts(self, category: Optional[str] = None,
+                                     available_only: bool = False) -> List[Dict[str, Any]]:
+        """Materiali con il numero di spazi che li possiedono"""
+        filter_query: Dict[str, Any] = {}
+        if category:
+            filter_query["category"] = category
+        if available_only:
+            filter_query["is_available"] = True
+
+        pipeline = [
+            {"$match": filter_query},
+            {
+                "$lookup": {
+                    "from": "spaces",
+                    "localField": "name",
+                    "foreignField": "materials.name",
+                    # Per il conteggio basta l'_id degli spazi
+                    "pipeline": [{"$project": {"_id": 1}}],
+                    "as": "spaces"
+                }
+            },
+            {
+                "$addFields": {
+                    "spaces_count": {"$size": "$spaces"}
+                }
+            },
+            {"$project": {"spaces": 0}}
+        ]
+
+        collection = await self.collection()
+        return await collection.aggregate(pipeline).to_list(None)
+
+    async def categories(self) -> List[str]:
+        collection = await self.collection()
+        return await collection.distinct("category")
+
+    async def usage_stats(self) -> List[Dict[str, Any]]:
+        """Statistiche di utilizzo: dai lookup arrivano solo i campi aggregati"""
+        pipeline = [
+            {"$project": {"name": 1}},
+            {
+                "$lookup": {
+                    "from": "bookings",
+                    "localField": "name",
+                    "foreignField": "materials_requested",
+                    "pipeline": [{"$project": {"_id": 0, "start_datetime": 1}}],
+                    "as": "bookings"
+                }
+            },
+            {
+                "$lookup": {
+                    "from": "spaces",
+                    "localField": "name",
+                    "foreignField": "materials.name",
+                    "pipeline": [{"$project": {"_id": 0, "name": 1}}],
+                    "as": "spaces"
+                }
+            },
+            {
+                "$addFields": {
+                    "total_bookings": {"$size": "$bookings"},
+                    "most_used_space": {
+                        "$arrayElemAt": ["$spaces.name", 0]
+                    },
+                    "last_usage_date": {
+                        "$max": "$bookings.start_datetime"
+                    }
+                }
+            },
+            {
+                "$project": {
+                    "material_id": {"$toString": "$_id"},
+                    "material_name": "$name",
+                    "total_bookings": 1,
+                    "most_used_space": 1,
+                    "last_usage_date": 1,
+                    "average_usage_per_month": {
+                        "$divide": ["$total_bookings", 12]  # Approssimazione
+                    }
+                }
+            }
+        ]
+
+        collection = await self.collection()
+        return await collection.aggregate(pipeline).to_list(None)
+
+
+materials_repository = MaterialsRepository()
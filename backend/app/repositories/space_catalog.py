@@ -0,0 +1,214 @@
+import asyncio
+import bisect
+import hashlib
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Callable, Set
+from pymongo.errors import OperationFailure, PyMongoError
+from ..config import settings
+from .base import BaseRepository
+
+
+def project(document: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """Proiezione di inclusione in memoria (campi di primo livello, _id sempre incluso)"""
+    if not projection:
+        return dict(document)
+    projected = {"_id": document["_id"]}
+    for field, include in projection.items():
+        field = field.split(".", 1)[0]
+        if include and field in document:
+            projected[field] = document[field]
+    return projected
+
+
+class SpaceCatalog(BaseRepository):
+    """
+    Copia in memoria della collection spaces con indici secondari per tipo,
+    capacità e nome materiale. Resta allineata tramite change stream MongoDB;
+    se il server non li supporta (standalone) ricarica periodicamente.
+    I documenti restituiti sono condivisi: i chiamanti non devono modificarli.
+    """
+
+    collection_name = "spaces"
+
+    def __init__(self):
+        self.enabled = settings.space_catalog_enabled
+        self.poll_interval = settings.space_catalog_poll_seconds
+
+        self.ready = False
+        self.version = 0
+        self.mode: Optional[str] = None  # "change_stream" oppure "polling"
+
+        self._spaces: Dict[str, Dict[str, Any]] = {}
+        self._by_type: Dict[str, Set[str]] = defaultdict(set)
+        self._by_material: Dict[str, Set[str]] = defaultdict(set)
+        self._by_capacity: List[tuple] = []
+        self._fingerprint: Optional[str] = None
+
+        self._listeners: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Registra una funzione chiamata a ogni modifica del catalogo"""
+        self._listeners.append(callback)
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        await self.reload()
+        self._task = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.ready = False
+
+    async def reload(self):
+        """Ricarica l'intera collection (piccola) e ricostruisce gli indici se è cambiata"""
+        collection = await self.collection()
+        spaces = await collection.find({}).sort("_id", 1).to_list(None)
+
+        digest = hashlib.sha1()
+        for space in spaces:
+            digest.update(repr(space).encode())
+        fingerprint = digest.hexdigest()
+        if fingerprint == self._fingerprint:
+            return
+
+        self._spaces = {str(space["_id"]): space for space in spaces}
+        self._fingerprint = fingerprint
+        self._rebuild_indexes()
+        self.ready = True
+        self._changed()
+        print(f"📚 Catalogo spazi caricato: {len(self._spaces)} spazi")
+
+    async def _watch(self):
+        resume_token = None
+        while True:
+            try:
+                collection = await self.collection()
+                async with collection.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                    # Il primo try_next avvia lo stream: da qui nessuna modifica va persa
+                    change = await stream.try_next()
+                    if resume_token is None:
+                        await self.reload()
+                    self.mode = "change_stream"
+                    while True:
+                        if change is not None:
+                            self._apply_change(change)
+                            resume_token = stream.resume_token
+                        change = await stream.next()
+
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # Change stream non disponibili (es. MongoDB standalone): polling
+                print(f"⚠️ Change stream spazi non disponibile ({e.code}), uso polling ogni {self.poll_interval}s")
+                await self._poll()
+                return
+            except PyMongoError as e:
+                print(f"⚠️ Change stream spazi interrotto: {e}")
+                resume_token = None
+                await asyncio.sleep(self.poll_interval)
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Errore ricarica catalogo spazi: {e}")
+
+    def _apply_change(self, change: Dict[str, Any]):
+        operation = change.get("operationType")
+        space_id = str(change.get("documentKey", {}).get("_id"))
+
+        if operation in ("insert", "update", "replace"):
+            document = change.get("fullDocument")
+            if document is None:
+                # Documento eliminato subito dopo la modifica
+                self._spaces.pop(space_id, None)
+            else:
+                self._spaces[space_id] = document
+        elif operation == "delete":
+            self._spaces.pop(space_id, None)
+        else:
+            # drop, rename, invalidate: lo stream si chiude e si ricarica tutto
+            return
+
+        self._fingerprint = None
+        self._rebuild_indexes()
+        self._changed()
+
+    def _rebuild_indexes(self):
+        by_type = defaultdict(set)
+        by_material = defaultdict(set)
+        by_capacity = []
+        for space_id, space in self._spaces.items():
+            if not space.get("is_active", True):
+                continue
+            by_type[space.get("type")].add(space_id)
+            for material in space.get("materials", []):
+                by_material[material.get("name")].add(space_id)
+            by_capacity.append((space.get("capacity", 0), space_id))
+
+        by_capacity.sort()
+        self._by_type, self._by_material, self._by_capacity = by_type, by_material, by_capacity
+
+    def _changed(self):
+        self.version += 1
+        self.written()
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Errore listener catalogo spazi: {e}")
+
+    def get(self, space_id: str) -> Optional[Dict[str, Any]]:
+        return self._spaces.get(str(space_id))
+
+    def items(self):
+        """Coppie (ID stringa, documento) di tutti gli spazi, anche non attivi"""
+        return self._spaces.items()
+
+    def list_active(self, space_type: Optional[str] = None, capacity_min: Optional[int] = None,
+                    materials: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Stessa semantica del filtro Mongo: tipo esatto, capacità minima, almeno un materiale"""
+        if space_type:
+            candidates = set(self._by_type.get(space_type, ()))
+        else:
+            candidates = {space_id for _, space_id in self._by_capacity}
+
+        if capacity_min:
+            start = bisect.bisect_left(self._by_capacity, (capacity_min, ""))
+            candidates &= {space_id for _, space_id in self._by_capacity[start:]}
+
+        if materials:
+            with_materials = set()
+            for name in materials:
+                with_materials |= self._by_material.get(name, set())
+            candidates &= with_materials
+
+        # Ordine per _id, come la collection
+        return [self._spaces[space_id] for space_id in sorted(candidates)]
+
+    def count_by_type(self) -> List[Dict[str, Any]]:
+        return [
+            {"type": space_type, "count": len(ids)}
+            for space_type, ids in sorted(self._by_type.items(), key=lambda item: str(item[0]))
+            if ids
+        ]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "mode": self.mode, "version": self.version, "spaces": len(self._spaces)}
+
+
+# Istanza globale del catalogo spazi
+space_catalog = SpaceCatalog()
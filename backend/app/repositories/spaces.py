@@ -0,0 +1,117 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+from pymongo import ReturnDocument
+from .base import BaseRepository
+from .space_catalog import space_catalog, project
+
+# Proiezioni per caso d'uso
+SPACE_NAME = {"name": 1}
+SPACE_SUMMARY = {"name": 1, "location": 1}
+SPACE_HOURS = {"name": 1, "available_hours": 1}
+SPACE_MATERIALS = {"name": 1, "materials": 1}
+# Campi usati da vincoli di prenotazione ed email di conferma
+SPACE_BOOKING = {"name": 1, "location": 1, "capacity": 1, "available_hours": 1, "booking_constraints": 1}
+# Campi di SpaceResponse
+SPACE_DETAIL = {
+    "name": 1, "type": 1, "capacity": 1, "materials": 1, "location": 1,
+    "description": 1, "available_hours": 1, "booking_constraints": 1
+}
+# Campi passati all'assistente AI (niente vincoli interni)
+SPACE_AI = {
+    "name": 1, "type": 1, "capacity": 1, "materials": 1, "location": 1,
+    "description": 1, "available_hours": 1
+}
+# Campi che, se cambiano, invalidano le risposte chat basate sul catalogo
+SPACE_CATALOG_FINGERPRINT = {"name": 1, "type": 1, "capacity": 1, "location": 1, "materials.name": 1, "is_active": 1}
+
+
+class SpacesRepository(BaseRepository):
+    """Letture servite dal catalogo in memoria quando è pronto, altrimenti da MongoDB"""
+
+    collection_name = "spaces"
+
+    def active_filter(self, space_type: Optional[str] = None, capacity_min: Optional[int] = None,
+                      materials: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Filtro degli spazi attivi, condiviso da listing, chat e ricerca AI"""
+        filter_query: Dict[str, Any] = {"is_active": True}
+        if space_type:
+            filter_query["type"] = space_type
+        if capacity_min:
+            filter_query["capacity"] = {"$gte": capacity_min}
+        if materials:
+            filter_query["materials.name"] = {"$in": materials}
+        return filter_query
+
+    async def get_by_id(self, space_id: Any, projection: Dict[str, int] = SPACE_DETAIL) -> Optional[Dict[str, Any]]:
+        object_id = self.object_id(space_id)
+        if space_catalog.ready:
+            space = space_catalog.get(str(object_id))
+            return project(space, projection) if space else None
+
+        collection = await self.collection()
+        return await collection.find_one({"_id": object_id}, projection)
+
+    async def get_many(self, ids: List[Any], projection: Optional[Dict[str, int]] = SPACE_DETAIL) -> Dict[str, Dict[str, Any]]:
+        if space_catalog.ready:
+            spaces = {}
+            for space_id in ids:
+                space = space_catalog.get(str(space_id))
+                if space:
+                    spaces[str(space_id)] = project(space, projection)
+            return spaces
+        return await super().get_many(ids, projection)
+
+    async def get_name(self, space_id: Any) -> Optional[str]:
+        space = await self.get_by_id(space_id, SPACE_NAME)
+        return space["name"] if space else None
+
+    async def list_active(self, space_type: Optional[str] = None, capacity_min: Optional[int] = None,
+                          materials: Optional[List[str]] = None, projection: Dict[str, int] = SPACE_DETAIL,
+                          limit: int = 0) -> List[Dict[str, Any]]:
+        if space_catalog.ready:
+            spaces = space_catalog.list_active(space_type, capacity_min, materials)
+            if limit:
+                spaces = spaces[:limit]
+            return [project(space, projection) for space in spaces]
+
+        collection = await self.collection()
+        cursor = collection.find(self.active_filter(space_type, capacity_min, materials), projection)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(None)
+
+    async def count_by_type(self) -> List[Dict[str, Any]]:
+        if space_catalog.ready:
+            return space_catalog.count_by_type()
+
+        collection = await self.collection()
+        pipeline = [
+            {"$match": {"is_active": True}},
+            {"$group": {"_id": "$type", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]
+        return [{"type": doc["_id"], "count": doc["count"]} async for doc in collection.aggregate(pipeline)]
+
+    async def list_all(self, projection: Dict[str, int] = SPACE_DETAIL) -> List[Dict[str, Any]]:
+        """Tutti gli spazi, anche non attivi"""
+        collection = await self.collection()
+        return await collection.find({}, projection).to_list(None)
+
+    async def update(self, space_id: Any, fields: Dict[str, Any],
+                     projection: Dict[str, int] = SPACE_DETAIL) -> Optional[Dict[str, Any]]:
+        """Aggiorna i campi indicati e restituisce lo spazio modificato (None se non esiste)"""
+        collection = await self.collection()
+        space = await collection.find_one_and_update(
+            {"_id": self.object_id(space_id)}, {"$set": {**fields, "updated_at": datetime.utcnow()}},
+            projection=projection, return_document=ReturnDocument.AFTER
+        )
+        if space is not None:
+            self.written()
+        return space
+
+    async def catalog_fingerprint_documents(self) -> List[Dict[str, Any]]:
+        collection = await self.collection()
+        return await collection.find({}, SPACE_CATALOG_FINGERPRINT).sort("_id", 1).to_list(None)
+
+
+spaces_repository = SpacesRepository()
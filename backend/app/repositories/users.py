@@ -0,0 +1,43 @@
+from typing import Dict, Any, Iterable, Optional
+from .base import BaseRepository
+
+# Utente autenticato: mai la password hashata fuori dal login
+USER_SESSION = {"email": 1, "full_name": 1, "role": 1}
+USER_CONTACT = {"email": 1, "full_name": 1}
+USER_CREDENTIALS = {"email": 1, "hashed_password": 1}
+
+
+class UsersRepository(BaseRepository):
+    collection_name = "users"
+    # Gli utenti si inseriscono soltanto: basta l'ultimo _id
+    watermark_sort = [("_id", -1)]
+
+    async def get_by_email(self, email: str, projection: Dict[str, int] = USER_SESSION) -> Optional[Dict[str, Any]]:
+        collection = await self.collection()
+        return await collection.find_one({"email": email}, projection)
+
+    async def get_by_id(self, user_id: Any, projection: Dict[str, int] = USER_CONTACT) -> Optional[Dict[str, Any]]:
+        collection = await self.collection()
+        return await collection.find_one({"_id": self.object_id(user_id)}, projection)
+
+    async def get_many_by_email(self, emails: Iterable[str], projection: Dict[str, int] = USER_CONTACT) -> Dict[str, Dict[str, Any]]:
+        """Utenti per email con una sola query $in, indicizzati per email"""
+        emails = list(set(emails))
+        if not emails:
+            return {}
+        collection = await self.collection()
+        cursor = collection.find({"email": {"$in": emails}}, projection)
+        return {user["email"]: user async for user in cursor}
+
+    async def email_exists(self, email: str) -> bool:
+        collection = await self.collection()
+        return await collection.find_one({"email": email}, {"_id": 1}) is not None
+
+    async def insert(self, user_data: Dict[str, Any]) -> str:
+        collection = await self.collection()
+        result = await collection.insert_one(user_data)
+        self.written()
+        return str(result.inserted_id)
+
+
+users_repository = UsersRepository()
@@ -0,0 +1,36 @@
+import secrets
+from collections import defaultdict
+from typing import Dict, Iterable
+
+
+class CollectionVersions:
+    """
+    Versioni in memoria delle collection, incrementate a ogni scrittura fatta
+    tramite i repository (spazi: a ogni modifica vista dal catalogo). Sono per
+    processo: non vedono le scritture di altre istanze dell'API né degli
+    script, quindi servono solo come segnale locale (es. invalidazione delle
+    cache in memoria, metriche). ETag e feed si validano con
+    BaseRepository.watermark / latest_change, letti dal database.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._versions: Dict[str, int] = defaultdict(int)
+
+    def bump(self, collection_name: str):
+        self._versions[collection_name] += 1
+
+    def get(self, collection_name: str) -> int:
+        return self._versions[collection_name]
+
+    def token(self, collection_names: Iterable[str]) -> str:
+        """Stringa che cambia quando cambia almeno una delle collection indicate"""
+        names = sorted(collection_names)
+        return self.epoch + "." + ".".join(f"{name}:{self._versions[name]}" for name in names)
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self._versions)
+
+
+# Istanza globale delle versioni delle collection
+collection_versions = CollectionVersions()
@@ -0,0 +1,48 @@
+"""
+Serializzazione JSON veloce per le risposte dell'API (orjson).
+
+datetime, UUID e dataclass sono gestiti nativamente da orjson; ObjectId,
+modelli Pydantic e set tramite la funzione default.
+"""
+
+from typing import Any, Optional
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Tipo non serializzabile in JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """Risposta JSON di default dell'applicazione"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def trusted_response(content: Any, response: Optional[Response] = None, status_code: int = 200) -> FastJSONResponse:
+    """
+    Serializza direttamente dati letti dalle nostre collection, senza
+    jsonable_encoder né response_model. Gli header già impostati sulla
+    risposta della route (es. ETag) vengono mantenuti.
+    """
+    result = FastJSONResponse(content, status_code=status_code)
+    if response is not None:
+        for name, value in response.headers.items():
+            if name != "content-length":
+                result.headers[name] = value
+    return result
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import JSONResponse
+from ..middleware.auth_middleware import get_current_user_required as get_current_user
+from ..services.slow_query_log import slow_query_log
+from ..services.request_coalescer import request_coalescer
+from ..services.etag_service import etag_service
+from ..services.space_snapshots import space_snapshots
+from ..services.timetable_import import timetable_import
+from ..services.calendar_feeds import calendar_feeds
+from ..services.caldav_sync import caldav_sync
+from ..models.space import SpaceUpdate
+
+router = APIRouter()
+
+def require_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    """Consente l'accesso solo agli amministratori"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Solo gli amministratori possono accedere a questa risorsa")
+    return current_user
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=100, description="Numero massimo di forme di query"),
+    since_hours: int = Query(24, ge=1, le=24 * 30, description="Finestra temporale in ore"),
+    current_user: dict = Depends(require_admin)
+):
+    """Forme di query lente ordinate per tempo totale, con l'ultimo explain registrato"""
+    return {
+        "offenders": await slow_query_log.top_offenders(limit, since_hours),
+        "metrics": slow_query_log.get_metrics()
+    }
+
+@router.get("/coalescing")
+async def get_coalescing_metrics(current_user: dict = Depends(require_admin)):
+    """Calcoli condivisi tra richieste identiche e hit della cache breve"""
+    return request_coalescer.get_metrics()
+
+@router.get("/etags")
+async def get_etag_metrics(current_user: dict = Depends(require_admin)):
+    """Risposte 304 servite e versioni correnti delle collection"""
+    return etag_service.get_metrics()
+
+@router.get("/space-snapshots")
+async def get_space_snapshot_metrics(current_user: dict = Depends(require_admin)):
+    """Propagazione degli snapshot spazio e letture di spaces per prenotazioni ancora senza snapshot"""
+    return space_snapshots.get_metrics()
+
+@router.patch("/spaces/{space_id}")
+async def update_space(space_id: str, update: SpaceUpdate, current_user: dict = Depends(require_admin)):
+    """Modifica uno spazio; nome e posizione si aggiornano subito anche su prenotazioni e serie"""
+    fields = update.model_dump(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nessun campo da aggiornare")
+    try:
+        space = await space_snapshots.update_space(space_id, fields)
+    except Exception:
+        raise HTTPException(status_code=400, detail="ID spazio non valido")
+    if space is None:
+        raise HTTPException(status_code=404, detail="Spazio non trovato")
+    return {"id": str(space.pop("_id")), **space}
+
+@router.get("/ics-feeds")
+async def get_ics_feed_metrics(current_user: dict = Depends(require_admin)):
+    """Feed ICS serviti dalla memoria dopo la verifica della versione, ricostruiti o risposti con 304"""
+    return calendar_feeds.get_metrics()
+
+@router.get("/caldav-sync")
+async def get_caldav_sync_metrics(current_user: dict = Depends(require_admin)):
+    """Eventi inviati al server CalDAV, invariati, ripristinati dopo modifiche remote e retry"""
+    return caldav_sync.get_metrics()
+
+@router.post("/caldav-sync")
+async def run_caldav_sync(current_user: dict = Depends(require_admin)):
+    """Esegue subito un passaggio di sincronizzazione CalDAV"""
+    try:
+        result = await caldav_sync.run_once()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Server CalDAV non raggiungibile: {e}")
+    if "error" in result:
+        raise HTTPException(status_code=503, detail=result["error"])
+    return result
+
+@router.post("/timetable-import")
+async def import_timetable(
+    file: UploadFile = File(..., description="Orario in formato CSV o ICS"),
+    dry_run: bool = Query(False, description="Solo validazione, senza creare prenotazioni"),
+    current_user: dict = Depends(require_admin)
+):
+    """Import dell'orario semestrale: righe valide create in blocco, errori per riga; 207 col resoconto se l'inserimento fallisce"""
+    result = await timetable_import.run(file.file, file.filename or "", dry_run)
+    if "insert_error" in result:
+        return JSONResponse(status_code=207, content=result)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from bson import ObjectId
-from ..database import get_database
+from ..repositories import users_repository
+from ..repositories.users import USER_CREDENTIALS
 from ..models.user import UserCreate, UserLogin, UserResponse
 from ..services.auth_service import (
     get_password_hash, 
@@ -18,8 +19,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     token = credentials.credentials
     email = verify_token(token)
     
-    db = await get_database()
-    user = await db.users.find_one({"email": email})
+    user = await users_repository.get_by_email(email)
     
     if user is None:
         raise HTTPException(
@@ -31,11 +31,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 @router.post("/register", response_model=dict)
 async def register(user: UserCreate):
-    db = await get_database()
-    
     # Verifica se l'utente esiste già
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
+    if await users_repository.email_exists(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -51,7 +48,7 @@ async def register(user: UserCreate):
         "created_at": user.created_at if hasattr(user, 'created_at') else None
     }
     
-    result = await db.users.insert_one(user_data)
+    user_id = await users_repository.insert(user_data)
     
     # ✅ INVIA EMAIL DI BENVENUTO DA classrent2025@gmail.com
     try:
@@ -69,16 +66,14 @@ async def register(user: UserCreate):
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user_id": str(result.inserted_id),
+        "user_id": user_id,
         "message": f"Registrazione completata! Email di benvenuto inviata a {user.email}"
     }
 
 @router.post("/login", response_model=dict)
 async def login(user: UserLogin):
-    db = await get_database()
-    
     # Verifica utente
-    db_user = await db.users.find_one({"email": user.email})
+    db_user = await users_repository.get_by_email(user.email, USER_CREDENTIALS)
     if not db_user or not verify_password(user.password, db_user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from datetime import datetime, timedelta
 from bson import ObjectId
-from ..models.booking import BookingCreate, BookingUpdate, BookingResponse
+from ..models.booking import BookingCreate, BookingSeriesCreate, BookingUpdate, BookingResponse, BookingStatus
 from ..services.booking_service import booking_service
+from ..services.booking_series_service import booking_series_service
+from ..responses import trusted_response
 from ..middleware.auth_middleware import get_current_user_required as get_current_user  # ✅ CORRETTO
 
 router = APIRouter()
@@ -19,11 +22,101 @@ async def create_booking(
     )
     return result
 
-@router.get("/", response_model=List[BookingResponse])
+@router.get("/search")
+async def search_bookings(
+    space_id: Optional[str] = Query(None, description="Filtra per spazio"),
+    user_id: Optional[str] = Query(None, description="Filtra per utente (solo amministratori)"),
+    status: Optional[str] = Query(None, description="Stati separati da virgola (pending, confirmed, cancelled, completed)"),
+    date_from: Optional[str] = Query(None, description="Inizio dal giorno YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="Inizio fino al giorno YYYY-MM-DD incluso"),
+    material: Optional[str] = Query(None, description="Materiale richiesto"),
+    cursor: Optional[str] = Query(None, description="next_cursor della pagina precedente"),
+    limit: int = Query(50, ge=1, le=200, description="Righe per pagina"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="Ordine per data di inizio"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Ricerca prenotazioni con paginazione a cursore. Gli utenti vedono solo
+    le proprie prenotazioni; gli amministratori quelle di tutti.
+    """
+    if current_user.get("role") != "admin":
+        if user_id and user_id != str(current_user["_id"]):
+            raise HTTPException(status_code=403, detail="Puoi cercare solo le tue prenotazioni")
+        user_id = str(current_user["_id"])
+    
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    valid_statuses = {s.value for s in BookingStatus}
+    if statuses and not set(statuses) <= valid_statuses:
+        raise HTTPException(status_code=400, detail=f"Stato non valido. Valori ammessi: {', '.join(sorted(valid_statuses))}")
+    
+    try:
+        start_from = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        start_to = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1) if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato data non valido. Usa YYYY-MM-DD")
+    
+    result = await booking_service.search_bookings(
+        user_id=user_id,
+        space_id=space_id,
+        statuses=statuses,
+        start_from=start_from,
+        start_to=start_to,
+        material=material,
+        cursor=cursor,
+        limit=limit,
+        sort_direction=1 if order == "asc" else -1
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return trusted_response(result)
+
+@router.post("/series", response_model=dict)
+async def create_booking_series(
+    series: BookingSeriesCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Crea una prenotazione ricorrente (regola RRULE con COUNT o UNTIL)"""
+    result = await booking_series_service.create_series(series.dict(), str(current_user["_id"]))
+    if "conflicts" in result:
+        raise HTTPException(status_code=409, detail=result)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/series")
+async def get_my_booking_series(current_user: dict = Depends(get_current_user)):
+    """Prenotazioni ricorrenti dell'utente con la prossima occorrenza"""
+    return trusted_response(await booking_series_service.list_user_series(str(current_user["_id"])))
+
+@router.delete("/series/{series_id}", response_model=dict)
+async def cancel_booking_series(
+    series_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Annulla tutte le occorrenze di una serie"""
+    result = await booking_series_service.cancel_series(series_id, str(current_user["_id"]))
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@router.delete("/series/{series_id}/occurrences/{occurrence}", response_model=dict)
+async def skip_series_occurrence(
+    series_id: str,
+    occurrence: datetime,
+    current_user: dict = Depends(get_current_user)
+):
+    """Annulla una sola occorrenza (inizio in formato ISO)"""
+    result = await booking_series_service.skip_occurrence(series_id, str(current_user["_id"]), occurrence)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/", response_model=List[BookingResponse], deprecated=True)
 async def get_my_bookings(current_user: dict = Depends(get_current_user)):  # ✅ CORRETTO
-    """Recupera le prenotazioni dell'utente corrente"""
+    """Recupera le prenotazioni dell'utente corrente (tutte: preferire /bookings/search)"""
     bookings = await booking_service.get_user_bookings(str(current_user["_id"]))
-    return bookings
+    return trusted_response(bookings)
 
 @router.put("/{booking_id}", response_model=dict)
 async def update_booking(
@@ -51,8 +144,8 @@ async def cancel_booking(
     )
     return result
 
-@router.get("/history", response_model=List[BookingResponse])
+@router.get("/history", response_model=List[BookingResponse], deprecated=True)
 async def get_booking_history(current_user: dict = Depends(get_current_user)):  # ✅ CORRETTO
     """Recupera lo storico completo delle prenotazioni"""
     bookings = await booking_service.get_user_bookings(str(current_user["_id"]))
-    return bookings
\ No newline at end of file
+    return trusted_response(bookings)
\ No newline at end of file
@@ -1,15 +1,83 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
-from bson import ObjectId
-from ..database import get_database
+from ..config import settings
+from ..repositories import bookings_repository, spaces_repository, spaces_loader, users_loader
+from ..repositories.changes import encode_watermark, decode_watermark
+from ..repositories.bookings import BOOKING_SUMMARY
+from ..repositories.spaces import SPACE_SUMMARY
 from ..middleware.auth_middleware import get_current_user_required as get_current_user  # ✅ CORRETTO
 from ..services.database_calendar_service import database_calendar_service  # ✅ MONGODB CALENDAR
+from ..services.request_coalescer import request_coalescer
+from ..services.calendar_live import calendar_live
+from ..services.etag_service import etag_service
+from ..services.space_snapshots import space_snapshots
+from ..services.calendar_feeds import calendar_feeds, feed_token, valid_feed_token
+from ..responses import trusted_response
 
 router = APIRouter()
 
+async def _calendar_rows(events: List[Dict[str, Any]], current_user: dict) -> List[Dict[str, Any]]:
+    """Eventi calendario nel formato del frontend, con utente e privacy per l'utente corrente"""
+    # Utenti delle prenotazioni: una query $in invece di una per evento
+    users_loader.prefetch(event["user_id"] for event in events if event.get("user_id"))
+    
+    # Trasforma eventi calendario in formato compatibile con frontend
+    calendar_bookings = []
+    for event in events:
+        # Eventi di sistema attivi confermati; gli annullati compaiono solo nella sincronizzazione delta
+        status = event.get("status", "active")
+        booking_data = {
+            "id": event.get("booking_id") or event["id"],
+            "space_id": event["space_id"],
+            "space_name": event["space_name"],
+            "space_location": event["location"],
+            "user_id": event.get("created_by_email", "sistema"),
+            "user_name": "Utente Sistema",  # Placeholder
+            "user_role": "student",
+            "start_datetime": event["start_datetime"],
+            "end_datetime": event["end_datetime"],
+            "purpose": event["purpose"],
+            "status": "confirmed" if status == "active" else status,
+            "materials_requested": event.get("materials_requested", []),
+            "notes": event.get("notes", ""),
+            "created_at": event.get("start_datetime", datetime.utcnow()),
+            "is_own_booking": False  # Privacy: solo info pubbliche
+        }
+        if event.get("series_id"):
+            booking_data["series_id"] = event["series_id"]
+        
+        # Evento derivato da una prenotazione: dettagli utente dal database
+        if event.get("user_id"):
+            try:
+                user = await users_loader.load(event["user_id"])
+                if user:
+                    booking_data.update({
+                        "user_id": event["user_id"],
+                        "user_name": user["full_name"],
+                        "user_role": user.get("role", "student"),
+                        "is_own_booking": str(event["user_id"]) == str(current_user["_id"])
+                    })
+                    
+                    # Privacy: nascondi dettagli se non è la propria prenotazione
+                    if not booking_data["is_own_booking"]:
+                        booking_data["notes"] = ""
+                        if len(booking_data["purpose"]) > 50:
+                            booking_data["purpose"] = booking_data["purpose"][:50] + "..."
+                            
+            except Exception as e:
+                print(f"⚠️ Errore recupero dettagli booking {event.get('booking_id')}: {e}")
+        
+        calendar_bookings.append(booking_data)
+    
+    return calendar_bookings
+
 @router.get("/bookings", response_model=List[Dict])
 async def get_calendar_bookings(
+    request: Request,
+    response: Response,
     start_date: str = Query(..., description="Data inizio in formato YYYY-MM-DD"),
     end_date: str = Query(..., description="Data fine in formato YYYY-MM-DD"),
     space_id: Optional[str] = Query(None, description="Filtra per spazio specifico"),
@@ -19,6 +87,13 @@ async def get_calendar_bookings(
     Recupera tutte le prenotazioni per il calendario condiviso MongoDB
     Visibile a tutti gli utenti dell'applicazione
     """
+    # Risposta per utente (is_own_booking, privacy): ETag distinto per utente
+    not_modified = await etag_service.check(
+        request, response, ["bookings", "booking_series", "calendar_events", "spaces", "users"], f"user:{current_user['_id']}"
+    )
+    if not_modified:
+        return not_modified
+    
     try:
         # Converte le date
         start_dt = datetime.strptime(start_date, "%Y-%m-%d")
@@ -29,62 +104,83 @@ async def get_calendar_bookings(
             start_dt, end_dt, space_id
         )
         
-        # Trasforma eventi calendario in formato compatibile con frontend
-        calendar_bookings = []
-        for event in events:
-            # Recupera dettagli dall'evento calendario
-            booking_data = {
-                "id": event.get("booking_id", event["id"]),
-                "space_id": event["space_id"],
-                "space_name": event["space_name"],
-                "space_location": event["location"],
-                "user_id": event.get("created_by_email", "sistema"),
-                "user_name": "Utente Sistema",  # Placeholder
-                "user_role": "student",
-                "start_datetime": event["start_datetime"].isoformat(),
-                "end_datetime": event["end_datetime"].isoformat(),
-                "purpose": event["purpose"],
-                "status": "confirmed",  # Eventi nel calendario MongoDB sono sempre confermati
-                "materials_requested": event.get("materials_requested", []),
-                "notes": event.get("notes", ""),
-                "created_at": event.get("start_datetime", datetime.utcnow()).isoformat(),
-                "is_own_booking": False  # Privacy: solo info pubbliche
-            }
-            
-            # Se c'è un booking_id, recupera dettagli utente dal database
-            if event.get("booking_id"):
-                try:
-                    db = await get_database()
-                    booking = await db.bookings.find_one({"_id": ObjectId(event["booking_id"])})
-                    if booking:
-                        user = await db.users.find_one({"_id": ObjectId(booking["user_id"])})
-                        if user:
-                            booking_data.update({
-                                "user_id": booking["user_id"],
-                                "user_name": user["full_name"],
-                                "user_role": user.get("role", "student"),
-                                "status": booking["status"],
-                                "is_own_booking": str(booking["user_id"]) == str(current_user["_id"])
-                            })
-                            
-                            # Privacy: nascondi dettagli se non è la propria prenotazione
-                            if not booking_data["is_own_booking"]:
-                                booking_data["notes"] = ""
-                                if len(booking_data["purpose"]) > 50:
-                                    booking_data["purpose"] = booking_data["purpose"][:50] + "..."
-                                    
-                except Exception as e:
-                    print(f"⚠️ Errore recupero dettagli booking {event.get('booking_id')}: {e}")
-            
-            calendar_bookings.append(booking_data)
+        calendar_bookings = await _calendar_rows(events, current_user)
         
-        return calendar_bookings
+        # Dati dal nostro DB: datetime serializzati da orjson, senza passare da jsonable_encoder
+        return trusted_response(calendar_bookings, response)
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail="Formato data non valido. Usa YYYY-MM-DD")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nel recupero prenotazioni: {str(e)}")
 
+@router.get("/changes")
+async def get_calendar_changes(
+    since: Optional[str] = Query(None, description="Token restituito dal pull precedente (assente = sincronizzazione completa)"),
+    start_date: Optional[str] = Query(None, description="Solo eventi che iniziano da questa data (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Solo eventi che iniziano entro questa data (YYYY-MM-DD)"),
+    space_id: Optional[str] = Query(None, description="Filtra per spazio specifico"),
+    limit: int = Query(settings.calendar_changes_page_size, ge=1, le=2000, description="Modifiche per pagina"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Sincronizzazione delta per i client senza connessione live: eventi
+    creati, modificati o annullati dopo il token, nello stesso formato di
+    /calendar/bookings (gli annullati con status "cancelled", come quelli
+    spostati fuori da intervallo o spazio; un annullamento con id uguale a
+    series_id rimuove tutte le occorrenze della serie). Il client
+    conserva la copia locale e ripete la richiesta con next_token;
+    has_more indica che ci sono altre pagine da scaricare subito.
+    """
+    try:
+        after = decode_watermark(since) if since else {}
+        start_dt = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Token o formato data non validi (date in formato YYYY-MM-DD)")
+    
+    settled_before = datetime.utcnow() - timedelta(seconds=settings.calendar_changes_settle_seconds)
+    try:
+        events, marks, has_more = await database_calendar_service.get_changes(
+            after, settled_before, start_dt, end_dt, space_id, limit
+        )
+        changes = await _calendar_rows(events, current_user)
+        
+        return trusted_response({
+            "changes": changes,
+            "next_token": encode_watermark(marks) if marks else None,
+            "has_more": has_more
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore nella sincronizzazione calendario: {str(e)}")
+
+@router.get("/live")
+async def live_calendar(
+    request: Request,
+    start_date: str = Query(..., description="Data inizio in formato YYYY-MM-DD"),
+    end_date: str = Query(..., description="Data fine in formato YYYY-MM-DD"),
+    space_id: Optional[str] = Query(None, description="Spazi da seguire, separati da virgola"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-Sent Events con le modifiche del calendario nell'intervallo e
+    negli spazi visualizzati. Eventi: change (delta), resync (ricaricare
+    l'intervallo), unavailable (usare il polling); heartbeat come commenti.
+    """
+    try:
+        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato data non valido. Usa YYYY-MM-DD")
+    
+    space_ids = {s.strip() for s in space_id.split(",") if s.strip()} if space_id else None
+    
+    return StreamingResponse(
+        calendar_live.stream(space_ids, start_dt, end_dt, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/availability/{space_id}")
 async def get_space_availability(
     space_id: str,
@@ -113,6 +209,86 @@ async def get_space_availability(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nella verifica disponibilità: {str(e)}")
 
+async def _calendar_stats_summary() -> Dict[str, Any]:
+    """Conteggi e spazi più usati: uguali per tutti gli utenti"""
+    now = datetime.now()
+    today_start = datetime.combine(now.date(), datetime.min.time())
+    today_end = datetime.combine(now.date(), datetime.max.time())
+    week_start = today_start - timedelta(days=now.weekday())
+    week_end = week_start + timedelta(days=7)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    
+    # ✅ STATISTICHE DAL CALENDARIO MONGODB
+    today_events = await database_calendar_service.get_calendar_events(
+        today_start, today_end
+    )
+    
+    week_events = await database_calendar_service.get_calendar_events(
+        week_start, week_end
+    )
+    
+    month_events = await database_calendar_service.get_calendar_events(
+        month_start, next_month
+    )
+    
+    # Conta per tipo di evento
+    today_bookings = len([e for e in today_events if e.get("event_type") == "booking"])
+    week_bookings = len([e for e in week_events if e.get("event_type") == "booking"])
+    month_bookings = len([e for e in month_events if e.get("event_type") == "booking"])
+    
+    # Spazi più utilizzati questo mese
+    space_usage = {}
+    for event in month_events:
+        if event.get("event_type") == "booking" and event.get("space_id"):
+            space_id = event["space_id"]
+            space_usage[space_id] = space_usage.get(space_id, 0) + 1
+    
+    # Trasforma in lista ordinata
+    popular_spaces = []
+    top_spaces = sorted(space_usage.items(), key=lambda x: x[1], reverse=True)[:5]
+    spaces_loader.prefetch(space_id for space_id, _ in top_spaces)
+    for space_id, count in top_spaces:
+        try:
+            space = await spaces_loader.load(space_id)
+            space_name = space.get("name") if space else None
+            if space_name:
+                popular_spaces.append({
+                    "space_id": space_id,
+                    "space_name": space_name,
+                    "booking_count": count
+                })
+        except:
+            continue
+    
+    return {
+        "today_bookings": today_bookings,
+        "week_bookings": week_bookings,
+        "month_bookings": month_bookings,
+        "popular_spaces": popular_spaces,
+        "last_updated": now.isoformat()
+    }
+
+async def _user_next_bookings(user_id: str) -> List[Dict[str, Any]]:
+    """Prossime prenotazioni dell'utente corrente"""
+    user_next_bookings = []
+    try:
+        user_bookings = await bookings_repository.list_for_user(
+            user_id, "upcoming", sort_direction=1, limit=3, projection=BOOKING_SUMMARY
+        )
+        
+        spaces = await space_snapshots.resolve(user_bookings)
+        for booking, space in zip(user_bookings, spaces):
+            user_next_bookings.append({
+                "id": str(booking["_id"]),
+                "space_name": (space or {}).get("name") or "Spazio eliminato",
+                "start_datetime": booking["start_datetime"].isoformat(),
+                "purpose": booking["purpose"]
+            })
+    except Exception as e:
+        print(f"⚠️ Errore recupero prossime prenotazioni utente: {e}")
+    return user_next_bookings
+
 @router.get("/stats")
 async def get_calendar_stats(
     current_user: dict = Depends(get_current_user)  # ✅ CORRETTO
@@ -121,82 +297,18 @@ async def get_calendar_stats(
     Statistiche del calendario per dashboard (da MongoDB)
     """
     try:
-        db = await get_database()
-        
-        now = datetime.now()
-        today_start = datetime.combine(now.date(), datetime.min.time())
-        today_end = datetime.combine(now.date(), datetime.max.time())
-        week_start = today_start - timedelta(days=now.weekday())
-        week_end = week_start + timedelta(days=7)
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        next_month = (month_start + timedelta(days=32)).replace(day=1)
-        
-        # ✅ STATISTICHE DAL CALENDARIO MONGODB
-        today_events = await database_calendar_service.get_calendar_events(
-            today_start, today_end
-        )
+        user_id = str(current_user["_id"])
         
-        week_events = await database_calendar_service.get_calendar_events(
-            week_start, week_end
+        # Al caricamento della dashboard molte richieste arrivano insieme:
+        # la parte comune è calcolata una volta sola, quella personale una volta per utente
+        summary, user_next_bookings = await asyncio.gather(
+            request_coalescer.run("calendar.stats", None, "authenticated", _calendar_stats_summary),
+            request_coalescer.run("calendar.stats.user", None, f"user:{user_id}", lambda: _user_next_bookings(user_id), ttl=0)
         )
         
-        month_events = await database_calendar_service.get_calendar_events(
-            month_start, next_month
-        )
-        
-        # Conta per tipo di evento
-        today_bookings = len([e for e in today_events if e.get("event_type") == "booking"])
-        week_bookings = len([e for e in week_events if e.get("event_type") == "booking"])
-        month_bookings = len([e for e in month_events if e.get("event_type") == "booking"])
-        
-        # Spazi più utilizzati questo mese
-        space_usage = {}
-        for event in month_events:
-            if event.get("event_type") == "booking" and event.get("space_id"):
-                space_id = event["space_id"]
-                space_usage[space_id] = space_usage.get(space_id, 0) + 1
-        
-        # Trasforma in lista ordinata
-        popular_spaces = []
-        for space_id, count in sorted(space_usage.items(), key=lambda x: x[1], reverse=True)[:5]:
-            try:
-                space = await db.spaces.find_one({"_id": ObjectId(space_id)})
-                if space:
-                    popular_spaces.append({
-                        "space_id": space_id,
-                        "space_name": space["name"],
-                        "booking_count": count
-                    })
-            except:
-                continue
-        
-        # Prossime prenotazioni per l'utente corrente
-        user_next_bookings = []
-        try:
-            user_bookings = await db.bookings.find({
-                "user_id": str(current_user["_id"]),
-                "start_datetime": {"$gte": now},
-                "status": {"$in": ["confirmed", "pending"]}
-            }).sort("start_datetime", 1).limit(3).to_list(3)
-            
-            for booking in user_bookings:
-                space = await db.spaces.find_one({"_id": ObjectId(booking["space_id"])})
-                user_next_bookings.append({
-                    "id": str(booking["_id"]),
-                    "space_name": space["name"] if space else "Spazio eliminato",
-                    "start_datetime": booking["start_datetime"].isoformat(),
-                    "purpose": booking["purpose"]
-                })
-        except Exception as e:
-            print(f"⚠️ Errore recupero prossime prenotazioni utente: {e}")
-        
         return {
-            "today_bookings": today_bookings,
-            "week_bookings": week_bookings,
-            "month_bookings": month_bookings,
-            "popular_spaces": popular_spaces,
+            **summary,
             "user_next_bookings": user_next_bookings,
-            "last_updated": now.isoformat(),
             "calendar_source": "MongoDB Database"  # ✅ Indica che usa MongoDB
         }
         
@@ -223,8 +335,7 @@ async def check_bulk_availability(
         results = []
         
         for space_id in space_ids:
-            db = await get_database()
-            space = await db.spaces.find_one({"_id": ObjectId(space_id)})
+            space = await spaces_repository.get_by_id(space_id, SPACE_SUMMARY)
             if not space:
                 continue
                 
@@ -330,4 +441,53 @@ async def add_system_event(
     except ValueError as e:
         raise HTTPException(status_code=400, detail="Formato datetime non valido")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Errore nell'aggiunta evento sistema: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Errore nell'aggiunta evento sistema: {str(e)}")
+
+@router.get("/feeds")
+async def get_calendar_feed_urls(
+    request: Request,
+    space_id: Optional[str] = Query(None, description="Aggiunge l'URL del feed di questo spazio"),
+    current_user: dict = Depends(get_current_user)
+):
+    """URL da aggiungere all'app calendario: feed personale e, se richiesto, feed di uno spazio"""
+    base_url = str(request.base_url).rstrip("/") + "/calendar"
+    user_id = str(current_user["_id"])
+    feeds = {"user": f"{base_url}/users/{user_id}.ics?token={feed_token('user', user_id)}"}
+    if space_id:
+        feeds["space"] = f"{base_url}/{space_id}.ics?token={feed_token('space', space_id)}"
+    return feeds
+
+async def _ics_response(request: Request, kind: str, key: str, token: Optional[str]) -> Response:
+    """Feed dalla cache; 304 se l'app ha già l'ultima versione"""
+    if not valid_feed_token(kind, key, token):
+        raise HTTPException(status_code=403, detail="Token del feed non valido")
+    
+    feed = await calendar_feeds.get_feed(kind, key)
+    if not feed:
+        raise HTTPException(status_code=404, detail="Calendario non trovato")
+    
+    headers = {"ETag": feed["etag"], "Cache-Control": "private, no-cache"}
+    if etag_service.matches(request.headers.get("if-none-match"), feed["etag"]):
+        calendar_feeds.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(content=feed["body"], media_type="text/calendar", headers=headers)
+
+# Feed ICS senza autenticazione Bearer (token firmato nell'URL): dichiarati per ultimi,
+# così "/{space_id}.ics" non si confonde con le altre route del calendario
+@router.get("/users/{user_id}.ics")
+async def get_user_ics_feed(
+    user_id: str,
+    request: Request,
+    token: Optional[str] = Query(None, description="Token del feed restituito da /calendar/feeds")
+):
+    """Prenotazioni e serie di un utente in formato iCalendar"""
+    return await _ics_response(request, "user", user_id, token)
+
+@router.get("/{space_id}.ics")
+async def get_space_ics_feed(
+    space_id: str,
+    request: Request,
+    token: Optional[str] = Query(None, description="Token del feed restituito da /calendar/feeds")
+):
+    """Occupazione di uno spazio in formato iCalendar (solo informazioni pubbliche)"""
+    return await _ics_response(request, "space", space_id, token)
@@ -2,8 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from ..services.openai_agent_service import ai_agent_service
+from ..services.chat_response_cache import chat_response_cache
+from ..services.ai_run_governor import ai_run_governor
+from ..services.tool_output_encoder import tool_output_encoder
 from ..services.booking_service import booking_service
-from ..database import get_database
+from ..repositories import spaces_repository
+from ..repositories.spaces import SPACE_AI
 from .auth import get_current_user
 
 router = APIRouter()
@@ -28,11 +32,12 @@ async def chat_with_ai(
     
     try:
         # Prepara il contesto per l'AI
+        # Identità e ruolo dal token: il contesto del client non può sovrascriverli
         context = {
+            **chat_message.context,
             "user_id": str(current_user["_id"]),
             "user_name": current_user["full_name"],
-            "user_role": current_user.get("role", "student"),
-            **chat_message.context
+            "user_role": current_user.get("role", "student")
         }
         
         # Processa il messaggio tramite l'AI Agent
@@ -76,7 +81,6 @@ async def _enrich_response_data(ai_response: Dict, current_user: dict):
     
     if action == "booking_suggestion" or "spaces" in data:
         # Aggiungi informazioni dettagliate sugli spazi
-        db = await get_database()
         if "spaces" in data:
             for space in data["spaces"]:
                 # Verifica disponibilità in tempo reale se necessario
@@ -103,10 +107,8 @@ async def _enrich_response_data(ai_response: Dict, current_user: dict):
 @router.get("/spaces", response_model=List[Dict])
 async def get_available_spaces():
     """Recupera tutti gli spazi disponibili per l'AI"""
-    db = await get_database()
-    
     spaces = []
-    async for space in db.spaces.find({"is_active": True}):
+    for space in await spaces_repository.list_active(projection=SPACE_AI):
         spaces.append({
             "id": str(space["_id"]),
             "name": space["name"],
@@ -120,6 +122,15 @@ async def get_available_spaces():
     
     return spaces
 
+@router.get("/metrics")
+async def get_chat_metrics(current_user: dict = Depends(get_current_user)):
+    """Metriche della pipeline chat (cache risposte, run OpenAI, tool output)"""
+    return {
+        "response_cache": chat_response_cache.get_metrics(),
+        "run_governor": ai_run_governor.get_metrics(),
+        "tool_outputs": tool_output_encoder.get_metrics()
+    }
+
 @router.post("/confirm-booking", response_model=Dict)
 async def confirm_ai_booking(
     booking_data: Dict[str, Any],
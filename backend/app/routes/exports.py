@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import datetime, timedelta
+from ..repositories.bookings import decode_cursor, search_filter
+from ..models.booking import BookingStatus
+from ..services.export_service import (
+    export_service, parse_occupancy_cursor, BOOKING_COLUMNS, OCCUPANCY_COLUMNS
+)
+from .admin import require_admin
+
+router = APIRouter()
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def parse_range(date_from: Optional[str], date_to: Optional[str]):
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        end = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1) if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato data non valido. Usa YYYY-MM-DD")
+    return start, end
+
+def streaming_export(batches, columns, export_format: str, name: str) -> StreamingResponse:
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return StreamingResponse(
+        export_service.encode(batches, columns, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
+@router.get("/bookings")
+async def export_bookings(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv oppure ndjson"),
+    date_from: Optional[str] = Query(None, description="Inizio dal giorno YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="Inizio fino al giorno YYYY-MM-DD incluso"),
+    space_id: Optional[str] = Query(None, description="Filtra per spazio"),
+    status: Optional[str] = Query(None, description="Stati separati da virgola"),
+    cursor: Optional[str] = Query(None, description="resume_cursor dell'ultima riga ricevuta"),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Export in streaming delle prenotazioni con nomi di spazio e utente. Le
+    occorrenze delle serie ricorrenti non sono prenotazioni e non compaiono:
+    l'export dell'occupazione invece le include.
+    """
+    start, end = parse_range(date_from, date_to)
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    if statuses and not set(statuses) <= {s.value for s in BookingStatus}:
+        raise HTTPException(status_code=400, detail="Stato non valido")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filter_query = search_filter(space_id=space_id, statuses=statuses, start_from=start, start_to=end)
+    return streaming_export(
+        export_service.booking_batches(filter_query, after), BOOKING_COLUMNS, format, "prenotazioni"
+    )
+
+@router.get("/occupancy")
+async def export_occupancy(
+    date_from: str = Query(..., description="Dal giorno YYYY-MM-DD"),
+    date_to: str = Query(..., description="Al giorno YYYY-MM-DD incluso"),
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="csv oppure ndjson"),
+    space_id: Optional[str] = Query(None, description="Filtra per spazio"),
+    cursor: Optional[str] = Query(None, description="resume_cursor dell'ultima riga ricevuta"),
+    current_user: dict = Depends(require_admin)
+):
+    """Export in streaming dell'occupazione giornaliera per spazio, occorrenze delle serie comprese"""
+    start, end = parse_range(date_from, date_to)
+    try:
+        after = parse_occupancy_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return streaming_export(
+        export_service.occupancy_batches(start, end, space_id, after), OCCUPANCY_COLUMNS, format, "occupazione"
+    )
@@ -1,45 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List, Optional
-from bson import ObjectId
 from datetime import datetime, timedelta
-from ..database import get_database
+from ..repositories import bookings_repository, spaces_repository
+from ..repositories.spaces import SPACE_HOURS, SPACE_MATERIALS
 from ..models.space import SpaceResponse
+from ..models.trusted import trusted_rows
+from ..responses import trusted_response
+from ..services.request_coalescer import request_coalescer
+from ..services.etag_service import etag_service
+from ..services.booking_series_service import booking_series_service
 from .auth import get_current_user
 
 router = APIRouter()
 
 @router.get("/", response_model=List[SpaceResponse])
 async def get_all_spaces(
+    request: Request,
+    response: Response,
     space_type: Optional[str] = Query(None, description="Filtra per tipo di spazio"),
     capacity_min: Optional[int] = Query(None, description="Capacità minima"),
     materials: Optional[str] = Query(None, description="Materiali richiesti (separati da virgola)"),
     current_user: dict = Depends(get_current_user)
 ):
     """Recupera tutti gli spazi disponibili con filtri opzionali"""
-    db = await get_database()
+    not_modified = await etag_service.check(request, response, ["spaces"], "authenticated")
+    if not_modified:
+        return not_modified
     
-    # Costruisci query di filtro
-    filter_query = {"is_active": True}
+    material_list = [m.strip() for m in materials.split(",")] if materials else None
     
-    if space_type:
-        filter_query["type"] = space_type
+    async def build_spaces():
+        # Documenti validati in scrittura: righe costruite senza rivalidazione
+        return trusted_rows(SpaceResponse, await spaces_repository.list_active(space_type, capacity_min, material_list))
     
-    if capacity_min:
-        filter_query["capacity"] = {"$gte": capacity_min}
-    
-    if materials:
-        material_list = [m.strip() for m in materials.split(",")]
-        filter_query["materials.name"] = {"$in": material_list}
-    
-    spaces = []
-    async for space in db.spaces.find(filter_query):
-        space_response = SpaceResponse(
-            id=str(space["_id"]),
-            **{k: v for k, v in space.items() if k != "_id"}
-        )
-        spaces.append(space_response)
-    
-    return spaces
+    # Stesso elenco per ogni utente autenticato: le richieste identiche condividono il calcolo
+    spaces = await request_coalescer.run(
+        "spaces.list",
+        {"space_type": space_type, "capacity_min": capacity_min, "materials": material_list},
+        "authenticated",
+        build_spaces
+    )
+    return trusted_response(spaces, response)
 
 @router.get("/{space_id}", response_model=SpaceResponse)
 async def get_space_details(
@@ -47,10 +48,8 @@ async def get_space_details(
     current_user: dict = Depends(get_current_user)
 ):
     """Recupera dettagli di uno spazio specifico"""
-    db = await get_database()
-    
     try:
-        space = await db.spaces.find_one({"_id": ObjectId(space_id)})
+        space = await spaces_repository.get_by_id(space_id)
         if not space:
             raise HTTPException(status_code=404, detail="Spazio non trovato")
         
@@ -68,8 +67,6 @@ async def check_space_availability(
     current_user: dict = Depends(get_current_user)
 ):
     """Verifica disponibilità di uno spazio per una data specifica"""
-    db = await get_database()
-    
     try:
         # Converte la data
         check_date = datetime.strptime(date, "%Y-%m-%d").date()
@@ -78,19 +75,24 @@ async def check_space_availability(
         
         # Trova tutte le prenotazioni per quel giorno
         bookings = []
-        async for booking in db.bookings.find({
-            "space_id": space_id,
-            "status": {"$in": ["pending", "confirmed"]},
-            "start_datetime": {"$gte": start_datetime, "$lt": end_datetime}
-        }).sort("start_datetime", 1):
+        for booking in await bookings_repository.list_for_space_between(space_id, start_datetime, end_datetime):
             bookings.append({
                 "start_time": booking["start_datetime"].strftime("%H:%M"),
                 "end_time": booking["end_datetime"].strftime("%H:%M"),
                 "purpose": booking["purpose"]
             })
         
+        # Occorrenze delle prenotazioni ricorrenti, espanse solo per questo giorno
+        for slot in await booking_series_service.occupied_slots(space_id, start_datetime, end_datetime):
+            bookings.append({
+                "start_time": slot["start_datetime"].strftime("%H:%M"),
+                "end_time": slot["end_datetime"].strftime("%H:%M"),
+                "purpose": slot["purpose"]
+            })
+        bookings.sort(key=lambda booking: booking["start_time"])
+        
         # Recupera orari disponibili dello spazio
-        space = await db.spaces.find_one({"_id": ObjectId(space_id)})
+        space = await spaces_repository.get_by_id(space_id, SPACE_HOURS)
         if not space:
             raise HTTPException(status_code=404, detail="Spazio non trovato")
         
@@ -109,33 +111,22 @@ async def check_space_availability(
 @router.get("/types/list")
 async def get_space_types(current_user: dict = Depends(get_current_user)):
     """Recupera tutti i tipi di spazi disponibili"""
-    db = await get_database()
-    
-    pipeline = [
-        {"$match": {"is_active": True}},
-        {"$group": {"_id": "$type", "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    
-    types = []
-    async for doc in db.spaces.aggregate(pipeline):
-        types.append({
-            "type": doc["_id"],
-            "count": doc["count"]
-        })
-    
-    return types
+    return await request_coalescer.run("spaces.types", None, "authenticated", spaces_repository.count_by_type)
 
 @router.get("/{space_id}/materials")
 async def get_space_materials(
     space_id: str,
+    request: Request,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """Recupera tutti i materiali disponibili in uno spazio"""
-    db = await get_database()
+    not_modified = await etag_service.check(request, response, ["spaces"], "authenticated")
+    if not_modified:
+        return not_modified
     
     try:
-        space = await db.spaces.find_one({"_id": ObjectId(space_id)})
+        space = await spaces_repository.get_by_id(space_id, SPACE_MATERIALS)
         if not space:
             raise HTTPException(status_code=404, detail="Spazio non trovato")
         
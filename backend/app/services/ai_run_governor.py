@@ -0,0 +1,182 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from ..config import settings
+
+BUDGET_WINDOW_SECONDS = 3600
+
+
+class AIRunLease:
+    """Permesso di eseguire una run dell'assistente per un utente"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.superseded = asyncio.Event()
+        self.tokens_used = 0
+        self.rejected_reason: Optional[str] = None
+
+    @property
+    def admitted(self) -> bool:
+        return self.rejected_reason is None
+
+    async def wait_superseded(self, timeout: float) -> bool:
+        """Attende fino a timeout secondi; True se la run è stata sostituita"""
+        try:
+            await asyncio.wait_for(self.superseded.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class AIRunGovernor:
+    """
+    Limita le run OpenAI concorrenti: coda di ammissione globale,
+    una sola run in corso per utente e budget orari di richieste e token.
+    Quando la capacità è esaurita la richiesta viene rifiutata e il
+    chiamante risponde con il fallback locale.
+    """
+
+    def __init__(self):
+        self.max_concurrent_runs = settings.ai_max_concurrent_runs
+        self.max_queue = settings.ai_max_queue
+        self.queue_timeout = settings.ai_queue_timeout_seconds
+        self.user_requests_per_hour = settings.ai_user_requests_per_hour
+        self.user_tokens_per_hour = settings.ai_user_tokens_per_hour
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._running = 0
+        self._inflight: Dict[str, AIRunLease] = {}
+        self._user_requests = defaultdict(deque)
+        self._user_tokens = defaultdict(deque)
+
+        self._metrics = {
+            "admitted": 0,
+            "superseded": 0,
+            "rejected_budget_requests": 0,
+            "rejected_budget_tokens": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0,
+            "rejected_superseded": 0,
+            "tokens_used": 0
+        }
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Creato lazy per legarlo all'event loop attivo
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_runs)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def admit(self, user_id: str):
+        """
+        Context manager che restituisce sempre un lease: se lease.admitted è
+        False la run non deve partire (vedi lease.rejected_reason).
+        """
+        lease = AIRunLease(user_id)
+
+        reason = self._check_budget(user_id)
+        if reason:
+            lease.rejected_reason = reason
+            self._metrics[f"rejected_{reason}"] += 1
+            yield lease
+            return
+
+        # Una sola run per utente: la precedente viene annullata
+        previous = self._inflight.get(user_id)
+        if previous:
+            previous.superseded.set()
+            self._metrics["superseded"] += 1
+        self._inflight[user_id] = lease
+
+        acquired = False
+        try:
+            reason = await self._acquire_slot(lease)
+            if reason:
+                lease.rejected_reason = reason
+                self._metrics[f"rejected_{reason}"] += 1
+                yield lease
+                return
+
+            acquired = True
+            self._running += 1
+            self._metrics["admitted"] += 1
+            self._user_requests[user_id].append(time.monotonic())
+            yield lease
+
+        finally:
+            if acquired:
+                self._running -= 1
+                self._get_semaphore().release()
+                self._record_tokens(user_id, lease.tokens_used)
+            if self._inflight.get(user_id) is lease:
+                del self._inflight[user_id]
+
+    async def _acquire_slot(self, lease: AIRunLease) -> Optional[str]:
+        semaphore = self._get_semaphore()
+
+        if semaphore.locked() and self._waiting >= self.max_queue:
+            return "queue_full"
+
+        self._waiting += 1
+        try:
+            acquire_task = asyncio.ensure_future(semaphore.acquire())
+            superseded_task = asyncio.ensure_future(lease.superseded.wait())
+            done, _ = await asyncio.wait(
+                {acquire_task, superseded_task},
+                timeout=self.queue_timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            superseded_task.cancel()
+
+            if acquire_task in done:
+                return None
+
+            acquire_task.cancel()
+            try:
+                await acquire_task
+                # Slot ottenuto mentre si annullava: va restituito
+                semaphore.release()
+            except asyncio.CancelledError:
+                pass
+
+            return "superseded" if lease.superseded.is_set() else "queue_timeout"
+        finally:
+            self._waiting -= 1
+
+    def _check_budget(self, user_id: str) -> Optional[str]:
+        now = time.monotonic()
+
+        requests = self._user_requests[user_id]
+        while requests and now - requests[0] > BUDGET_WINDOW_SECONDS:
+            requests.popleft()
+        if len(requests) >= self.user_requests_per_hour:
+            return "budget_requests"
+
+        tokens = self._user_tokens[user_id]
+        while tokens and now - tokens[0][0] > BUDGET_WINDOW_SECONDS:
+            tokens.popleft()
+        if sum(amount for _, amount in tokens) >= self.user_tokens_per_hour:
+            return "budget_tokens"
+
+        return None
+
+    def _record_tokens(self, user_id: str, tokens_used: int):
+        if tokens_used:
+            self._user_tokens[user_id].append((time.monotonic(), tokens_used))
+            self._metrics["tokens_used"] += tokens_used
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrent_runs": self.max_concurrent_runs,
+            "max_queue": self.max_queue
+        }
+
+
+# Istanza globale del governor
+ai_run_governor = AIRunGovernor()
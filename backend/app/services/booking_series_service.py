@@ -0,0 +1,231 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from ..config import settings
+from ..repositories import bookings_repository, booking_series_repository, spaces_loader, users_loader
+from ..repositories.booking_series import SERIES_SLOTS
+from ..models.booking import BookingSeries, BookingStatus
+from .classrent_email_service import classrent_email_service
+from .recurrence import Interval, naive_utc, normalize_rule, expand_all, occurrences, find_conflicts, series_timezone
+from .space_snapshots import space_snapshots, space_snapshot
+
+
+class BookingSeriesService:
+    """
+    Prenotazioni ricorrenti (es. lo stesso laboratorio ogni martedì del
+    semestre) salvate come una sola serie RRULE con date escluse. La
+    disponibilità espande le occorrenze solo nella finestra richiesta; alla
+    creazione tutte le occorrenze si verificano in una passata contro gli
+    intervalli occupati letti con due query, e si invia una sola email.
+    """
+
+    def __init__(self):
+        self.max_occurrences = settings.series_max_occurrences
+
+    async def busy_intervals(self, space_id: str, start: datetime, end: datetime) -> List[Interval]:
+        """Intervalli occupati nello spazio: prenotazioni singole e occorrenze delle serie attive"""
+        bookings = await bookings_repository.list_overlapping(space_id, start, end)
+        busy = [(booking["start_datetime"], booking["end_datetime"]) for booking in bookings]
+        for series in await booking_series_repository.list_overlapping(start, end, space_id, SERIES_SLOTS):
+            busy.extend(occurrences(series, start, end))
+        return busy
+
+    async def has_conflict(self, space_id: str, start: datetime, end: datetime) -> bool:
+        """True se un'occorrenza di una serie attiva si sovrappone all'intervallo"""
+        start, end = naive_utc(start), naive_utc(end)
+        for series in await booking_series_repository.list_overlapping(start, end, space_id, SERIES_SLOTS):
+            for _ in occurrences(series, start, end):
+                return True
+        return False
+
+    async def busy_space_ids(self, space_ids: List[str], start: datetime, end: datetime) -> set:
+        """Spazi occupati in [start, end) tra quelli indicati: una query per le prenotazioni e una per le serie"""
+        start, end = naive_utc(start), naive_utc(end)
+        busy = await bookings_repository.busy_space_ids(space_ids, start, end)
+        candidates = [space_id for space_id in space_ids if space_id not in busy]
+        if candidates:
+            for series in await booking_series_repository.list_overlapping(
+                start, end, projection={**SERIES_SLOTS, "space_id": 1}, space_ids=candidates
+            ):
+                if series["space_id"] not in busy and next(iter(occurrences(series, start, end)), None):
+                    busy.add(series["space_id"])
+        return busy
+
+    async def occupied_slots(self, space_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Occorrenze delle serie dello spazio che iniziano nell'intervallo"""
+        slots = []
+        for series in await booking_series_repository.list_overlapping(start, end, space_id, SERIES_SLOTS):
+            for occurrence_start, occurrence_end in occurrences(series, start, end):
+                if occurrence_start >= start:
+                    slots.append({
+                        "start_datetime": occurrence_start,
+                        "end_datetime": occurrence_end,
+                        "purpose": series["purpose"]
+                    })
+        return sorted(slots, key=lambda slot: slot["start_datetime"])
+
+    async def create_series(self, series_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """Crea una serie dopo aver verificato vincoli e conflitti di tutte le occorrenze"""
+        # Import locale: booking_service usa questo servizio per la disponibilità
+        from .booking_service import booking_service
+
+        try:
+            start = naive_utc(series_data["start_datetime"])
+            end = naive_utc(series_data["end_datetime"])
+            validation = await booking_service._validate_booking_data({
+                "space_id": series_data["space_id"], "start_datetime": start, "end_datetime": end
+            })
+            if not validation["valid"]:
+                return {"error": validation["error"]}
+
+            try:
+                rule = normalize_rule(series_data["rrule"])
+                tz = series_timezone(series_data.get("timezone")).key
+                exdates = [naive_utc(exdate) for exdate in series_data.get("exdates", [])]
+                slots = expand_all(rule, start, end, exdates, self.max_occurrences, tz)
+            except ValueError as e:
+                return {"error": str(e)}
+            if not slots:
+                return {"error": "La serie non ha occorrenze"}
+
+            space = await spaces_loader.load(series_data["space_id"])
+            if not space:
+                return {"error": "Spazio non trovato"}
+
+            for slot_start, slot_end in slots:
+                constraint_check = await booking_service.check_constraints(
+                    {"start_datetime": slot_start, "end_datetime": slot_end}, space
+                )
+                if not constraint_check["valid"]:
+                    return {"error": f"{slot_start.strftime('%d/%m/%Y')}: {constraint_check['error']}"}
+
+            # Una lettura per tutta la finestra, poi confronto in memoria
+            busy = await self.busy_intervals(series_data["space_id"], slots[0][0], slots[-1][1])
+            conflicts = find_conflicts(slots, busy)
+            if conflicts:
+                return {
+                    "error": f"Lo spazio non è disponibile in {len(conflicts)} occorrenze su {len(slots)}",
+                    "conflicts": [slot_start.isoformat() for slot_start, _ in conflicts[:20]]
+                }
+
+            series = BookingSeries(**{
+                "user_id": user_id,
+                "space_id": series_data["space_id"],
+                "rrule": rule,
+                "start_datetime": start,
+                "end_datetime": end,
+                "exdates": exdates,
+                "timezone": tz,
+                "window_start": slots[0][0],
+                "window_end": slots[-1][1],
+                "occurrence_count": len(slots),
+                "purpose": series_data.get("purpose", "Prenotazione ricorrente"),
+                "status": BookingStatus.CONFIRMED,
+                "materials_requested": series_data.get("materials_requested", []),
+                "notes": series_data.get("notes") or "",
+                "space_snapshot": space_snapshot(space),
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }).model_dump()
+            series_id = await booking_series_repository.insert(series)
+
+            user = await users_loader.load(user_id)
+            if user:
+                try:
+                    # Una sola email per tutta la serie
+                    summary = f"Prenotazione ricorrente: {len(slots)} occorrenze fino al {slots[-1][0].strftime('%d/%m/%Y')}"
+                    await classrent_email_service.send_booking_confirmation(
+                        user_email=user["email"],
+                        booking={**series, "notes": f"{summary}. {series['notes']}".strip()},
+                        space=space,
+                        user_name=user["full_name"]
+                    )
+                except Exception as e:
+                    print(f"⚠️ Errore invio email serie (non critico): {e}")
+
+            return {
+                "series_id": series_id,
+                "status": "created",
+                "occurrences": len(slots),
+                "message": f"Serie creata con {len(slots)} occorrenze"
+            }
+
+        except Exception as e:
+            print(f"❌ Errore nella creazione serie: {e}")
+            return {"error": f"Errore interno: {str(e)}"}
+
+    async def skip_occurrence(self, series_id: str, user_id: str, occurrence_start: datetime) -> Dict[str, Any]:
+        """Annulla una sola occorrenza aggiungendola alle date escluse"""
+        try:
+            series = await booking_series_repository.get_owned(series_id, user_id)
+        except Exception:
+            return {"error": "ID serie non valido"}
+        if not series or series["status"] == BookingStatus.CANCELLED:
+            return {"error": "Serie non trovata"}
+
+        occurrence_start = naive_utc(occurrence_start)
+        window = occurrences(series, occurrence_start, occurrence_start + timedelta(minutes=1))
+        if not any(start == occurrence_start for start, _ in window):
+            return {"error": "Nessuna occorrenza della serie in questa data"}
+        if occurrence_start <= datetime.utcnow():
+            return {"error": "Non è possibile annullare occorrenze già iniziate"}
+
+        await booking_series_repository.add_exdate(series_id, user_id, occurrence_start)
+        return {"status": "cancelled", "message": "Occorrenza annullata"}
+
+    async def cancel_series(self, series_id: str, user_id: str) -> Dict[str, Any]:
+        """Annulla tutte le occorrenze della serie"""
+        try:
+            series = await booking_series_repository.get_owned(series_id, user_id)
+        except Exception:
+            return {"error": "ID serie non valido"}
+        if not series:
+            return {"error": "Serie non trovata"}
+
+        modified = await booking_series_repository.set_fields(
+            series_id, {"status": BookingStatus.CANCELLED, "updated_at": datetime.utcnow()}, user_id=user_id
+        )
+        if modified == 0:
+            return {"error": "Impossibile annullare la serie"}
+
+        space = await spaces_loader.load(series["space_id"])
+        user = await users_loader.load(user_id)
+        if user and space:
+            try:
+                await classrent_email_service.send_booking_cancellation(
+                    user_email=user["email"],
+                    booking=series,
+                    space=space,
+                    user_name=user["full_name"],
+                    reason="Annullata l'intera serie ricorrente"
+                )
+            except Exception as e:
+                print(f"⚠️ Errore invio email annullamento serie: {e}")
+        return {"status": "cancelled", "message": "Serie annullata"}
+
+    async def list_user_series(self, user_id: str) -> List[Dict[str, Any]]:
+        """Serie dell'utente con la prossima occorrenza"""
+        series_list = await booking_series_repository.list_for_user(user_id)
+        spaces = await space_snapshots.resolve(series_list)
+        now = datetime.utcnow()
+        rows = []
+        for series, space in zip(series_list, spaces):
+            upcoming = next(occurrences(series, now, series["window_end"]), None) if series["window_end"] > now else None
+            rows.append({
+                "id": str(series["_id"]),
+                "space_id": series["space_id"],
+                "space_name": (space or {}).get("name") or "Spazio eliminato",
+                "rrule": series["rrule"],
+                "start_datetime": series["start_datetime"],
+                "end_datetime": series["end_datetime"],
+                "exdates": series.get("exdates", []),
+                "timezone": series.get("timezone") or settings.campus_timezone,
+                "occurrence_count": series["occurrence_count"],
+                "next_occurrence": upcoming[0] if upcoming else None,
+                "purpose": series["purpose"],
+                "status": series["status"]
+            })
+        return rows
+
+
+# Istanza globale delle prenotazioni ricorrenti
+booking_series_service = BookingSeriesService()
@@ -1,19 +1,21 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from bson import ObjectId
-from ..database import get_database
+from pydantic import ValidationError
+from ..repositories import bookings_repository, spaces_loader, users_loader
+from ..repositories.bookings import encode_cursor, decode_cursor, search_filter
 from ..models.booking import Booking, BookingStatus, BookingResponse
+from ..models.trusted import trusted_row, invalid_fields
 from .classrent_email_service import classrent_email_service  # ✅ CORRETTO
-from .database_calendar_service import database_calendar_service  # ✅ CORRETTO
+from .space_snapshots import space_snapshots, space_snapshot
+from .booking_series_service import booking_series_service
 
 class BookingService:
     def __init__(self):
         pass
     
     async def create_booking(self, booking_data: Dict, user_id: str) -> Dict:
-        """Crea una nuova prenotazione con email e calendario MongoDB"""
-        db = await get_database()
-        
+        """Crea una nuova prenotazione con email (il calendario la legge da bookings)"""
         try:
             # Validazione dati di input
             validation_result = await self._validate_booking_data(booking_data)
@@ -31,7 +33,7 @@ class BookingService:
                 )
             
             # Verifica che lo spazio esista
-            space = await db.spaces.find_one({"_id": ObjectId(booking_data["space_id"])})
+            space = await spaces_loader.load(booking_data["space_id"])
             if not space:
                 return {"error": "Spazio non trovato"}
             
@@ -48,8 +50,8 @@ class BookingService:
             if not constraint_check["valid"]:
                 return {"error": constraint_check["error"]}
             
-            # Prepara i dati della prenotazione
-            booking = {
+            # Prepara i dati della prenotazione (validati qui, una volta sola: le letture si fidano del DB)
+            booking = Booking(**{
                 "user_id": user_id,
                 "space_id": booking_data["space_id"],
                 "start_datetime": booking_data["start_datetime"],
@@ -58,16 +60,17 @@ class BookingService:
                 "status": BookingStatus.CONFIRMED,  # Auto-conferma
                 "materials_requested": booking_data.get("materials_requested", []),
                 "notes": booking_data.get("notes", ""),
+                # Nome e posizione dello spazio copiati: gli elenchi non rileggono spaces
+                "space_snapshot": space_snapshot(space),
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
-            }
+            }).model_dump()
             
             # Inserisci nel database
-            result = await db.bookings.insert_one(booking)
-            booking_id = str(result.inserted_id)
+            booking_id = await bookings_repository.insert(booking)
             
             # Recupera informazioni utente
-            user = await db.users.find_one({"_id": ObjectId(user_id)})
+            user = await users_loader.load(user_id)
             if not user:
                 return {"error": "Utente non trovato"}
             
@@ -83,30 +86,6 @@ class BookingService:
             except Exception as e:
                 print(f"⚠️ Errore invio email (non critico): {e}")
             
-            # ✅ AGGIUNGI AL CALENDARIO MONGODB (non Google)
-            try:
-                booking_calendar_data = {
-                    'booking_id': booking_id,
-                    'space_id': booking_data["space_id"],
-                    'space_name': space['name'],
-                    'location': space['location'],
-                    'start_datetime': booking['start_datetime'],
-                    'end_datetime': booking['end_datetime'],
-                    'purpose': booking['purpose'],
-                    'materials_requested': booking['materials_requested'],
-                    'notes': booking['notes']
-                }
-                
-                # Usa calendario MongoDB invece di Google
-                calendar_added = await database_calendar_service.add_booking_to_calendar(
-                    booking_calendar_data, 
-                    user["email"]
-                )
-                print(f"📅 Evento aggiunto al calendario MongoDB: {calendar_added}")
-                
-            except Exception as e:
-                print(f"⚠️ Errore operazioni calendar MongoDB (non critico): {e}")
-            
             return {
                 "booking_id": booking_id, 
                 "status": "created",
@@ -118,39 +97,30 @@ class BookingService:
             return {"error": f"Errore interno: {str(e)}"}
     
     async def cancel_booking(self, booking_id: str, user_id: str, reason: str = "") -> Dict:
-        """Cancella prenotazione con notifica email e rimozione da calendario MongoDB"""
-        db = await get_database()
-        
+        """Cancella prenotazione con notifica email"""
         try:
             # Recupera prenotazione prima di cancellarla
-            booking = await db.bookings.find_one({
-                "_id": ObjectId(booking_id),
-                "user_id": user_id
-            })
+            booking = await bookings_repository.get_owned(booking_id, user_id)
             
             if not booking:
                 return {"error": "Prenotazione non trovata"}
             
             # Recupera dettagli spazio e utente
-            space = await db.spaces.find_one({"_id": ObjectId(booking["space_id"])})
-            user = await db.users.find_one({"_id": ObjectId(user_id)})
+            space = await spaces_loader.load(booking["space_id"])
+            user = await users_loader.load(user_id)
             
             # Aggiorna stato nel database
-            result = await db.bookings.update_one(
+            modified = await bookings_repository.set_fields(
+                booking_id,
                 {
-                    "_id": ObjectId(booking_id),
-                    "user_id": user_id
+                    "status": BookingStatus.CANCELLED,
+                    "updated_at": datetime.utcnow(),
+                    "cancellation_reason": reason
                 },
-                {
-                    "$set": {
-                        "status": BookingStatus.CANCELLED,
-                        "updated_at": datetime.utcnow(),
-                        "cancellation_reason": reason
-                    }
-                }
+                user_id=user_id
             )
             
-            if result.modified_count == 0:
+            if modified == 0:
                 return {"error": "Impossibile cancellare la prenotazione"}
             
             # ✅ Invia email cancellazione da classrent2025@gmail.com
@@ -167,12 +137,6 @@ class BookingService:
                 except Exception as e:
                     print(f"⚠️ Errore invio email cancellazione: {e}")
             
-            # ✅ Rimuovi dal calendario MongoDB (non Google)
-            try:
-                await database_calendar_service.remove_booking_from_calendar(booking_id)
-            except Exception as e:
-                print(f"⚠️ Errore rimozione calendario MongoDB: {e}")
-            
             return {
                 "status": "cancelled", 
                 "message": f"Prenotazione cancellata. Notifica inviata a {user['email'] if user else 'utente'}"
@@ -184,14 +148,9 @@ class BookingService:
     
     async def update_booking(self, booking_id: str, user_id: str, update_data: Dict) -> Dict:
         """Aggiorna prenotazione con notifica email se necessario"""
-        db = await get_database()
-        
         try:
             # Verifica proprietario
-            booking = await db.bookings.find_one({
-                "_id": ObjectId(booking_id),
-                "user_id": user_id
-            })
+            booking = await bookings_repository.get_owned(booking_id, user_id)
             
             if not booking:
                 return {"error": "Prenotazione non trovata"}
@@ -212,65 +171,40 @@ class BookingService:
                     new_end = datetime.fromisoformat(new_end.replace('Z', '+00:00'))
                 
                 # Verifica disponibilità escludendo la prenotazione corrente
-                overlapping = await db.bookings.find_one({
-                    "_id": {"$ne": ObjectId(booking_id)},
-                    "space_id": booking["space_id"],
-                    "status": {"$in": [BookingStatus.PENDING, BookingStatus.CONFIRMED]},
-                    "$and": [
-                        {"start_datetime": {"$lt": new_end}},
-                        {"end_datetime": {"$gt": new_start}}
-                    ]
-                })
+                overlapping = await bookings_repository.has_overlap(
+                    booking["space_id"], new_start, new_end, exclude_booking_id=booking_id
+                ) or await booking_series_service.has_conflict(booking["space_id"], new_start, new_end)
                 
                 if overlapping:
                     return {"error": "Lo spazio non è disponibile nei nuovi orari"}
             
             # Aggiorna prenotazione
             update_data["updated_at"] = datetime.utcnow()
+            if "space_id" in update_data:
+                update_data["space_snapshot"] = space_snapshot(await spaces_loader.load(update_data["space_id"]))
             
-            await db.bookings.update_one(
-                {"_id": ObjectId(booking_id)},
-                {"$set": update_data}
-            )
+            await bookings_repository.set_fields(booking_id, update_data)
             
-            # ✅ Aggiorna calendario MongoDB se ci sono cambiamenti significativi
+            # Il calendario legge da bookings: basta l'email se cambiano orari o spazio
             significant_changes = any(key in update_data for key in ['start_datetime', 'end_datetime', 'space_id'])
             
             if significant_changes:
                 try:
-                    user = await db.users.find_one({"_id": ObjectId(user_id)})
-                    space = await db.spaces.find_one({"_id": ObjectId(booking["space_id"])})
+                    user = await users_loader.load(user_id)
+                    space = await spaces_loader.load(booking["space_id"])
                     
                     if user and space:
-                        # Aggiorna calendario MongoDB
-                        updated_booking = {**booking, **update_data}
-                        calendar_data = {
-                            'booking_id': booking_id,
-                            'space_id': booking["space_id"],
-                            'space_name': space['name'],
-                            'location': space['location'],
-                            'start_datetime': updated_booking['start_datetime'],
-                            'end_datetime': updated_booking['end_datetime'],
-                            'purpose': updated_booking['purpose'],
-                            'materials_requested': updated_booking['materials_requested'],
-                            'notes': updated_booking['notes']
-                        }
-                        
-                        await database_calendar_service.update_booking_in_calendar(
-                            booking_id, calendar_data
-                        )
-                        
                         # Invia email di notifica modifiche
                         await classrent_email_service.send_booking_confirmation(
                             user_email=user["email"],
-                            booking=updated_booking,
+                            booking={**booking, **update_data},
                             space=space,
                             user_name=user["full_name"]
                         )
                         print(f"📧 Email aggiornamento inviata a {user['email']}")
                         
                 except Exception as e:
-                    print(f"⚠️ Errore aggiornamento calendario/email: {e}")
+                    print(f"⚠️ Errore invio email aggiornamento: {e}")
             
             return {"status": "updated", "message": "Prenotazione aggiornata con successo"}
             
@@ -326,19 +260,11 @@ class BookingService:
     
     async def check_availability(self, space_id: str, start_time: datetime, end_time: datetime) -> bool:
         """Verifica se lo spazio è disponibile"""
-        db = await get_database()
-        
         try:
-            overlapping = await db.bookings.find_one({
-                "space_id": space_id,
-                "status": {"$in": [BookingStatus.PENDING, BookingStatus.CONFIRMED]},
-                "$and": [
-                    {"start_datetime": {"$lt": end_time}},
-                    {"end_datetime": {"$gt": start_time}}
-                ]
-            })
-            
-            return overlapping is None
+            if await bookings_repository.has_overlap(space_id, start_time, end_time):
+                return False
+            # Le serie ricorrenti occupano lo spazio senza documenti per occorrenza
+            return not await booking_series_service.has_conflict(space_id, start_time, end_time)
             
         except Exception as e:
             print(f"❌ Errore verifica disponibilità: {e}")
@@ -387,32 +313,66 @@ class BookingService:
             print(f"❌ Errore verifica vincoli: {e}")
             return {"valid": False, "error": "Errore nella verifica dei vincoli"}
     
-    async def get_user_bookings(self, user_id: str) -> List[BookingResponse]:
-        """Recupera le prenotazioni dell'utente"""
-        db = await get_database()
+    async def search_bookings(self, user_id: Optional[str] = None, space_id: Optional[str] = None,
+                              statuses: Optional[List[str]] = None, start_from: Optional[datetime] = None,
+                              start_to: Optional[datetime] = None, material: Optional[str] = None,
+                              cursor: Optional[str] = None, limit: int = 50, sort_direction: int = -1) -> Dict[str, Any]:
+        """
+        Ricerca prenotazioni con paginazione keyset su (start_datetime, _id):
+        ogni pagina riparte dall'ultima chiave vista, quindi le pagine profonde
+        costano come la prima. Righe con i campi di BookingResponse.
+        """
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return {"error": str(e)}
         
-        bookings = []
         try:
-            async for booking in db.bookings.find({"user_id": user_id}).sort("start_datetime", -1):
-                space = await db.spaces.find_one({"_id": ObjectId(booking["space_id"])})
-                
-                booking_response = BookingResponse(
-                    id=str(booking["_id"]),
-                    user_id=booking["user_id"],
-                    space_id=booking["space_id"],
-                    space_name=space["name"] if space else "Spazio eliminato",
-                    start_datetime=booking["start_datetime"],
-                    end_datetime=booking["end_datetime"],
-                    purpose=booking["purpose"],
-                    status=booking["status"],
-                    materials_requested=booking.get("materials_requested", []),
-                    notes=booking.get("notes", ""),
-                    created_at=booking["created_at"]
-                )
-                bookings.append(booking_response)
+            filter_query = search_filter(user_id, space_id, statuses, start_from, start_to, material)
+            page, has_more = await bookings_repository.search(filter_query, after, sort_direction, limit)
+            
+            # Nome dello spazio dallo snapshot sulla prenotazione, senza leggere spaces
+            spaces = await space_snapshots.resolve(page)
+            bookings = []
+            for booking, space in zip(page, spaces):
+                space_name = space.get("name") if space else None
                 
+                # Prenotazione validata con Booking in scrittura
+                try:
+                    bookings.append(trusted_row(
+                        BookingResponse,
+                        booking,
+                        id=str(booking["_id"]),
+                        space_name=space_name or "Spazio eliminato",
+                        materials_requested=booking.get("materials_requested", []),
+                        notes=booking.get("notes", "")
+                    ))
+                except ValidationError as e:
+                    print(f"⚠️ Prenotazione {booking['_id']} esclusa dalla ricerca: {invalid_fields(e)}")
+            
+            return {
+                "bookings": bookings,
+                "next_cursor": encode_cursor(page[-1]) if has_more else None,
+                "has_more": has_more
+            }
+            
         except Exception as e:
-            print(f"❌ Errore recupero prenotazioni: {e}")
+            print(f"❌ Errore ricerca prenotazioni: {e}")
+            return {"error": "Errore nella ricerca delle prenotazioni"}
+    
+    async def get_user_bookings(self, user_id: str, page_size: int = 200) -> List[Dict[str, Any]]:
+        """Recupera tutte le prenotazioni dell'utente scorrendo le pagine della ricerca"""
+        bookings = []
+        cursor = None
+        while True:
+            result = await self.search_bookings(user_id=user_id, cursor=cursor, limit=page_size)
+            if "error" in result:
+                print(f"❌ Errore recupero prenotazioni: {result['error']}")
+                break
+            bookings.extend(result["bookings"])
+            cursor = result["next_cursor"]
+            if not cursor:
+                break
         
         return bookings
 
@@ -0,0 +1,458 @@
+"""
+Sincronizzazione incrementale delle prenotazioni verso un server CalDAV.
+
+Lato locale si leggono solo i documenti modificati dopo il watermark
+(updated_at, _id) di bookings e booking_series, come /calendar/changes; un
+hash del contenuto evita di rinviare eventi invariati. Lato remoto il ctag
+dice se il calendario è cambiato e il sync token (RFC 6578) quali eventi:
+quelli modificati o eliminati da altri si rinviano, perché la fonte resta
+il database. Le richieste partono in lotti, con concorrenza limitata dal
+pool di client e retry con backoff sugli errori temporanei.
+"""
+
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse, unquote
+import requests
+from caldav import DAVClient
+from caldav.elements import dav
+from caldav.elements.base import BaseElement
+from caldav.lib.error import AuthorizationError
+from icalendar import Calendar
+from ..config import settings
+from ..repositories import bookings_repository, booking_series_repository, caldav_items_repository, caldav_state_repository
+from ..repositories.bookings import ACTIVE_STATUSES, BOOKING_CALENDAR
+from ..repositories.booking_series import SERIES_DETAIL
+from ..repositories.changes import Watermark, changes_filter, encode_watermark, decode_watermark
+from .calendar_feeds import PRODID, feed_event, feed_timezones
+from .space_snapshots import space_snapshots
+
+SOURCES = [(bookings_repository, BOOKING_CALENDAR), (booking_series_repository, SERIES_DETAIL)]
+
+
+class GetCTag(BaseElement):
+    tag = "{http://calendarserver.org/ns/}getctag"
+
+
+class RemoteError(Exception):
+    """Risposta inattesa dal server CalDAV"""
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"CalDAV {status} {message}".strip())
+        self.status = status
+
+    @property
+    def transient(self) -> bool:
+        return self.status >= 500 or self.status == 429
+
+
+class SyncTokenInvalid(Exception):
+    """Sync token scaduto o non supportato: serve il confronto completo degli ETag"""
+
+
+def event_uid(collection_name: str, document_id: Any) -> str:
+    return f"{'series' if collection_name == 'booking_series' else 'booking'}-{document_id}"
+
+
+def event_body(document: Dict[str, Any], space: Optional[Dict[str, Any]]) -> bytes:
+    """Risorsa iCalendar con un solo VEVENT (UID stabile, serie con RRULE)"""
+    calendar = Calendar()
+    calendar.add("prodid", PRODID)
+    calendar.add("version", "2.0")
+    for component in feed_timezones([document]):
+        calendar.add_component(component)
+    calendar.add_component(feed_event(document, space, private=False))
+    return calendar.to_ical()
+
+
+def content_hash(body: bytes) -> str:
+    """Hash senza DTSTAMP: una scrittura che non cambia l'evento non lo rinvia"""
+    lines = [line for line in body.split(b"\r\n") if not line.startswith(b"DTSTAMP")]
+    return hashlib.sha1(b"\r\n".join(lines)).hexdigest()
+
+
+def response_entries(tree) -> List[Tuple[str, int, Optional[str]]]:
+    """(path, stato, etag) di ogni risposta di una multistatus"""
+    entries = []
+    for response in tree.iter("{DAV:}response"):
+        href = unquote(urlparse(response.findtext("{DAV:}href") or "").path)
+        status_line = response.findtext("{DAV:}status") or response.findtext(".//{DAV:}propstat/{DAV:}status") or ""
+        parts = status_line.split()
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 200
+        entries.append((href, status, response.findtext(".//{DAV:}getetag")))
+    return entries
+
+
+class CalDavRemote:
+    """
+    Operazioni sul calendario remoto sopra caldav.DAVClient. Il client è
+    sincrono: ogni chiamata gira in un thread con un client del pool, così
+    le richieste contemporanee non superano la dimensione del pool.
+    """
+
+    def __init__(self, url: str, username: Optional[str], password: Optional[str],
+                 concurrency: int, timeout: float):
+        self.url = url.rstrip("/") + "/"
+        self.path = unquote(urlparse(self.url).path)
+        self._clients: asyncio.Queue = asyncio.Queue()
+        for _ in range(concurrency):
+            self._clients.put_nowait(DAVClient(url=self.url, username=username, password=password, timeout=timeout))
+        self.requests = 0
+
+    def href(self, uid: str) -> str:
+        return f"{self.path}{uid}.ics"
+
+    async def _request(self, method: str, path: str, body: Any = "", headers: Optional[Dict[str, str]] = None):
+        client = await self._clients.get()
+        try:
+            self.requests += 1
+            return await asyncio.to_thread(client.request, urljoin(self.url, path), method, body, headers or {})
+        finally:
+            self._clients.put_nowait(client)
+
+    async def collection_state(self) -> Dict[str, Optional[str]]:
+        """ctag e sync token correnti del calendario (PROPFIND Depth 0)"""
+        query = dav.Propfind() + [dav.Prop() + [GetCTag(), dav.SyncToken()]]
+        response = await self._request("PROPFIND", self.path, str(query), {"Depth": "0"})
+        if response.status != 207 or response.tree is None:
+            raise RemoteError(response.status, "PROPFIND calendario")
+        return {
+            "ctag": response.tree.findtext(".//" + GetCTag.tag),
+            "sync_token": response.tree.findtext(".//{DAV:}sync-token")
+        }
+
+    async def changes_since(self, sync_token: str) -> Tuple[Optional[str], Dict[str, Optional[str]]]:
+        """Eventi cambiati dopo il token (REPORT sync-collection): path -> ETag, None se eliminato"""
+        query = dav.SyncCollection() + [
+            dav.SyncToken(value=sync_token), dav.SyncLevel(value="1"), dav.Prop() + dav.GetEtag()
+        ]
+        try:
+            response = await self._request("REPORT", self.path, str(query),
+                                           {"Depth": "0", "Content-Type": 'application/xml; charset="utf-8"'})
+        except AuthorizationError:
+            # DAVClient solleva su 403, la risposta dei token non più validi (valid-sync-token)
+            raise SyncTokenInvalid("sync token rifiutato (403)")
+        if response.status in (400, 403, 409, 412, 501):
+            raise SyncTokenInvalid(f"sync-collection rifiutato ({response.status})")
+        if response.status != 207 or response.tree is None:
+            raise RemoteError(response.status, "REPORT sync-collection")
+        changes = {
+            href: (None if status == 404 else etag)
+            for href, status, etag in response_entries(response.tree) if href != self.path
+        }
+        return response.tree.findtext("{DAV:}sync-token"), changes
+
+    async def list_etags(self) -> Dict[str, str]:
+        """ETag di tutti gli eventi del calendario (PROPFIND Depth 1)"""
+        query = dav.Propfind() + [dav.Prop() + dav.GetEtag()]
+        response = await self._request("PROPFIND", self.path, str(query), {"Depth": "1"})
+        if response.status != 207 or response.tree is None:
+            raise RemoteError(response.status, "PROPFIND eventi")
+        return {href: etag for href, status, etag in response_entries(response.tree)
+                if href != self.path and status == 200}
+
+    async def get_etag(self, uid: str) -> Optional[str]:
+        query = dav.Propfind() + [dav.Prop() + dav.GetEtag()]
+        response = await self._request("PROPFIND", self.href(uid), str(query), {"Depth": "0"})
+        if response.status != 207 or response.tree is None:
+            return None
+        return response.tree.findtext(".//{DAV:}getetag")
+
+    async def put(self, uid: str, body: bytes, etag: Optional[str], overwrite: bool = False) -> Optional[str]:
+        """Crea o aggiorna l'evento solo se il server ha ancora la versione nota; restituisce il nuovo ETag"""
+        headers = {"Content-Type": "text/calendar; charset=utf-8"}
+        if not overwrite:
+            headers.update({"If-Match": etag} if etag else {"If-None-Match": "*"})
+        response = await self._request("PUT", self.href(uid), body, headers)
+        if response.status not in (200, 201, 204):
+            raise RemoteError(response.status, f"PUT {uid}")
+        # Alcuni server non restituiscono l'ETag dopo il PUT
+        return response.headers.get("ETag") or await self.get_etag(uid)
+
+    async def delete(self, uid: str, etag: Optional[str], overwrite: bool = False):
+        headers = {"If-Match": etag} if etag and not overwrite else {}
+        response = await self._request("DELETE", self.href(uid), "", headers)
+        if response.status not in (200, 204, 404):
+            raise RemoteError(response.status, f"DELETE {uid}")
+
+
+class CalDavSyncEngine:
+    """
+    Invio periodico delle prenotazioni al calendario CalDAV configurato
+    (caldav_url). Ogni passaggio: controllo remoto con ctag e sync token,
+    rinvio degli eventi cambiati sul server, poi le modifiche locali dopo il
+    watermark a lotti. Il watermark avanza solo fino alla prima modifica non
+    inviata per un errore temporaneo (rete, 5xx, 429), che si riprova al
+    passaggio successivo. Un evento rifiutato dal server (altri 4xx) non
+    blocca il watermark: resta segnato da rinviare con l'ultimo errore.
+    """
+
+    def __init__(self):
+        self.enabled = bool(settings.caldav_url)
+        self.interval = settings.caldav_sync_interval_seconds
+        self.batch_size = settings.caldav_sync_batch_size
+        self.concurrency = settings.caldav_sync_concurrency
+        self.max_retries = settings.caldav_sync_max_retries
+        self.retry_base_seconds = settings.caldav_sync_retry_base_seconds
+        self.settle_seconds = settings.calendar_changes_settle_seconds
+
+        self.remote: Optional[CalDavRemote] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._metrics = {
+            "runs": 0, "pushed": 0, "deleted": 0, "unchanged": 0, "repaired": 0, "failed": 0, "rejected": 0,
+            "retries": 0, "conflicts": 0, "remote_checks_skipped": 0, "last_run": None, "last_error": None
+        }
+
+    def _remote(self) -> CalDavRemote:
+        if self.remote is None:
+            self.remote = CalDavRemote(settings.caldav_url, settings.caldav_username, settings.caldav_password,
+                                       self.concurrency, settings.caldav_sync_timeout_seconds)
+        return self.remote
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._loop())
+        print(f"✅ Sincronizzazione CalDAV attiva ogni {self.interval:.0f}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._metrics["last_error"] = str(e)
+                print(f"⚠️ Sincronizzazione CalDAV non riuscita: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _with_retry(self, operation, *args):
+        """Riprova errori di rete e 5xx/429 con backoff esponenziale"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await operation(*args)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except RemoteError as e:
+                if not e.transient:
+                    raise
+                error = e
+            if attempt < self.max_retries:
+                self._metrics["retries"] += 1
+                await asyncio.sleep(self.retry_base_seconds * 2 ** attempt)
+        raise error
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Un passaggio completo; restituisce i conteggi"""
+        if not settings.caldav_url:
+            return {"error": "CalDAV non configurato (caldav_url)"}
+
+        async with self._lock:
+            remote = self._remote()
+            report = {"pushed": 0, "deleted": 0, "unchanged": 0, "repaired": 0, "failed": 0, "rejected": 0}
+            state = await caldav_state_repository.get()
+
+            ctag, sync_token = await self._check_remote(remote, state, report)
+            await self._push_stale(remote, report)
+            marks = decode_watermark(state["watermark"]) if state.get("watermark") else {}
+            marks = await self._push_changes(remote, marks, report)
+            await caldav_state_repository.save({
+                "watermark": encode_watermark(marks) if marks else None,
+                "ctag": ctag,
+                "sync_token": sync_token
+            })
+
+            self._metrics["runs"] += 1
+            self._metrics["last_run"] = datetime.utcnow()
+            for key, value in report.items():
+                self._metrics[key] += value
+            if report["pushed"] or report["deleted"] or report["failed"] or report["rejected"]:
+                print(f"📤 CalDAV: {report['pushed']} inviati, {report['deleted']} eliminati, "
+                      f"{report['repaired']} da ripristinare, {report['failed']} non riusciti, "
+                      f"{report['rejected']} rifiutati dal server")
+            return report
+
+    async def _check_remote(self, remote: CalDavRemote, state: Dict[str, Any],
+                            report: Dict[str, int]) -> Tuple[Optional[str], Optional[str]]:
+        """Eventi nostri modificati o eliminati sul server da altri: segnati da rinviare"""
+        collection = await self._with_retry(remote.collection_state)
+        if collection["ctag"] and collection["ctag"] == state.get("ctag"):
+            # Calendario remoto invariato: nessun REPORT
+            self._metrics["remote_checks_skipped"] += 1
+            return collection["ctag"], state.get("sync_token")
+
+        sync_token = collection["sync_token"]
+        changed = None
+        if state.get("sync_token"):
+            try:
+                sync_token, changed = await self._with_retry(remote.changes_since, state["sync_token"])
+            except SyncTokenInvalid:
+                changed = None
+
+        if changed is None:
+            # Primo passaggio o token non valido: confronto completo degli ETag
+            listing = await self._with_retry(remote.list_etags)
+            items = await caldav_items_repository.list_all()
+            stale = {item["_id"]: listing.get(item["href"]) for item in items
+                     if listing.get(item["href"]) != item.get("etag")}
+        else:
+            items = await caldav_items_repository.get_many_by_href(changed)
+            stale = {item["_id"]: changed[item["href"]] for item in items
+                     if changed[item["href"]] != item.get("etag")}
+
+        await caldav_items_repository.mark_stale(stale, stale)
+        report["repaired"] += len(stale)
+        return collection["ctag"], sync_token
+
+    async def _push_stale(self, remote: CalDavRemote, report: Dict[str, int]):
+        """Rinvia gli eventi segnati dal controllo remoto o rifiutati in precedenza, a lotti"""
+        after = None
+        while True:
+            items = await caldav_items_repository.list_stale(self.batch_size, after)
+            if not items:
+                return
+            # I rifiutati restano con hash None: si riparte dopo l'ultimo UID del lotto
+            after = items[-1]["_id"]
+            entries = []
+            for name, (repository, projection) in (("bookings", SOURCES[0]), ("booking_series", SOURCES[1])):
+                prefix = event_uid(name, "")
+                ids = [item["_id"][len(prefix):] for item in items if item["_id"].startswith(prefix)]
+                documents = await repository.get_many(ids, projection)
+                # Documento non più nel database: l'evento remoto va eliminato
+                entries += [(name, documents.get(document_id) or {"_id": document_id, "status": "deleted"})
+                            for document_id in ids]
+            results = await self._sync_documents(remote, entries, report, force=True)
+            if not all(results) or len(items) < self.batch_size:
+                return
+
+    async def _push_changes(self, remote: CalDavRemote, marks: Dict[str, Watermark],
+                            report: Dict[str, int]) -> Dict[str, Watermark]:
+        """Modifiche locali dopo il watermark in ordine di updated_at, un lotto alla volta"""
+        settled_before = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+        while True:
+            candidates = []
+            has_more = False
+            for repository, projection in SOURCES:
+                name = repository.collection_name
+                documents, more = await repository.list_changes(
+                    changes_filter(marks.get(name), settled_before), self.batch_size, projection
+                )
+                has_more = has_more or more
+                candidates += [(document["updated_at"], document["_id"], name, document) for document in documents]
+
+            candidates.sort(key=lambda candidate: candidate[:2])
+            if len(candidates) > self.batch_size:
+                has_more = True
+                candidates = candidates[:self.batch_size]
+            if not candidates:
+                return marks
+
+            results = await self._sync_documents(
+                remote, [(name, document) for _, _, name, document in candidates], report
+            )
+            for (updated_at, object_id, name, _), done in zip(candidates, results):
+                if not done:
+                    # Si riparte da qui al prossimo passaggio
+                    return marks
+                marks[name] = (updated_at, object_id)
+            if not has_more:
+                return marks
+
+    async def _sync_documents(self, remote: CalDavRemote, entries: List[Tuple[str, Dict[str, Any]]],
+                              report: Dict[str, int], force: bool = False) -> List[bool]:
+        """Invia il lotto in parallelo (limitato dal pool) e salva lo stato remoto con un bulk_write"""
+        uids = [event_uid(name, document["_id"]) for name, document in entries]
+        items = await caldav_items_repository.get_many_by_uid(uids)
+        active = [document for _, document in entries if document.get("status") in ACTIVE_STATUSES]
+        spaces = dict(zip((id(document) for document in active), await space_snapshots.resolve(active)))
+
+        operations = []
+        for index, ((name, document), uid) in enumerate(zip(entries, uids)):
+            item = items.get(uid)
+            if document.get("status") in ACTIVE_STATUSES:
+                body = event_body(document, spaces[id(document)])
+                digest = content_hash(body)
+                if item and item.get("hash") == digest and not force:
+                    report["unchanged"] += 1
+                    continue
+                operations.append((index, "put", uid, body, digest, item))
+            elif item:
+                operations.append((index, "delete", uid, None, None, item))
+            else:
+                report["unchanged"] += 1
+
+        outcomes = await asyncio.gather(*(
+            self._apply(remote, action, uid, body, item) for _, action, uid, body, _, item in operations
+        ))
+
+        results = [True] * len(entries)
+        saved, deleted, rejected = [], [], []
+        for (index, action, uid, _, digest, item), (outcome, value) in zip(operations, outcomes):
+            if outcome == "failed":
+                results[index] = False
+                report["failed"] += 1
+            elif outcome == "rejected":
+                # Errore permanente: non blocca il watermark, _push_stale lo riprova
+                rejected.append({"_id": uid, "href": remote.href(uid), "etag": (item or {}).get("etag"),
+                                 "last_error": value})
+                report["rejected"] += 1
+            elif action == "put":
+                saved.append({"_id": uid, "href": remote.href(uid), "etag": value, "hash": digest})
+                report["pushed"] += 1
+            else:
+                deleted.append(uid)
+                report["deleted"] += 1
+        await caldav_items_repository.apply(saved, deleted, rejected)
+        return results
+
+    async def _apply(self, remote: CalDavRemote, action: str, uid: str, body: Optional[bytes],
+                     item: Optional[Dict[str, Any]]) -> Tuple[str, Optional[str]]:
+        """
+        ("done", ETag), ("rejected", errore) se il server rifiuta l'evento
+        (4xx non temporaneo) oppure ("failed", None) per rete, 5xx e 429
+        dopo i retry: solo questi fermano il watermark.
+        """
+        etag = (item or {}).get("etag")
+        operation = remote.put if action == "put" else remote.delete
+        arguments = (uid, body, etag) if action == "put" else (uid, etag)
+        try:
+            try:
+                return "done", await self._with_retry(operation, *arguments)
+            except RemoteError as e:
+                if e.status != 412:
+                    raise
+                # Evento cambiato sul server da altri: il database resta la fonte e si sovrascrive
+                self._metrics["conflicts"] += 1
+                return "done", await self._with_retry(operation, *arguments, True)
+        except RemoteError as e:
+            if e.transient:
+                return self._failed(action, uid, e)
+            self._metrics["last_error"] = f"{action} {uid}: {e}"
+            print(f"⚠️ CalDAV {action} {uid} rifiutato dal server: {e}")
+            return "rejected", str(e)
+        except Exception as e:
+            return self._failed(action, uid, e)
+
+    def _failed(self, action: str, uid: str, error: Exception) -> Tuple[str, Optional[str]]:
+        self._metrics["last_error"] = f"{action} {uid}: {error}"
+        print(f"⚠️ CalDAV {action} {uid} non riuscito: {error}")
+        return "failed", None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "enabled": self.enabled, "requests": self.remote.requests if self.remote else 0}
+
+
+# Istanza globale della sincronizzazione CalDAV
+caldav_sync = CalDavSyncEngine()
@@ -0,0 +1,245 @@
+import hashlib
+import hmac
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+from icalendar import Calendar, Event, Timezone, TimezoneDaylight, TimezoneStandard, vRecur
+from ..config import settings
+from ..repositories import bookings_repository, booking_series_repository, spaces_repository, users_repository
+from ..repositories.spaces import SPACE_SUMMARY
+from .request_coalescer import request_coalescer
+from .recurrence import series_timezone
+from .space_snapshots import space_snapshots
+
+PRODID = "-//ClassRent//Calendario spazi//IT"
+
+
+def feed_token(kind: str, key: str) -> str:
+    """Token nell'URL del feed: le app calendario non possono inviare il token Bearer"""
+    return hmac.new(settings.secret_key.encode(), f"{kind}:{key}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def valid_feed_token(kind: str, key: str, token: Optional[str]) -> bool:
+    return hmac.compare_digest(feed_token(kind, key), token or "")
+
+
+def as_utc(value: datetime) -> datetime:
+    """I datetime salvati sono UTC senza fuso: nel feed si scrivono con Z"""
+    return value.replace(tzinfo=timezone.utc)
+
+
+@lru_cache(maxsize=64)
+def _transitions(name: str, year: int) -> List[Tuple[datetime, timedelta, timedelta, str, bool]]:
+    """Cambi d'ora dell'anno: (ora locale prima del cambio, offset prima, offset dopo, nome, legale)"""
+    tz = series_timezone(name)
+    moment = datetime(year, 1, 1, tzinfo=timezone.utc)
+    previous = moment.astimezone(tz)
+    transitions = []
+    while moment.year == year:
+        moment += timedelta(hours=1)
+        current = moment.astimezone(tz)
+        if current.utcoffset() != previous.utcoffset():
+            local_before = (moment + previous.utcoffset()).replace(tzinfo=None)
+            transitions.append((local_before, previous.utcoffset(), current.utcoffset(),
+                                current.tzname(), bool(current.dst())))
+        previous = current
+    return transitions
+
+
+def feed_timezone(name: str, first_year: int, last_year: int) -> Timezone:
+    """VTIMEZONE con i cambi d'ora degli anni indicati, richiesto dai DTSTART con TZID"""
+    component = Timezone()
+    component.add("tzid", name)
+    transitions = [item for year in range(first_year, last_year + 1) for item in _transitions(name, year)]
+    if not transitions:
+        # Fuso senza ora legale: un solo offset
+        reference = datetime(first_year, 1, 1, tzinfo=timezone.utc).astimezone(series_timezone(name))
+        transitions = [(datetime(1970, 1, 1), reference.utcoffset(), reference.utcoffset(), reference.tzname(), False)]
+    for local_before, offset_from, offset_to, tzname, daylight in transitions:
+        observance = TimezoneDaylight() if daylight else TimezoneStandard()
+        observance.add("dtstart", local_before)
+        observance.add("tzoffsetfrom", offset_from)
+        observance.add("tzoffsetto", offset_to)
+        observance.add("tzname", tzname)
+        component.add_component(observance)
+    return component
+
+
+def feed_timezones(documents: List[Dict[str, Any]]) -> List[Timezone]:
+    """Un VTIMEZONE per ogni fuso delle serie, dall'anno di inizio a quello di fine"""
+    years: Dict[str, Tuple[int, int]] = {}
+    for document in documents:
+        if "rrule" not in document:
+            continue
+        name = series_timezone(document.get("timezone")).key
+        first = document["start_datetime"].year
+        last = (document.get("window_end") or document["start_datetime"] + timedelta(days=366)).year
+        known = years.get(name, (first, last))
+        years[name] = (min(known[0], first), max(known[1], last))
+    return [feed_timezone(name, first, last) for name, (first, last) in sorted(years.items())]
+
+
+def describe_mark(mark: Optional[Tuple[Optional[datetime], Any]]) -> str:
+    if mark is None:
+        return "-"
+    updated_at, object_id = mark
+    return f"{updated_at.isoformat() if updated_at else ''}:{object_id}"
+
+
+def feed_event(document: Dict[str, Any], space: Optional[Dict[str, Any]], private: bool) -> Event:
+    """
+    VEVENT di una prenotazione, oppure di una serie con RRULE ed EXDATE (una
+    sola voce per tutto il semestre). Le serie sono scritte nell'ora locale
+    con TZID, così il client le ripete come il server anche dopo il cambio
+    d'ora; il calendario deve contenere i VTIMEZONE di feed_timezones. Nei
+    feed degli spazi niente note e scopo abbreviato, come nel calendario
+    condiviso.
+    """
+    is_series = "rrule" in document
+    # Prenotazioni singole in UTC (Z), serie nel loro fuso
+    local = series_timezone(document.get("timezone")) if is_series else timezone.utc
+    event = Event()
+    event.add("uid", f"{'series' if is_series else 'booking'}-{document['_id']}@classrent")
+    # DTSTAMP dall'ultima modifica: lo stesso dato produce sempre lo stesso testo
+    event.add("dtstamp", as_utc(document.get("updated_at") or document["start_datetime"]))
+    event.add("dtstart", as_utc(document["start_datetime"]).astimezone(local))
+    event.add("dtend", as_utc(document["end_datetime"]).astimezone(local))
+
+    purpose = document.get("purpose", "")
+    if not private and len(purpose) > 50:
+        purpose = purpose[:50] + "..."
+    event.add("summary", purpose)
+
+    name = (space or {}).get("name") or "Spazio eliminato"
+    location = (space or {}).get("location")
+    event.add("location", f"{name} - {location}" if location else name)
+    event.add("status", "TENTATIVE" if document.get("status") == "pending" else "CONFIRMED")
+
+    if is_series:
+        recur = vRecur(vRecur.from_ical(document["rrule"]))
+        if "UNTIL" in recur:
+            # Con DTSTART e TZID UNTIL deve essere in UTC (RFC 5545); le serie vecchie lo salvano senza Z
+            recur["UNTIL"] = [as_utc(until) for until in recur["UNTIL"]]
+        event.add("rrule", recur)
+        if document.get("exdates"):
+            event.add("exdate", [as_utc(exdate).astimezone(local) for exdate in document["exdates"]])
+
+    if private:
+        details = [document.get("notes") or ""]
+        if document.get("materials_requested"):
+            details.append("Materiali: " + ", ".join(document["materials_requested"]))
+        description = "\n".join(detail for detail in details if detail)
+        if description:
+            event.add("description", description)
+    return event
+
+
+class CalendarFeedService:
+    """
+    Feed iCalendar per spazio e per utente, pensati per le app calendario
+    che ripetono la stessa richiesta ogni pochi minuti. Ogni feed resta in
+    cache con la sua versione: a ogni richiesta tre query indicizzate
+    (proprietario e ultima modifica di prenotazioni e serie) dicono se il
+    feed è cambiato, anche per scritture di altre istanze o degli script, e
+    solo in quel caso si ricostruisce. L'ETag dipende solo dai dati, quindi
+    resta valido anche dopo un riavvio o su un'altra istanza.
+    """
+
+    def __init__(self):
+        self.past_days = settings.ics_feed_past_days
+        self.future_days = settings.ics_feed_future_days
+        self.max_entries = settings.ics_feed_cache_size
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._metrics = {"revalidated": 0, "builds": 0, "not_modified": 0}
+
+    async def _version(self, kind: str, key: str, day: str) -> Optional[Tuple[str, str]]:
+        """Versione dei dati del feed e titolo del calendario (None se lo spazio o l'utente non esiste)"""
+        if kind == "space":
+            space = await spaces_repository.get_by_id(key, SPACE_SUMMARY)
+            if not space:
+                return None
+            owner_filter = {"space_id": key}
+            title = f"ClassRent - {space['name']}"
+            label = f"{space['name']}|{space.get('location')}"
+        else:
+            user = await users_repository.get_by_id(key)
+            if not user:
+                return None
+            owner_filter = {"user_id": key}
+            title = f"ClassRent - {user['full_name']}"
+            label = user["full_name"]
+
+        bookings_mark = await bookings_repository.latest_change(owner_filter)
+        series_mark = await booking_series_repository.latest_change(owner_filter)
+        marks = "|".join(describe_mark(mark) for mark in (bookings_mark, series_mark))
+        # La finestra del feed scorre ogni giorno
+        return f"{day}|{label}|{marks}", title
+
+    async def _build(self, kind: str, key: str, title: str, now: datetime) -> bytes:
+        start = now - timedelta(days=self.past_days)
+        end = now + timedelta(days=self.future_days)
+        owner = {"space_id": key} if kind == "space" else {"user_id": key}
+        bookings = await bookings_repository.list_calendar_between(start, end, **owner)
+        series_list = await booking_series_repository.list_overlapping(start, end, **owner)
+
+        documents: List[Dict[str, Any]] = bookings + series_list
+        spaces = await space_snapshots.resolve(documents)
+
+        calendar = Calendar()
+        calendar.add("prodid", PRODID)
+        calendar.add("version", "2.0")
+        calendar.add("x-wr-calname", title)
+        calendar.add("x-published-ttl", "PT15M")
+        for component in feed_timezones(documents):
+            calendar.add_component(component)
+        for document, space in zip(documents, spaces):
+            calendar.add_component(feed_event(document, space, private=(kind == "user")))
+        return calendar.to_ical()
+
+    async def get_feed(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Feed ("space" o "user") con body ed ETag; None se lo spazio o l'utente non esiste"""
+        now = datetime.utcnow()
+        day = now.date().isoformat()
+        cache_key = (kind, key)
+
+        # Sempre dal database: i contatori del processo non vedono le scritture di altre istanze
+        resolved = await self._version(kind, key, day)
+        if resolved is None:
+            self._cache.pop(cache_key, None)
+            return None
+        version, title = resolved
+
+        entry = self._cache.get(cache_key)
+        if entry and entry["version"] == version:
+            self._cache.move_to_end(cache_key)
+            self._metrics["revalidated"] += 1
+            return entry
+
+        async def build():
+            self._metrics["builds"] += 1
+            return await self._build(kind, key, title, now)
+
+        # Le app che chiedono lo stesso feed insieme condividono una sola costruzione
+        body = await request_coalescer.run("calendar.feed", {"kind": kind, "key": key, "version": version},
+                                           "feed", build, ttl=0)
+        entry = {
+            "version": version,
+            "etag": f'"{hashlib.sha1(version.encode()).hexdigest()[:20]}"',
+            "body": body
+        }
+        self._cache[cache_key] = entry
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return entry
+
+    def record_not_modified(self):
+        self._metrics["not_modified"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "cached_feeds": len(self._cache)}
+
+
+# Istanza globale dei feed ICS
+calendar_feeds = CalendarFeedService()
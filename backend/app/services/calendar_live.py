@@ -0,0 +1,253 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set, AsyncIterator
+from pymongo.errors import OperationFailure, PyMongoError
+from ..config import settings
+from ..database import get_database
+from ..repositories.versions import collection_versions
+from ..responses import dumps
+
+WATCHED_COLLECTIONS = ["bookings", "booking_series", "calendar_events"]
+
+
+def compact_delta(change: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Delta minimo per il client: cosa è cambiato, dove e quando (niente dati personali)"""
+    collection = change.get("ns", {}).get("coll")
+    operation = change.get("operationType")
+    document_id = str(change.get("documentKey", {}).get("_id"))
+
+    if operation == "delete":
+        return {"op": "delete", "collection": collection, "id": document_id}
+    if operation not in ("insert", "update", "replace"):
+        return None
+
+    document = change.get("fullDocument")
+    if document is None:
+        # Documento già eliminato quando è stato letto l'update
+        return {"op": "delete", "collection": collection, "id": document_id}
+
+    status = document.get("status")
+    # Una serie tocca tutta la sua finestra: i client nel periodo ricaricano
+    start = document.get("window_start", document.get("start_datetime"))
+    end = document.get("window_end", document.get("end_datetime"))
+    delta = {
+        "op": "cancel" if status == "cancelled" else "upsert",
+        "collection": collection,
+        "id": document_id,
+        "space_id": document.get("space_id"),
+        "start_datetime": start,
+        "end_datetime": end,
+        "status": status
+    }
+    if document.get("booking_id"):
+        delta["booking_id"] = document["booking_id"]
+    return delta
+
+
+def sse_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    lines = f"id: {event_id}\n" if event_id else ""
+    return (lines + f"event: {event}\ndata: ").encode() + dumps(data) + b"\n\n"
+
+
+class LiveSubscription:
+    """Una connessione: filtro spazi/intervallo e coda limitata (backpressure per connessione)"""
+
+    def __init__(self, space_ids: Optional[Set[str]], start: datetime, end: datetime, queue_size: int):
+        self.space_ids = space_ids
+        self.start = start
+        self.end = end
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        self.delivered = 0
+
+    def matches(self, delta: Dict[str, Any]) -> bool:
+        if delta["op"] == "delete":
+            return True
+        if self.space_ids and delta.get("space_id") not in self.space_ids:
+            return False
+        start, end = delta.get("start_datetime"), delta.get("end_datetime")
+        if isinstance(start, datetime) and isinstance(end, datetime):
+            return start < self.end and end > self.start
+        return True
+
+    def offer(self, payload: bytes):
+        """Non blocca mai l'hub: se il client è lento si scarta e gli si chiede un resync"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+            self.delivered += 1
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class CalendarLiveHub:
+    """
+    Calendario in tempo reale: un solo change stream MongoDB su bookings e
+    calendar_events, i cui delta compatti sono inviati (SSE) ai client
+    connessi filtrando per spazio e intervallo visualizzato. Ogni evento
+    porta come id il resume token del change stream: alla riconnessione il
+    client invia Last-Event-ID e riceve gli eventi persi dal buffer recente,
+    oppure un resync se il token è troppo vecchio.
+    """
+
+    def __init__(self):
+        self.queue_size = settings.live_queue_size
+        self.heartbeat_seconds = settings.live_heartbeat_seconds
+        self.available = False
+
+        self._subscriptions: Set[LiveSubscription] = set()
+        self._by_space: Dict[str, Set[LiveSubscription]] = {}
+        self._unfiltered: Set[LiveSubscription] = set()
+        self._recent: deque = deque(maxlen=settings.live_replay_size)
+        self._task: Optional[asyncio.Task] = None
+
+        self._metrics = {"changes": 0, "deliveries": 0, "overflows": 0, "resumes": 0, "resyncs": 0}
+
+    async def start(self):
+        if not settings.live_calendar_enabled or self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.available = False
+
+    async def _watch(self):
+        resume_token = None
+        pipeline = [{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]
+        while True:
+            try:
+                db = await get_database(profiled=False)
+                async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.available = True
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.publish(change)
+
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if resume_token is not None:
+                    # Token non più nell'oplog: si riparte da ora e tutti i client ricaricano
+                    print(f"⚠️ Ripresa change stream calendario fallita ({e.code}), resync dei client")
+                    resume_token = None
+                    self._recent.clear()
+                    for subscription in self._subscriptions:
+                        subscription.overflowed = True
+                    continue
+                # Change stream non disponibili (es. MongoDB standalone): i client useranno il polling
+                print(f"⚠️ Calendario live non disponibile ({e.code}): i client useranno il polling")
+                self.available = False
+                return
+            except PyMongoError as e:
+                print(f"⚠️ Change stream calendario interrotto: {e}")
+                await asyncio.sleep(1)
+
+    def subscribe(self, space_ids: Optional[Set[str]], start: datetime, end: datetime) -> LiveSubscription:
+        subscription = LiveSubscription(space_ids, start, end, self.queue_size)
+        self._subscriptions.add(subscription)
+        if space_ids:
+            for space_id in space_ids:
+                self._by_space.setdefault(space_id, set()).add(subscription)
+        else:
+            self._unfiltered.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LiveSubscription):
+        self._subscriptions.discard(subscription)
+        self._unfiltered.discard(subscription)
+        for space_id in subscription.space_ids or ():
+            subscribers = self._by_space.get(space_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_space[space_id]
+
+    def publish(self, change: Dict[str, Any]):
+        """Serializza il delta una volta e lo consegna ai soli iscritti interessati"""
+        delta = compact_delta(change)
+        if delta is None:
+            return
+        # Scritture anche da altre istanze: gli ETag che dipendono dalla collection scadono
+        collection_versions.bump(delta["collection"])
+
+        token = (change.get("_id") or {}).get("_data")
+        payload = sse_event("change", delta, token)
+        self._recent.append((token, delta, payload))
+        self._metrics["changes"] += 1
+
+        if delta["op"] == "delete" or not delta.get("space_id"):
+            candidates = self._subscriptions
+        else:
+            candidates = self._unfiltered | self._by_space.get(delta["space_id"], set())
+
+        for subscription in candidates:
+            if subscription.matches(delta):
+                was_overflowed = subscription.overflowed
+                subscription.offer(payload)
+                if subscription.overflowed and not was_overflowed:
+                    self._metrics["overflows"] += 1
+                elif not subscription.overflowed:
+                    self._metrics["deliveries"] += 1
+
+    def _replay(self, subscription: LiveSubscription, last_event_id: str) -> Optional[List[bytes]]:
+        """Eventi dopo last_event_id per questa iscrizione, None se il token non è più nel buffer"""
+        tokens = [token for token, _, _ in self._recent]
+        if last_event_id not in tokens:
+            return None
+        start = tokens.index(last_event_id) + 1
+        return [payload for _, delta, payload in list(self._recent)[start:] if subscription.matches(delta)]
+
+    async def stream(self, space_ids: Optional[Set[str]], start: datetime, end: datetime,
+                     last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Flusso SSE di una connessione: replay, delta, heartbeat e resync"""
+        yield b"retry: 3000\n\n"
+        if not self.available:
+            yield sse_event("unavailable", {"reason": "change stream non disponibile"})
+            return
+
+        # Iscrizione al primo giro del generatore: il finally la rimuove sempre
+        subscription = self.subscribe(space_ids, start, end)
+        try:
+            if last_event_id:
+                replay = self._replay(subscription, last_event_id)
+                if replay is None:
+                    self._metrics["resyncs"] += 1
+                    yield sse_event("resync", {"reason": "token di ripresa scaduto"})
+                else:
+                    self._metrics["resumes"] += 1
+                    for payload in replay:
+                        yield payload
+
+            while True:
+                if subscription.overflowed:
+                    # Client troppo lento: si svuota la coda e si chiede di ricaricare l'intervallo
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.overflowed = False
+                    self._metrics["resyncs"] += 1
+                    yield sse_event("resync", {"reason": "client in ritardo"})
+                    continue
+                try:
+                    payload = await asyncio.wait_for(subscription.queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                yield payload
+        finally:
+            self.unsubscribe(subscription)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "available": self.available, "connections": len(self._subscriptions), "buffered": len(self._recent)}
+
+
+# Istanza globale del calendario live
+calendar_live = CalendarLiveHub()
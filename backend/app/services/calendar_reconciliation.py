@@ -0,0 +1,71 @@
+from typing import Dict, Any, Optional
+from ..repositories import bookings_repository, calendar_events_repository
+from ..repositories.bookings import BOOKING_SUMMARY
+
+DRIFT_KINDS = ("orphan", "duplicate", "status", "space", "times")
+
+
+def mirror_drift(event: Dict[str, Any], booking: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Tipo di divergenza tra la copia legacy in calendar_events e la prenotazione (None se allineate)"""
+    if booking is None:
+        return "orphan"
+    if (event.get("status") == "cancelled") != (booking.get("status") == "cancelled"):
+        return "status"
+    if event.get("space_id") != booking.get("space_id"):
+        return "space"
+    if (event.get("start_datetime"), event.get("end_datetime")) != (booking.get("start_datetime"), booking.get("end_datetime")):
+        return "times"
+    return None
+
+
+class CalendarReconciler:
+    """
+    Riconciliazione delle copie delle prenotazioni scritte in calendar_events
+    prima che il calendario leggesse direttamente da bookings. Confronta ogni
+    copia con la prenotazione (a batch, una query $in per batch) e riporta le
+    divergenze; con apply le copie vengono eliminate, perché bookings è
+    l'unica fonte, e alle prenotazioni legacy si assegna updated_at.
+    """
+
+    async def run(self, apply: bool = False, batch_size: int = 500, max_samples: int = 20) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "mirrors": 0,
+            "in_sync": 0,
+            "drift": {kind: 0 for kind in DRIFT_KINDS},
+            "samples": [],
+            "deleted": 0,
+            "bookings_backfilled": 0,
+            "applied": apply
+        }
+        seen = set()
+        after = None
+
+        while True:
+            batch = await calendar_events_repository.mirror_batch(after, batch_size)
+            if not batch:
+                break
+            after = batch[-1]["_id"]
+            bookings = await bookings_repository.get_many([event["booking_id"] for event in batch], BOOKING_SUMMARY)
+
+            for event in batch:
+                report["mirrors"] += 1
+                booking_id = str(event["booking_id"])
+                drift = "duplicate" if booking_id in seen else mirror_drift(event, bookings.get(booking_id))
+                seen.add(booking_id)
+                if drift is None:
+                    report["in_sync"] += 1
+                    continue
+                report["drift"][drift] += 1
+                if len(report["samples"]) < max_samples:
+                    report["samples"].append({"event_id": str(event["_id"]), "booking_id": booking_id, "drift": drift})
+
+            if apply:
+                report["deleted"] += await calendar_events_repository.delete_many([event["_id"] for event in batch])
+
+        if apply:
+            report["bookings_backfilled"] = await bookings_repository.backfill_updated_at()
+        return report
+
+
+# Istanza globale della riconciliazione calendario
+calendar_reconciler = CalendarReconciler()
@@ -0,0 +1,217 @@
+import re
+import unicodedata
+from typing import Dict, Any, Optional
+from datetime import datetime, timedelta
+
+# Tipi di spazio riconosciuti (forma normalizzata -> tipo nel database)
+SPACE_TYPE_KEYWORDS = [
+    (r"\bbox medic[oi]\b", "box_medico"),
+    (r"\bsal[ae] riunion[ei]\b", "sala_riunioni"),
+    (r"\blab(oratori[oi])?\b", "laboratorio"),
+    (r"\baul[ae]\b", "aula"),
+]
+
+# Materiali riconosciuti (forma normalizzata -> nome nel database)
+MATERIAL_KEYWORDS = [
+    (r"\bproiettor[ei]\b", "Proiettore"),
+    (r"\b(pc|computer)\b", "PC"),
+    (r"\blavagn[ae] interattiv[ae]\b", "Lavagna Interattiva"),
+    (r"\bmicrofon[oi]\b", "Microfono"),
+    (r"\bwebcam\b", "Webcam"),
+    (r"\bschermo grande\b", "Schermo Grande"),
+]
+
+WEEKDAYS = ["lunedi", "martedi", "mercoledi", "giovedi", "venerdi", "sabato", "domenica"]
+
+# Verbi che indicano un'azione di scrittura: li gestisce sempre l'AI
+WRITE_ACTION_PATTERN = re.compile(
+    r"\b(prenot(a|are|ami|iamo|o|erei)|cancell(a|are|ami)|annull(a|are|ami)|"
+    r"spost(a|are|ami)|modific(a|are|ami)|disdic\w*)\b"
+)
+
+MY_BOOKINGS_PATTERN = re.compile(
+    r"\b(mie|miei|mia|mio)( \w+){0,2} prenotazion[ei]\b|\bprenotazion[ei] (mie|che ho)\b|"
+    r"\bstorico( delle)? prenotazion[ei]\b|\bho prenotato\b"
+)
+
+CHECKLIST_PATTERN = re.compile(
+    r"\bcosa (mi |ci )?(serve|servono|occorre|devo (preparare|portare))\b|\bchecklist\b|"
+    r"\b(lista|elenco) (delle cose |di cose )?(per|da)\b"
+)
+
+SEARCH_SPACE_PATTERN = re.compile(
+    r"\b(aul[ae]|spaz[io]|laboratori[oi]|lab|sal[ae]|box)\b"
+)
+
+SEARCH_VERB_PATTERN = re.compile(
+    r"\b(liber[ei]|disponibil[ei]|ci sono|quali|quale|cerco|cerca|trova|trovami|mostra|mostrami|elenca|c'e)\b"
+)
+
+
+class ChatIntentRouter:
+    """
+    Parser deterministico di intenti e slot per la chat.
+    Riconosce le richieste più frequenti senza passare dall'LLM;
+    restituisce None per i messaggi ambigui.
+    """
+
+    def normalize(self, message: str) -> str:
+        """Minuscolo, senza accenti e spazi multipli"""
+        text = unicodedata.normalize("NFKD", message.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = text.replace("’", "'")
+        return re.sub(r"\s+", " ", text).strip()
+
+    def is_write_action(self, message: str) -> bool:
+        """True se il messaggio chiede di prenotare, annullare o modificare qualcosa"""
+        return bool(WRITE_ACTION_PATTERN.search(self.normalize(message)))
+
+    def parse(self, message: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Restituisce {"intent": ..., "slots": {...}} oppure None se il messaggio
+        è ambiguo o richiede un'azione di scrittura.
+        """
+        text = self.normalize(message)
+        if not text:
+            return None
+
+        now = now or datetime.now()
+
+        if WRITE_ACTION_PATTERN.search(text):
+            return None
+
+        candidates = []
+
+        if MY_BOOKINGS_PATTERN.search(text):
+            candidates.append({
+                "intent": "my_bookings",
+                "slots": {"status": self._parse_booking_status(text)}
+            })
+
+        if CHECKLIST_PATTERN.search(text):
+            activity_type = self._parse_activity(text)
+            if activity_type:
+                candidates.append({
+                    "intent": "checklist",
+                    "slots": {
+                        "activity_type": activity_type,
+                        "space_type": self._parse_space_type(text)
+                    }
+                })
+
+        if SEARCH_SPACE_PATTERN.search(text) and SEARCH_VERB_PATTERN.search(text):
+            candidates.append({
+                "intent": "search_spaces",
+                "slots": self._parse_search_slots(text, now)
+            })
+
+        # Più intenti insieme = messaggio ambiguo, se ne occupa l'AI
+        if len(candidates) != 1:
+            return None
+
+        return candidates[0]
+
+    def _parse_booking_status(self, text: str) -> str:
+        if re.search(r"\b(prossim[ei]|futur[ei]|in arrivo)\b", text):
+            return "upcoming"
+        if re.search(r"\b(passat[ei]|precedent[ei]|vecch[ie]+)\b", text):
+            return "past"
+        if re.search(r"\b(cancellat[ei]|annullat[ei])\b", text):
+            return "cancelled"
+        return "all"
+
+    def _parse_activity(self, text: str) -> Optional[str]:
+        for key in ["laurea", "tesi", "seminario"]:
+            if key in text:
+                return key
+
+        match = re.search(r"\bper (il |lo |la |l'|un |una |uno |un')?([a-z' ]{3,40}?)\s*[?.!]*$", text)
+        if match:
+            return match.group(2).strip()
+        return None
+
+    def _parse_space_type(self, text: str) -> Optional[str]:
+        for pattern, space_type in SPACE_TYPE_KEYWORDS:
+            if re.search(pattern, text):
+                return space_type
+        return None
+
+    def _parse_search_slots(self, text: str, now: datetime) -> Dict[str, Any]:
+        slots: Dict[str, Any] = {}
+
+        space_type = self._parse_space_type(text)
+        if space_type:
+            slots["space_type"] = space_type
+
+        capacity = re.search(
+            r"\b(?:per|da|almeno|con)\s+(\d{1,4})\s*(?:persone|posti|studenti|partecipanti|utenti)\b", text
+        )
+        if capacity:
+            slots["capacity"] = int(capacity.group(1))
+
+        materials = [name for pattern, name in MATERIAL_KEYWORDS if re.search(pattern, text)]
+        if materials:
+            slots["materials"] = materials
+
+        date = self._parse_date(text, now)
+        if date:
+            slots["date"] = date.strftime("%Y-%m-%d")
+
+        interval = re.search(r"\bdalle (\d{1,2})(?:[:.](\d{2}))? alle (\d{1,2})(?:[:.](\d{2}))?\b", text)
+        if interval:
+            start_h, start_m = int(interval.group(1)), int(interval.group(2) or 0)
+            end_h, end_m = int(interval.group(3)), int(interval.group(4) or 0)
+            if 0 <= start_h < 24 and 0 <= end_h < 24 and (end_h, end_m) > (start_h, start_m):
+                slots["start_time"] = f"{start_h:02d}:{start_m:02d}"
+                slots["duration_hours"] = ((end_h * 60 + end_m) - (start_h * 60 + start_m)) / 60
+        else:
+            start = re.search(r"\b(?:alle|ore|dalle)\s+(\d{1,2})(?:[:.](\d{2}))?\b", text)
+            if start and int(start.group(1)) < 24:
+                slots["start_time"] = f"{int(start.group(1)):02d}:{int(start.group(2) or 0):02d}"
+
+            duration = re.search(r"\bper (\d{1,2}(?:[.,]\d)?) or[ae]\b", text)
+            if duration:
+                slots["duration_hours"] = float(duration.group(1).replace(",", "."))
+
+        return slots
+
+    def _parse_date(self, text: str, now: datetime) -> Optional[datetime]:
+        today = datetime.combine(now.date(), datetime.min.time())
+
+        if re.search(r"\bdopodomani\b", text):
+            return today + timedelta(days=2)
+        if re.search(r"\bdomani\b", text):
+            return today + timedelta(days=1)
+        if re.search(r"\boggi\b", text):
+            return today
+
+        iso = re.search(r"\b(\d{4})-(\d{2})-(\d{2})\b", text)
+        if iso:
+            try:
+                return datetime(int(iso.group(1)), int(iso.group(2)), int(iso.group(3)))
+            except ValueError:
+                return None
+
+        numeric = re.search(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b", text)
+        if numeric:
+            day, month = int(numeric.group(1)), int(numeric.group(2))
+            year = numeric.group(3)
+            year = int(year) + (2000 if len(year) == 2 else 0) if year else today.year
+            try:
+                parsed = datetime(year, month, day)
+            except ValueError:
+                return None
+            if not numeric.group(3) and parsed < today:
+                parsed = parsed.replace(year=year + 1)
+            return parsed
+
+        for index, weekday in enumerate(WEEKDAYS):
+            if re.search(rf"\b{weekday}\b", text):
+                days_ahead = (index - today.weekday()) % 7 or 7
+                return today + timedelta(days=days_ahead)
+
+        return None
+
+
+# Istanza globale del router
+chat_intent_router = ChatIntentRouter()
@@ -0,0 +1,198 @@
+import copy
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+from ..config import settings
+from ..repositories import spaces_repository
+from ..repositories.space_catalog import space_catalog
+
+# Parole che non cambiano il senso della domanda
+STOPWORDS = {
+    "a", "ad", "al", "alla", "alle", "allo", "ai", "agli", "c", "che", "chi", "ci", "come",
+    "con", "cosa", "da", "dal", "dalla", "dei", "degli", "del", "della", "delle", "di", "e",
+    "ecco", "gli", "ha", "hai", "ho", "i", "il", "in", "io", "l", "la", "le", "lo", "ma",
+    "me", "mi", "ne", "nel", "nella", "per", "puoi", "quale", "quali", "quanti", "quante",
+    "se", "si", "sono", "su", "sul", "sulla", "ti", "tu", "un", "una", "uno", "vorrei", "ciao",
+    "mostrami", "dimmi", "sapere", "elenca", "favore", "grazie", "qual"
+}
+
+CATALOG_TAG = "catalog"
+
+
+class ChatResponseCache:
+    """
+    Cache delle risposte della chat che non dipendono dallo stato dell'utente
+    (checklist, catalogo spazi). Chiave: messaggio normalizzato + ruolo;
+    le parafrasi vengono riconosciute con una similarità lessicale locale.
+    """
+
+    def __init__(self):
+        self.ttl_seconds = settings.chat_cache_ttl_seconds
+        self.max_entries = settings.chat_cache_max_entries
+        self.similarity_threshold = settings.chat_cache_similarity_threshold
+        self.catalog_check_interval = settings.chat_cache_catalog_check_seconds
+
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._catalog_fingerprint: Optional[str] = None
+        self._catalog_checked_at = 0.0
+
+        self._metrics = {
+            "hits_exact": 0,
+            "hits_similar": 0,
+            "misses": 0,
+            "stores": 0,
+            "invalidations": 0,
+            "saved_latency_seconds": 0.0
+        }
+
+    def normalize(self, message: str) -> str:
+        """Minuscolo, senza accenti, punteggiatura e stopword"""
+        text = unicodedata.normalize("NFKD", message.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        tokens = re.findall(r"[a-z0-9]+", text)
+        return " ".join(token for token in tokens if token not in STOPWORDS)
+
+    def _trigrams(self, text: str) -> Set[str]:
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _similarity(self, a: Dict[str, Any], b: Dict[str, Any]) -> float:
+        """Dice sui trigrammi di caratteri, con i numeri che devono coincidere"""
+        if a["numbers"] != b["numbers"]:
+            return 0.0
+        if not a["trigrams"] or not b["trigrams"]:
+            return 0.0
+        overlap = len(a["trigrams"] & b["trigrams"])
+        return 2 * overlap / (len(a["trigrams"]) + len(b["trigrams"]))
+
+    def _features(self, normalized: str) -> Dict[str, Any]:
+        return {
+            "trigrams": self._trigrams(normalized),
+            "numbers": frozenset(re.findall(r"\d+", normalized))
+        }
+
+    async def get(self, message: str, role: str) -> Optional[Dict[str, Any]]:
+        """Restituisce una copia della risposta in cache, se presente e valida"""
+        await self._check_catalog()
+
+        normalized = self.normalize(message)
+        if not normalized:
+            return None
+
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        entry = self._entries.get((role, normalized))
+        if entry:
+            self._entries.move_to_end((role, normalized))
+            self._metrics["hits_exact"] += 1
+            return self._serve(entry)
+
+        features = self._features(normalized)
+        best_entry, best_score = None, 0.0
+        for (entry_role, _), candidate in self._entries.items():
+            if entry_role != role:
+                continue
+            score = self._similarity(features, candidate)
+            if score > best_score:
+                best_entry, best_score = candidate, score
+
+        if best_entry and best_score >= self.similarity_threshold:
+            self._metrics["hits_similar"] += 1
+            return self._serve(best_entry)
+
+        self._metrics["misses"] += 1
+        return None
+
+    def set(self, message: str, role: str, response: Dict[str, Any],
+            compute_seconds: float, tags: Optional[Set[str]] = None):
+        """Memorizza una risposta indipendente dallo stato dell'utente"""
+        normalized = self.normalize(message)
+        if not normalized:
+            return
+
+        cached_response = copy.deepcopy(response)
+        cached_response.pop("thread_id", None)
+
+        key = (role, normalized)
+        self._entries[key] = {
+            "response": cached_response,
+            "compute_seconds": compute_seconds,
+            "tags": set(tags or ()),
+            "expires_at": time.monotonic() + self.ttl_seconds,
+            **self._features(normalized)
+        }
+        self._entries.move_to_end(key)
+        self._metrics["stores"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, tag: Optional[str] = None):
+        """Invalida tutte le voci, o solo quelle con il tag indicato"""
+        if tag is None:
+            removed = len(self._entries)
+            self._entries.clear()
+        else:
+            keys = [key for key, entry in self._entries.items() if tag in entry["tags"]]
+            for key in keys:
+                del self._entries[key]
+            removed = len(keys)
+
+        if removed:
+            self._metrics["invalidations"] += removed
+
+    def get_metrics(self) -> Dict[str, Any]:
+        hits = self._metrics["hits_exact"] + self._metrics["hits_similar"]
+        lookups = hits + self._metrics["misses"]
+        return {
+            **self._metrics,
+            "saved_latency_seconds": round(self._metrics["saved_latency_seconds"], 3),
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries)
+        }
+
+    def _serve(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        self._metrics["saved_latency_seconds"] += entry["compute_seconds"]
+        response = copy.deepcopy(entry["response"])
+        response.setdefault("data", {})["cached"] = True
+        return response
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            del self._entries[key]
+
+    async def _check_catalog(self):
+        """Invalida le voci del catalogo se gli spazi sono cambiati"""
+        if space_catalog.ready:
+            # Le modifiche arrivano già dal listener del catalogo in memoria
+            return
+
+        now = time.monotonic()
+        if now - self._catalog_checked_at < self.catalog_check_interval:
+            return
+        self._catalog_checked_at = now
+
+        try:
+            digest = hashlib.sha1()
+            for space in await spaces_repository.catalog_fingerprint_documents():
+                digest.update(repr(sorted(space.items())).encode())
+            fingerprint = digest.hexdigest()
+        except Exception as e:
+            print(f"⚠️ Errore verifica catalogo spazi per la cache chat: {e}")
+            return
+
+        if self._catalog_fingerprint is not None and fingerprint != self._catalog_fingerprint:
+            print("🔄 Catalogo spazi modificato: invalido la cache della chat")
+            self.invalidate(CATALOG_TAG)
+        self._catalog_fingerprint = fingerprint
+
+
+# Istanza globale della cache
+chat_response_cache = ChatResponseCache()
+space_catalog.add_listener(lambda: chat_response_cache.invalidate(CATALOG_TAG))
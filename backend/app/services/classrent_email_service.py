@@ -286,6 +286,72 @@ class ClassRentEmailService:
             print(f"❌ Errore invio cancellazione: {e}")
             return False
     
+    async def send_import_summary(self, user_email: str, bookings: List[Dict], user_name: str = "Utente") -> bool:
+        """Riepilogo unico delle prenotazioni create per l'utente da un import orari"""
+        if not self.is_configured:
+            return False
+        
+        try:
+            bookings = sorted(bookings, key=lambda booking: booking["start_datetime"])
+            occurrences = sum(booking.get("occurrence_count", 1) for booking in bookings)
+            subject = f"📅 Orario importato su ClassRent - {occurrences} prenotazioni"
+            
+            rows = "".join(
+                f"<tr><td>{booking['space_snapshot'].get('name') or ''}</td>"
+                f"<td>{booking['start_datetime'].strftime('%d/%m/%Y %H:%M')} - {booking['end_datetime'].strftime('%H:%M')}</td>"
+                f"<td>{str(booking['occurrence_count']) + ' occorrenze' if booking.get('rrule') else 'singola'}</td>"
+                f"<td>{booking['purpose']}</td></tr>"
+                for booking in bookings[:100]
+            )
+            more = f"<p>... e altre {len(bookings) - 100} righe.</p>" if len(bookings) > 100 else ""
+            
+            body = f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="UTF-8">
+                <style>
+                    body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; }}
+                    .container {{ max-width: 700px; margin: 0 auto; background: white; }}
+                    .header {{ background: linear-gradient(135deg, #1976d2, #42a5f5); color: white; padding: 40px 30px; text-align: center; }}
+                    .content {{ padding: 30px; }}
+                    .footer {{ background: #f5f5f5; padding: 20px; text-align: center; font-size: 12px; color: #666; }}
+                    table {{ width: 100%; border-collapse: collapse; font-size: 14px; }}
+                    th, td {{ text-align: left; padding: 8px; border-bottom: 1px solid #eee; }}
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <div style="font-size: 24px; font-weight: bold;">🎓 ClassRent</div>
+                        <h1>Orario importato</h1>
+                    </div>
+                    
+                    <div class="content">
+                        <h2>Ciao {user_name}!</h2>
+                        <p>Sono state create <strong>{occurrences} prenotazioni</strong> a tuo nome dall'orario del semestre.</p>
+                        <table>
+                            <tr><th>🏫 Spazio</th><th>📅 Prima data</th><th>🔁 Ricorrenza</th><th>🎯 Scopo</th></tr>
+                            {rows}
+                        </table>
+                        {more}
+                    </div>
+                    
+                    <div class="footer">
+                        <p><strong>ClassRent</strong> - Notifica automatica</p>
+                        <p>Import processato il {datetime.now().strftime('%d/%m/%Y alle %H:%M')}</p>
+                    </div>
+                </div>
+            </body>
+            </html>
+            """
+            
+            return await self.send_email(user_email, subject, body)
+            
+        except Exception as e:
+            print(f"❌ Errore invio riepilogo import: {e}")
+            return False
+    
     async def send_welcome_email(self, user_email: str, user_name: str, temp_password: str = None) -> bool:
         """Invia email di benvenuto ai nuovi utenti registrati"""
         if not self.is_configured:
@@ -1,165 +1,209 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
-from bson import ObjectId
-from ..database import get_database
+from ..repositories import bookings_repository, booking_series_repository, calendar_events_repository, spaces_repository
+from ..repositories.bookings import BOOKING_CALENDAR
+from ..repositories.booking_series import SERIES_DETAIL
+from ..repositories.calendar_events import CALENDAR_EVENT_CHANGE, SYSTEM_EVENTS
+from ..repositories.changes import Watermark, changes_filter
+from ..repositories.spaces import SPACE_HOURS
+from ..models.booking import BookingStatus
+from .recurrence import occurrences
+from .space_snapshots import space_snapshots
+
+
+def booking_event(booking: Dict[str, Any], space: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Evento calendario derivato da una prenotazione (nessuna copia salvata)"""
+    booking_id = str(booking["_id"])
+    return {
+        "id": booking_id,
+        "booking_id": booking_id,
+        "space_id": booking["space_id"],
+        "space_name": (space or {}).get("name") or "Spazio eliminato",
+        "location": (space or {}).get("location") or "",
+        "start_datetime": booking["start_datetime"],
+        "end_datetime": booking["end_datetime"],
+        "purpose": booking.get("purpose", ""),
+        "materials_requested": booking.get("materials_requested", []),
+        "notes": booking.get("notes", ""),
+        "event_type": "booking",
+        "user_id": booking.get("user_id"),
+        "status": booking.get("status")
+    }
+
+
+def series_event(series: Dict[str, Any], space: Optional[Dict[str, Any]], start: datetime, end: datetime,
+                 status: Optional[str] = None) -> Dict[str, Any]:
+    """Occorrenza di una serie come evento calendario, con ID stabile serie:inizio"""
+    series_id = str(series["_id"])
+    occurrence_id = f"{series_id}:{start.strftime('%Y%m%dT%H%M%S')}"
+    event = booking_event({**series, "_id": occurrence_id, "start_datetime": start, "end_datetime": end}, space)
+    event.update({"booking_id": None, "series_id": series_id, "status": status or series.get("status")})
+    return event
+
+def in_changes_filter(document: Dict[str, Any], start: Optional[datetime], end: Optional[datetime],
+                      space_id: Optional[str]) -> bool:
+    """True se il documento rientra nell'intervallo e nello spazio richiesti dal client"""
+    if space_id and document.get("space_id") != space_id:
+        return False
+    # Le serie si confrontano con la finestra di tutte le occorrenze
+    first = document.get("window_start", document["start_datetime"])
+    last = document.get("window_end")
+    if start and (last <= start if last is not None else first < start):
+        return False
+    return not (end and first >= end)
+
 
 class DatabaseCalendarService:
     """
-    Sistema calendario che usa SOLO il database MongoDB
-    Non richiede API esterne - tutto memorizzato in ClassRent
+    Calendario ClassRent su MongoDB, senza API esterne.
+    Le prenotazioni hanno una sola fonte, la collection bookings: il
+    calendario le legge da lì (read model su richiesta, nessuna doppia
+    scrittura). calendar_events contiene solo gli eventi di sistema.
     """
     
     def __init__(self):
         self.is_configured = True  # Sempre configurato perché usa solo DB
         print("✅ Sistema Calendario Database configurato")
     
-    async def add_booking_to_calendar(self, booking_data: Dict[str, Any], user_email: str = None) -> bool:
-        """
-        Aggiunge prenotazione al calendario database
-        Crea record calendario collegato alla prenotazione
-        """
-        try:
-            db = await get_database()
-            
-            # Crea evento calendario nel database
-            calendar_event = {
-                "booking_id": booking_data.get('booking_id'),
-                "space_id": booking_data.get('space_id'),
-                "space_name": booking_data.get('space_name'),
-                "location": booking_data.get('location'),
-                "start_datetime": booking_data.get('start_datetime'),
-                "end_datetime": booking_data.get('end_datetime'),
-                "purpose": booking_data.get('purpose'),
-                "materials_requested": booking_data.get('materials_requested', []),
-                "notes": booking_data.get('notes', ''),
-                "created_by_email": user_email,
-                "event_type": "booking",
-                "status": "active",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            
-            # Inserisci evento nel database
-            result = await db.calendar_events.insert_one(calendar_event)
-            
-            print(f"✅ Evento calendario aggiunto al database: {booking_data.get('space_name')}")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Errore aggiunta evento calendario DB: {e}")
-            return False
+    async def _booking_events(self, bookings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        spaces = await space_snapshots.resolve(bookings)
+        return [booking_event(booking, space) for booking, space in zip(bookings, spaces)]
     
-    async def update_booking_in_calendar(self, booking_id: str, booking_data: Dict[str, Any]) -> bool:
-        """
-        Aggiorna evento calendario nel database
-        """
-        try:
-            db = await get_database()
-            
-            # Aggiorna evento esistente
-            update_data = {
-                "space_name": booking_data.get('space_name'),
-                "location": booking_data.get('location'),
-                "start_datetime": booking_data.get('start_datetime'),
-                "end_datetime": booking_data.get('end_datetime'),
-                "purpose": booking_data.get('purpose'),
-                "materials_requested": booking_data.get('materials_requested', []),
-                "notes": booking_data.get('notes', ''),
-                "updated_at": datetime.utcnow()
-            }
-            
-            result = await db.calendar_events.update_one(
-                {"booking_id": booking_id},
-                {"$set": update_data}
-            )
-            
-            if result.modified_count > 0:
-                print(f"✅ Evento calendario aggiornato: {booking_id}")
-                return True
-            else:
-                print(f"⚠️ Nessun evento calendario trovato per: {booking_id}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ Errore aggiornamento evento calendario: {e}")
-            return False
+    async def _series_events(self, series_list: List[Dict[str, Any]], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Occorrenze che iniziano nell'intervallo, espanse solo nella finestra"""
+        spaces = await space_snapshots.resolve(series_list)
+        return [
+            series_event(series, space, occurrence_start, occurrence_end)
+            for series, space in zip(series_list, spaces)
+            for occurrence_start, occurrence_end in occurrences(series, start, end)
+            if occurrence_start >= start
+        ]
     
-    async def remove_booking_from_calendar(self, booking_id: str) -> bool:
+    def _series_changes(self, series: Dict[str, Any], space: Optional[Dict[str, Any]],
+                        start: Optional[datetime], end: Optional[datetime]) -> List[Dict[str, Any]]:
         """
-        Rimuove/disattiva evento calendario dal database
+        Tutte le occorrenze di una serie modificata (nel filtro richiesto):
+        date escluse e serie annullate risultano annullate
         """
-        try:
-            db = await get_database()
-            
-            # Marca come cancellato invece di eliminare (per cronologia)
-            result = await db.calendar_events.update_one(
-                {"booking_id": booking_id},
-                {
-                    "$set": {
-                        "status": "cancelled",
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            if result.modified_count > 0:
-                print(f"✅ Evento calendario rimosso: {booking_id}")
-                return True
-            else:
-                print(f"⚠️ Nessun evento calendario trovato per rimozione: {booking_id}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ Errore rimozione evento calendario: {e}")
-            return False
+        window_start = max(start, series["window_start"]) if start else series["window_start"]
+        window_end = min(end, series["window_end"]) if end else series["window_end"]
+        cancelled = series["status"] == BookingStatus.CANCELLED
+        skipped = set(series.get("exdates") or ())
+        return [
+            series_event(series, space, occurrence_start, occurrence_end,
+                         BookingStatus.CANCELLED.value if cancelled or occurrence_start in skipped else None)
+            for occurrence_start, occurrence_end in occurrences(series, window_start, window_end, include_skipped=True)
+            if occurrence_start >= window_start
+        ]
     
     async def get_calendar_events(self, start_date: datetime, end_date: datetime, space_id: str = None) -> List[Dict]:
         """
-        Recupera eventi calendario dal database per periodo
+        Recupera eventi calendario dal database per periodo:
+        prenotazioni attive, occorrenze delle serie ed eventi di sistema,
+        ordinati per inizio
         """
         try:
-            db = await get_database()
-            
-            # Costruisci query
-            filter_query = {
-                "start_datetime": {"$gte": start_date, "$lt": end_date},
-                "status": "active"
-            }
-            
-            if space_id:
-                filter_query["space_id"] = space_id
-            
-            # Recupera eventi
-            events = []
-            async for event in db.calendar_events.find(filter_query).sort("start_datetime", 1):
-                events.append({
-                    "id": str(event["_id"]),
-                    "booking_id": event.get("booking_id"),
-                    "space_id": event.get("space_id"),
-                    "space_name": event.get("space_name"),
-                    "location": event.get("location"),
-                    "start_datetime": event.get("start_datetime"),
-                    "end_datetime": event.get("end_datetime"),
-                    "purpose": event.get("purpose"),
-                    "materials_requested": event.get("materials_requested", []),
-                    "notes": event.get("notes", ""),
-                    "created_by_email": event.get("created_by_email"),
-                    "event_type": event.get("event_type", "booking")
-                })
-            
-            return events
+            bookings = await bookings_repository.list_calendar_between(start_date, end_date, space_id)
+            events = await self._booking_events(bookings)
+            series_list = await booking_series_repository.list_overlapping(start_date, end_date, space_id)
+            events += await self._series_events(series_list, start_date, end_date)
+            events += await calendar_events_repository.list_active_between(start_date, end_date, space_id)
+            return sorted(events, key=lambda event: event["start_datetime"])
             
         except Exception as e:
             print(f"❌ Errore recupero eventi calendario: {e}")
             return []
     
+    async def get_changes(self, since: Dict[str, Watermark], settled_before: datetime,
+                          start: Optional[datetime], end: Optional[datetime], space_id: Optional[str],
+                          limit: int) -> Tuple[List[Dict[str, Any]], Dict[str, Watermark], bool]:
+        """
+        Modifiche dopo il token da prenotazioni, serie ricorrenti ed eventi di
+        sistema, unite in ordine di updated_at. Una serie modificata produce
+        tutte le sue occorrenze nel filtro. Restituisce eventi, nuovo
+        watermark per collection e se ci sono altre pagine.
+
+        Con un watermark per la collection si leggono tutte le sue modifiche,
+        anche dei documenti spostati fuori dall'intervallo o dallo spazio del
+        client: questi tornano come annullati, così il client li rimuove. Una
+        serie modificata è preceduta da un annullamento con id della serie,
+        che rimuove le occorrenze calcolate con la regola precedente.
+        """
+        # Le serie si filtrano per finestra: start_datetime è solo la prima occorrenza
+        window = {}
+        if start:
+            window["window_end"] = {"$gt": start}
+        if end:
+            window["window_start"] = {"$lt": end}
+
+        def source_filter(collection_name: str, windowed: bool = True) -> Dict[str, Any]:
+            if collection_name in since:
+                return changes_filter(since[collection_name], settled_before)
+            if not windowed:
+                filter_query = changes_filter(None, settled_before, space_id=space_id)
+                return {"$and": [filter_query, window]} if window else filter_query
+            return changes_filter(None, settled_before, start, end, space_id)
+
+        sources = [
+            (bookings_repository, source_filter("bookings"), BOOKING_CALENDAR),
+            (booking_series_repository, source_filter("booking_series", windowed=False), SERIES_DETAIL)
+        ]
+        if not space_id:
+            # Gli eventi di sistema non appartengono a uno spazio
+            sources.append((calendar_events_repository, {"$and": [source_filter("calendar_events"), SYSTEM_EVENTS]},
+                            CALENDAR_EVENT_CHANGE))
+        
+        candidates = []
+        has_more = False
+        for repository, filter_query, projection in sources:
+            documents, more = await repository.list_changes(filter_query, limit, projection)
+            has_more = has_more or more
+            candidates += [(document["updated_at"], document["_id"], repository.collection_name, document)
+                           for document in documents]
+        
+        candidates.sort(key=lambda candidate: candidate[:2])
+        if len(candidates) > limit:
+            has_more = True
+            candidates = candidates[:limit]
+        
+        # Snapshot spazio di prenotazioni e serie in un solo passaggio, nello stesso ordine
+        derived = [candidate[3] for candidate in candidates if candidate[2] != "calendar_events"]
+        spaces = iter(await space_snapshots.resolve(derived))
+        
+        marks = dict(since)
+        changes = []
+        for updated_at, object_id, collection_name, document in candidates:
+            marks[collection_name] = (updated_at, object_id)
+            # Fuori da intervallo e spazio del client (es. prenotazione spostata): solo la rimozione
+            wanted = in_changes_filter(document, start, end, space_id)
+            if collection_name == "bookings":
+                event = booking_event(document, next(spaces))
+                if not wanted:
+                    event["status"] = BookingStatus.CANCELLED.value
+                changes.append(event)
+            elif collection_name == "booking_series":
+                space = next(spaces)
+                if collection_name in since:
+                    removal = series_event(document, space, document["start_datetime"], document["end_datetime"],
+                                           BookingStatus.CANCELLED.value)
+                    removal["id"] = removal["series_id"]
+                    changes.append(removal)
+                if wanted:
+                    changes += self._series_changes(document, space, start, end)
+            else:
+                document["id"] = str(document.pop("_id"))
+                document.setdefault("materials_requested", [])
+                document.setdefault("notes", "")
+                if not wanted:
+                    document["status"] = BookingStatus.CANCELLED.value
+                changes.append(document)
+        return changes, marks, has_more
+    
     async def get_space_availability_calendar(self, space_id: str, date: datetime) -> Dict[str, Any]:
         """
         Verifica disponibilità spazio per data specifica usando calendario database
         """
         try:
-            db = await get_database()
-            
             # Inizio e fine giornata
             start_of_day = datetime.combine(date.date(), datetime.min.time())
             end_of_day = datetime.combine(date.date(), datetime.max.time())
@@ -168,7 +212,7 @@ class DatabaseCalendarService:
             events = await self.get_calendar_events(start_of_day, end_of_day, space_id)
             
             # Recupera informazioni spazio
-            space = await db.spaces.find_one({"_id": ObjectId(space_id)})
+            space = await spaces_repository.get_by_id(space_id, SPACE_HOURS)
             if not space:
                 return {"error": "Spazio non trovato"}
             
@@ -224,8 +268,6 @@ class DatabaseCalendarService:
         Aggiunge eventi di sistema (manutenzioni, chiusure, etc.)
         """
         try:
-            db = await get_database()
-            
             system_event = {
                 "booking_id": None,
                 "space_id": None,
@@ -243,7 +285,7 @@ class DatabaseCalendarService:
                 "updated_at": datetime.utcnow()
             }
             
-            await db.calendar_events.insert_one(system_event)
+            await calendar_events_repository.insert(system_event)
             print(f"✅ Evento sistema aggiunto: {title}")
             return True
             
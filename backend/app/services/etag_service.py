@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+from typing import Dict, Any, Iterable, Optional
+from fastapi import Request, Response
+from ..repositories import (
+    bookings_repository, booking_series_repository, calendar_events_repository,
+    spaces_repository, users_repository, collection_versions
+)
+
+# Collection che le risposte con ETag possono dichiarare
+REPOSITORIES = {
+    repository.collection_name: repository
+    for repository in (bookings_repository, booking_series_repository, calendar_events_repository,
+                       spaces_repository, users_repository)
+}
+
+
+class ETagService:
+    """
+    ETag deboli per le GET di catalogo e calendario, derivati dallo stato nel
+    database delle collection da cui dipende la risposta (ultima modifica e
+    numero di documenti, una query indicizzata per collection). Valgono anche
+    con più istanze dell'API e con scritture degli script. Se il client invia
+    un If-None-Match ancora valido si risponde 304 senza ricostruire i dati.
+    """
+
+    def __init__(self):
+        self._metrics = {"not_modified": 0, "full_responses": 0}
+
+    async def version(self, collections: Iterable[str]) -> str:
+        """Watermark delle collection indicate, letti in parallelo"""
+        names = sorted(collections)
+        marks = await asyncio.gather(*(REPOSITORIES[name].watermark() for name in names))
+        return "|".join(f"{name}={mark}" for name, mark in zip(names, marks))
+
+    async def make_etag(self, request: Request, collections: Iterable[str], scope: str) -> str:
+        """Watermark + path + query ordinata + ambito (le risposte per utente hanno ETag per utente)"""
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        source = f"{await self.version(collections)}|{request.url.path}|{query}|{scope}"
+        return f'W/"{hashlib.sha1(source.encode()).hexdigest()[:20]}"'
+
+    def matches(self, if_none_match: Optional[str], etag: str) -> bool:
+        """Confronto debole come da RFC 9110: si ignora il prefisso W/"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        opaque = etag[2:] if etag.startswith("W/") else etag
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == opaque:
+                return True
+        return False
+
+    async def check(self, request: Request, response: Response, collections: Iterable[str],
+                    scope: str) -> Optional[Response]:
+        """
+        Restituisce la risposta 304 da inviare subito, oppure None dopo aver
+        impostato ETag e Cache-Control sulla risposta che la route costruirà.
+        """
+        etag = await self.make_etag(request, collections, scope)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if self.matches(request.headers.get("if-none-match"), etag):
+            self._metrics["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        self._metrics["full_responses"] += 1
+        response.headers.update(headers)
+        return None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "versions": collection_versions.snapshot()}
+
+
+# Istanza globale del servizio ETag
+etag_service = ETagService()
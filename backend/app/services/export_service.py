@@ -0,0 +1,222 @@
+import csv
+import io
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from ..config import settings
+from ..repositories import bookings_repository, booking_series_repository, spaces_repository, users_repository
+from ..repositories.bookings import encode_cursor
+from ..repositories.booking_series import SERIES_SLOTS
+from ..repositories.spaces import SPACE_HOURS
+from ..repositories.users import USER_CONTACT
+from .recurrence import occurrences
+from .space_snapshots import space_snapshots
+from ..responses import dumps
+
+BOOKING_COLUMNS = [
+    "id", "start_datetime", "end_datetime", "space_id", "space_name", "user_id", "user_name",
+    "user_email", "purpose", "status", "materials_requested", "notes", "created_at", "resume_cursor"
+]
+OCCUPANCY_COLUMNS = [
+    "space_id", "space_name", "date", "bookings", "booked_minutes", "available_minutes",
+    "occupancy_pct", "resume_cursor"
+]
+
+
+def available_minutes(space: Optional[Dict[str, Any]]) -> int:
+    """Minuti prenotabili in un giorno secondo available_hours (HH:MM)"""
+    hours = (space or {}).get("available_hours") or {}
+    try:
+        start_h, start_m = map(int, hours["start_time"].split(":"))
+        end_h, end_m = map(int, hours["end_time"].split(":"))
+    except (KeyError, ValueError, AttributeError):
+        return 0
+    return max(0, (end_h * 60 + end_m) - (start_h * 60 + start_m))
+
+
+def occupancy_cursor_token(space_id: str, day: str) -> str:
+    return f"{space_id}|{day}"
+
+
+def parse_occupancy_cursor(cursor: str) -> Tuple[str, str]:
+    """Solleva ValueError se il cursore non è valido"""
+    space_id, separator, day = cursor.partition("|")
+    if not separator or not space_id:
+        raise ValueError("Cursore di export non valido")
+    datetime.strptime(day, "%Y-%m-%d")
+    return space_id, day
+
+
+def occupancy_row(group: Dict[str, Any], space: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    space_id, day = group["_id"]["space_id"], group["_id"]["day"]
+    booked = round(group["booked_minutes"])
+    available = available_minutes(space)
+    return {
+        "space_id": space_id,
+        "space_name": space["name"] if space else "Spazio eliminato",
+        "date": day,
+        "bookings": group["bookings"],
+        "booked_minutes": booked,
+        "available_minutes": available,
+        "occupancy_pct": round(100 * booked / available, 1) if available else None,
+        "resume_cursor": occupancy_cursor_token(space_id, day)
+    }
+
+
+def occupancy_group(space_id: str, day: str) -> Dict[str, Any]:
+    return {"_id": {"space_id": space_id, "day": day}, "bookings": 0, "booked_minutes": 0.0}
+
+
+def format_csv(rows: List[Dict[str, Any]], columns: List[str], header: bool = False) -> bytes:
+    """Un blocco CSV: liste unite con ';', datetime ISO 8601"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row.get(column)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, list):
+                value = ";".join(str(item) for item in value)
+            values.append("" if value is None else value)
+        writer.writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+
+def format_ndjson(rows: List[Dict[str, Any]]) -> bytes:
+    return b"".join(dumps(row) + b"\n" for row in rows)
+
+
+class ExportService:
+    """
+    Export in streaming di prenotazioni e occupazione: le righe arrivano dal
+    cursore Mongo a batch, i nomi di spazi e utenti si risolvono con una
+    query $in per batch e ogni batch diventa un blocco della risposta HTTP.
+    Il batch successivo si legge solo dopo che il server ha inviato il
+    precedente (backpressure), quindi la memoria resta costante. Ogni riga
+    porta il resume_cursor da passare come cursor per riprendere dopo di lei.
+
+    L'export delle prenotazioni contiene solo i documenti di bookings: le
+    occorrenze delle serie non hanno id né cursore e restano escluse.
+    L'occupazione invece le conta, espandendole nella finestra richiesta.
+    """
+
+    def __init__(self):
+        self.batch_size = settings.export_batch_size
+
+    async def booking_batches(self, filter_query: Dict[str, Any], after=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        cursor = await bookings_repository.export_cursor(filter_query, after, self.batch_size)
+        batch = []
+        async for booking in cursor:
+            batch.append(booking)
+            if len(batch) >= self.batch_size:
+                yield await self._resolve_bookings(batch)
+                batch = []
+        if batch:
+            yield await self._resolve_bookings(batch)
+
+    async def _resolve_bookings(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        spaces = await space_snapshots.resolve(batch)
+        users = await users_repository.get_many(list({b["user_id"] for b in batch}), USER_CONTACT)
+        rows = []
+        for booking, space in zip(batch, spaces):
+            user = users.get(booking["user_id"])
+            rows.append({
+                "id": str(booking["_id"]),
+                "start_datetime": booking["start_datetime"],
+                "end_datetime": booking["end_datetime"],
+                "space_id": booking["space_id"],
+                "space_name": (space or {}).get("name") or "Spazio eliminato",
+                "user_id": booking["user_id"],
+                "user_name": user.get("full_name") if user else None,
+                "user_email": user.get("email") if user else None,
+                "purpose": booking.get("purpose"),
+                "status": booking.get("status"),
+                "materials_requested": booking.get("materials_requested", []),
+                "notes": booking.get("notes") or "",
+                "created_at": booking.get("created_at"),
+                "resume_cursor": encode_cursor(booking)
+            })
+        return rows
+
+    async def occupancy_batches(self, start: datetime, end: datetime, space_id: Optional[str] = None,
+                                after: Optional[Tuple[str, str]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        series_groups = await self.series_occupancy(start, end, space_id, after)
+        cursor = await bookings_repository.occupancy_cursor(start, end, space_id, after, self.batch_size)
+        batch = []
+        async for group in self._merge_occupancy(cursor, series_groups):
+            batch.append(group)
+            if len(batch) >= self.batch_size:
+                yield await self._resolve_occupancy(batch)
+                batch = []
+        if batch:
+            yield await self._resolve_occupancy(batch)
+
+    async def series_occupancy(self, start: datetime, end: datetime, space_id: Optional[str] = None,
+                               after: Optional[Tuple[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Occorrenze delle serie attive che iniziano nella finestra, raggruppate
+        per (spazio, giorno UTC) come l'aggregazione delle prenotazioni e
+        ordinate allo stesso modo. Restano in memoria: sono al più una riga
+        per spazio con serie e giorno dell'export.
+        """
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for series in await booking_series_repository.list_overlapping(
+            start, end, space_id, {**SERIES_SLOTS, "space_id": 1}
+        ):
+            for occurrence_start, occurrence_end in occurrences(series, start, end):
+                key = (series["space_id"], occurrence_start.strftime("%Y-%m-%d"))
+                if occurrence_start < start or (after is not None and key <= after):
+                    continue
+                group = groups.setdefault(key, occupancy_group(*key))
+                group["bookings"] += 1
+                group["booked_minutes"] += (occurrence_end - occurrence_start).total_seconds() / 60
+        return [groups[key] for key in sorted(groups)]
+
+    @staticmethod
+    async def _merge_occupancy(cursor, series_groups: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Unisce in ordine (spazio, giorno) i gruppi del cursore e quelli delle serie"""
+        key = lambda group: (group["_id"]["space_id"], group["_id"]["day"])
+        pending = iter(series_groups)
+        series_group = next(pending, None)
+        async for group in cursor:
+            while series_group is not None and key(series_group) < key(group):
+                yield series_group
+                series_group = next(pending, None)
+            if series_group is not None and key(series_group) == key(group):
+                group = {
+                    **group,
+                    "bookings": group["bookings"] + series_group["bookings"],
+                    "booked_minutes": group["booked_minutes"] + series_group["booked_minutes"]
+                }
+                series_group = next(pending, None)
+            yield group
+        while series_group is not None:
+            yield series_group
+            series_group = next(pending, None)
+
+    async def _resolve_occupancy(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        spaces = await spaces_repository.get_many(list({g["_id"]["space_id"] for g in batch}), SPACE_HOURS)
+        return [occupancy_row(group, spaces.get(group["_id"]["space_id"])) for group in batch]
+
+    async def encode(self, batches: AsyncIterator[List[Dict[str, Any]]], columns: List[str],
+                     export_format: str) -> AsyncIterator[bytes]:
+        """Blocchi CSV (con intestazione anche se vuoto) o NDJSON, uno per batch"""
+        if export_format == "csv":
+            yield format_csv([], columns, header=True)
+        exported = 0
+        try:
+            async for rows in batches:
+                exported += len(rows)
+                yield format_csv(rows, columns) if export_format == "csv" else format_ndjson(rows)
+        except Exception as e:
+            # Intestazioni già inviate: il client riprende dall'ultimo resume_cursor ricevuto
+            print(f"❌ Export interrotto dopo {exported} righe: {e}")
+            raise
+        print(f"📤 Export completato: {exported} righe ({export_format})")
+
+
+# Istanza globale del servizio di export
+export_service = ExportService()
@@ -0,0 +1,282 @@
+from typing import Dict, Any, List
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from ..database import get_database
+
+# Registro dichiarativo degli indici: ogni indice esiste per una query precisa
+INDEX_REGISTRY: List[Dict[str, Any]] = [
+    # users: login e risoluzione token (auth.py, auth_middleware.py)
+    {"collection": "users", "keys": [("email", ASCENDING)], "name": "users_email_unique",
+     "options": {"unique": True}},
+
+    # spaces: listing e filtri (routes/spaces.py, chat tools) - is_active sempre in equality
+    {"collection": "spaces", "keys": [("is_active", ASCENDING), ("type", ASCENDING), ("capacity", ASCENDING)],
+     "name": "spaces_active_type_capacity"},
+    {"collection": "spaces", "keys": [("materials.name", ASCENDING)], "name": "spaces_material_name"},
+    # spaces: ultima modifica per gli ETag (etag_service)
+    {"collection": "spaces", "keys": [("updated_at", ASCENDING), ("_id", ASCENDING)], "name": "spaces_updated_id"},
+
+    # materials: filtri per categoria e $lookup per nome
+    {"collection": "materials", "keys": [("name", ASCENDING)], "name": "materials_name"},
+    {"collection": "materials", "keys": [("category", ASCENDING), ("is_available", ASCENDING)],
+     "name": "materials_category_available"},
+
+    # bookings: storico utente ordinato per data con paginazione keyset (search, chat, stats);
+    # sostituisce bookings_user_start (user_id, start_datetime), che si può rimuovere dai DB esistenti
+    {"collection": "bookings", "keys": [("user_id", ASCENDING), ("start_datetime", DESCENDING), ("_id", DESCENDING)],
+     "name": "bookings_user_start_id"},
+    # bookings: ricerca admin su tutti gli utenti e per spazio, stessa chiave keyset
+    {"collection": "bookings", "keys": [("start_datetime", DESCENDING), ("_id", DESCENDING)],
+     "name": "bookings_start_id"},
+    {"collection": "bookings", "keys": [("space_id", ASCENDING), ("start_datetime", DESCENDING), ("_id", DESCENDING)],
+     "name": "bookings_space_start_id"},
+    # bookings: sovrapposizioni per spazio (check_availability, update_booking, /spaces/{id}/availability)
+    {"collection": "bookings",
+     "keys": [("space_id", ASCENDING), ("status", ASCENDING), ("start_datetime", ASCENDING), ("end_datetime", ASCENDING)],
+     "name": "bookings_space_status_start_end"},
+    # bookings: $lookup delle statistiche materiali (/materials/stats)
+    {"collection": "bookings", "keys": [("materials_requested", ASCENDING)], "name": "bookings_materials_requested"},
+    # bookings: sincronizzazione delta del calendario derivato (/calendar/changes)
+    {"collection": "bookings", "keys": [("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "bookings_updated_id"},
+    {"collection": "bookings", "keys": [("space_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "bookings_space_updated_id"},
+    # bookings: versione dei feed ICS per utente (ultima modifica)
+    {"collection": "bookings", "keys": [("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "bookings_user_updated_id"},
+
+    # booking_series: serie che possono toccare un intervallo (disponibilità, calendario)
+    {"collection": "booking_series",
+     "keys": [("space_id", ASCENDING), ("status", ASCENDING), ("window_start", ASCENDING), ("window_end", ASCENDING)],
+     "name": "series_space_status_window"},
+    {"collection": "booking_series", "keys": [("status", ASCENDING), ("window_start", ASCENDING), ("window_end", ASCENDING)],
+     "name": "series_status_window"},
+    {"collection": "booking_series", "keys": [("user_id", ASCENDING), ("window_start", DESCENDING)],
+     "name": "series_user_window"},
+    {"collection": "booking_series", "keys": [("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "series_updated_id"},
+    {"collection": "booking_series", "keys": [("space_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "series_space_updated_id"},
+    {"collection": "booking_series", "keys": [("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "series_user_updated_id"},
+
+    # calendar_events: range di date sui soli eventi di sistema attivi (get_calendar_events)
+    {"collection": "calendar_events", "keys": [("start_datetime", ASCENDING)], "name": "calendar_active_start",
+     "options": {"partialFilterExpression": {"status": "active"}}},
+    {"collection": "calendar_events", "keys": [("space_id", ASCENDING), ("start_datetime", ASCENDING)],
+     "name": "calendar_active_space_start",
+     "options": {"partialFilterExpression": {"status": "active"}}},
+    # calendar_events: sincronizzazione delta degli eventi di sistema (/calendar/changes)
+    {"collection": "calendar_events", "keys": [("updated_at", ASCENDING), ("_id", ASCENDING)],
+     "name": "calendar_updated_id"},
+
+    # caldav_items: eventi cambiati sul server (sync-collection) e da rinviare
+    {"collection": "caldav_items", "keys": [("href", ASCENDING)], "name": "caldav_items_href"},
+    {"collection": "caldav_items", "keys": [("hash", ASCENDING)], "name": "caldav_items_hash"},
+]
+
+
+def known_query_shapes() -> List[Dict[str, Any]]:
+    """Forme delle query reali dell'applicazione, con valori di esempio, per il controllo dei piani"""
+    now = datetime.utcnow()
+    later = now + timedelta(hours=2)
+    sample_id = "000000000000000000000000"
+
+    return [
+        {"name": "auth.user_by_email", "collection": "users",
+         "filter": {"email": "utente@universita.edu"}},
+        {"name": "spaces.list_active", "collection": "spaces",
+         "filter": {"is_active": True}},
+        {"name": "spaces.filter_type_capacity", "collection": "spaces",
+         "filter": {"is_active": True, "type": "aula", "capacity": {"$gte": 30}}},
+        {"name": "spaces.filter_materials", "collection": "spaces",
+         "filter": {"is_active": True, "materials.name": {"$in": ["Proiettore"]}}},
+        {"name": "spaces.types_aggregate", "collection": "spaces",
+         "pipeline": [{"$match": {"is_active": True}}, {"$group": {"_id": "$type", "count": {"$sum": 1}}}]},
+        {"name": "bookings.user_history", "collection": "bookings",
+         "filter": {"user_id": sample_id}, "sort": [("start_datetime", DESCENDING)]},
+        {"name": "bookings.user_upcoming", "collection": "bookings",
+         "filter": {"user_id": sample_id, "start_datetime": {"$gte": now}, "status": {"$in": ["confirmed", "pending"]}},
+         "sort": [("start_datetime", ASCENDING)]},
+        {"name": "bookings.search_user_page", "collection": "bookings",
+         "filter": {"$and": [{"user_id": sample_id}, {"$or": [
+             {"start_datetime": {"$lt": now}}, {"start_datetime": now, "_id": {"$lt": ObjectId(sample_id)}}
+         ]}]},
+         "sort": [("start_datetime", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "bookings.search_all_page", "collection": "bookings",
+         "filter": {"$or": [{"start_datetime": {"$lt": now}}, {"start_datetime": now, "_id": {"$lt": ObjectId(sample_id)}}]},
+         "sort": [("start_datetime", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "bookings.overlap_check", "collection": "bookings",
+         "filter": {"space_id": sample_id, "status": {"$in": ["pending", "confirmed"]},
+                    "$and": [{"start_datetime": {"$lt": later}}, {"end_datetime": {"$gt": now}}]}},
+        {"name": "bookings.space_day", "collection": "bookings",
+         "filter": {"space_id": sample_id, "status": {"$in": ["pending", "confirmed"]},
+                    "start_datetime": {"$gte": now, "$lt": later}},
+         "sort": [("start_datetime", ASCENDING)]},
+        {"name": "calendar.bookings_range", "collection": "bookings",
+         "filter": {"status": {"$in": ["pending", "confirmed"]}, "start_datetime": {"$gte": now, "$lt": later}},
+         "sort": [("start_datetime", ASCENDING)]},
+        {"name": "calendar.events_range", "collection": "calendar_events",
+         "filter": {"booking_id": None, "start_datetime": {"$gte": now, "$lt": later}, "status": "active"},
+         "sort": [("start_datetime", ASCENDING)]},
+        {"name": "calendar.events_range_space", "collection": "calendar_events",
+         "filter": {"booking_id": None, "start_datetime": {"$gte": now, "$lt": later}, "status": "active",
+                    "space_id": sample_id},
+         "sort": [("start_datetime", ASCENDING)]},
+        {"name": "calendar.changes_since", "collection": "bookings",
+         "filter": {"$and": [{"updated_at": {"$lt": later}}, {"$or": [
+             {"updated_at": {"$gt": now}}, {"updated_at": now, "_id": {"$gt": ObjectId(sample_id)}}
+         ]}]},
+         "sort": [("updated_at", ASCENDING), ("_id", ASCENDING)]},
+        {"name": "calendar.changes_since_space", "collection": "bookings",
+         "filter": {"$and": [{"updated_at": {"$lt": later}, "space_id": sample_id}, {"$or": [
+             {"updated_at": {"$gt": now}}, {"updated_at": now, "_id": {"$gt": ObjectId(sample_id)}}
+         ]}]},
+         "sort": [("updated_at", ASCENDING), ("_id", ASCENDING)]},
+        {"name": "series.space_window", "collection": "booking_series",
+         "filter": {"space_id": sample_id, "status": {"$in": ["pending", "confirmed"]},
+                    "window_start": {"$lt": later}, "window_end": {"$gt": now}}},
+        {"name": "series.calendar_window", "collection": "booking_series",
+         "filter": {"status": {"$in": ["pending", "confirmed"]}, "window_start": {"$lt": later}, "window_end": {"$gt": now}}},
+        {"name": "series.user_list", "collection": "booking_series",
+         "filter": {"user_id": sample_id}, "sort": [("window_start", DESCENDING)]},
+        {"name": "calendar.series_changes_since", "collection": "booking_series",
+         "filter": {"$and": [{"updated_at": {"$lt": later}}, {"$or": [
+             {"updated_at": {"$gt": now}}, {"updated_at": now, "_id": {"$gt": ObjectId(sample_id)}}
+         ]}]},
+         "sort": [("updated_at", ASCENDING), ("_id", ASCENDING)]},
+        {"name": "feeds.space_version", "collection": "bookings",
+         "filter": {"space_id": sample_id}, "sort": [("updated_at", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "feeds.user_version", "collection": "bookings",
+         "filter": {"user_id": sample_id}, "sort": [("updated_at", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "feeds.user_series_version", "collection": "booking_series",
+         "filter": {"user_id": sample_id}, "sort": [("updated_at", DESCENDING), ("_id", DESCENDING)]},
+        {"name": "calendar.system_changes_since", "collection": "calendar_events",
+         "filter": {"$and": [{"updated_at": {"$lt": later}}, {"$or": [
+             {"updated_at": {"$gt": now}}, {"updated_at": now, "_id": {"$gt": ObjectId(sample_id)}}
+         ]}, {"booking_id": None}]},
+         "sort": [("updated_at", ASCENDING), ("_id", ASCENDING)]},
+    ]
+
+
+# Opzioni che cambiano il comportamento dell'indice (vincoli, copertura, TTL)
+INDEX_OPTIONS = {"unique": False, "sparse": False, "partialFilterExpression": None, "expireAfterSeconds": None}
+
+
+def index_mismatches(spec: Dict[str, Any], info: Dict[str, Any]) -> List[str]:
+    """Differenze tra un indice del registro e quello presente nel database (chiavi e opzioni)"""
+    differences = []
+    if [tuple(k) for k in info["key"]] != [tuple(k) for k in spec["keys"]]:
+        differences.append(f"chiavi {info['key']} invece di {spec['keys']}")
+    options = spec.get("options", {})
+    for option, default in INDEX_OPTIONS.items():
+        expected = options.get(option, default)
+        actual = info.get(option, default)
+        if expected != actual:
+            differences.append(f"{option} {actual!r} invece di {expected!r}")
+    return differences
+
+
+def plan_stages(node: Any) -> set:
+    """Raccoglie ricorsivamente gli stage del winning plan di un explain (anche dentro $cursor)"""
+    stages = set()
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("rejectedPlans", "allPlansExecution"):
+                continue
+            if key == "stage" and isinstance(value, str):
+                stages.add(value)
+            else:
+                stages |= plan_stages(value)
+    elif isinstance(node, list):
+        for item in node:
+            stages |= plan_stages(item)
+    return stages
+
+
+class IndexManager:
+    """
+    Applica in modo idempotente gli indici del registro e verifica che
+    nessuna query nota venga eseguita con una scansione completa (COLLSCAN)
+    """
+
+    async def ensure_indexes(self, db=None, rebuild: bool = False) -> Dict[str, List[str]]:
+        """
+        Crea gli indici mancanti; quelli già presenti (anche con altro nome)
+        vengono saltati se chiavi e opzioni coincidono. Un indice con opzioni
+        diverse (unique, partialFilterExpression, TTL...) viene segnalato, e
+        ricreato solo con rebuild=True.
+        """
+        db = db if db is not None else await get_database()
+        summary = {"created": [], "existing": [], "mismatched": [], "rebuilt": [], "failed": []}
+
+        by_collection: Dict[str, List[Dict[str, Any]]] = {}
+        for spec in INDEX_REGISTRY:
+            by_collection.setdefault(spec["collection"], []).append(spec)
+
+        for collection_name, specs in by_collection.items():
+            collection = db[collection_name]
+            existing = await collection.index_information()
+            existing_keys = {tuple(tuple(k) for k in info["key"]): name for name, info in existing.items()}
+
+            for spec in specs:
+                key = tuple((field, direction) for field, direction in spec["keys"])
+                current = spec["name"] if spec["name"] in existing else existing_keys.get(key)
+                if current is not None:
+                    differences = index_mismatches(spec, existing[current])
+                    if not differences:
+                        summary["existing"].append(spec["name"])
+                        continue
+                    if not rebuild:
+                        print(f"⚠️ Indice {current} diverso dal registro ({spec['name']}): {'; '.join(differences)}")
+                        summary["mismatched"].append(spec["name"])
+                        continue
+
+                try:
+                    if current is not None:
+                        await collection.drop_index(current)
+                    await collection.create_indexes([
+                        IndexModel(spec["keys"], name=spec["name"], **spec.get("options", {}))
+                    ])
+                    summary["rebuilt" if current is not None else "created"].append(spec["name"])
+                except OperationFailure as e:
+                    print(f"⚠️ Impossibile creare l'indice {spec['name']}: {e}")
+                    summary["failed"].append(spec["name"])
+
+        print(
+            f"📊 Indici: {len(summary['created'])} creati, "
+            f"{len(summary['existing'])} già presenti, {len(summary['rebuilt'])} ricreati, "
+            f"{len(summary['mismatched'])} diversi dal registro, {len(summary['failed'])} falliti"
+        )
+        return summary
+
+    async def check_query_plans(self, db=None) -> List[Dict[str, Any]]:
+        """Esegue explain su ogni query nota e segnala i piani con COLLSCAN"""
+        db = db if db is not None else await get_database()
+        results = []
+
+        for shape in known_query_shapes():
+            if "pipeline" in shape:
+                command = {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+            else:
+                command = {"find": shape["collection"], "filter": shape["filter"]}
+                if shape.get("sort"):
+                    command["sort"] = dict(shape["sort"])
+
+            explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+            stages = sorted(plan_stages(explain))
+
+            results.append({
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages
+            })
+
+        return results
+
+
+# Istanza globale del gestore indici
+index_manager = IndexManager()
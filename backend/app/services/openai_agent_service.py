@@ -2,15 +2,27 @@ import openai
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import json
+import time
 import asyncio
 import aiohttp
 from ..config import settings
-from ..database import get_database
-from bson import ObjectId
+from ..repositories import bookings_repository, spaces_repository
+from ..repositories.bookings import BOOKING_SUMMARY
+from ..repositories.spaces import SPACE_AI
+from .chat_intent_router import chat_intent_router
+from .chat_response_cache import chat_response_cache, CATALOG_TAG
+from .ai_run_governor import ai_run_governor, AIRunLease
+from .tool_output_encoder import tool_output_encoder
+from .space_snapshots import space_snapshots
+from .booking_series_service import booking_series_service
+
+# Funzioni dell'assistente il cui risultato non dipende dall'utente
+USER_INDEPENDENT_FUNCTIONS = {"search_available_spaces", "generate_activity_checklist"}
 
 class OpenAIAgentService:
     def __init__(self):
         self.client = None
+        self.http_client = None  # Client httpx opzionale (registrazione benchmark)
         self.is_configured = False
         self.assistant_id = None
         self._assistant_creation_lock = asyncio.Lock()
@@ -34,7 +46,11 @@ class OpenAIAgentService:
             
             try:
                 # Inizializza client OpenAI
-                self.client = openai.AsyncOpenAI(api_key=settings.openai_api_key)
+                self.client = openai.AsyncOpenAI(
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url,
+                    http_client=self.http_client
+                )
                 
                 # Test di connessione asincrono
                 await self.client.models.list()
@@ -228,11 +244,37 @@ class OpenAIAgentService:
                 raise
     
     async def process_user_message(self, message: str, user_id: str, context: Dict = None) -> Dict[str, Any]:
+        """Processa un messaggio dell'utente, servendo dalla cache le risposte riutilizzabili"""
+        user_role = (context or {}).get("user_role", "student")
+        # Le richieste di scrittura somigliano alle ricerche ma devono sempre arrivare all'assistente
+        cacheable = not chat_intent_router.is_write_action(message)
+
+        if cacheable:
+            cached_response = await chat_response_cache.get(message, user_role)
+            if cached_response:
+                return cached_response
+
+        started = time.perf_counter()
+        response = await self._process_message(message, user_id, context)
+
+        # Solo le risposte marcate come indipendenti dall'utente vanno in cache
+        cache_tags = response.pop("_cache_tags", None)
+        if cacheable and cache_tags is not None:
+            chat_response_cache.set(message, user_role, response, time.perf_counter() - started, cache_tags)
+
+        return response
+
+    async def _process_message(self, message: str, user_id: str, context: Dict = None) -> Dict[str, Any]:
         """Processa un messaggio dell'utente tramite l'assistente AI"""
         
         try:
+            # Fast-path: le richieste più comuni non passano dall'LLM
+            local_response = await self._route_locally(message, user_id)
+            if local_response:
+                return local_response
+
             await self._initialize_if_needed()
-            
+
             if not self.is_configured:
                 return await self._fallback_response(message, user_id, context)
             
@@ -242,104 +284,231 @@ class OpenAIAgentService:
             if not self.assistant_id:
                 return await self._fallback_response(message, user_id, context)
             
-            # Crea un thread per la conversazione
-            thread = await self.client.beta.threads.create()
+            # Coda di ammissione globale e budget per utente
+            async with ai_run_governor.admit(user_id) as lease:
+                if lease.rejected_reason == "superseded":
+                    return self._superseded_response()
+                
+                if not lease.admitted:
+                    print(f"⚠️ Run AI non ammessa ({lease.rejected_reason}): uso il fallback locale")
+                    return await self._fallback_response(message, user_id, context)
+                
+                return await self._run_assistant(message, user_id, context, lease)
+                
+        except Exception as e:
+            print(f"❌ Errore nell'elaborazione del messaggio: {e}")
+            return await self._fallback_response(message, user_id, context)
+    
+    async def _run_assistant(self, message: str, user_id: str, context: Dict, lease: AIRunLease) -> Dict[str, Any]:
+        """Esegue una run dell'assistente su un nuovo thread"""
+        
+        # Crea un thread per la conversazione
+        thread = await self.client.beta.threads.create()
+        
+        # Aggiungi il messaggio dell'utente
+        await self.client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=message
+        )
+        
+        # Esegui l'assistente
+        run = await self.client.beta.threads.runs.create(
+            thread_id=thread.id,
+            assistant_id=self.assistant_id
+        )
+        
+        # Attendi il completamento con gestione function calls
+        max_iterations = 10
+        iteration = 0
+        functions_called = set()
+        slot_searches = False
+        
+        while run.status in ['queued', 'in_progress', 'requires_action'] and iteration < max_iterations:
+            # Attesa più lunga per ridurre calls API, interrotta se arriva un messaggio più recente
+            if await lease.wait_superseded(settings.ai_run_poll_interval_seconds):
+                await self._cancel_run(thread.id, run.id)
+                return self._superseded_response()
             
-            # Aggiungi il messaggio dell'utente
-            await self.client.beta.threads.messages.create(
+            run = await self.client.beta.threads.runs.retrieve(
                 thread_id=thread.id,
-                role="user",
-                content=message
+                run_id=run.id
             )
             
-            # Esegui l'assistente
-            run = await self.client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.assistant_id
-            )
+            # Gestisci le chiamate a funzione
+            if run.status == 'requires_action':
+                try:
+                    tool_outputs = []
+                    
+                    for tool_call in run.required_action.submit_tool_outputs.tool_calls:
+                        functions_called.add(tool_call.function.name)
+                        try:
+                            arguments = json.loads(tool_call.function.arguments)
+                            if tool_call.function.name == "search_available_spaces" and (
+                                arguments.get("date") or arguments.get("start_time")
+                            ):
+                                slot_searches = True
+                            output = await self._handle_function_call(
+                                tool_call.function.name,
+                                arguments,
+                                user_id,
+                                context
+                            )
+                            tool_outputs.append({
+                                "tool_call_id": tool_call.id,
+                                "output": tool_output_encoder.encode(tool_call.function.name, output)
+                            })
+                        except Exception as func_error:
+                            print(f"❌ Errore nella funzione {tool_call.function.name}: {func_error}")
+                            tool_outputs.append({
+                                "tool_call_id": tool_call.id,
+                                "output": json.dumps({"error": f"Errore: {str(func_error)}"}, ensure_ascii=False)
+                            })
+                    
+                    # Invia i risultati delle funzioni
+                    run = await self.client.beta.threads.runs.submit_tool_outputs(
+                        thread_id=thread.id,
+                        run_id=run.id,
+                        tool_outputs=tool_outputs
+                    )
+                    
+                except Exception as submit_error:
+                    print(f"❌ Errore nell'invio tool outputs: {submit_error}")
+                    break
             
-            # Attendi il completamento con gestione function calls
-            max_iterations = 10
-            iteration = 0
+            iteration += 1
+        
+        # Token consumati dalla run, conteggiati nel budget dell'utente
+        usage = getattr(run, "usage", None)
+        if usage:
+            lease.tokens_used = usage.total_tokens
+        
+        if run.status == 'completed':
+            # Recupera la risposta
+            messages = await self.client.beta.threads.messages.list(
+                thread_id=thread.id
+            )
             
-            while run.status in ['queued', 'in_progress', 'requires_action'] and iteration < max_iterations:
-                await asyncio.sleep(2)  # Attesa più lunga per ridurre calls API
-                
-                run = await self.client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                
-                # Gestisci le chiamate a funzione
-                if run.status == 'requires_action':
-                    try:
-                        tool_outputs = []
-                        
-                        for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                            try:
-                                output = await self._handle_function_call(
-                                    tool_call.function.name,
-                                    json.loads(tool_call.function.arguments),
-                                    user_id,
-                                    context
-                                )
-                                tool_outputs.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": json.dumps(output, default=str, ensure_ascii=False)
-                                })
-                            except Exception as func_error:
-                                print(f"❌ Errore nella funzione {tool_call.function.name}: {func_error}")
-                                tool_outputs.append({
-                                    "tool_call_id": tool_call.id,
-                                    "output": json.dumps({"error": f"Errore: {str(func_error)}"}, ensure_ascii=False)
-                                })
-                        
-                        # Invia i risultati delle funzioni
-                        run = await self.client.beta.threads.runs.submit_tool_outputs(
-                            thread_id=thread.id,
-                            run_id=run.id,
-                            tool_outputs=tool_outputs
-                        )
-                        
-                    except Exception as submit_error:
-                        print(f"❌ Errore nell'invio tool outputs: {submit_error}")
-                        break
-                
-                iteration += 1
+            assistant_message = messages.data[0]
+            response_text = assistant_message.content[0].text.value
             
-            if run.status == 'completed':
-                # Recupera la risposta
-                messages = await self.client.beta.threads.messages.list(
-                    thread_id=thread.id
+            ai_response = {
+                "response": response_text,
+                "action": "ai_response",
+                "data": {},
+                "thread_id": thread.id
+            }
+
+            # Senza tool call la risposta libera del modello non è condivisibile tra utenti;
+            # con data o ora la ricerca dipende dalle prenotazioni (e da "domani")
+            if functions_called and functions_called <= USER_INDEPENDENT_FUNCTIONS and not slot_searches:
+                ai_response["_cache_tags"] = (
+                    {CATALOG_TAG} if "search_available_spaces" in functions_called else set()
                 )
-                
-                assistant_message = messages.data[0]
-                response_text = assistant_message.content[0].text.value
-                
-                return {
-                    "response": response_text,
-                    "action": "ai_response",
-                    "data": {},
-                    "thread_id": thread.id
-                }
-            
-            elif run.status == 'failed':
-                error_message = getattr(run, 'last_error', {}).get('message', 'Errore sconosciuto')
-                print(f"❌ Run fallito: {error_message}")
-                return await self._fallback_response(message, user_id, context)
-            
-            else:
-                print(f"❌ Run non completato. Status finale: {run.status}")
-                return {
-                    "response": "Mi dispiace, si è verificato un timeout nel processare la tua richiesta. Riprova.",
-                    "action": "error",
-                    "data": {"status": run.status, "iterations": iteration}
-                }
-                
-        except Exception as e:
-            print(f"❌ Errore nell'elaborazione del messaggio: {e}")
+
+            return ai_response
+        
+        elif run.status == 'failed':
+            error_message = getattr(run, 'last_error', {}).get('message', 'Errore sconosciuto')
+            print(f"❌ Run fallito: {error_message}")
             return await self._fallback_response(message, user_id, context)
+        
+        else:
+            print(f"❌ Run non completato. Status finale: {run.status}")
+            return {
+                "response": "Mi dispiace, si è verificato un timeout nel processare la tua richiesta. Riprova.",
+                "action": "error",
+                "data": {"status": run.status, "iterations": iteration}
+            }
     
+    def _superseded_response(self) -> Dict[str, Any]:
+        return {
+            "response": "Richiesta sostituita da un messaggio più recente.",
+            "action": "superseded",
+            "data": {}
+        }
+    
+    async def _cancel_run(self, thread_id: str, run_id: str):
+        """Annulla una run sostituita da un messaggio più recente"""
+        try:
+            await self.client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            print(f"🛑 Run {run_id} annullata (messaggio più recente dello stesso utente)")
+        except Exception as e:
+            print(f"⚠️ Errore annullamento run {run_id}: {e}")
+    
+    async def _route_locally(self, message: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Risponde senza LLM ai messaggi riconosciuti dal router di intenti"""
+        parsed = chat_intent_router.parse(message)
+        if not parsed:
+            return None
+
+        intent = parsed["intent"]
+        slots = parsed["slots"]
+
+        if intent == "my_bookings":
+            result = await self._get_user_bookings(user_id, slots["status"])
+            if "error" in result:
+                return None
+
+            if not result["bookings"]:
+                response_text = "Non ho trovato prenotazioni corrispondenti alla tua richiesta."
+            else:
+                response_text = f"Ecco le tue prenotazioni ({result['count']}):"
+
+            return {
+                "response": response_text,
+                "action": "history",
+                "data": {**result, "local_intent": intent}
+            }
+
+        if intent == "checklist":
+            result = await self._generate_activity_checklist(slots["activity_type"], slots.get("space_type"))
+            return {
+                "response": f"Ecco cosa serve per: {result['activity_type']}",
+                "action": "todo_list",
+                "data": {**result, "todo_list": result["checklist"], "local_intent": intent},
+                "_cache_tags": set()
+            }
+
+        if intent == "search_spaces":
+            result = await self._search_available_spaces(slots)
+            if "error" in result:
+                return None
+
+            spaces = result["spaces"][:settings.ai_tool_output_max_items]
+
+            if not spaces:
+                response_text = "Non ho trovato spazi liberi con questi criteri. Prova a cambiare data, orario o capienza."
+            else:
+                response_text = f"Ho trovato {result['count']} spazi che corrispondono alla tua richiesta:"
+
+            local_response = {
+                "response": response_text,
+                "action": "booking_suggestion",
+                "data": {
+                    "spaces": spaces,
+                    "count": result["count"],
+                    "criteria": slots,
+                    "suggestions": [
+                        {
+                            "space_id": space["id"],
+                            "name": space["name"],
+                            "reason": f"{space['location']} - {space['capacity']} posti"
+                        }
+                        for space in spaces
+                    ],
+                    "local_intent": intent
+                }
+            }
+
+            # Senza data la risposta dipende solo dal catalogo spazi
+            if not slots.get("date"):
+                local_response["_cache_tags"] = {CATALOG_TAG}
+
+            return local_response
+
+        return None
+
     async def _handle_function_call(self, function_name: str, arguments: Dict, user_id: str, context: Dict) -> Dict:
         """Gestisce le chiamate alle funzioni dell'assistente"""
         
@@ -401,9 +570,7 @@ class OpenAIAgentService:
                 }
             else:
                 # Recupera nome spazio per conferma
-                db = await get_database()
-                space = await db.spaces.find_one({"_id": ObjectId(booking_args["space_id"])})
-                space_name = space["name"] if space else "Spazio"
+                space_name = await spaces_repository.get_name(booking_args["space_id"]) or "Spazio"
                 
                 return {
                     "success": True,
@@ -465,25 +632,28 @@ class OpenAIAgentService:
             return {"error": f"Errore verifica disponibilità: {str(e)}"}
     
     async def _search_available_spaces(self, criteria: Dict) -> Dict:
-        """Cerca spazi disponibili"""
+        """
+        Cerca spazi disponibili; con data e ora solo quelli liberi nello slot.
+        Restituisce tutti i risultati con il loro numero: il limite per il
+        modello lo applica tool_output_encoder.
+        """
         try:
-            db = await get_database()
-            
-            # Costruisci query
-            filter_query = {"is_active": True}
-            
-            if criteria.get("space_type"):
-                filter_query["type"] = criteria["space_type"]
-            
-            if criteria.get("capacity"):
-                filter_query["capacity"] = {"$gte": criteria["capacity"]}
-            
-            if criteria.get("materials"):
-                filter_query["materials.name"] = {"$in": criteria["materials"]}
-            
-            # Recupera spazi
+            candidates = await spaces_repository.list_active(
+                criteria.get("space_type"), criteria.get("capacity"), criteria.get("materials"),
+                projection=SPACE_AI
+            )
+
+            # Disponibilità verificata prima del limite, con una query per tutti gli spazi candidati
+            if criteria.get("date") and criteria.get("start_time"):
+                start_datetime = datetime.fromisoformat(f"{criteria['date']}T{criteria['start_time']}:00")
+                end_datetime = start_datetime + timedelta(hours=criteria.get("duration_hours") or 1)
+                busy = await booking_series_service.busy_space_ids(
+                    [str(space["_id"]) for space in candidates], start_datetime, end_datetime
+                )
+                candidates = [space for space in candidates if str(space["_id"]) not in busy]
+
             spaces = []
-            async for space in db.spaces.find(filter_query).limit(5):
+            for space in candidates:
                 spaces.append({
                     "id": str(space["_id"]),
                     "name": space["name"],
@@ -507,24 +677,13 @@ class OpenAIAgentService:
     async def _get_user_bookings(self, user_id: str, status: str = "all") -> Dict:
         """Recupera prenotazioni utente"""
         try:
-            db = await get_database()
-            
-            filter_query = {"user_id": user_id}
-            
-            if status == "upcoming":
-                filter_query["start_datetime"] = {"$gte": datetime.now()}
-                filter_query["status"] = {"$in": ["confirmed", "pending"]}
-            elif status == "past":
-                filter_query["end_datetime"] = {"$lt": datetime.now()}
-            elif status == "cancelled":
-                filter_query["status"] = "cancelled"
-            
             bookings = []
-            async for booking in db.bookings.find(filter_query).sort("start_datetime", -1).limit(10):
-                space = await db.spaces.find_one({"_id": ObjectId(booking["space_id"])})
+            user_bookings = await bookings_repository.list_for_user(user_id, status, limit=10, projection=BOOKING_SUMMARY)
+            spaces = await space_snapshots.resolve(user_bookings)
+            for booking, space in zip(user_bookings, spaces):
                 bookings.append({
                     "id": str(booking["_id"]),
-                    "space_name": space["name"] if space else "Spazio eliminato",
+                    "space_name": (space or {}).get("name") or "Spazio eliminato",
                     "start_datetime": booking["start_datetime"].isoformat(),
                     "end_datetime": booking["end_datetime"].isoformat(),
                     "purpose": booking["purpose"],
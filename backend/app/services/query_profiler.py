@@ -0,0 +1,259 @@
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+from motor.motor_asyncio import AsyncIOMotorCollection
+from ..config import settings
+from .slow_query_log import slow_query_log
+
+# Metodi di collection che eseguono una singola operazione sul server
+COLLECTION_OPERATIONS = {
+    "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "replace_one", "delete_one", "delete_many", "count_documents",
+    "estimated_document_count", "distinct", "find_one_and_update",
+    "find_one_and_replace", "find_one_and_delete", "bulk_write"
+}
+
+# Metodi dei cursori che restituiscono il cursore stesso
+CURSOR_CHAIN_METHODS = {
+    "sort", "skip", "limit", "batch_size", "hint", "max_time_ms",
+    "collation", "comment", "where", "allow_disk_use"
+}
+
+
+class NPlusOneQueryError(RuntimeError):
+    """Sollevata in modalità strict quando una forma di query si ripete troppe volte"""
+
+
+def operation_query(operation: str, args: tuple, kwargs: Dict[str, Any]) -> Any:
+    """
+    Parte dell'operazione che ne determina la forma: il filtro per letture,
+    aggiornamenti ed eliminazioni, nessuno per gli inserimenti (i documenti
+    non sono una query) e i soli tipi di operazione per bulk_write.
+    """
+    if operation in ("insert_one", "insert_many", "estimated_document_count"):
+        return None
+    if operation == "bulk_write":
+        requests = args[0] if args else kwargs.get("requests", [])
+        return {type(request).__name__: None for request in requests}
+    if operation == "distinct":
+        # distinct(key, filter): il primo argomento è il nome del campo
+        return args[1] if len(args) > 1 else kwargs.get("filter")
+    return args[0] if args else kwargs.get("filter")
+
+
+def query_shape(operation: str, collection: str, query: Any = None) -> str:
+    """Forma della query: operazione, collection e struttura del filtro senza valori"""
+    return f"{collection}.{operation} {json.dumps(_strip_values(query), sort_keys=True)}"
+
+
+def _strip_values(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _strip_values(item) for key, item in value.items()}
+    if isinstance(value, list):
+        # $and/$or conservano la struttura, le liste di valori ($in) no
+        if value and all(isinstance(item, dict) for item in value):
+            return [_strip_values(item) for item in value]
+        return "?"
+    return "?" if value is not None else None
+
+
+class RequestQueryProfile:
+    """Statistiche delle query eseguite durante una singola richiesta"""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes: Counter = Counter()
+        self.n_plus_one: Dict[str, int] = {}
+
+    def record(self, shape: str):
+        self.count += 1
+        self.shapes[shape] += 1
+
+        repeats = self.shapes[shape]
+        if repeats > query_profiler.n_plus_one_threshold:
+            first_time = shape not in self.n_plus_one
+            self.n_plus_one[shape] = repeats
+            if first_time:
+                message = f"Possibile N+1 in {self.label or 'richiesta'}: {shape} ripetuta più di {query_profiler.n_plus_one_threshold} volte"
+                if query_profiler.strict:
+                    raise NPlusOneQueryError(message)
+                print(f"⚠️ {message}")
+
+    def add_time(self, seconds: float):
+        self.total_ms += seconds * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "n_plus_one": dict(self.n_plus_one)
+        }
+
+
+_current_profile: ContextVar[Optional[RequestQueryProfile]] = ContextVar("db_query_profile", default=None)
+
+
+class ProfiledCursor:
+    """Cursore che misura il tempo speso a leggere i risultati"""
+
+    def __init__(self, cursor, profile: Optional[RequestQueryProfile], operation: str, collection: str, query: Any):
+        self._cursor = cursor
+        self._profile = profile
+        self._operation = operation
+        self._collection = collection
+        self._query = query
+        self._elapsed = 0.0
+        self._pending = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name in CURSOR_CHAIN_METHODS:
+            def chained(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chained
+        return attr
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        start = time.perf_counter()
+        self._pending = True
+        try:
+            return await self._cursor.__anext__()
+        except StopAsyncIteration:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        finally:
+            if self._pending:
+                self._elapsed += time.perf_counter() - start
+
+    async def to_list(self, length=None):
+        start = time.perf_counter()
+        self._pending = True
+        try:
+            return await self._cursor.to_list(length)
+        finally:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+
+    async def close(self):
+        try:
+            await self._cursor.close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        # Tempo delle letture fatte finora: a cursore esaurito, dopo to_list, alla chiusura o al rilascio
+        if not self._pending:
+            return
+        elapsed, self._elapsed, self._pending = self._elapsed, 0.0, False
+        query_profiler.observe(self._profile, self._operation, self._collection, self._query, elapsed)
+
+    def __del__(self):
+        # Lettura interrotta (break in un async for) senza close()
+        if getattr(self, "_pending", False):
+            try:
+                self._finish()
+            except Exception:
+                pass
+
+
+class ProfiledCollection:
+    """Collection Motor che registra ogni operazione nel profilo della richiesta corrente"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        profile = _current_profile.get()
+
+        if name in COLLECTION_OPERATIONS:
+            async def timed(*args, **kwargs):
+                query = operation_query(name, args, kwargs)
+                if profile is not None:
+                    profile.record(query_shape(name, self._collection.name, query))
+                start = time.perf_counter()
+                try:
+                    return await attr(*args, **kwargs)
+                finally:
+                    query_profiler.observe(profile, name, self._collection.name, query, time.perf_counter() - start)
+            return timed
+
+        if name in ("find", "aggregate"):
+            def cursor(*args, **kwargs):
+                query = args[0] if args else kwargs.get("filter", kwargs.get("pipeline"))
+                if profile is not None:
+                    profile.record(query_shape(name, self._collection.name, query))
+                return ProfiledCursor(attr(*args, **kwargs), profile, name, self._collection.name, query)
+            return cursor
+
+        return attr
+
+    def __getitem__(self, name):
+        return ProfiledCollection(self._collection[name])
+
+
+class ProfiledDatabase:
+    """Database Motor le cui collection sono strumentate dal profiler"""
+
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if isinstance(attr, AsyncIOMotorCollection):
+            return ProfiledCollection(attr)
+        return attr
+
+    def __getitem__(self, name):
+        return ProfiledCollection(self._database[name])
+
+
+class QueryProfiler:
+    """
+    Conta e cronometra le operazioni MongoDB di ogni richiesta e segnala
+    le forme di query ripetute (pattern N+1, es. find_one in un ciclo).
+    Le operazioni lente vengono passate a slow_query_log.
+    """
+
+    def __init__(self):
+        self.enabled = settings.db_profiler_enabled
+        self.n_plus_one_threshold = settings.db_n_plus_one_threshold
+        self.strict = settings.db_profiler_strict
+
+    def observe(self, profile: Optional[RequestQueryProfile], operation: str, collection: str, query: Any, seconds: float):
+        """Somma la durata al profilo e segnala le operazioni lente al log dedicato"""
+        if profile is not None:
+            profile.add_time(seconds)
+        duration_ms = seconds * 1000
+        if duration_ms >= slow_query_log.threshold_ms:
+            slow_query_log.report(operation, collection, query, query_shape(operation, collection, query), duration_ms)
+
+    def wrap(self, database):
+        return ProfiledDatabase(database) if self.enabled else database
+
+    @contextmanager
+    def profile(self, label: str = ""):
+        """Attiva un profilo per il blocco corrente (una richiesta HTTP o un test)"""
+        profile = RequestQueryProfile(label)
+        token = _current_profile.set(profile)
+        try:
+            yield profile
+        finally:
+            _current_profile.reset(token)
+
+    def current(self) -> Optional[RequestQueryProfile]:
+        return _current_profile.get()
+
+
+# Istanza globale del profiler
+query_profiler = QueryProfiler()
@@ -0,0 +1,132 @@
+"""
+Regole di ricorrenza (RRULE, RFC 5545) delle serie di prenotazioni.
+
+La regola è validata e normalizzata con icalendar ed espansa con
+dateutil.rrule solo nella finestra richiesta: una serie di un semestre è
+un solo documento e le sue occorrenze non vengono mai salvate.
+
+L'espansione avviene nell'ora locale della serie (fuso del campus se non
+indicato) e ogni occorrenza si converte poi in UTC: la lezione delle 9 resta
+alle 9 anche dopo il cambio dell'ora legale.
+"""
+
+import re
+from datetime import datetime, time, timezone
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dateutil.rrule import rrule, rrulestr
+from icalendar import vRecur
+from ..config import settings
+
+Interval = Tuple[datetime, datetime]
+
+# UNTIL salvato senza Z dalle versioni precedenti: è comunque UTC
+_FLOATING_UNTIL = re.compile(r"(UNTIL=\d{8}T\d{6})(?=;|$)")
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Datetime senza fuso in UTC, come quelli salvati in MongoDB"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def series_timezone(name: Optional[str] = None) -> ZoneInfo:
+    """Fuso in cui si espande la serie; ValueError se il nome non esiste"""
+    try:
+        return _zone(name or settings.campus_timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Fuso orario non valido: {name}")
+
+
+@lru_cache(maxsize=64)
+def _zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def normalize_rule(text: str) -> str:
+    """Solleva ValueError se la regola non è valida o non ha fine (COUNT o UNTIL)"""
+    text = text.strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+    try:
+        recur = vRecur(vRecur.from_ical(text))
+    except ValueError:
+        raise ValueError("Regola di ricorrenza non valida")
+    if "FREQ" not in recur:
+        raise ValueError("La regola di ricorrenza deve indicare FREQ")
+    if "COUNT" not in recur and "UNTIL" not in recur:
+        raise ValueError("La regola di ricorrenza deve terminare (COUNT o UNTIL)")
+
+    if "UNTIL" in recur:
+        until = recur["UNTIL"][0]
+        if not isinstance(until, datetime):
+            # Data senza ora: l'ultimo giorno è incluso
+            until = datetime.combine(until, time.max.replace(microsecond=0))
+        # Con DTSTART in ora locale UNTIL deve essere in UTC (RFC 5545)
+        recur["UNTIL"] = [naive_utc(until).replace(tzinfo=timezone.utc)]
+    return recur.to_ical().decode()
+
+
+@lru_cache(maxsize=1024)
+def compile_rule(rule: str, dtstart: datetime, tz: Optional[str] = None) -> rrule:
+    """Regola con DTSTART (UTC senza fuso) portato nell'ora locale del fuso della serie"""
+    local_start = dtstart.replace(tzinfo=timezone.utc).astimezone(series_timezone(tz))
+    return rrulestr(_FLOATING_UNTIL.sub(r"\1Z", rule), dtstart=local_start, cache=True)
+
+
+def expand_all(rule: str, start: datetime, end: datetime, exdates: Iterable[datetime], limit: int,
+               tz: Optional[str] = None) -> List[Interval]:
+    """Tutte le occorrenze della serie (per la creazione); ValueError oltre limit"""
+    duration = end - start
+    skipped = set(exdates)
+    starts = []
+    for occurrence in compile_rule(rule, start, tz):
+        if len(starts) >= limit:
+            raise ValueError(f"La serie supera il massimo di {limit} occorrenze")
+        starts.append(naive_utc(occurrence))
+    return [(occurrence, occurrence + duration) for occurrence in starts if occurrence not in skipped]
+
+
+def occurrences(series: Dict[str, Any], start: datetime, end: datetime,
+                include_skipped: bool = False) -> Iterator[Interval]:
+    """
+    Occorrenze che si sovrappongono a [start, end), generate pigramente:
+    l'espansione si ferma alla fine della finestra.
+    """
+    duration = series["end_datetime"] - series["start_datetime"]
+    skipped = set(series.get("exdates") or ())
+    rule = compile_rule(series["rrule"], series["start_datetime"], series.get("timezone"))
+    for local in rule.xafter((start - duration).replace(tzinfo=timezone.utc), inc=True):
+        occurrence = naive_utc(local)
+        if occurrence >= end:
+            return
+        if occurrence + duration <= start:
+            continue
+        if include_skipped or occurrence not in skipped:
+            yield occurrence, occurrence + duration
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Unione degli intervalli occupati, ordinata e senza sovrapposizioni"""
+    merged: List[List[datetime]] = []
+    for start, end in sorted(intervals):
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def find_conflicts(candidates: List[Interval], busy: Iterable[Interval]) -> List[Interval]:
+    """Occorrenze (ordinate) che si sovrappongono a un intervallo occupato: una sola passata"""
+    occupied = merge_intervals(busy)
+    conflicts = []
+    index = 0
+    for start, end in candidates:
+        while index < len(occupied) and occupied[index][1] <= start:
+            index += 1
+        if index < len(occupied) and occupied[index][0] < end:
+            conflicts.append((start, end))
+    return conflicts
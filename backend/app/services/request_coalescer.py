@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable
+from ..config import settings
+from ..repositories.space_catalog import space_catalog
+
+
+class RequestCoalescer:
+    """
+    Single-flight per gli endpoint di lettura più richiesti: richieste identiche
+    concorrenti (stesso endpoint, parametri normalizzati e ambito di
+    autorizzazione) condividono un solo calcolo in corso. Facoltativamente il
+    risultato resta in cache per pochi secondi. I risultati sono condivisi tra
+    le richieste: i chiamanti non devono modificarli.
+    """
+
+    def __init__(self):
+        self.enabled = settings.coalesce_enabled
+        self.default_ttl = settings.coalesce_ttl_seconds
+        self.max_entries = settings.coalesce_max_entries
+
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+        self._metrics = {"computed": 0, "coalesced": 0, "cache_hits": 0, "errors": 0, "invalidations": 0}
+
+    def make_key(self, endpoint: str, params: Optional[Dict[str, Any]], scope: str) -> str:
+        """Chiave stabile: parametri senza valori nulli, ordinati, liste ordinate"""
+        normalized = {}
+        for name, value in (params or {}).items():
+            if value is None or value == "" or value == []:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = sorted(str(item).strip() for item in value)
+            normalized[name] = value
+        return f"{endpoint}|{scope}|{json.dumps(normalized, sort_keys=True, default=str)}"
+
+    async def run(self, endpoint: str, params: Optional[Dict[str, Any]], scope: str,
+                  compute: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        if not self.enabled:
+            return await compute()
+
+        key = self.make_key(endpoint, params, scope)
+        ttl = self.default_ttl if ttl is None else ttl
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires_at, value = cached
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                self._metrics["cache_hits"] += 1
+                return value
+            del self._cache[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._metrics["coalesced"] += 1
+        else:
+            # Task separato: se il client che l'ha avviato si disconnette gli altri ricevono comunque il risultato
+            future = asyncio.ensure_future(compute())
+            self._inflight[key] = future
+            self._metrics["computed"] += 1
+            future.add_done_callback(lambda done: self._finish(key, done, ttl))
+
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future, ttl: float):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._metrics["errors"] += 1
+            return
+        if ttl > 0:
+            self._cache[key] = (time.monotonic() + ttl, future.result())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, endpoint_prefix: Optional[str] = None):
+        """Svuota la cache breve (tutta o per prefisso di endpoint); i calcoli in corso non sono toccati"""
+        if endpoint_prefix is None:
+            removed = len(self._cache)
+            self._cache.clear()
+        else:
+            stale = [key for key in self._cache if key.startswith(endpoint_prefix)]
+            for key in stale:
+                del self._cache[key]
+            removed = len(stale)
+        if removed:
+            self._metrics["invalidations"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "inflight": len(self._inflight), "cached": len(self._cache)}
+
+
+# Istanza globale del coalescer
+request_coalescer = RequestCoalescer()
+
+# Spazi modificati: le liste in cache non sono più valide
+space_catalog.add_listener(lambda: request_coalescer.invalidate("spaces"))
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from ..config import settings
+from ..database import db as mongo
+from .index_manager import plan_stages
+
+SLOW_QUERIES_COLLECTION = "slow_queries"
+
+# Operazioni di sola scrittura: nessun filtro da spiegare
+NO_EXPLAIN_OPERATIONS = {"insert_one", "insert_many", "bulk_write", "estimated_document_count"}
+
+
+class SlowQueryLog:
+    """
+    Registra le operazioni MongoDB più lente della soglia configurata,
+    con forma del filtro e riepilogo di explain("executionStats"), in una
+    collection capped. Le scritture sono campionate e limitate al minuto.
+    """
+
+    def __init__(self):
+        self.threshold_ms = settings.slow_query_threshold_ms
+        self.sample_rate = settings.slow_query_sample_rate
+        self.max_writes_per_minute = settings.slow_query_max_writes_per_minute
+        self.collection_size_bytes = settings.slow_query_collection_size_bytes
+
+        self._writes = deque()
+        self._tasks = set()
+        self._metrics = {"observed": 0, "recorded": 0, "sampled_out": 0, "rate_limited": 0, "errors": 0}
+
+    def _raw_database(self):
+        # Database non strumentato: explain e scritture del log non devono essere profilati
+        if mongo.client is None:
+            return None
+        return mongo.client[settings.database_name]
+
+    async def ensure_collection(self):
+        """Crea la collection capped se non esiste"""
+        database = self._raw_database()
+        if database is None:
+            return
+
+        if SLOW_QUERIES_COLLECTION not in await database.list_collection_names():
+            await database.create_collection(
+                SLOW_QUERIES_COLLECTION, capped=True, size=self.collection_size_bytes
+            )
+            print(f"✅ Collection capped {SLOW_QUERIES_COLLECTION} creata")
+
+    def report(self, operation: str, collection: str, query: Any, shape: str, duration_ms: float):
+        """Chiamato dal profiler per ogni operazione: registra in background quelle lente"""
+        if duration_ms < self.threshold_ms or collection == SLOW_QUERIES_COLLECTION:
+            return
+
+        self._metrics["observed"] += 1
+
+        if random.random() >= self.sample_rate:
+            self._metrics["sampled_out"] += 1
+            return
+
+        now = time.monotonic()
+        while self._writes and now - self._writes[0] > 60:
+            self._writes.popleft()
+        if len(self._writes) >= self.max_writes_per_minute:
+            self._metrics["rate_limited"] += 1
+            return
+        self._writes.append(now)
+
+        print(f"🐢 Query lenta ({duration_ms:.0f}ms): {shape}")
+        task = asyncio.ensure_future(self._record(operation, collection, query, shape, duration_ms))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _record(self, operation: str, collection: str, query: Any, shape: str, duration_ms: float):
+        database = self._raw_database()
+        if database is None:
+            return
+
+        try:
+            explain = await self._explain(database, operation, collection, query)
+            await database[SLOW_QUERIES_COLLECTION].insert_one({
+                "collection": collection,
+                "operation": operation,
+                "shape": shape,
+                "duration_ms": round(duration_ms, 2),
+                "explain": explain,
+                "created_at": datetime.utcnow()
+            })
+            self._metrics["recorded"] += 1
+        except Exception as e:
+            self._metrics["errors"] += 1
+            print(f"⚠️ Errore registrazione query lenta: {e}")
+
+    async def _explain(self, database, operation: str, collection: str, query: Any) -> Optional[Dict[str, Any]]:
+        """Esegue explain('executionStats') e ne restituisce un riepilogo"""
+        if operation in NO_EXPLAIN_OPERATIONS:
+            return None
+
+        if operation == "aggregate":
+            command = {"aggregate": collection, "pipeline": query or [], "cursor": {}}
+        elif operation == "count_documents":
+            command = {"count": collection, "query": query or {}}
+        else:
+            # Per find, distinct e scritture con filtro si spiega la selezione dei documenti
+            command = {"find": collection, "filter": query or {}}
+            if operation == "find_one":
+                command["limit"] = 1
+
+        try:
+            explain = await database.command({"explain": command, "verbosity": "executionStats"})
+        except Exception as e:
+            return {"error": str(e)}
+
+        return self.summarize_explain(explain)
+
+    def summarize_explain(self, explain: Dict[str, Any]) -> Dict[str, Any]:
+        stats = self._find_execution_stats(explain) or {}
+        return {
+            "stages": sorted(plan_stages(explain.get("queryPlanner", explain))),
+            "n_returned": stats.get("nReturned"),
+            "execution_time_ms": stats.get("executionTimeMillis"),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "docs_examined": stats.get("totalDocsExamined")
+        }
+
+    def _find_execution_stats(self, node: Any) -> Optional[Dict[str, Any]]:
+        # Nelle pipeline executionStats è annidato dentro lo stage $cursor
+        if isinstance(node, dict):
+            if isinstance(node.get("executionStats"), dict):
+                return node["executionStats"]
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            return None
+
+        for child in children:
+            found = self._find_execution_stats(child)
+            if found:
+                return found
+        return None
+
+    async def top_offenders(self, limit: int = 20, since_hours: int = 24) -> List[Dict[str, Any]]:
+        """Forme di query ordinate per tempo totale speso nel periodo"""
+        database = self._raw_database()
+        if database is None:
+            return []
+
+        pipeline = [
+            {"$match": {"created_at": {"$gte": datetime.utcnow() - timedelta(hours=since_hours)}}},
+            {"$sort": {"created_at": 1}},
+            {"$group": {
+                "_id": "$shape",
+                "collection": {"$last": "$collection"},
+                "operation": {"$last": "$operation"},
+                "count": {"$sum": 1},
+                "total_ms": {"$sum": "$duration_ms"},
+                "avg_ms": {"$avg": "$duration_ms"},
+                "max_ms": {"$max": "$duration_ms"},
+                "last_seen": {"$last": "$created_at"},
+                "last_explain": {"$last": "$explain"}
+            }},
+            {"$sort": {"total_ms": -1}},
+            {"$limit": limit}
+        ]
+
+        offenders = []
+        async for entry in database[SLOW_QUERIES_COLLECTION].aggregate(pipeline):
+            entry["shape"] = entry.pop("_id")
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["avg_ms"] = round(entry["avg_ms"], 2)
+            offenders.append(entry)
+        return offenders
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "threshold_ms": self.threshold_ms, "sample_rate": self.sample_rate}
+
+
+# Istanza globale del log delle query lente
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,158 @@
+import asyncio
+from typing import Dict, Any, List, Optional
+from bson import ObjectId
+from ..repositories import bookings_repository, booking_series_repository, spaces_repository, spaces_loader
+from ..repositories.space_catalog import space_catalog
+from ..repositories.spaces import SPACE_SUMMARY
+
+SNAPSHOT_FIELDS = ("name", "location")
+
+
+def space_snapshot(space: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Campi dello spazio copiati sulla prenotazione (None se lo spazio non esiste più)"""
+    return {field: (space or {}).get(field) for field in SNAPSHOT_FIELDS}
+
+
+class SpaceSnapshotService:
+    """
+    Snapshot di nome e posizione dello spazio salvato su ogni prenotazione
+    e serie: gli elenchi di prenotazioni non leggono più spaces. Le modifiche
+    fatte con update_space si propagano subito; quelle viste dal catalogo
+    spazi (scritture dirette sul database) in background, con un update_many
+    per spazio e collection. All'avvio refresh_all() recupera le rinomine
+    avvenute ad applicazione ferma. Le prenotazioni create prima dello
+    snapshot si completano con backfill() (script backfill_space_snapshots.py);
+    fino ad allora si ricade sul loader.
+    """
+
+    def __init__(self):
+        self._known: Optional[Dict[str, Dict[str, Any]]] = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._startup_task: Optional[asyncio.Task] = None
+        self._metrics = {
+            "propagated_spaces": 0, "propagated_bookings": 0, "propagated_series": 0,
+            "fallback_lookups": 0, "backfilled": 0
+        }
+
+    async def resolve(self, bookings: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """Snapshot dello spazio per ogni prenotazione; lo spazio si legge solo se manca"""
+        missing = [booking["space_id"] for booking in bookings if "space_snapshot" not in booking]
+        if not missing:
+            return [booking["space_snapshot"] for booking in bookings]
+
+        self._metrics["fallback_lookups"] += len(missing)
+        spaces_loader.prefetch(missing)
+        resolved = []
+        for booking in bookings:
+            if "space_snapshot" in booking:
+                resolved.append(booking["space_snapshot"])
+            else:
+                space = await spaces_loader.load(booking["space_id"])
+                resolved.append(space_snapshot(space) if space else None)
+        return resolved
+
+    def catalog_changed(self):
+        """Listener del catalogo: accoda gli spazi il cui snapshot è cambiato"""
+        current = {space_id: space_snapshot(space) for space_id, space in space_catalog.items()}
+        if self._known is None:
+            # Primo caricamento: nessuna modifica da propagare
+            self._known = current
+            return
+        for space_id, snapshot in current.items():
+            if self._known.get(space_id) != snapshot:
+                self._pending[space_id] = snapshot
+        self._known = current
+
+        if self._pending and (self._task is None or self._task.done()):
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._propagate())
+            except RuntimeError:
+                # Nessun event loop (es. script): si propaga alla prossima modifica
+                pass
+
+    async def _propagate(self):
+        while self._pending:
+            space_id, snapshot = self._pending.popitem()
+            try:
+                await self.propagate(space_id, snapshot)
+            except Exception as e:
+                print(f"⚠️ Errore propagazione snapshot spazio {space_id}: {e}")
+
+    async def propagate(self, space_id: str, snapshot: Dict[str, Any]) -> int:
+        """Nuovo snapshot su prenotazioni e serie dello spazio; restituisce i documenti aggiornati"""
+        bookings = await bookings_repository.refresh_space_snapshot(space_id, snapshot)
+        series = await booking_series_repository.refresh_space_snapshot(space_id, snapshot)
+        self._metrics["propagated_spaces"] += 1
+        self._metrics["propagated_bookings"] += bookings
+        self._metrics["propagated_series"] += series
+        if bookings or series:
+            print(f"🏷️ Snapshot spazio aggiornato su {bookings} prenotazioni e {series} serie: {snapshot['name']}")
+        return bookings + series
+
+    async def update_space(self, space_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Aggiorna uno spazio e, se nome o posizione cambiano, i suoi snapshot (anche senza catalogo)"""
+        space = await spaces_repository.update(space_id, fields)
+        if space is None:
+            return None
+        if any(field in fields for field in SNAPSHOT_FIELDS):
+            snapshot = space_snapshot(space)
+            await self.propagate(str(space["_id"]), snapshot)
+            if self._known is not None:
+                # Il listener del catalogo non deve ripetere la propagazione
+                self._known[str(space["_id"])] = snapshot
+        return space
+
+    async def start(self):
+        """All'avvio riallinea in background gli snapshot di tutti gli spazi"""
+        async def refresh():
+            try:
+                modified = await self.refresh_all()
+                if modified:
+                    print(f"🏷️ Snapshot spazio riallineati all'avvio: {modified} documenti")
+            except Exception as e:
+                print(f"⚠️ Riallineamento snapshot spazio non riuscito: {e}")
+
+        if self._startup_task is None:
+            self._startup_task = asyncio.ensure_future(refresh())
+
+    async def backfill(self, batch_size: int = 500, after: Optional[ObjectId] = None, max_batches: int = 0):
+        """
+        Snapshot sulle prenotazioni che non ce l'hanno, a batch in ordine di
+        _id. Riprendibile: ogni batch dichiara l'ultimo _id trattato e un
+        nuovo avvio salta comunque le prenotazioni già completate.
+        """
+        batches = 0
+        while True:
+            batch = await bookings_repository.missing_snapshot_batch(after, batch_size)
+            if not batch:
+                return
+            after = batch[-1]["_id"]
+            spaces = await spaces_repository.get_many(list({booking["space_id"] for booking in batch}), SPACE_SUMMARY)
+
+            updates: Dict[str, Any] = {}
+            for booking in batch:
+                ids, _ = updates.setdefault(booking["space_id"], ([], space_snapshot(spaces.get(booking["space_id"]))))
+                ids.append(booking["_id"])
+
+            modified = await bookings_repository.set_space_snapshots(updates)
+            self._metrics["backfilled"] += modified
+            batches += 1
+            yield {"batch": batches, "bookings": len(batch), "modified": modified, "last_id": str(after)}
+            if max_batches and batches >= max_batches:
+                return
+
+    async def refresh_all(self) -> int:
+        """Riallinea gli snapshot di tutti gli spazi (es. rinomine avvenute ad applicazione ferma)"""
+        total = 0
+        for space in await spaces_repository.list_all(SPACE_SUMMARY):
+            total += await self.propagate(str(space["_id"]), space_snapshot(space))
+        return total
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "pending": len(self._pending)}
+
+
+# Istanza globale degli snapshot spazio
+space_snapshots = SpaceSnapshotService()
+space_catalog.add_listener(space_snapshots.catalog_changed)
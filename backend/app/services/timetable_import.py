@@ -0,0 +1,367 @@
+"""
+Import dell'orario semestrale da CSV o ICS.
+
+CSV: intestazione con space (ID o nome dello spazio), owner_email,
+start_datetime, end_datetime, purpose e facoltativi notes, rrule, exdates
+(date ISO separate da ";") e timezone (fuso IANA della regola).
+ICS: un VEVENT per lezione con LOCATION (nome dello spazio), ORGANIZER
+(email del titolare), DTSTART, DTEND o DURATION, SUMMARY e facoltativi
+DESCRIPTION, RRULE ed EXDATE.
+
+Le righe con una regola RRULE diventano serie ricorrenti, espanse nel fuso
+indicato (nell'ICS il TZID di DTSTART) o in quello del campus; le altre
+prenotazioni singole. Le righe si validano una alla volta mentre si legge
+il file; i conflitti si decidono in memoria riga per riga, per spazio.
+"""
+
+import csv
+import io
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Iterator, BinaryIO
+from bson import ObjectId
+from icalendar import Calendar
+from pymongo.errors import BulkWriteError
+from ..config import settings
+from ..repositories import bookings_repository, booking_series_repository, spaces_repository, users_repository
+from ..models.booking import Booking, BookingSeries, BookingStatus
+from .booking_service import booking_service
+from .booking_series_service import booking_series_service
+from .classrent_email_service import classrent_email_service
+from .recurrence import naive_utc, normalize_rule, expand_all, merge_intervals, series_timezone
+from .space_snapshots import space_snapshot
+
+CSV_REQUIRED = {"space", "owner_email", "start_datetime", "end_datetime", "purpose"}
+
+
+def as_datetime(value: Any) -> datetime:
+    """Datetime UTC senza fuso da stringa ISO o valore ICS; ValueError altrimenti"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if not isinstance(value, datetime):
+        # Anche un date ICS (evento di giornata intera) non è una lezione
+        raise ValueError("Formato data/ora non valido")
+    return naive_utc(value)
+
+
+def csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Righe del CSV lette una alla volta dal file caricato (numero di riga, campi)"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    missing = CSV_REQUIRED - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Colonne mancanti nel CSV: {', '.join(sorted(missing))}")
+    for row in reader:
+        yield reader.line_num, {
+            "space": (row.get("space") or "").strip(),
+            "owner_email": (row.get("owner_email") or "").strip().lower(),
+            "start_datetime": row.get("start_datetime") or "",
+            "end_datetime": row.get("end_datetime") or "",
+            "purpose": (row.get("purpose") or "").strip(),
+            "notes": (row.get("notes") or "").strip(),
+            "rrule": (row.get("rrule") or "").strip(),
+            "exdates": [value for value in (row.get("exdates") or "").split(";") if value.strip()],
+            "timezone": (row.get("timezone") or "").strip()
+        }
+
+
+def ics_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Eventi del file ICS (numero dell'evento, campi). icalendar analizza il
+    file intero; la validazione procede comunque un evento alla volta.
+    """
+    try:
+        calendar = Calendar.from_ical(stream.read())
+    except ValueError:
+        raise ValueError("File ICS non valido")
+    for number, event in enumerate(calendar.walk("VEVENT"), start=1):
+        start = event.decoded("DTSTART", None)
+        end = event.decoded("DTEND", None)
+        if end is None and start is not None and "DURATION" in event:
+            end = start + event.decoded("DURATION")
+
+        exdates = event.get("EXDATE") or []
+        if not isinstance(exdates, list):
+            exdates = [exdates]
+        organizer = str(event.get("ORGANIZER") or "").strip()
+        if organizer.lower().startswith("mailto:"):
+            organizer = organizer[len("mailto:"):]
+        rrule = event.get("RRULE")
+
+        yield number, {
+            "space": str(event.get("LOCATION") or "").strip(),
+            "owner_email": organizer.lower(),
+            "start_datetime": start,
+            "end_datetime": end,
+            "purpose": str(event.get("SUMMARY") or "").strip(),
+            "notes": str(event.get("DESCRIPTION") or "").strip(),
+            "rrule": rrule.to_ical().decode() if rrule else "",
+            "exdates": [item.dt for exdate in exdates for item in exdate.dts],
+            # La regola si ripete nell'ora locale di DTSTART
+            "timezone": str(event["DTSTART"].params.get("TZID") or "") if "DTSTART" in event else ""
+        }
+
+
+def _overlapping(intervals: List[Tuple[datetime, datetime, Optional[int]]], starts: List[datetime],
+                 start: datetime, end: datetime) -> Optional[Tuple[datetime, datetime, Optional[int]]]:
+    """Intervallo che si sovrappone a [start, end) in una lista ordinata di intervalli disgiunti"""
+    index = bisect_left(starts, end)
+    if index and intervals[index - 1][1] > start:
+        return intervals[index - 1]
+    return None
+
+
+def sweep_conflicts(entries: List[Dict[str, Any]], busy: List[Tuple[datetime, datetime]]) -> Dict[int, str]:
+    """
+    Conflitti delle righe di uno spazio. Le righe si decidono una alla volta
+    in ordine di inizio (a parità, numero di riga): tutte le occorrenze si
+    confrontano con gli intervalli già occupati (uniti) e con quelli delle
+    righe già accettate, e solo una riga accettata occupa i suoi intervalli.
+    Così una serie scartata per un conflitto successivo non blocca le righe
+    che si sovrappongono solo alle sue occorrenze precedenti.
+    """
+    occupied = [(start, end, None) for start, end in merge_intervals(busy)]
+    occupied_starts = [start for start, _, _ in occupied]
+    accepted: List[Tuple[datetime, datetime, Optional[int]]] = []
+    accepted_starts: List[datetime] = []
+    conflicts: Dict[int, str] = {}
+    for entry in sorted(entries, key=lambda entry: (entry["slots"][0][0], entry["row"])):
+        for start, end in entry["slots"]:
+            if _overlapping(occupied, occupied_starts, start, end):
+                conflicts[entry["row"]] = f"Spazio già occupato il {start.strftime('%d/%m/%Y %H:%M')}"
+                break
+            other = _overlapping(accepted, accepted_starts, start, end)
+            if other:
+                conflicts[entry["row"]] = f"Si sovrappone alla riga {other[2]} il {start.strftime('%d/%m/%Y %H:%M')}"
+                break
+        else:
+            # Le righe accettate restano disgiunte: basta il vicino precedente per la verifica
+            for start, end in entry["slots"]:
+                index = bisect_left(accepted_starts, start)
+                accepted.insert(index, (start, end, entry["row"]))
+                accepted_starts.insert(index, start)
+    return conflicts
+
+
+class TimetableImportService:
+    """
+    Import orario semestrale: validazione in streaming contro vincoli degli
+    spazi, utenti e prenotazioni esistenti (due query per spazio), inserimento
+    in lotti con insert_many e un solo riepilogo email per titolare.
+    """
+
+    def __init__(self):
+        self.batch_size = settings.timetable_import_batch_size
+        self.max_errors = settings.timetable_import_max_errors
+        self.max_occurrences = settings.series_max_occurrences
+
+    def _reject(self, report: Dict[str, Any], row: int, error: str):
+        report["error_count"] += 1
+        if len(report["errors"]) < self.max_errors:
+            report["errors"].append({"row": row, "error": error})
+
+    async def _spaces(self) -> Dict[str, Dict[str, Any]]:
+        """Spazi attivi per ID e per nome (minuscolo), letti una volta per import"""
+        spaces = {}
+        for space in await spaces_repository.list_active():
+            spaces[str(space["_id"])] = space
+            spaces[space["name"].strip().lower()] = space
+        return spaces
+
+    async def _validate(self, fields: Dict[str, Any],
+                        spaces: Dict[str, Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Riga pronta per l'inserimento con le sue occorrenze, oppure il motivo dello scarto"""
+        space = spaces.get(fields["space"]) or spaces.get(fields["space"].lower())
+        if not space:
+            return None, f"Spazio non trovato: {fields['space'] or '(vuoto)'}"
+        if not fields["owner_email"]:
+            return None, "Email del titolare obbligatoria"
+        if not fields["purpose"]:
+            return None, "Scopo della prenotazione obbligatorio"
+
+        try:
+            start = as_datetime(fields["start_datetime"])
+            end = as_datetime(fields["end_datetime"])
+        except (TypeError, ValueError):
+            return None, "Formato data/ora non valido"
+
+        validation = await booking_service._validate_booking_data({
+            "space_id": str(space["_id"]), "start_datetime": start, "end_datetime": end
+        })
+        if not validation["valid"]:
+            return None, validation["error"]
+
+        rule, exdates, tz, slots = None, [], None, [(start, end)]
+        if fields["rrule"]:
+            try:
+                rule = normalize_rule(fields["rrule"])
+                tz = series_timezone(fields.get("timezone")).key
+                exdates = [as_datetime(exdate) for exdate in fields["exdates"]]
+                slots = expand_all(rule, start, end, exdates, self.max_occurrences, tz)
+            except ValueError as e:
+                return None, str(e)
+            if not slots:
+                return None, "La serie non ha occorrenze"
+
+        for slot_start, slot_end in slots:
+            constraint_check = await booking_service.check_constraints(
+                {"start_datetime": slot_start, "end_datetime": slot_end}, space
+            )
+            if not constraint_check["valid"]:
+                return None, f"{slot_start.strftime('%d/%m/%Y')}: {constraint_check['error']}"
+
+        return {
+            "space": space,
+            "owner_email": fields["owner_email"],
+            "start": start,
+            "end": end,
+            "rrule": rule,
+            "exdates": exdates,
+            "timezone": tz,
+            "slots": slots,
+            "purpose": fields["purpose"],
+            "notes": fields["notes"]
+        }, None
+
+    def _document(self, entry: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        common = {
+            "user_id": user_id,
+            "space_id": str(entry["space"]["_id"]),
+            "start_datetime": entry["start"],
+            "end_datetime": entry["end"],
+            "purpose": entry["purpose"],
+            "status": BookingStatus.CONFIRMED,
+            "materials_requested": [],
+            "notes": entry["notes"],
+            "space_snapshot": space_snapshot(entry["space"]),
+            "created_at": now,
+            "updated_at": now
+        }
+        if not entry["rrule"]:
+            return Booking(**common).model_dump()
+        return BookingSeries(**{
+            **common,
+            "rrule": entry["rrule"],
+            "exdates": entry["exdates"],
+            "timezone": entry["timezone"],
+            "window_start": entry["slots"][0][0],
+            "window_end": entry["slots"][-1][1],
+            "occurrence_count": len(entry["slots"])
+        }).model_dump()
+
+    async def _insert(self, repository, documents: List[Dict[str, Any]], report: Dict[str, Any], key: str):
+        """Inserimento a lotti; il resoconto conta anche i documenti di un lotto fallito a metà"""
+        for offset in range(0, len(documents), self.batch_size):
+            try:
+                report[key] += len(await repository.insert_many(documents[offset:offset + self.batch_size]))
+            except BulkWriteError as e:
+                report[key] += e.details.get("nInserted", 0)
+                raise
+
+    async def _rollback(self, report: Dict[str, Any], import_id: str, error: Exception) -> Dict[str, Any]:
+        """
+        Inserimento non riuscito: si rimuovono tutti i documenti con l'ID
+        dell'import (anche quelli di lotti parziali). Se anche la rimozione
+        fallisce il resoconto lo dice, con l'ID per completarla a mano.
+        """
+        report["insert_error"] = f"Errore durante l'inserimento: {error}"
+        report["import_id"] = import_id
+        try:
+            report["removed_bookings"] = await bookings_repository.delete_imported(import_id)
+            report["removed_series"] = await booking_series_repository.delete_imported(import_id)
+        except Exception as e:
+            print(f"❌ Rimozione import orari {import_id} non riuscita: {e}")
+            report["rolled_back"] = False
+            return report
+        report["rolled_back"] = True
+        report["created_bookings"] = report["created_series"] = 0
+        return report
+
+    async def run(self, stream: BinaryIO, filename: str, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Valida e importa l'orario. Le righe valide si inseriscono anche se
+        altre sono scartate; con dry_run si restituisce solo il resoconto.
+        Se l'inserimento fallisce i documenti già scritti si rimuovono e il
+        resoconto riporta insert_error, rolled_back e cosa è stato creato.
+        """
+        file_format = "ics" if filename.lower().endswith(".ics") else "csv"
+        report: Dict[str, Any] = {
+            "format": file_format, "dry_run": dry_run, "rows": 0, "valid": 0, "occurrences": 0,
+            "created_bookings": 0, "created_series": 0, "notified": 0, "error_count": 0, "errors": []
+        }
+
+        spaces = await self._spaces()
+        entries = []
+        try:
+            rows = ics_rows(stream) if file_format == "ics" else csv_rows(stream)
+            for row, fields in rows:
+                report["rows"] += 1
+                entry, error = await self._validate(fields, spaces)
+                if error:
+                    self._reject(report, row, error)
+                    continue
+                entry["row"] = row
+                entries.append(entry)
+        except (ValueError, csv.Error, UnicodeDecodeError) as e:
+            return {"error": f"File non leggibile: {e}"}
+
+        # Titolari con una sola query $in
+        owners = await users_repository.get_many_by_email(entry["owner_email"] for entry in entries)
+        by_space: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for entry in entries:
+            if entry["owner_email"] not in owners:
+                self._reject(report, entry["row"], f"Utente non trovato: {entry['owner_email']}")
+                continue
+            by_space[str(entry["space"]["_id"])].append(entry)
+
+        # Conflitti: prenotazioni e serie esistenti lette una volta per spazio, poi verifica in memoria
+        valid = []
+        for space_id, space_entries in by_space.items():
+            window_start = min(entry["slots"][0][0] for entry in space_entries)
+            window_end = max(entry["slots"][-1][1] for entry in space_entries)
+            busy = await booking_series_service.busy_intervals(space_id, window_start, window_end)
+            conflicts = sweep_conflicts(space_entries, busy)
+            for entry in space_entries:
+                if entry["row"] in conflicts:
+                    self._reject(report, entry["row"], conflicts[entry["row"]])
+                else:
+                    valid.append(entry)
+
+        report["errors"].sort(key=lambda error: error["row"])
+        report["valid"] = len(valid)
+        report["occurrences"] = sum(len(entry["slots"]) for entry in valid)
+        if dry_run or not valid:
+            return report
+
+        # Senza transazioni (serve un replica set): i documenti dell'import sono marcati per la rimozione
+        import_id = str(ObjectId())
+        bookings, series, by_owner = [], [], defaultdict(list)
+        for entry in valid:
+            document = self._document(entry, str(owners[entry["owner_email"]]["_id"]))
+            document["import_id"] = import_id
+            (series if entry["rrule"] else bookings).append(document)
+            by_owner[entry["owner_email"]].append(document)
+
+        try:
+            await self._insert(bookings_repository, bookings, report, "created_bookings")
+            await self._insert(booking_series_repository, series, report, "created_series")
+        except Exception as e:
+            print(f"❌ Errore inserimento import orari: {e}")
+            return await self._rollback(report, import_id, e)
+
+        # Un riepilogo per titolare invece di un'email per prenotazione
+        for email, documents in by_owner.items():
+            try:
+                if await classrent_email_service.send_import_summary(email, documents, owners[email]["full_name"]):
+                    report["notified"] += 1
+            except Exception as e:
+                print(f"⚠️ Errore invio riepilogo import a {email}: {e}")
+
+        print(f"📥 Import orari: {report['created_bookings']} prenotazioni, {report['created_series']} serie, "
+              f"{report['error_count']} righe scartate")
+        return report
+
+
+# Istanza globale dell'import orari
+timetable_import = TimetableImportService()
@@ -0,0 +1,129 @@
+import json
+import math
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+from ..config import settings
+
+# Campi che il modello usa davvero, per funzione e per lista annidata.
+# None = la lista contiene valori semplici e viene solo troncata.
+TOOL_PROJECTIONS: Dict[str, Dict[str, Optional[List[str]]]] = {
+    "search_available_spaces": {
+        "spaces": ["id", "name", "type", "capacity", "location", "materials"],
+    },
+    "get_user_bookings": {
+        "bookings": ["id", "space_name", "start_datetime", "end_datetime", "purpose", "status"],
+    },
+    "check_space_availability": {
+        "conflicts": ["start_time", "end_time"],
+    },
+    "generate_activity_checklist": {
+        "checklist": None,
+    },
+}
+
+# Liste di risultati di ricerca troncate a ai_tool_output_max_items: la
+# funzione restituisce tutti i risultati e il loro count, così il modello sa
+# quanti ce ne sono. Le altre (checklist, prenotazioni, conflitti) sono il
+# contenuto della risposta e arrivano intere al modello
+TRUNCATED_LISTS: Dict[str, set] = {
+    "search_available_spaces": {"spaces"},
+}
+
+# Campi scalari ridondanti (il modello li conosce già dagli argomenti)
+DROPPED_FIELDS = {"criteria", "status_filter"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima approssimativa dei token (circa 4 caratteri per token)"""
+    return math.ceil(len(text) / 4)
+
+
+class ToolOutputEncoder:
+    """
+    Codifica compatta dei risultati delle funzioni per l'assistente:
+    proietta solo i campi utili, tronca i risultati di ricerca con un
+    marcatore "more_available" e registra i token risparmiati per ogni chiamata.
+    """
+
+    def __init__(self):
+        self.max_list_items = settings.ai_tool_output_max_items
+        self._metrics = defaultdict(lambda: {
+            "calls": 0,
+            "raw_tokens": 0,
+            "compact_tokens": 0
+        })
+
+    def encode(self, function_name: str, output: Any) -> str:
+        """Restituisce il JSON compatto da inviare come tool output"""
+        compact = self.compact(function_name, output)
+        encoded = self._dumps(compact)
+
+        raw_tokens = estimate_tokens(json.dumps(output, default=str, ensure_ascii=False))
+        compact_tokens = estimate_tokens(encoded)
+
+        stats = self._metrics[function_name]
+        stats["calls"] += 1
+        stats["raw_tokens"] += raw_tokens
+        stats["compact_tokens"] += compact_tokens
+
+        print(f"🔧 Tool output {function_name}: ~{compact_tokens} token (originale ~{raw_tokens})")
+        return encoded
+
+    def compact(self, function_name: str, output: Any) -> Any:
+        """Applica proiezione e troncamento al risultato di una funzione"""
+        if not isinstance(output, dict) or "error" in output:
+            return output
+
+        projections = TOOL_PROJECTIONS.get(function_name, {})
+        truncated = TRUNCATED_LISTS.get(function_name, set())
+        compact: Dict[str, Any] = {}
+
+        for key, value in output.items():
+            if key in DROPPED_FIELDS or value is None or value == "":
+                continue
+
+            if isinstance(value, list):
+                fields = projections.get(key)
+                limit = self.max_list_items if key in truncated else len(value)
+                compact[key] = [self._project(item, fields) for item in value[:limit]]
+                if len(value) > limit:
+                    compact[f"{key}_more_available"] = len(value) - limit
+            else:
+                compact[key] = value
+
+        return compact
+
+    def _project(self, item: Any, fields: Optional[List[str]]) -> Any:
+        if not isinstance(item, dict) or fields is None:
+            return item
+
+        projected = {}
+        for field in fields:
+            value = item.get(field)
+            if value is None or value == "" or value == []:
+                continue
+
+            # Dei materiali al modello basta il nome
+            if field == "materials" and isinstance(value, list):
+                value = [m.get("name") if isinstance(m, dict) else m for m in value]
+
+            projected[field] = value
+
+        return projected
+
+    def _dumps(self, value: Any) -> str:
+        return json.dumps(value, default=str, ensure_ascii=False, separators=(",", ":"))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        metrics = {}
+        for function_name, stats in self._metrics.items():
+            metrics[function_name] = {
+                **stats,
+                "avg_compact_tokens": round(stats["compact_tokens"] / stats["calls"], 1),
+                "tokens_saved": stats["raw_tokens"] - stats["compact_tokens"]
+            }
+        return metrics
+
+
+# Istanza globale dell'encoder
+tool_output_encoder = ToolOutputEncoder()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Backfill dello snapshot spazio (nome e posizione) sulle prenotazioni ClassRent.
+
+Completa a batch, in ordine di _id, le prenotazioni create prima dello
+snapshot: ogni batch è un solo bulk_write. Il comando è riprendibile: si
+può interrompere in qualsiasi momento e rilanciare (le prenotazioni già
+completate vengono saltate), oppure ripartire dall'ultimo _id stampato.
+
+Uso:
+    python backfill_space_snapshots.py                    # tutte le prenotazioni senza snapshot
+    python backfill_space_snapshots.py --after <id>       # riprende dopo l'_id indicato
+    python backfill_space_snapshots.py --refresh          # riallinea anche gli snapshot esistenti
+"""
+
+import argparse
+import asyncio
+import sys
+from bson import ObjectId
+from app.database import connect_to_mongo, close_mongo_connection
+from app.services.space_snapshots import space_snapshots
+
+
+async def main(batch_size: int, after: str, max_batches: int, refresh: bool) -> int:
+    await connect_to_mongo()
+    try:
+        total = 0
+        async for progress in space_snapshots.backfill(batch_size, ObjectId(after) if after else None, max_batches):
+            total += progress["modified"]
+            print(f"📦 Batch {progress['batch']}: {progress['modified']}/{progress['bookings']} prenotazioni "
+                  f"(ultimo _id {progress['last_id']})")
+        print(f"✅ Snapshot aggiunti: {total}")
+
+        if refresh:
+            print("🔄 Riallineamento snapshot esistenti...")
+            print(f"✅ Prenotazioni riallineate: {await space_snapshots.refresh_all()}")
+    finally:
+        await close_mongo_connection()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill snapshot spazio sulle prenotazioni")
+    parser.add_argument("--batch-size", type=int, default=500, help="Prenotazioni per batch")
+    parser.add_argument("--after", help="Riprende dopo questo _id di prenotazione")
+    parser.add_argument("--max-batches", type=int, default=0, help="Si ferma dopo N batch (0 = tutti)")
+    parser.add_argument("--refresh", action="store_true", help="Riallinea gli snapshot degli spazi modificati")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.batch_size, args.after, args.max_batches, args.refresh)))
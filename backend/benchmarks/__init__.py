@@ -0,0 +1,5 @@
+"""
+Benchmark per ClassRent
+
+Script di misura delle prestazioni eseguibili con python -m benchmarks.<nome>.
+"""
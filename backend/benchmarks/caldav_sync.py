@@ -0,0 +1,245 @@
+"""
+Benchmark della sincronizzazione CalDAV incrementale.
+
+Prenotazioni e serie in memoria (senza MongoDB) inviate a FakeCalDavServer:
+sincronizzazione iniziale, un passaggio dopo aver modificato l'1% delle
+prenotazioni (più un altro 1% salvato senza cambiare il contenuto), un
+passaggio a vuoto che si ferma al ctag, e l'invio iniziale con concorrenza
+1 e 8 su un server con latenza:
+    python -m benchmarks.caldav_sync --bookings 2000 --series 200 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.config import settings
+from app.repositories import bookings_repository, booking_series_repository, caldav_items_repository, caldav_state_repository
+from app.services.caldav_sync import CalDavRemote, CalDavSyncEngine
+from benchmarks.fake_caldav_server import FakeCalDavServer
+
+OPERATORS = {
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$in": lambda value, operand: value in operand,
+}
+
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """Il sottoinsieme dei filtri MongoDB usato da changes_filter"""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(OPERATORS[operator](document.get(key), operand) for operator, operand in condition.items()):
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+class MemoryStore:
+    """Collection bookings, booking_series, caldav_items e stato in memoria al posto dei repository"""
+
+    def __init__(self):
+        self.documents: Dict[str, Dict[str, Dict[str, Any]]] = {"bookings": {}, "booking_series": {}}
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.state: Dict[str, Any] = {}
+        self.queries = 0
+
+    def add(self, collection_name: str, document: Dict[str, Any]) -> Dict[str, Any]:
+        self.documents[collection_name][str(document["_id"])] = document
+        return document
+
+    def install(self, setattr_fn=setattr):
+        """Sostituisce i metodi dei repository globali (monkeypatch.setattr nei test)"""
+        for repository in (bookings_repository, booking_series_repository):
+            setattr_fn(repository, "list_changes", self._list_changes(repository.collection_name))
+            setattr_fn(repository, "get_many", self._get_many(repository.collection_name))
+        for name in ("get_many_by_uid", "get_many_by_href", "list_all", "apply", "mark_stale", "list_stale"):
+            setattr_fn(caldav_items_repository, name, getattr(self, name))
+        setattr_fn(caldav_state_repository, "get", self.get_state)
+        setattr_fn(caldav_state_repository, "save", self.save_state)
+
+    def _list_changes(self, collection_name: str):
+        async def list_changes(filter_query, limit, projection=None) -> Tuple[List[Dict[str, Any]], bool]:
+            self.queries += 1
+            found = sorted((document for document in self.documents[collection_name].values()
+                            if matches(document, filter_query)),
+                           key=lambda document: (document["updated_at"], document["_id"]))
+            return [dict(document) for document in found[:limit]], len(found) > limit
+        return list_changes
+
+    def _get_many(self, collection_name: str):
+        async def get_many(ids, projection=None):
+            self.queries += 1
+            documents = self.documents[collection_name]
+            return {str(key): dict(documents[str(key)]) for key in ids if str(key) in documents}
+        return get_many
+
+    async def get_many_by_uid(self, uids):
+        self.queries += 1
+        return {uid: dict(self.items[uid]) for uid in uids if uid in self.items}
+
+    async def get_many_by_href(self, hrefs):
+        self.queries += 1
+        hrefs = set(hrefs)
+        return [dict(item) for item in self.items.values() if item["href"] in hrefs]
+
+    async def list_all(self):
+        self.queries += 1
+        return [dict(item) for item in self.items.values()]
+
+    async def apply(self, saved, deleted, rejected=()):
+        rejected = list(rejected)
+        if saved or deleted or rejected:
+            self.queries += 1
+        for item in saved:
+            self.items[item["_id"]] = {**item, "last_error": None}
+        for uid in deleted:
+            self.items.pop(uid, None)
+        for item in rejected:
+            self.items[item["_id"]] = {**self.items.get(item["_id"], {}), **item, "hash": None}
+        return len(saved) + len(deleted) + len(rejected)
+
+    async def mark_stale(self, uids, etags: Dict[str, Optional[str]]):
+        for uid in uids:
+            if uid in self.items:
+                self.items[uid].update({"hash": None, "etag": etags.get(uid)})
+        return len(etags)
+
+    async def list_stale(self, limit, after=None):
+        self.queries += 1
+        stale = sorted((item for item in self.items.values()
+                        if item.get("hash") is None and (after is None or item["_id"] > after)),
+                       key=lambda item: item["_id"])
+        return [dict(item) for item in stale[:limit]]
+
+    async def get_state(self):
+        return dict(self.state)
+
+    async def save_state(self, fields):
+        self.state.update(fields)
+
+
+def make_booking(start: datetime, purpose: str, updated_at: datetime, rng: random.Random) -> Dict[str, Any]:
+    space = rng.randint(1, 40)
+    return {
+        "_id": ObjectId(), "user_id": str(ObjectId()), "space_id": f"space-{space}",
+        "space_snapshot": {"name": f"Aula {space}", "location": "Polo didattico"},
+        "start_datetime": start, "end_datetime": start + timedelta(hours=2),
+        "purpose": purpose, "status": "confirmed", "updated_at": updated_at
+    }
+
+
+def populate(store: MemoryStore, bookings: int, series: int, seed: int):
+    rng = random.Random(seed)
+    base = datetime.utcnow() - timedelta(hours=1)
+    for number in range(bookings):
+        start = datetime(2026, 2, 2, 8) + timedelta(days=rng.randint(0, 120), hours=rng.randint(0, 10))
+        store.add("bookings", make_booking(start, f"Lezione {number}", base + timedelta(milliseconds=number), rng))
+    for number in range(series):
+        start = datetime(2026, 2, 2, 8) + timedelta(days=rng.randint(0, 6), hours=rng.randint(0, 10))
+        document = make_booking(start, f"Corso {number}", base + timedelta(milliseconds=number), rng)
+        store.add("booking_series", {**document, "rrule": "FREQ=WEEKLY;COUNT=14", "exdates": []})
+
+
+def make_engine(url: str, concurrency: int, batch_size: int) -> CalDavSyncEngine:
+    engine = CalDavSyncEngine()
+    engine.concurrency = concurrency
+    engine.batch_size = batch_size
+    engine.retry_base_seconds = 0.01
+    engine.settle_seconds = 0
+    engine.remote = CalDavRemote(url, None, None, concurrency, 10.0)
+    return engine
+
+
+async def timed_run(engine: CalDavSyncEngine, server: FakeCalDavServer, store: MemoryStore) -> Dict[str, Any]:
+    server.requests.clear()
+    store.queries = 0
+    started = time.perf_counter()
+    report = await engine.run_once()
+    return {
+        **report,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "requests": dict(server.requests),
+        "local_queries": store.queries
+    }
+
+
+async def initial_sync(bookings: int, series: int, latency: float, concurrency: int, batch_size: int,
+                       seed: int) -> Tuple[Dict[str, Any], CalDavSyncEngine, FakeCalDavServer, MemoryStore]:
+    store = MemoryStore()
+    populate(store, bookings, series, seed)
+    store.install()
+    server = FakeCalDavServer(latency=latency)
+    await server.start()
+    engine = make_engine(server.url, concurrency, batch_size)
+    return await timed_run(engine, server, store), engine, server, store
+
+
+async def scenario(bookings: int, series: int, latency: float, concurrency: int, batch_size: int,
+                   change_ratio: float, seed: int) -> Dict[str, Any]:
+    settings.caldav_url = "http://127.0.0.1/calendars/classrent/"
+    results: Dict[str, Any] = {}
+
+    initial, engine, server, store = await initial_sync(bookings, series, latency, concurrency, batch_size, seed)
+    results["initial"] = initial
+
+    # 1% modificato davvero, un altro 1% salvato con lo stesso contenuto
+    rng = random.Random(seed + 1)
+    documents = list(store.documents["bookings"].values())
+    touched = rng.sample(documents, 2 * max(1, int(len(documents) * change_ratio)))
+    now = datetime.utcnow() - timedelta(seconds=1)
+    for index, document in enumerate(touched):
+        document["updated_at"] = now + timedelta(microseconds=index)
+        if index % 2 == 0:
+            document["purpose"] += " (spostata)"
+    results["incremental"] = await timed_run(engine, server, store)
+    # Il server vede le nostre scritture: un REPORT che non trova modifiche altrui
+    results["after_own_writes"] = await timed_run(engine, server, store)
+    results["noop"] = await timed_run(engine, server, store)
+    await server.stop()
+
+    for level in (1, 8):
+        run, _, level_server, _ = await initial_sync(bookings, series, latency, level, batch_size, seed)
+        await level_server.stop()
+        results[f"initial_concurrency_{level}"] = {"wall_seconds": run["wall_seconds"], "pushed": run["pushed"]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sincronizzazione CalDAV ClassRent")
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="Latenza del server CalDAV in secondi")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--change-ratio", type=float, default=0.01, help="Quota di prenotazioni modificate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(scenario(args.bookings, args.series, args.latency, args.concurrency,
+                                  args.batch_size, args.change_ratio, args.seed))
+    for name, run in result.items():
+        print(f"{name:<26}{run}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Benchmark della pipeline chat.
+
+Registrazione di conversazioni reali (richiede OPENAI_API_KEY e MongoDB):
+    python -m benchmarks.chat_pipeline record --messages messaggi.txt --out benchmarks/fixtures/chat_conversations.json
+
+Replay contro il server OpenAI finto locale:
+    python -m benchmarks.chat_pipeline replay --concurrency 20 --iterations 5 --run-latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.openai_agent_service import ai_agent_service
+from app.services.chat_response_cache import chat_response_cache
+from app.services.ai_run_governor import ai_run_governor
+from .fake_openai_server import FakeOpenAIServer
+
+DEFAULT_FIXTURES = Path(__file__).parent / "fixtures" / "chat_conversations.json"
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Trasporto httpx che ricostruisce le conversazioni dalle chiamate alle Assistants API"""
+
+    def __init__(self):
+        self._inner = httpx.AsyncHTTPTransport()
+        self.conversations: Dict[str, Dict[str, Any]] = {}
+        self._pending_calls: Dict[str, Dict[str, Any]] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._inner.handle_async_request(request)
+        body = await response.aread()
+        await response.aclose()
+
+        try:
+            self._record(request, json.loads(body) if body else None)
+        except Exception as e:
+            print(f"⚠️ Errore registrazione chiamata {request.url.path}: {e}")
+
+        headers = [
+            (key, value) for key, value in response.headers.items()
+            if key.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    def _conversation(self, thread_id: str) -> Dict[str, Any]:
+        return self.conversations.setdefault(thread_id, {
+            "name": f"conversation-{len(self.conversations) + 1}",
+            "message": None, "turns": [], "response": None, "usage": None
+        })
+
+    def _record(self, request: httpx.Request, payload: Optional[Dict[str, Any]]):
+        parts = request.url.path.strip("/").split("/")
+        if "threads" not in parts or payload is None:
+            return
+
+        thread_id = parts[parts.index("threads") + 1]
+        conversation = self._conversation(thread_id)
+        tail = parts[parts.index("threads") + 2:]
+
+        if tail == ["messages"] and request.method == "POST":
+            conversation["message"] = json.loads(request.content)["content"]
+
+        elif tail == ["messages"] and request.method == "GET":
+            for message in payload.get("data", []):
+                if message.get("role") == "assistant":
+                    conversation["response"] = message["content"][0]["text"]["value"]
+                    break
+
+        elif len(tail) >= 2 and tail[0] == "runs" and tail[-1] == "submit_tool_outputs":
+            for tool_output in json.loads(request.content).get("tool_outputs", []):
+                call = self._pending_calls.pop(tool_output["tool_call_id"], None)
+                if call is not None:
+                    try:
+                        call["output"] = json.loads(tool_output["output"])
+                    except ValueError:
+                        call["output"] = tool_output["output"]
+
+        if tail and tail[0] == "runs" and isinstance(payload, dict) and payload.get("object") == "thread.run":
+            if payload.get("status") == "requires_action":
+                tool_calls = payload["required_action"]["submit_tool_outputs"]["tool_calls"]
+                # La stessa richiesta di tool può essere letta da più polling
+                if any(tool_call["id"] in self._pending_calls for tool_call in tool_calls):
+                    return
+
+                turn = {"tool_calls": []}
+                for tool_call in tool_calls:
+                    call = {
+                        "name": tool_call["function"]["name"],
+                        "arguments": json.loads(tool_call["function"]["arguments"] or "{}"),
+                        "output": None
+                    }
+                    self._pending_calls[tool_call["id"]] = call
+                    turn["tool_calls"].append(call)
+                conversation["turns"].append(turn)
+            elif payload.get("status") == "completed" and payload.get("usage"):
+                conversation["usage"] = payload["usage"]
+
+    def fixtures(self) -> List[Dict[str, Any]]:
+        return [c for c in self.conversations.values() if c["message"] and c["response"]]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+async def record(args):
+    from app.database import connect_to_mongo, close_mongo_connection
+
+    messages = [line.strip() for line in Path(args.messages).read_text(encoding="utf-8").splitlines() if line.strip()]
+    transport = RecordingTransport()
+    ai_agent_service.http_client = httpx.AsyncClient(transport=transport, timeout=60)
+
+    # Registra solo interazioni reali con l'assistente
+    chat_response_cache.max_entries = 0
+    ai_agent_service._route_locally = _no_local_route
+
+    await connect_to_mongo()
+    try:
+        for message in messages:
+            response = await ai_agent_service.process_user_message(message, args.user_id, {"user_role": args.role})
+            print(f"🎙️ {message!r} -> {response.get('action')}")
+    finally:
+        await ai_agent_service.cleanup()
+        await close_mongo_connection()
+
+    fixtures = transport.fixtures()
+    Path(args.out).write_text(json.dumps(fixtures, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    print(f"✅ Registrate {len(fixtures)} conversazioni in {args.out}")
+
+
+async def _no_local_route(message: str, user_id: str):
+    return None
+
+
+async def replay(args):
+    conversations = json.loads(Path(args.fixtures).read_text(encoding="utf-8"))
+    server = FakeOpenAIServer(conversations, api_latency=args.api_latency, run_latency=args.run_latency)
+    await server.start()
+
+    settings.openai_api_key = "sk-benchmark-local-key"
+    settings.openai_base_url = server.base_url
+    settings.ai_run_poll_interval_seconds = args.poll_interval
+    ai_run_governor.max_concurrent_runs = args.max_concurrent_runs
+    ai_run_governor.user_requests_per_hour = 10 ** 9
+    ai_run_governor.user_tokens_per_hour = 10 ** 12
+
+    if args.no_cache:
+        chat_response_cache.max_entries = 0
+    if args.no_local_router:
+        ai_agent_service._route_locally = _no_local_route
+    if args.live_tools:
+        from app.database import connect_to_mongo
+        await connect_to_mongo()
+    else:
+        ai_agent_service._handle_function_call = _recorded_tool_handler(conversations)
+
+    jobs = [conversation for _ in range(args.iterations) for conversation in conversations]
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, conversation in enumerate(jobs):
+        queue.put_nowait((index, conversation))
+
+    results = []
+
+    async def worker():
+        while not queue.empty():
+            index, conversation = queue.get_nowait()
+            started = time.perf_counter()
+            response = await ai_agent_service.process_user_message(
+                conversation["message"], f"bench-user-{index}", {"user_role": args.role}
+            )
+            results.append({
+                "conversation": conversation.get("name", conversation["message"][:30]),
+                "latency": time.perf_counter() - started,
+                "action": response.get("action"),
+                "cached": bool(response.get("data", {}).get("cached"))
+            })
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        wall_time = time.perf_counter() - started
+        await ai_agent_service.cleanup()
+        await server.stop()
+
+    report = build_report(results, server.thread_stats(), wall_time)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+def _recorded_tool_handler(conversations: List[Dict[str, Any]]):
+    """Restituisce gli output registrati invece di eseguire le funzioni sul database"""
+    recorded = {}
+    for conversation in conversations:
+        for turn in conversation.get("turns", []):
+            for call in turn["tool_calls"]:
+                key = (call["name"], json.dumps(call.get("arguments", {}), sort_keys=True))
+                recorded[key] = call.get("output")
+
+    async def handler(function_name: str, arguments: Dict, user_id: str, context: Dict) -> Dict:
+        key = (function_name, json.dumps(arguments, sort_keys=True))
+        return recorded.get(key, {"error": f"Output non registrato per {function_name}"})
+
+    return handler
+
+
+def build_report(results: List[Dict[str, Any]], thread_stats: Dict[str, Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    latencies = [r["latency"] for r in results]
+    actions = defaultdict(int)
+    for r in results:
+        actions["cached" if r["cached"] else r["action"]] += 1
+
+    per_conversation = defaultdict(lambda: {"latencies": [], "threads": 0, "tool_calls": 0,
+                                            "tool_output_tokens": 0, "total_tokens": 0})
+    for r in results:
+        per_conversation[r["conversation"]]["latencies"].append(r["latency"])
+    for stats in thread_stats.values():
+        entry = per_conversation[stats["conversation"] or "unknown"]
+        entry["threads"] += 1
+        entry["tool_calls"] += stats["tool_calls"]
+        entry["tool_output_tokens"] += stats["tool_output_tokens"]
+        entry["total_tokens"] += stats["total_tokens"]
+
+    conversations = {}
+    for name, entry in per_conversation.items():
+        threads = entry["threads"] or 1
+        conversations[name] = {
+            "requests": len(entry["latencies"]),
+            "assistant_runs": entry["threads"],
+            "p50": round(percentile(entry["latencies"], 50), 4),
+            "p95": round(percentile(entry["latencies"], 95), 4),
+            "tool_calls_per_run": round(entry["tool_calls"] / threads, 2),
+            "tool_output_tokens_per_run": round(entry["tool_output_tokens"] / threads, 1),
+            "total_tokens_per_run": round(entry["total_tokens"] / threads, 1)
+        }
+
+    return {
+        "requests": len(results),
+        "wall_time_seconds": round(wall_time, 3),
+        "throughput_rps": round(len(results) / wall_time, 2) if wall_time else 0.0,
+        "actions": dict(actions),
+        "latency": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies), 4) if latencies else 0.0
+        },
+        "conversations": conversations
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency"]
+    print(f"\n📊 Richieste: {report['requests']} in {report['wall_time_seconds']}s ({report['throughput_rps']} req/s)")
+    print(f"   Azioni: {report['actions']}")
+    print(f"   Latenza end-to-end: p50={latency['p50']}s p95={latency['p95']}s p99={latency['p99']}s max={latency['max']}s\n")
+    print(f"{'conversazione':<28}{'req':>5}{'run':>5}{'p50':>9}{'p95':>9}{'tool/run':>10}{'tok tool':>10}{'tok tot':>10}")
+    for name, stats in sorted(report["conversations"].items()):
+        print(
+            f"{name[:27]:<28}{stats['requests']:>5}{stats['assistant_runs']:>5}{stats['p50']:>9}{stats['p95']:>9}"
+            f"{stats['tool_calls_per_run']:>10}{stats['tool_output_tokens_per_run']:>10}{stats['total_tokens_per_run']:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline chat ClassRent")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Registra conversazioni reali con l'assistente")
+    record_parser.add_argument("--messages", required=True, help="File con un messaggio per riga")
+    record_parser.add_argument("--out", default=str(DEFAULT_FIXTURES))
+    record_parser.add_argument("--user-id", required=True, help="ID utente usato per le funzioni")
+    record_parser.add_argument("--role", default="student")
+
+    replay_parser = subparsers.add_parser("replay", help="Riproduce le fixture contro il server finto")
+    replay_parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    replay_parser.add_argument("--concurrency", type=int, default=10)
+    replay_parser.add_argument("--iterations", type=int, default=3)
+    replay_parser.add_argument("--api-latency", type=float, default=0.02, help="Latenza di ogni chiamata API (s)")
+    replay_parser.add_argument("--run-latency", type=float, default=0.5, help="Tempo di elaborazione di ogni turno della run (s)")
+    replay_parser.add_argument("--poll-interval", type=float, default=0.25)
+    replay_parser.add_argument("--max-concurrent-runs", type=int, default=settings.ai_max_concurrent_runs)
+    replay_parser.add_argument("--role", default="student")
+    replay_parser.add_argument("--no-cache", action="store_true", help="Disattiva la cache delle risposte")
+    replay_parser.add_argument("--no-local-router", action="store_true", help="Manda tutto all'assistente")
+    replay_parser.add_argument("--live-tools", action="store_true", help="Esegue le funzioni sul database invece di usare gli output registrati")
+    replay_parser.add_argument("--json", help="Salva il report in formato JSON")
+
+    args = parser.parse_args()
+
+    # Niente access log per ogni chiamata simulata
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    asyncio.run(record(args) if args.command == "record" else replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Server locale che imita un calendario CalDAV: PROPFIND (getctag, sync-token,
+getetag), REPORT sync-collection (RFC 6578), PUT e DELETE condizionali con
+If-Match/If-None-Match, con latenza configurabile e errori iniettabili.
+"""
+
+import asyncio
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from aiohttp import web
+
+TOKEN_PREFIX = "http://classrent.test/sync/"
+
+
+class FakeCalDavServer:
+    """Un solo calendario in memoria; ogni scrittura incrementa ctag e sync token"""
+
+    def __init__(self, latency: float = 0.0, sync_tokens: bool = True, host: str = "127.0.0.1",
+                 port: int = 0, collection: str = "/calendars/classrent/"):
+        self.latency = latency
+        self.sync_tokens = sync_tokens
+        self.host = host
+        self.port = port
+        self.collection = collection
+
+        self.events: Dict[str, Tuple[str, bytes]] = {}  # path -> (etag, body)
+        self.sequence = 0
+        self.oldest_token = 0  # Token precedenti rifiutati (403 valid-sync-token)
+        self.log: List[Tuple[int, str]] = []
+        self.requests: Counter = Counter()
+        self.fail_writes: List[int] = []  # Stati restituiti ai prossimi PUT/DELETE
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{self.collection}"
+
+    @property
+    def ctag(self) -> str:
+        return str(self.sequence)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Porta effettiva se assegnata dal sistema operativo
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def path(self, uid: str) -> str:
+        return f"{self.collection}{uid}.ics"
+
+    def edit_remotely(self, path: str, body: bytes = b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n"):
+        """Modifica fatta da un altro client (nuovo ETag)"""
+        self._store(path, body)
+
+    def delete_remotely(self, path: str):
+        self.events.pop(path, None)
+        self._bump(path)
+
+    def _bump(self, path: str):
+        self.sequence += 1
+        self.log.append((self.sequence, path))
+
+    def _store(self, path: str, body: bytes) -> str:
+        etag = f'"{self.sequence + 1}-{hashlib.sha1(body).hexdigest()[:8]}"'
+        self.events[path] = (etag, body)
+        self._bump(path)
+        return etag
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests[request.method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_writes and request.method in ("PUT", "DELETE"):
+            return web.Response(status=self.fail_writes.pop(0))
+
+        body = await request.read()
+        if request.method == "PROPFIND":
+            return self._propfind(request.path, request.headers.get("Depth", "0"))
+        if request.method == "REPORT":
+            return self._report(body)
+        if request.method == "PUT":
+            return self._put(request.path, request.headers, body)
+        if request.method == "DELETE":
+            return self._delete(request.path, request.headers)
+        if request.method == "GET" and request.path in self.events:
+            etag, data = self.events[request.path]
+            return web.Response(body=data, headers={"ETag": etag, "Content-Type": "text/calendar"})
+        return web.Response(status=404)
+
+    def _multistatus(self, responses: List[str], extra: str = "") -> web.Response:
+        text = ('<?xml version="1.0" encoding="utf-8"?>'
+                '<D:multistatus xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/">'
+                + "".join(responses) + extra + "</D:multistatus>")
+        return web.Response(status=207, body=text.encode(), content_type="application/xml", charset="utf-8")
+
+    def _response(self, path: str, props: str = "", status: str = "200 OK") -> str:
+        if not props:
+            return f"<D:response><D:href>{escape(path)}</D:href><D:status>HTTP/1.1 {status}</D:status></D:response>"
+        return (f"<D:response><D:href>{escape(path)}</D:href><D:propstat><D:prop>{props}</D:prop>"
+                f"<D:status>HTTP/1.1 {status}</D:status></D:propstat></D:response>")
+
+    def _etag_response(self, path: str) -> str:
+        return self._response(path, f"<D:getetag>{escape(self.events[path][0])}</D:getetag>")
+
+    def _propfind(self, path: str, depth: str) -> web.Response:
+        if path in self.events:
+            return self._multistatus([self._etag_response(path)])
+        if path != self.collection:
+            return web.Response(status=404)
+        props = f"<D:resourcetype><D:collection/></D:resourcetype><CS:getctag>{self.ctag}</CS:getctag>"
+        if self.sync_tokens:
+            props += f"<D:sync-token>{TOKEN_PREFIX}{self.sequence}</D:sync-token>"
+        responses = [self._response(path, props)]
+        if depth == "1":
+            responses += [self._etag_response(event_path) for event_path in self.events]
+        return self._multistatus(responses)
+
+    def _report(self, body: bytes) -> web.Response:
+        if not self.sync_tokens:
+            return web.Response(status=501)
+        token = ElementTree.fromstring(body).findtext("{DAV:}sync-token") or ""
+        if token:
+            since = token[len(TOKEN_PREFIX):] if token.startswith(TOKEN_PREFIX) else ""
+            if not since.isdigit() or int(since) < self.oldest_token or int(since) > self.sequence:
+                return web.Response(
+                    status=403, content_type="application/xml",
+                    body=b'<?xml version="1.0"?><D:error xmlns:D="DAV:"><D:valid-sync-token/></D:error>'
+                )
+            changed = {path for sequence, path in self.log if sequence > int(since)}
+        else:
+            changed = set(self.events)
+        responses = [self._etag_response(path) if path in self.events else self._response(path, status="404 Not Found")
+                     for path in sorted(changed)]
+        return self._multistatus(responses, f"<D:sync-token>{TOKEN_PREFIX}{self.sequence}</D:sync-token>")
+
+    def _precondition_failed(self, path: str, headers) -> bool:
+        current = self.events.get(path)
+        if_match = headers.get("If-Match")
+        if if_match and (current is None or current[0] != if_match):
+            return True
+        return headers.get("If-None-Match") == "*" and current is not None
+
+    def _put(self, path: str, headers, body: bytes) -> web.Response:
+        if self._precondition_failed(path, headers):
+            return web.Response(status=412)
+        created = path not in self.events
+        etag = self._store(path, body)
+        return web.Response(status=201 if created else 204, headers={"ETag": etag})
+
+    def _delete(self, path: str, headers) -> web.Response:
+        if path not in self.events:
+            return web.Response(status=404)
+        if self._precondition_failed(path, headers):
+            return web.Response(status=412)
+        self.delete_remotely(path)
+        return web.Response(status=204)
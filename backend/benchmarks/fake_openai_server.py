@@ -0,0 +1,208 @@
+"""
+Server locale che imita le Assistants API di OpenAI riproducendo
+conversazioni registrate, con latenza configurabile.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, Any, List, Optional
+from aiohttp import web
+
+from app.services.tool_output_encoder import estimate_tokens
+
+
+class FakeOpenAIServer:
+    """Riproduce le fixture: ogni thread segue lo script della conversazione con lo stesso messaggio"""
+
+    def __init__(self, conversations: List[Dict[str, Any]], api_latency: float = 0.02,
+                 run_latency: float = 0.5, host: str = "127.0.0.1", port: int = 0):
+        self.conversations = {c["message"]: c for c in conversations}
+        self.api_latency = api_latency
+        self.run_latency = run_latency
+        self.host = host
+        self.port = port
+
+        self.threads: Dict[str, Dict[str, Any]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/v1/models", self._list_models)
+        app.router.add_post("/v1/assistants", self._create_assistant)
+        app.router.add_post("/v1/threads", self._create_thread)
+        app.router.add_post("/v1/threads/{thread_id}/messages", self._create_message)
+        app.router.add_get("/v1/threads/{thread_id}/messages", self._list_messages)
+        app.router.add_post("/v1/threads/{thread_id}/runs", self._create_run)
+        app.router.add_get("/v1/threads/{thread_id}/runs/{run_id}", self._retrieve_run)
+        app.router.add_post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs", self._submit_tool_outputs)
+        app.router.add_post("/v1/threads/{thread_id}/runs/{run_id}/cancel", self._cancel_run)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Porta effettiva se assegnata dal sistema operativo
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def thread_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Statistiche per thread: conversazione, tool call e token"""
+        return {
+            thread_id: {
+                "conversation": thread.get("conversation", {}).get("name"),
+                "tool_calls": thread["tool_calls"],
+                "tool_output_tokens": thread["tool_output_tokens"],
+                "total_tokens": thread["total_tokens"]
+            }
+            for thread_id, thread in self.threads.items()
+        }
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):08d}"
+
+    async def _delay(self):
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    async def _list_models(self, request):
+        await self._delay()
+        return web.json_response({"object": "list", "data": [{"id": "gpt-4-1106-preview", "object": "model", "created": 0, "owned_by": "bench"}]})
+
+    async def _create_assistant(self, request):
+        await self._delay()
+        body = await request.json()
+        return web.json_response({
+            "id": self._new_id("asst"), "object": "assistant", "created_at": int(time.time()),
+            "name": body.get("name"), "model": body.get("model"), "instructions": body.get("instructions"),
+            "tools": body.get("tools", []), "metadata": {}
+        })
+
+    async def _create_thread(self, request):
+        await self._delay()
+        thread_id = self._new_id("thread")
+        self.threads[thread_id] = {"messages": [], "tool_calls": 0, "tool_output_tokens": 0, "total_tokens": 0}
+        return web.json_response({"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+
+    async def _create_message(self, request):
+        await self._delay()
+        thread = self.threads[request.match_info["thread_id"]]
+        body = await request.json()
+        content = body["content"] if isinstance(body["content"], str) else json.dumps(body["content"])
+        thread["conversation"] = self.conversations.get(content, {
+            "name": "unknown", "message": content, "turns": [],
+            "response": "Risposta non registrata", "usage": {}
+        })
+        message = self._message_object(request.match_info["thread_id"], "user", content)
+        thread["messages"].append(message)
+        return web.json_response(message)
+
+    async def _list_messages(self, request):
+        await self._delay()
+        thread = self.threads[request.match_info["thread_id"]]
+        return web.json_response({
+            "object": "list", "data": list(reversed(thread["messages"])),
+            "first_id": None, "last_id": None, "has_more": False
+        })
+
+    async def _create_run(self, request):
+        await self._delay()
+        thread_id = request.match_info["thread_id"]
+        run_id = self._new_id("run")
+        self.runs[run_id] = {
+            "thread_id": thread_id, "status": "queued", "turn": 0,
+            "ready_at": time.monotonic() + self.run_latency
+        }
+        return web.json_response(self._run_object(run_id))
+
+    async def _retrieve_run(self, request):
+        await self._delay()
+        run_id = request.match_info["run_id"]
+        run = self.runs[run_id]
+
+        if run["status"] in ("queued", "in_progress"):
+            if time.monotonic() < run["ready_at"]:
+                run["status"] = "in_progress"
+            else:
+                self._advance(run_id)
+
+        return web.json_response(self._run_object(run_id))
+
+    async def _submit_tool_outputs(self, request):
+        await self._delay()
+        run_id = request.match_info["run_id"]
+        run = self.runs[run_id]
+        thread = self.threads[run["thread_id"]]
+
+        body = await request.json()
+        for tool_output in body.get("tool_outputs", []):
+            thread["tool_output_tokens"] += estimate_tokens(tool_output.get("output", ""))
+
+        run["turn"] += 1
+        run["status"] = "queued"
+        run["ready_at"] = time.monotonic() + self.run_latency
+        return web.json_response(self._run_object(run_id))
+
+    async def _cancel_run(self, request):
+        await self._delay()
+        run_id = request.match_info["run_id"]
+        self.runs[run_id]["status"] = "cancelled"
+        return web.json_response(self._run_object(run_id))
+
+    def _advance(self, run_id: str):
+        """Passa al turno successivo dello script: tool call oppure risposta finale"""
+        run = self.runs[run_id]
+        thread = self.threads[run["thread_id"]]
+        conversation = thread["conversation"]
+        turns = conversation.get("turns", [])
+
+        if run["turn"] < len(turns):
+            run["status"] = "requires_action"
+            run["tool_calls"] = [
+                {
+                    "id": self._new_id("call"),
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))}
+                }
+                for call in turns[run["turn"]]["tool_calls"]
+            ]
+            thread["tool_calls"] += len(run["tool_calls"])
+            return
+
+        run["status"] = "completed"
+        usage = conversation.get("usage") or {}
+        thread["total_tokens"] += usage.get("total_tokens", 0)
+        thread["messages"].append(self._message_object(run["thread_id"], "assistant", conversation.get("response", "")))
+
+    def _run_object(self, run_id: str) -> Dict[str, Any]:
+        run = self.runs[run_id]
+        conversation = self.threads[run["thread_id"]].get("conversation", {})
+        required_action = None
+        if run["status"] == "requires_action":
+            required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": run["tool_calls"]}}
+
+        return {
+            "id": run_id, "object": "thread.run", "created_at": int(time.time()),
+            "thread_id": run["thread_id"], "assistant_id": "asst_bench", "status": run["status"],
+            "required_action": required_action, "last_error": None, "model": "gpt-4-1106-preview",
+            "instructions": "", "tools": [], "metadata": {},
+            "usage": conversation.get("usage") if run["status"] == "completed" else None
+        }
+
+    def _message_object(self, thread_id: str, role: str, text: str) -> Dict[str, Any]:
+        return {
+            "id": self._new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "status": "completed",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "attachments": [], "metadata": {}
+        }
@@ -0,0 +1,128 @@
+"""
+Benchmark del fan-out del calendario live.
+
+Simula migliaia di client SSE collegati a CalendarLiveHub (senza MongoDB):
+ognuno segue 1-3 spazi (o tutti) sul mese corrente e legge il proprio flusso
+tramite CalendarLiveHub.stream. Una parte dei client è lenta o bloccata per
+verificare che la backpressure per connessione non rallenti gli altri:
+    python -m benchmarks.live_fanout --clients 3000 --changes 2000 --spaces 40
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+from bson import ObjectId
+
+from app.services.calendar_live import CalendarLiveHub
+
+
+def make_change(space_ids: List[str], month_start: datetime, rng: random.Random, sequence: int) -> Dict[str, Any]:
+    start = month_start + timedelta(days=rng.randint(0, 27), hours=rng.randint(8, 18))
+    return {
+        "_id": {"_data": f"{sequence:016x}"},
+        "operationType": rng.choice(["insert", "update"]),
+        "ns": {"db": "classrent", "coll": rng.choice(["bookings", "calendar_events"])},
+        "documentKey": {"_id": ObjectId()},
+        "fullDocument": {
+            "space_id": rng.choice(space_ids),
+            "start_datetime": start,
+            "end_datetime": start + timedelta(hours=2),
+            "status": rng.choice(["confirmed", "confirmed", "active", "cancelled"])
+        }
+    }
+
+
+async def consume(hub: CalendarLiveHub, space_ids, start, end, delay: float, stats: Dict[str, int], stalled: bool):
+    stream = hub.stream(space_ids, start, end)
+    async for chunk in stream:
+        if chunk.startswith(b"event: change") or b"\nevent: change" in chunk:
+            stats["received"] += 1
+        elif b"event: resync" in chunk:
+            stats["resyncs"] += 1
+        if stalled:
+            # Client che non legge più: la sua coda si riempie e va in overflow
+            await asyncio.Event().wait()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+async def scenario(clients: int, changes: int, spaces: int, slow_ratio: float, stalled_ratio: float,
+                   rate: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    hub = CalendarLiveHub()
+    hub.available = True
+    hub.heartbeat_seconds = 3600
+
+    space_ids = [str(ObjectId()) for _ in range(spaces)]
+    month_start = datetime(2025, 10, 1)
+    month_end = month_start + timedelta(days=31)
+    stats = {"received": 0, "resyncs": 0}
+
+    tasks = []
+    for _ in range(clients):
+        followed = None if rng.random() < 0.1 else set(rng.sample(space_ids, rng.randint(1, 3)))
+        roll = rng.random()
+        stalled = roll < stalled_ratio
+        delay = 0.05 if stalled_ratio <= roll < stalled_ratio + slow_ratio else 0.0
+        tasks.append(asyncio.ensure_future(consume(hub, followed, month_start, month_end, delay, stats, stalled)))
+    await asyncio.sleep(0)
+
+    publish_seconds = 0.0
+    interval = 1 / rate if rate else 0
+    started = time.perf_counter()
+    for sequence in range(changes):
+        change = make_change(space_ids, month_start, rng, sequence)
+        begin = time.perf_counter()
+        hub.publish(change)
+        publish_seconds += time.perf_counter() - begin
+        # Lascia girare i consumatori tra un cambiamento e l'altro
+        await asyncio.sleep(interval)
+    await asyncio.sleep(0.2)
+    wall = time.perf_counter() - started
+
+    metrics = hub.get_metrics()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "clients": clients,
+        "changes": changes,
+        "publish_us_per_change": round(publish_seconds * 1e6 / changes, 1),
+        "deliveries": metrics["deliveries"],
+        "received": stats["received"],
+        "overflows": metrics["overflows"],
+        "resyncs_received": stats["resyncs"],
+        "wall_seconds": round(wall, 2),
+        "deliveries_per_second": round(metrics["deliveries"] / wall)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fan-out calendario live ClassRent")
+    parser.add_argument("--clients", type=int, default=3000)
+    parser.add_argument("--changes", type=int, default=2000)
+    parser.add_argument("--spaces", type=int, default=40)
+    parser.add_argument("--slow", type=float, default=0.05, help="Quota di client lenti")
+    parser.add_argument("--stalled", type=float, default=0.01, help="Quota di client bloccati")
+    parser.add_argument("--rate", type=int, default=500, help="Cambiamenti al secondo (0 = senza pausa)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(scenario(args.clients, args.changes, args.spaces, args.slow, args.stalled, args.rate, args.seed))
+    for key, value in result.items():
+        print(f"{key:<24}{value}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark delle proiezioni del repository layer.
+
+Confronta, su dati sintetici realistici, i byte BSON trasferiti e il tempo
+di decodifica lato driver tra il documento intero (come facevano le route
+prima del repository layer) e la proiezione usata oggi:
+    python -m benchmarks.repository_projection --spaces 40 --bookings 5000 --repeat 5
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+import bson
+from bson import ObjectId
+
+from app.repositories.spaces import SPACE_NAME, SPACE_AI, SPACE_DETAIL
+from app.repositories.bookings import BOOKING_SUMMARY, BOOKING_OWNER
+from app.repositories.calendar_events import CALENDAR_EVENT
+from app.repositories.users import USER_SESSION
+
+MATERIAL_NAMES = [
+    "Proiettore", "PC", "Lavagna Interattiva", "Microfono", "Webcam", "Schermo Grande",
+    "Casse Audio", "Document Camera", "Tavolo Modulare", "Sedie Extra", "Lettino", "Stetoscopio"
+]
+
+
+def make_spaces(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    spaces = []
+    for i in range(count):
+        materials = [
+            {"name": name, "description": f"{name} in dotazione all'aula, modello {rng.randint(100, 999)}", "quantity": rng.randint(1, 30)}
+            for name in rng.sample(MATERIAL_NAMES, rng.randint(3, len(MATERIAL_NAMES)))
+        ]
+        spaces.append({
+            "_id": ObjectId(),
+            "name": f"Aula {100 + i}",
+            "type": rng.choice(["aula", "laboratorio", "sala_riunioni", "box_medico"]),
+            "capacity": rng.choice([3, 15, 30, 50, 120, 200]),
+            "materials": materials,
+            "location": f"Edificio {rng.choice('ABCD')} - Piano {rng.randint(0, 3)}",
+            "description": "Spazio attrezzato per lezioni, seminari ed esercitazioni. " * 3,
+            "available_hours": {"start_time": "08:00", "end_time": "20:00"},
+            "booking_constraints": {"max_duration": 240, "advance_booking_days": 7},
+            "is_active": True,
+            "created_at": datetime(2025, 1, 1)
+        })
+    return spaces
+
+
+def make_bookings(count: int, spaces: List[Dict[str, Any]], users: List[Dict[str, Any]], rng: random.Random) -> List[Dict[str, Any]]:
+    bookings = []
+    start = datetime(2025, 9, 1, 8)
+    for _ in range(count):
+        begin = start + timedelta(days=rng.randint(0, 120), hours=rng.randint(0, 10))
+        bookings.append({
+            "_id": ObjectId(),
+            "user_id": str(rng.choice(users)["_id"]),
+            "space_id": str(rng.choice(spaces)["_id"]),
+            "start_datetime": begin,
+            "end_datetime": begin + timedelta(hours=rng.randint(1, 3)),
+            "purpose": rng.choice(["Lezione di Analisi", "Ricevimento studenti", "Seminario di dipartimento", "Esame orale"]),
+            "status": rng.choice(["confirmed", "confirmed", "cancelled"]),
+            "materials_requested": rng.sample(MATERIAL_NAMES, rng.randint(0, 3)),
+            "notes": "Portare il registro presenze e verificare il collegamento HDMI. " * rng.randint(0, 3),
+            "cancellation_reason": "",
+            "created_at": begin - timedelta(days=3),
+            "updated_at": begin - timedelta(days=3)
+        })
+    return bookings
+
+
+def make_calendar_events(bookings: List[Dict[str, Any]], spaces_by_id: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    events = []
+    for booking in bookings:
+        space = spaces_by_id[booking["space_id"]]
+        events.append({
+            "_id": ObjectId(),
+            "booking_id": str(booking["_id"]),
+            "space_id": booking["space_id"],
+            "space_name": space["name"],
+            "location": space["location"],
+            "start_datetime": booking["start_datetime"],
+            "end_datetime": booking["end_datetime"],
+            "purpose": booking["purpose"],
+            "materials_requested": booking["materials_requested"],
+            "notes": booking["notes"],
+            "created_by_email": "docente@universita.edu",
+            "event_type": "booking",
+            "status": "active",
+            "created_at": booking["created_at"],
+            "updated_at": booking["updated_at"]
+        })
+    return events
+
+
+def project(document: Dict[str, Any], projection: Dict[str, int]) -> Dict[str, Any]:
+    """Proiezione di inclusione come la applica il server (campi di primo livello, _id incluso)"""
+    projected = {"_id": document["_id"]} if projection.get("_id", 1) else {}
+    for field, include in projection.items():
+        if include and field != "_id" and field in document:
+            projected[field] = document[field]
+    return projected
+
+
+def measure(documents: List[Dict[str, Any]], projection: Dict[str, int], repeat: int) -> Dict[str, float]:
+    payloads = [bson.encode(project(doc, projection) if projection else doc) for doc in documents]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            bson.decode(payload)
+    decode_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    return {"bytes": sum(len(p) for p in payloads), "decode_ms": decode_ms}
+
+
+def run(spaces_count: int, bookings_count: int, repeat: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    users = [{"_id": ObjectId(), "email": f"utente{i}@universita.edu", "full_name": f"Utente {i}",
+              "hashed_password": "$2b$12$" + "x" * 53, "role": "student", "created_at": datetime(2025, 1, 1)}
+             for i in range(200)]
+    spaces = make_spaces(spaces_count, rng)
+    spaces_by_id = {str(s["_id"]): s for s in spaces}
+    bookings = make_bookings(bookings_count, spaces, users, rng)
+    events = make_calendar_events(bookings, spaces_by_id)
+
+    one_user = users[0]["_id"]
+    user_bookings = [b for b in bookings if b["user_id"] == str(one_user)] or bookings[:25]
+    month_events = [e for e in events if e["start_datetime"] < datetime(2025, 10, 1)]
+    # Una lettura del nome spazio per ogni prenotazione mostrata (storico utente, calendario)
+    name_lookups = [spaces_by_id[b["space_id"]] for b in user_bookings]
+
+    scenarios = [
+        ("spaces.get_name (storico utente)", name_lookups, SPACE_NAME),
+        ("spaces.list_active (chat AI)", spaces, SPACE_AI),
+        ("spaces.list_active (listing)", spaces, SPACE_DETAIL),
+        ("bookings.list_for_user (chat)", user_bookings, BOOKING_SUMMARY),
+        ("bookings.get_by_id (calendario)", bookings[:len(month_events)], BOOKING_OWNER),
+        ("users.get_by_email (ogni richiesta)", users, USER_SESSION),
+        ("calendar_events.list_active_between (mese)", month_events, CALENDAR_EVENT),
+    ]
+
+    results = []
+    for name, documents, projection in scenarios:
+        before = measure(documents, None, repeat)
+        after = measure(documents, projection, repeat)
+        results.append({
+            "scenario": name,
+            "documents": len(documents),
+            "bytes_before": before["bytes"],
+            "bytes_after": after["bytes"],
+            "decode_ms_before": round(before["decode_ms"], 3),
+            "decode_ms_after": round(after["decode_ms"], 3),
+            "bytes_saved_pct": round(100 * (1 - after["bytes"] / before["bytes"]), 1) if before["bytes"] else 0.0
+        })
+    return results
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'Scenario':<46}{'Doc':>6}{'Byte prima':>12}{'Byte dopo':>12}{'Risparmio':>11}{'Decode prima':>14}{'Decode dopo':>13}")
+    for r in results:
+        print(
+            f"{r['scenario']:<46}{r['documents']:>6}{r['bytes_before']:>12}{r['bytes_after']:>12}"
+            f"{r['bytes_saved_pct']:>10}%{r['decode_ms_before']:>12.2f}ms{r['decode_ms_after']:>11.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark proiezioni repository ClassRent")
+    parser.add_argument("--spaces", type=int, default=40)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="Ripetizioni della decodifica per stabilizzare i tempi")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    args = parser.parse_args()
+
+    results = run(args.spaces, args.bookings, args.repeat, args.seed)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
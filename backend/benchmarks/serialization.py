@@ -0,0 +1,161 @@
+"""
+Benchmark della serializzazione delle risposte.
+
+Confronta, su payload sintetici grandi di /calendar/bookings e /materials/,
+il percorso di default di FastAPI (isoformat manuale, jsonable_encoder,
+json.dumps) con FastJSONResponse (orjson, datetime nativi) e misura la
+compressione gzip/brotli applicata da CompressionMiddleware:
+    python -m benchmarks.serialization --events 5000 --materials 2000 --repeat 5
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Callable
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models.material import MaterialResponse
+from app.responses import FastJSONResponse
+from app.middleware.compression import brotli
+from benchmarks.repository_projection import MATERIAL_NAMES
+
+
+def make_calendar_bookings(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Righe di /calendar/bookings come le costruisce la route (datetime nativi)"""
+    rows = []
+    start = datetime(2025, 9, 1, 8)
+    for i in range(count):
+        begin = start + timedelta(days=rng.randint(0, 30), hours=rng.randint(0, 10))
+        rows.append({
+            "id": str(ObjectId()),
+            "space_id": str(ObjectId()),
+            "space_name": f"Aula {100 + rng.randint(0, 40)}",
+            "space_location": f"Edificio {rng.choice('ABCD')} - Piano {rng.randint(0, 3)}",
+            "user_id": str(ObjectId()),
+            "user_name": f"Utente {rng.randint(0, 200)}",
+            "user_role": rng.choice(["student", "professor"]),
+            "start_datetime": begin,
+            "end_datetime": begin + timedelta(hours=rng.randint(1, 3)),
+            "purpose": rng.choice(["Lezione di Analisi", "Ricevimento studenti", "Seminario di dipartimento"]),
+            "status": "confirmed",
+            "materials_requested": rng.sample(MATERIAL_NAMES, rng.randint(0, 3)),
+            "notes": "",
+            "created_at": begin,
+            "is_own_booking": i % 10 == 0
+        })
+    return rows
+
+
+def make_materials(count: int, rng: random.Random) -> List[MaterialResponse]:
+    return [
+        MaterialResponse(
+            id=str(ObjectId()),
+            name=f"{rng.choice(MATERIAL_NAMES)} {i}",
+            description="Materiale in dotazione al dipartimento, verificato a inizio semestre",
+            quantity=rng.randint(1, 30),
+            category=rng.choice(["elettronica", "arredamento", "didattica"]),
+            is_available=rng.random() > 0.1,
+            maintenance_notes=None,
+            spaces_count=rng.randint(0, 12)
+        )
+        for i in range(count)
+    ]
+
+
+def with_isoformat(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Conversione manuale dei datetime com'era nella route del calendario"""
+    converted = []
+    for row in rows:
+        row = dict(row)
+        for field in ("start_datetime", "end_datetime", "created_at"):
+            row[field] = row[field].isoformat()
+        converted.append(row)
+    return converted
+
+
+def timed(function: Callable[[], bytes], repeat: int) -> Dict[str, Any]:
+    body = function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return {"body": body, "ms": (time.perf_counter() - start) * 1000 / repeat}
+
+
+def compression_sizes(body: bytes) -> Dict[str, Any]:
+    sizes = {"gzip": len(gzip.compress(body, compresslevel=6))}
+    sizes["br"] = len(brotli.compress(body, quality=4)) if brotli is not None else None
+    return sizes
+
+
+def run(events: int, materials: int, repeat: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    calendar_rows = make_calendar_bookings(events, rng)
+    material_rows = make_materials(materials, rng)
+
+    scenarios = [
+        (
+            "/calendar/bookings",
+            lambda: JSONResponse(None).render(jsonable_encoder(with_isoformat(calendar_rows))),
+            lambda: FastJSONResponse(None).render(calendar_rows)
+        ),
+        (
+            "/materials/",
+            lambda: JSONResponse(None).render(jsonable_encoder(material_rows)),
+            lambda: FastJSONResponse(None).render(material_rows)
+        ),
+    ]
+
+    results = []
+    for name, default_path, fast_path in scenarios:
+        before = timed(default_path, repeat)
+        after = timed(fast_path, repeat)
+        assert json.loads(before["body"]) == json.loads(after["body"]), f"Output diverso per {name}"
+        sizes = compression_sizes(after["body"])
+        results.append({
+            "scenario": name,
+            "rows": events if name.startswith("/calendar") else materials,
+            "ms_default": round(before["ms"], 2),
+            "ms_orjson": round(after["ms"], 2),
+            "speedup": round(before["ms"] / after["ms"], 1) if after["ms"] else None,
+            "bytes": len(after["body"]),
+            "bytes_gzip": sizes["gzip"],
+            "bytes_br": sizes["br"]
+        })
+    return results
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'Scenario':<22}{'Righe':>7}{'Default':>11}{'orjson':>10}{'x':>6}{'Byte':>11}{'gzip':>10}{'br':>10}")
+    for r in results:
+        br = r["bytes_br"] if r["bytes_br"] is not None else "-"
+        print(
+            f"{r['scenario']:<22}{r['rows']:>7}{r['ms_default']:>9.2f}ms{r['ms_orjson']:>8.2f}ms"
+            f"{r['speedup']:>6}{r['bytes']:>11}{r['bytes_gzip']:>10}{br:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serializzazione risposte ClassRent")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--materials", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    args = parser.parse_args()
+
+    results = run(args.events, args.materials, args.repeat, args.seed)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark dell'import orari semestrale.
+
+Genera un CSV di lezioni (una parte settimanali con RRULE, una parte con
+conflitti) e lo importa con TimetableImportService in dry run, con spazi,
+utenti e prenotazioni esistenti in memoria (senza MongoDB). Misura la
+validazione in streaming e la sweep line per spazio:
+    python -m benchmarks.timetable_import --rows 5000 --spaces 60 --weekly 0.3
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+from bson import ObjectId
+
+from app.repositories import bookings_repository, booking_series_repository, spaces_repository, users_repository
+from app.services.timetable_import import timetable_import
+
+
+def make_csv(rows: int, spaces: List[Dict[str, Any]], owners: List[str], weekly: float,
+             semester_start: datetime, rng: random.Random) -> bytes:
+    lines = ["space,owner_email,start_datetime,end_datetime,purpose,rrule"]
+    for number in range(rows):
+        start = semester_start + timedelta(days=rng.randint(0, 100), hours=rng.randint(8, 17))
+        end = start + timedelta(hours=rng.choice([1, 2, 3]))
+        end = min(end, start.replace(hour=20, minute=0))
+        rule = f"FREQ=WEEKLY;COUNT={rng.randint(8, 14)}" if rng.random() < weekly else ""
+        lines.append(f"{rng.choice(spaces)['name']},{rng.choice(owners)},{start.isoformat()},"
+                     f"{end.isoformat()},Lezione {number},{rule}")
+    return "\n".join(lines).encode()
+
+
+async def scenario(rows: int, spaces_count: int, owners_count: int, weekly: float, existing: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    semester_start = datetime(datetime.utcnow().year + 1, 2, 1)
+    spaces = [{"_id": ObjectId(), "name": f"Aula {index}", "location": "Polo didattico",
+               "available_hours": {"start_time": "08:00", "end_time": "20:00"}} for index in range(spaces_count)]
+    owners = [f"docente{index}@uni.it" for index in range(owners_count)]
+    booked: Dict[str, List[Dict[str, Any]]] = {str(space["_id"]): [] for space in spaces}
+    for _ in range(existing):
+        start = semester_start + timedelta(days=rng.randint(0, 100), hours=rng.randint(8, 17))
+        booked[str(rng.choice(spaces)["_id"])].append({"start_datetime": start, "end_datetime": start + timedelta(hours=2)})
+    queries = {"count": 0}
+
+    async def list_active(*args, **kwargs):
+        return spaces
+
+    async def get_many_by_email(emails):
+        return {email: {"_id": ObjectId(), "email": email, "full_name": email} for email in emails}
+
+    async def bookings_overlapping(space_id, start, end, projection=None):
+        queries["count"] += 1
+        return booked[space_id]
+
+    async def series_overlapping(start, end, space_id=None, projection=None):
+        queries["count"] += 1
+        return []
+
+    spaces_repository.list_active = list_active
+    users_repository.get_many_by_email = get_many_by_email
+    bookings_repository.list_overlapping = bookings_overlapping
+    booking_series_repository.list_overlapping = series_overlapping
+
+    payload = make_csv(rows, spaces, owners, weekly, semester_start, rng)
+    started = time.perf_counter()
+    report = await timetable_import.run(io.BytesIO(payload), "orario.csv", dry_run=True)
+    wall = time.perf_counter() - started
+
+    return {
+        "rows": report["rows"],
+        "valid": report["valid"],
+        "rejected": report["error_count"],
+        "occurrences_checked": report["occurrences"],
+        "availability_queries": queries["count"],
+        "wall_seconds": round(wall, 3),
+        "rows_per_second": round(report["rows"] / wall)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import orari ClassRent")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--spaces", type=int, default=60)
+    parser.add_argument("--owners", type=int, default=200)
+    parser.add_argument("--weekly", type=float, default=0.3, help="Quota di righe settimanali (RRULE)")
+    parser.add_argument("--existing", type=int, default=2000, help="Prenotazioni già presenti")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(scenario(args.rows, args.spaces, args.owners, args.weekly, args.existing, args.seed))
+    for key, value in result.items():
+        print(f"{key:<24}{value}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
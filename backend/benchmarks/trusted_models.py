@@ -0,0 +1,129 @@
+"""
+Micro-benchmark della costruzione delle risposte di elenco.
+
+Confronta, a 1k e 10k righe, il percorso con validazione (modello Pydantic
+per riga + rivalidazione di FastAPI tramite response_model + json) con le
+righe fidate di app.models.trusted serializzate con orjson. Il tempo per
+riga deve restare costante al crescere delle righe:
+    python -m benchmarks.trusted_models --rows 1000 10000 --repeat 3
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Any, List, Callable
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.models.booking import BookingResponse
+from app.models.material import MaterialResponse
+from app.models.space import SpaceResponse
+from app.models.trusted import trusted_row, trusted_rows
+from app.responses import FastJSONResponse
+from benchmarks.repository_projection import make_spaces, make_bookings, MATERIAL_NAMES
+
+
+def make_material_documents(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"{rng.choice(MATERIAL_NAMES)} {i}",
+            "description": "Materiale in dotazione al dipartimento",
+            "quantity": rng.randint(1, 30),
+            "category": rng.choice(["elettronica", "arredamento", "didattica"]),
+            "is_available": True,
+            "maintenance_notes": None,
+            "spaces_count": rng.randint(0, 12)
+        }
+        for i in range(count)
+    ]
+
+
+def validated_path(model, build: Callable[[Dict[str, Any]], Any], documents: List[Dict[str, Any]]) -> bytes:
+    """Com'era prima: un modello per riga, poi rivalidazione tramite response_model"""
+    field = create_response_field(name="Response", type_=List[model])
+    content = asyncio.run(serialize_response(field=field, response_content=[build(doc) for doc in documents]))
+    return JSONResponse(None).render(content)
+
+
+def timed(function: Callable[[], bytes], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(row_counts: List[int], repeat: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    results = []
+    for rows in row_counts:
+        spaces = make_spaces(rows, rng)
+        users = [{"_id": ObjectId()}]
+        bookings = make_bookings(rows, spaces, users, rng)
+        materials = make_material_documents(rows, rng)
+
+        scenarios = [
+            (
+                "SpaceResponse", spaces,
+                lambda docs: validated_path(SpaceResponse, lambda d: SpaceResponse(id=str(d["_id"]), **{k: v for k, v in d.items() if k != "_id"}), docs),
+                lambda docs: FastJSONResponse(None).render(trusted_rows(SpaceResponse, docs))
+            ),
+            (
+                "BookingResponse", bookings,
+                lambda docs: validated_path(BookingResponse, lambda d: BookingResponse(id=str(d["_id"]), space_name="Aula 101", **{k: v for k, v in d.items() if k in BookingResponse.model_fields}), docs),
+                lambda docs: FastJSONResponse(None).render([trusted_row(BookingResponse, d, id=str(d["_id"]), space_name="Aula 101") for d in docs])
+            ),
+            (
+                "MaterialResponse", materials,
+                lambda docs: validated_path(MaterialResponse, lambda d: MaterialResponse(id=str(d["_id"]), **{k: v for k, v in d.items() if k != "_id"}), docs),
+                lambda docs: FastJSONResponse(None).render(trusted_rows(MaterialResponse, docs))
+            ),
+        ]
+
+        for name, documents, before, after in scenarios:
+            assert json.loads(before(documents)) == json.loads(after(documents)), f"Output diverso per {name}"
+            seconds_before = timed(lambda: before(documents), repeat)
+            seconds_after = timed(lambda: after(documents), repeat)
+            results.append({
+                "model": name,
+                "rows": rows,
+                "ms_validated": round(seconds_before * 1000, 2),
+                "ms_trusted": round(seconds_after * 1000, 2),
+                "us_per_row_validated": round(seconds_before * 1e6 / rows, 2),
+                "us_per_row_trusted": round(seconds_after * 1e6 / rows, 2)
+            })
+    return results
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'Modello':<18}{'Righe':>7}{'Validato':>12}{'Fidato':>11}{'µs/riga prima':>15}{'µs/riga dopo':>14}")
+    for r in results:
+        print(
+            f"{r['model']:<18}{r['rows']:>7}{r['ms_validated']:>10.1f}ms{r['ms_trusted']:>9.1f}ms"
+            f"{r['us_per_row_validated']:>15.2f}{r['us_per_row_trusted']:>14.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark costruzione risposte ClassRent")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Salva il report in formato JSON")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat, args.seed)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
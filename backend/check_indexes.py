@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Verifica degli indici MongoDB per ClassRent.
+
+Applica il registro degli indici (se richiesto) ed esegue explain su ogni
+query nota dell'applicazione: esce con codice 1 se un piano usa COLLSCAN,
+così da poter essere usato in CI.
+
+Uso:
+    python check_indexes.py            # solo verifica dei piani
+    python check_indexes.py --apply    # crea gli indici mancanti e verifica
+    python check_indexes.py --apply --rebuild  # ricrea anche gli indici con opzioni diverse
+"""
+
+import argparse
+import asyncio
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.config import settings
+from app.services.index_manager import index_manager
+
+
+async def main(apply: bool, rebuild: bool) -> int:
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+
+    summary = {}
+    try:
+        if apply:
+            print("📊 Applicazione registro indici...")
+            summary = await index_manager.ensure_indexes(db, rebuild=rebuild)
+
+        print("🔍 Verifica piani delle query note...")
+        results = await index_manager.check_query_plans(db)
+    finally:
+        client.close()
+
+    collscans = [r for r in results if r["collscan"]]
+    for result in results:
+        icon = "❌" if result["collscan"] else "✅"
+        print(f"{icon} {result['name']:<32} {', '.join(result['stages'])}")
+
+    print()
+    if summary.get("mismatched"):
+        print(f"❌ {len(summary['mismatched'])} indici con opzioni diverse dal registro (usa --rebuild):")
+        for name in summary["mismatched"]:
+            print(f"   - {name}")
+        return 1
+
+    if collscans:
+        print(f"❌ {len(collscans)} query senza indice (COLLSCAN):")
+        for result in collscans:
+            print(f"   - {result['name']} su {result['collection']}")
+        return 1
+
+    print(f"🎉 Tutte le {len(results)} query note usano un indice")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica indici MongoDB")
+    parser.add_argument("--apply", action="store_true", help="Crea gli indici mancanti prima della verifica")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Con --apply ricrea gli indici con opzioni diverse dal registro")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.apply, args.rebuild)))
@@ -3,6 +3,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 from app.config import settings
 from app.services.auth_service import get_password_hash
+from app.services.index_manager import index_manager
 
 async def complete_reset_and_fix():
     """Reset completo del database rimuovendo is_active e correggendo tutti i problemi"""
@@ -234,11 +235,7 @@ async def complete_reset_and_fix():
         print(f"✅ Creati {len(spaces)} spazi")
         
         print("📊 Step 5: Creazione indici per performance...")
-        await db.users.create_index("email", unique=True)
-        await db.spaces.create_index([("type", 1), ("is_active", 1)])
-        await db.materials.create_index("name")
-        await db.bookings.create_index([("user_id", 1), ("start_datetime", -1)])
-        await db.bookings.create_index([("space_id", 1), ("start_datetime", 1)])
+        await index_manager.ensure_indexes(db)
         
         print("✅ Indici creati")
         
@@ -3,6 +3,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 from app.config import settings
 from app.services.auth_service import get_password_hash
+from app.services.index_manager import index_manager
 
 async def complete_reset():
     """Reset completo del database con struttura corretta"""
@@ -165,9 +166,7 @@ async def complete_reset():
         
         # Crea indici
         print("📊 Creazione indici...")
-        await db.users.create_index("email", unique=True)
-        await db.spaces.create_index([("type", 1), ("is_active", 1)])
-        await db.materials.create_index("name")
+        await index_manager.ensure_indexes(db)
         
         print("✅ Reset completo terminato!")
         print("\n🔐 Credenziali disponibili:")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Riconciliazione calendario ClassRent.
+
+Le prenotazioni hanno una sola fonte (bookings) e il calendario le legge
+da lì. Questo comando confronta le copie scritte in calendar_events dalla
+vecchia doppia scrittura con le prenotazioni e riporta le divergenze
+(copie orfane, duplicate, stato, spazio o orari diversi). Esce con codice
+1 se trova divergenze senza --apply, così da poter essere usato in CI.
+
+Uso:
+    python reconcile_calendar.py            # solo report
+    python reconcile_calendar.py --apply    # elimina le copie e completa updated_at
+"""
+
+import argparse
+import asyncio
+import sys
+from app.database import connect_to_mongo, close_mongo_connection
+from app.services.calendar_reconciliation import calendar_reconciler
+
+
+async def main(apply: bool, batch_size: int) -> int:
+    await connect_to_mongo()
+    try:
+        print("🔍 Confronto copie calendario con bookings...")
+        report = await calendar_reconciler.run(apply, batch_size)
+    finally:
+        await close_mongo_connection()
+
+    drifted = sum(report["drift"].values())
+    print(f"📅 Copie legacy: {report['mirrors']} (allineate: {report['in_sync']}, divergenti: {drifted})")
+    for kind, count in report["drift"].items():
+        if count:
+            print(f"   - {kind:<10} {count}")
+    for sample in report["samples"]:
+        print(f"   ⚠️ evento {sample['event_id']} → prenotazione {sample['booking_id']}: {sample['drift']}")
+
+    if apply:
+        print(f"🧹 Copie eliminate: {report['deleted']}, prenotazioni con updated_at completato: {report['bookings_backfilled']}")
+        return 0
+    if drifted:
+        print("❌ Divergenze trovate: esegui con --apply per riallineare")
+        return 1
+    print("🎉 Nessuna divergenza")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Riconciliazione calendario con bookings")
+    parser.add_argument("--apply", action="store_true", help="Elimina le copie legacy e completa updated_at")
+    parser.add_argument("--batch-size", type=int, default=500, help="Copie confrontate per batch")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.apply, args.batch_size)))
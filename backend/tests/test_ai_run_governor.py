@@ -0,0 +1,71 @@
+import asyncio
+from app.services.ai_run_governor import AIRunGovernor
+
+def _governor(**limits):
+    governor = AIRunGovernor()
+    for name, value in limits.items():
+        setattr(governor, name, value)
+    return governor
+
+def test_newer_message_supersedes_inflight_run():
+    """Test annullamento della run precedente dello stesso utente"""
+    governor = _governor(max_concurrent_runs=2)
+
+    async def scenario():
+        async with governor.admit("u1") as first:
+            assert first.admitted
+            async with governor.admit("u1") as second:
+                assert second.admitted
+                assert first.superseded.is_set()
+                assert not second.superseded.is_set()
+
+    asyncio.run(scenario())
+    assert governor.get_metrics()["superseded"] == 1
+
+def test_queue_full_and_timeout_are_rejected():
+    """Test rifiuto quando la capacità è esaurita"""
+    governor = _governor(max_concurrent_runs=1, max_queue=1, queue_timeout=0.05)
+
+    async def scenario():
+        async with governor.admit("u1") as running:
+            assert running.admitted
+
+            async def queued():
+                async with governor.admit("u2") as lease:
+                    return lease.rejected_reason
+
+            waiting = asyncio.create_task(queued())
+            await asyncio.sleep(0)
+
+            async with governor.admit("u3") as lease:
+                assert lease.rejected_reason == "queue_full"
+
+            assert await waiting == "queue_timeout"
+
+    asyncio.run(scenario())
+    metrics = governor.get_metrics()
+    assert metrics["rejected_queue_full"] == 1
+    assert metrics["rejected_queue_timeout"] == 1
+    assert metrics["running"] == 0
+
+def test_user_budgets():
+    """Test budget orari di richieste e token per utente"""
+    governor = _governor(user_requests_per_hour=2, user_tokens_per_hour=1000)
+
+    async def scenario():
+        async with governor.admit("u1") as lease:
+            lease.tokens_used = 1200
+        async with governor.admit("u1") as lease:
+            return lease.rejected_reason
+
+    assert asyncio.run(scenario()) == "budget_tokens"
+
+    governor = _governor(user_requests_per_hour=1)
+
+    async def scenario_requests():
+        async with governor.admit("u1"):
+            pass
+        async with governor.admit("u1") as lease:
+            return lease.rejected_reason
+
+    assert asyncio.run(scenario_requests()) == "budget_requests"
@@ -0,0 +1,181 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.services.caldav_sync import content_hash, event_body, event_uid
+from benchmarks.caldav_sync import MemoryStore, make_booking, make_engine
+from benchmarks.fake_caldav_server import FakeCalDavServer
+
+
+START = datetime(2031, 10, 7, 9, 0)
+
+
+def run_with_server(monkeypatch, body, bookings=5, **server_options):
+    """Esegue body(engine, server, store) con un FakeCalDavServer e i repository in memoria"""
+    monkeypatch.setattr(settings, "caldav_url", "http://127.0.0.1/calendars/classrent/")
+    store = MemoryStore()
+    rng = random.Random(1)
+    updated_at = datetime.utcnow() - timedelta(minutes=5)
+    for number in range(bookings):
+        store.add("bookings", make_booking(START + timedelta(days=number), f"Lezione {number}",
+                                           updated_at + timedelta(seconds=number), rng))
+    store.install(monkeypatch.setattr)
+
+    async def scenario():
+        server = FakeCalDavServer(**server_options)
+        await server.start()
+        try:
+            engine = make_engine(server.url, concurrency=2, batch_size=2)
+            return await body(engine, server, store)
+        finally:
+            await server.stop()
+
+    return asyncio.run(scenario())
+
+
+def touch(store, document, **fields):
+    document.update(fields, updated_at=datetime.utcnow() - timedelta(seconds=1))
+
+
+def test_hash_ignores_dtstamp():
+    """Una scrittura che cambia solo updated_at non cambia l'hash dell'evento"""
+    document = make_booking(START, "Lezione", START - timedelta(days=1), random.Random(1))
+    later = {**document, "updated_at": START}
+
+    assert event_body(document, None) != event_body(later, None)
+    assert content_hash(event_body(document, None)) == content_hash(event_body(later, None))
+    assert content_hash(event_body(document, None)) != content_hash(event_body({**document, "purpose": "Altro"}, None))
+
+
+def test_only_changed_events_are_pushed(monkeypatch):
+    """Dopo l'invio iniziale si rinviano solo le prenotazioni con contenuto cambiato"""
+    async def body(engine, server, store):
+        first = await engine.run_once()
+        documents = list(store.documents["bookings"].values())
+        touch(store, documents[0], purpose="Lezione spostata")
+        touch(store, documents[1])
+        server.requests.clear()
+        second = await engine.run_once()
+        return first, second, server
+
+    first, second, server = run_with_server(monkeypatch, body)
+
+    assert first["pushed"] == 5
+    assert second["pushed"] == 1
+    assert second["unchanged"] == 1
+    assert server.requests["PUT"] == 1
+    assert b"Lezione spostata" in next(data for _, data in server.events.values() if b"spostata" in data)
+
+
+def test_unchanged_ctag_needs_a_single_propfind(monkeypatch):
+    """Calendario remoto invariato e nessuna modifica locale: una sola richiesta"""
+    async def body(engine, server, store):
+        await engine.run_once()
+        await engine.run_once()
+        server.requests.clear()
+        report = await engine.run_once()
+        return report, dict(server.requests), engine.get_metrics()
+
+    report, requests, metrics = run_with_server(monkeypatch, body)
+
+    assert report["pushed"] == 0
+    assert requests == {"PROPFIND": 1}
+    assert metrics["remote_checks_skipped"] >= 1
+
+
+def test_cancelled_booking_is_deleted_remotely(monkeypatch):
+    """Prenotazione annullata: DELETE condizionato e stato remoto rimosso"""
+    async def body(engine, server, store):
+        await engine.run_once()
+        document = next(iter(store.documents["bookings"].values()))
+        touch(store, document, status="cancelled")
+        report = await engine.run_once()
+        return report, server, store, event_uid("bookings", document["_id"])
+
+    report, server, store, uid = run_with_server(monkeypatch, body)
+
+    assert report["deleted"] == 1
+    assert server.path(uid) not in server.events
+    assert uid not in store.items
+    assert len(server.events) == 4
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    """Un 503 si riprova con backoff; il watermark non salta le modifiche non inviate"""
+    async def body(engine, server, store):
+        server.fail_writes = [503, 503]
+        first = await engine.run_once()
+        engine.max_retries = 0
+        document = next(iter(store.documents["bookings"].values()))
+        touch(store, document, purpose="Nuovo scopo")
+        server.fail_writes = [503]
+        second = await engine.run_once()
+        third = await engine.run_once()
+        return first, second, third, engine.get_metrics()
+
+    first, second, third, metrics = run_with_server(monkeypatch, body)
+
+    assert first["pushed"] == 5 and first["failed"] == 0
+    assert metrics["retries"] == 2
+    assert second["failed"] == 1
+    assert third["pushed"] == 1 and third["failed"] == 0
+
+
+def test_rejected_event_does_not_pin_the_watermark(monkeypatch):
+    """Un 400 permanente non ferma il watermark: l'evento resta da rinviare con l'errore"""
+    async def body(engine, server, store):
+        engine.max_retries = 0
+        server.fail_writes = [400]
+        first = await engine.run_once()
+        rejected = [item for item in store.items.values() if item.get("hash") is None]
+        # Più modifiche nuove di un lotto dietro all'evento rifiutato
+        rng = random.Random(2)
+        for number in range(3):
+            store.add("bookings", make_booking(START + timedelta(days=20 + number), f"Nuova {number}",
+                                               datetime.utcnow() - timedelta(seconds=10 - number), rng))
+        second = await engine.run_once()
+        return first, rejected, second, store
+
+    first, rejected, second, store = run_with_server(monkeypatch, body)
+
+    assert first["rejected"] == 1 and first["pushed"] == 4 and first["failed"] == 0
+    assert len(rejected) == 1 and rejected[0]["last_error"].startswith("CalDAV 400")
+    # Secondo passaggio: le nuove prenotazioni partono e il rifiutato si riprova
+    assert second["pushed"] == 4 and second["rejected"] == 0
+    assert all(item["hash"] and item["last_error"] is None for item in store.items.values())
+
+
+def test_remote_edits_and_deletions_are_repaired(monkeypatch):
+    """Eventi modificati o eliminati da altri sul server: il database resta la fonte e si rinviano"""
+    async def body(engine, server, store):
+        await engine.run_once()
+        uids = [event_uid("bookings", key) for key in list(store.documents["bookings"])[:2]]
+        original = server.events[server.path(uids[0])][1]
+        server.edit_remotely(server.path(uids[0]))
+        server.delete_remotely(server.path(uids[1]))
+        report = await engine.run_once()
+        return report, server, uids, original
+
+    report, server, uids, original = run_with_server(monkeypatch, body)
+
+    assert report["repaired"] == 2
+    assert report["pushed"] == 2
+    assert server.events[server.path(uids[0])][1] == original
+    assert server.path(uids[1]) in server.events
+
+
+def test_invalid_sync_token_falls_back_to_etag_listing(monkeypatch):
+    """Token scaduto o server senza sync-collection: confronto completo degli ETag"""
+    async def body(engine, server, store):
+        await engine.run_once()
+        uid = event_uid("bookings", next(iter(store.documents["bookings"])))
+        server.delete_remotely(server.path(uid))
+        server.oldest_token = server.sequence
+        report = await engine.run_once()
+        return report, server, uid
+
+    report, server, uid = run_with_server(monkeypatch, body)
+
+    assert report["repaired"] == 1
+    assert server.path(uid) in server.events
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from icalendar import Calendar
+
+from app.repositories import bookings_repository, booking_series_repository, spaces_repository
+from app.services.calendar_feeds import CalendarFeedService, feed_event, feed_token, valid_feed_token
+from app.services.recurrence import normalize_rule
+
+
+START = datetime(2031, 10, 7, 9, 0)
+SPACE_ID = str(ObjectId())
+SNAPSHOT = {"name": "Aula Magna", "location": "Piano terra"}
+
+
+def make_series():
+    return {
+        "_id": ObjectId(), "user_id": "u1", "space_id": SPACE_ID, "space_snapshot": SNAPSHOT,
+        "rrule": normalize_rule("FREQ=WEEKLY;UNTIL=20311231"), "start_datetime": START,
+        "end_datetime": START + timedelta(hours=2), "exdates": [START + timedelta(weeks=1)],
+        "purpose": "Laboratorio di basi di dati con esercitazioni guidate e progetto finale",
+        "status": "confirmed", "notes": "Portare il portatile", "updated_at": START - timedelta(days=30)
+    }
+
+
+def test_series_becomes_one_vevent_in_campus_time_with_rrule_and_exdate():
+    """Una serie è una sola voce con RRULE ed EXDATE nell'ora del campus; nei feed pubblici niente note e scopo abbreviato"""
+    public = feed_event(make_series(), SNAPSHOT, private=False)
+    text = public.to_ical().decode()
+
+    assert "RRULE:FREQ=WEEKLY;UNTIL=20311231T235959Z" in text
+    assert "EXDATE;TZID=Europe/Rome:20311014T110000" in text
+    assert "DTSTART;TZID=Europe/Rome:20311007T110000" in text
+    assert "LOCATION:Aula Magna - Piano terra" in text
+    assert str(public["summary"]).endswith("...")
+    assert "DESCRIPTION" not in text
+
+    private = feed_event(make_series(), SNAPSHOT, private=True)
+    assert str(private["description"]) == "Portare il portatile"
+    assert not str(private["summary"]).endswith("...")
+
+
+def test_feed_token_is_bound_to_kind_and_key():
+    """Il token dell'URL vale solo per il feed per cui è stato emesso"""
+    token = feed_token("space", SPACE_ID)
+    assert valid_feed_token("space", SPACE_ID, token)
+    assert not valid_feed_token("user", SPACE_ID, token)
+    assert not valid_feed_token("space", SPACE_ID, None)
+
+
+def test_feed_is_cached_revalidated_and_rebuilt_only_when_its_data_changes(monkeypatch):
+    """Ogni richiesta verifica la versione nel database; il feed si ricostruisce solo se i suoi dati cambiano"""
+    service = CalendarFeedService()
+    calls = {"version": 0, "build": 0}
+    marks = {"bookings": (START, ObjectId())}
+    series = make_series()
+
+    async def get_space(space_id, projection=None):
+        calls["version"] += 1
+        return {"_id": ObjectId(space_id), **SNAPSHOT} if space_id == SPACE_ID else None
+
+    async def bookings_latest(filter_query):
+        return marks["bookings"]
+
+    async def series_latest(filter_query):
+        return (series["updated_at"], series["_id"])
+
+    async def list_bookings(start, end, space_id=None, user_id=None):
+        calls["build"] += 1
+        return []
+
+    async def list_series(start, end, space_id=None, projection=None, user_id=None):
+        return [series]
+
+    monkeypatch.setattr(spaces_repository, "get_by_id", get_space)
+    monkeypatch.setattr(bookings_repository, "latest_change", bookings_latest)
+    monkeypatch.setattr(booking_series_repository, "latest_change", series_latest)
+    monkeypatch.setattr(bookings_repository, "list_calendar_between", list_bookings)
+    monkeypatch.setattr(booking_series_repository, "list_overlapping", list_series)
+
+    first = asyncio.run(service.get_feed("space", SPACE_ID))
+    calendar = Calendar.from_ical(first["body"])
+    assert str(calendar["x-wr-calname"]) == "ClassRent - Aula Magna"
+    assert len(calendar.walk("VEVENT")) == 1
+
+    revalidated = asyncio.run(service.get_feed("space", SPACE_ID))
+    assert revalidated["etag"] == first["etag"]
+    assert calls == {"version": 2, "build": 1}
+
+    # Scrittura di un'altra istanza: nessun contatore locale cambia, la versione sì
+    marks["bookings"] = (START + timedelta(minutes=1), ObjectId())
+    rebuilt = asyncio.run(service.get_feed("space", SPACE_ID))
+    assert rebuilt["etag"] != first["etag"]
+    assert calls == {"version": 3, "build": 2}
+    assert service.get_metrics()["revalidated"] == 1
+
+    assert asyncio.run(service.get_feed("space", str(ObjectId()))) is None
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services.calendar_live import CalendarLiveHub, compact_delta
+
+
+MONTH_START = datetime(2025, 10, 1)
+MONTH_END = datetime(2025, 11, 1)
+
+
+def make_change(space_id, start, token, operation="insert", status="confirmed"):
+    return {
+        "_id": {"_data": token},
+        "operationType": operation,
+        "ns": {"db": "classrent", "coll": "bookings"},
+        "documentKey": {"_id": ObjectId()},
+        "fullDocument": {
+            "space_id": space_id,
+            "user_id": "utente",
+            "purpose": "Lezione",
+            "start_datetime": start,
+            "end_datetime": start + timedelta(hours=2),
+            "status": status
+        }
+    }
+
+
+def test_compact_delta_omits_personal_fields():
+    """Il delta contiene solo spazio, orari e stato; gli annullamenti diventano 'cancel'"""
+    delta = compact_delta(make_change("s1", datetime(2025, 10, 3, 9), "t1", "update", "cancelled"))
+    assert delta["op"] == "cancel"
+    assert delta["space_id"] == "s1"
+    assert "user_id" not in delta and "purpose" not in delta
+
+    deleted = compact_delta({"operationType": "delete", "ns": {"coll": "bookings"}, "documentKey": {"_id": "x"}})
+    assert deleted == {"op": "delete", "collection": "bookings", "id": "x"}
+    assert compact_delta({"operationType": "drop", "ns": {"coll": "bookings"}}) is None
+
+
+def test_publish_fans_out_only_to_matching_subscriptions():
+    """Ogni iscrizione riceve solo i delta dei propri spazi e del proprio intervallo"""
+    async def scenario():
+        hub = CalendarLiveHub()
+        s1 = hub.subscribe({"s1"}, MONTH_START, MONTH_END)
+        s2 = hub.subscribe({"s2"}, MONTH_START, MONTH_END)
+        everything = hub.subscribe(None, MONTH_START, MONTH_END)
+
+        hub.publish(make_change("s1", datetime(2025, 10, 3, 9), "t1"))
+        hub.publish(make_change("s1", datetime(2025, 12, 3, 9), "t2"))
+
+        assert s1.queue.qsize() == 1
+        assert s2.queue.qsize() == 0
+        assert everything.queue.qsize() == 1
+        assert b"id: t1" in s1.queue.get_nowait()
+
+        hub.unsubscribe(s1)
+        assert "s1" not in hub._by_space
+        assert hub.get_metrics()["connections"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_slow_client_overflows_and_gets_resync():
+    """Una coda piena non blocca l'hub: il client lento riceve un resync"""
+    async def scenario():
+        hub = CalendarLiveHub()
+        hub.available = True
+        hub.queue_size = 2
+        stream = hub.stream({"s1"}, MONTH_START, MONTH_END)
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        for index in range(5):
+            hub.publish(make_change("s1", datetime(2025, 10, 3, 9), f"t{index}"))
+
+        first = await pending
+        assert b"id: t0" in first
+        # Gli eventi rimasti in coda si scartano: il client ricarica l'intervallo
+        assert b"event: resync" in await stream.__anext__()
+        assert hub.get_metrics()["overflows"] == 1
+
+        await stream.aclose()
+        assert hub.get_metrics()["connections"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_replay_after_last_event_id():
+    """Alla riconnessione si rinviano gli eventi persi, None se il token è scaduto"""
+    async def scenario():
+        hub = CalendarLiveHub()
+        for index in range(3):
+            hub.publish(make_change("s1", datetime(2025, 10, 3, 9), f"t{index}"))
+        subscription = hub.subscribe({"s1"}, MONTH_START, MONTH_END)
+
+        replay = hub._replay(subscription, "t0")
+        assert [b"id: t1" in payload for payload in replay] == [True, False]
+        assert len(replay) == 2
+        assert hub._replay(subscription, "sconosciuto") is None
+
+    asyncio.run(scenario())
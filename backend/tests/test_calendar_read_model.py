@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.repositories import bookings_repository, booking_series_repository, calendar_events_repository, spaces_loader
+from app.services.database_calendar_service import booking_event, database_calendar_service
+from app.services.calendar_reconciliation import mirror_drift
+
+
+START = datetime(2025, 10, 3, 9, 0)
+
+
+def make_booking(status="confirmed", updated_at=None):
+    return {
+        "_id": ObjectId(),
+        "user_id": "u1",
+        "space_id": "s1",
+        "start_datetime": START,
+        "end_datetime": START + timedelta(hours=2),
+        "purpose": "Lezione",
+        "status": status,
+        "updated_at": updated_at or START
+    }
+
+
+def test_booking_event_derives_calendar_fields_from_booking_and_space():
+    """L'evento calendario è derivato dalla prenotazione, senza copia salvata"""
+    booking = make_booking()
+    event = booking_event(booking, {"name": "Aula 1", "location": "Piano terra"})
+
+    assert event["id"] == event["booking_id"] == str(booking["_id"])
+    assert event["space_name"] == "Aula 1"
+    assert event["location"] == "Piano terra"
+    assert event["user_id"] == "u1"
+    assert event["materials_requested"] == []
+    assert booking_event(booking, None)["space_name"] == "Spazio eliminato"
+
+
+def test_mirror_drift_classifies_legacy_copies():
+    """Test riconciliazione: copie allineate, orfane o divergenti dalla prenotazione"""
+    booking = make_booking()
+    mirror = {"booking_id": str(booking["_id"]), "space_id": "s1", "status": "active",
+              "start_datetime": booking["start_datetime"], "end_datetime": booking["end_datetime"]}
+
+    assert mirror_drift(mirror, booking) is None
+    assert mirror_drift(mirror, None) == "orphan"
+    assert mirror_drift(mirror, {**booking, "status": "cancelled"}) == "status"
+    assert mirror_drift({**mirror, "space_id": "s2"}, booking) == "space"
+    assert mirror_drift({**mirror, "end_datetime": START}, booking) == "times"
+
+
+def test_changes_merge_bookings_and_system_events_in_update_order(monkeypatch):
+    """Le modifiche delle due collection sono unite per updated_at con un watermark ciascuna"""
+    first = make_booking(updated_at=datetime(2025, 10, 1, 10, 0))
+    cancelled = make_booking("cancelled", datetime(2025, 10, 1, 12, 0))
+    system = {"_id": ObjectId(), "booking_id": None, "space_id": None, "space_name": "Chiusura",
+              "location": "Sistema", "start_datetime": START, "end_datetime": START, "purpose": "Manutenzione",
+              "status": "active", "updated_at": datetime(2025, 10, 1, 11, 0)}
+    system_key = (system["updated_at"], system["_id"])
+
+    async def bookings_changes(filter_query, limit, projection=None):
+        return [first, cancelled], True
+
+    async def events_changes(filter_query, limit, projection=None):
+        return [system], False
+
+    async def series_changes(filter_query, limit, projection=None):
+        return [], False
+
+    async def load_spaces(keys):
+        return [{"name": "Aula 1", "location": "Piano terra"} for _ in keys]
+
+    monkeypatch.setattr(bookings_repository, "list_changes", bookings_changes)
+    monkeypatch.setattr(booking_series_repository, "list_changes", series_changes)
+    monkeypatch.setattr(calendar_events_repository, "list_changes", events_changes)
+    monkeypatch.setattr(spaces_loader, "load_many", load_spaces)
+
+    changes, marks, has_more = asyncio.run(
+        database_calendar_service.get_changes({}, datetime(2025, 10, 2), None, None, None, 2)
+    )
+
+    assert [change["id"] for change in changes] == [str(first["_id"]), str(system_key[1])]
+    assert marks == {
+        "bookings": (first["updated_at"], first["_id"]),
+        "calendar_events": system_key
+    }
+    assert has_more
+
+
+def test_changed_series_yields_its_occurrences_with_skipped_ones_cancelled(monkeypatch):
+    """Una serie modificata produce le occorrenze nel filtro: le date escluse risultano annullate"""
+    series = {
+        "_id": ObjectId(), "user_id": "u1", "space_id": "s1", "rrule": "FREQ=WEEKLY;COUNT=4",
+        "start_datetime": START, "end_datetime": START + timedelta(hours=2),
+        "exdates": [START + timedelta(weeks=1)], "window_start": START,
+        "window_end": START + timedelta(weeks=3, hours=2), "purpose": "Laboratorio",
+        "status": "confirmed", "space_snapshot": {"name": "Lab", "location": "Piano 1"},
+        "updated_at": datetime(2025, 10, 1, 10, 0)
+    }
+
+    async def no_changes(filter_query, limit, projection=None):
+        return [], False
+
+    async def series_changes(filter_query, limit, projection=None):
+        return [series], False
+
+    monkeypatch.setattr(bookings_repository, "list_changes", no_changes)
+    monkeypatch.setattr(calendar_events_repository, "list_changes", no_changes)
+    monkeypatch.setattr(booking_series_repository, "list_changes", series_changes)
+
+    changes, marks, _ = asyncio.run(database_calendar_service.get_changes(
+        {}, datetime(2025, 10, 2), START + timedelta(days=1), START + timedelta(weeks=4), None, 10
+    ))
+
+    # La prima occorrenza è fuori dal filtro
+    assert [change["start_datetime"] for change in changes] == [START + timedelta(weeks=week) for week in (1, 2, 3)]
+    assert [change["status"] for change in changes] == ["cancelled", "confirmed", "confirmed"]
+    assert all(change["series_id"] == str(series["_id"]) and change["booking_id"] is None for change in changes)
+    assert changes[0]["id"] == f"{series['_id']}:20251010T090000"
+    assert changes[0]["space_name"] == "Lab"
+    assert marks == {"booking_series": (series["updated_at"], series["_id"])}
+
+
+def test_booking_moved_out_of_the_window_is_returned_as_removed(monkeypatch):
+    """Con un token si leggono le modifiche di tutti i documenti: uno spostato in un altro mese torna annullato"""
+    window_start, window_end = datetime(2025, 10, 1), datetime(2025, 11, 1)
+    moved = {**make_booking(updated_at=datetime(2025, 10, 1, 12, 0)),
+             "start_datetime": datetime(2025, 11, 14, 9, 0), "end_datetime": datetime(2025, 11, 14, 11, 0)}
+    other_space = make_booking(updated_at=datetime(2025, 10, 1, 13, 0))
+    other_space["space_id"] = "s2"
+    kept = make_booking(updated_at=datetime(2025, 10, 1, 14, 0))
+    series = {
+        "_id": ObjectId(), "user_id": "u1", "space_id": "s1", "rrule": "FREQ=WEEKLY;COUNT=2",
+        "start_datetime": datetime(2025, 12, 1, 9, 0), "end_datetime": datetime(2025, 12, 1, 11, 0),
+        "exdates": [], "window_start": datetime(2025, 12, 1, 9, 0), "window_end": datetime(2025, 12, 8, 11, 0),
+        "purpose": "Laboratorio", "status": "confirmed", "space_snapshot": {"name": "Lab", "location": "Piano 1"},
+        "updated_at": datetime(2025, 10, 1, 15, 0)
+    }
+    filters = {}
+
+    def changes_of(name, documents):
+        async def list_changes(filter_query, limit, projection=None):
+            filters[name] = filter_query
+            return documents, False
+        return list_changes
+
+    async def load_spaces(keys):
+        return [{"name": "Aula 1", "location": "Piano terra"} for _ in keys]
+
+    monkeypatch.setattr(bookings_repository, "list_changes", changes_of("bookings", [moved, other_space, kept]))
+    monkeypatch.setattr(booking_series_repository, "list_changes", changes_of("booking_series", [series]))
+    monkeypatch.setattr(calendar_events_repository, "list_changes", changes_of("calendar_events", []))
+    monkeypatch.setattr(spaces_loader, "load_many", load_spaces)
+
+    since = {"bookings": (datetime(2025, 10, 1), ObjectId()), "booking_series": (datetime(2025, 10, 1), ObjectId())}
+    changes, marks, _ = asyncio.run(database_calendar_service.get_changes(
+        since, datetime(2025, 10, 2), window_start, window_end, "s1", 10
+    ))
+
+    # Il filtro del pull delta non limita intervallo e spazio
+    assert "start_datetime" not in str(filters["bookings"]) and "space_id" not in str(filters["bookings"])
+    assert [(change["id"], change["status"]) for change in changes] == [
+        (str(moved["_id"]), "cancelled"),
+        (str(other_space["_id"]), "cancelled"),
+        (str(kept["_id"]), "confirmed"),
+        (str(series["_id"]), "cancelled")
+    ]
+    assert changes[-1]["series_id"] == str(series["_id"])
+    assert marks["bookings"] == (kept["updated_at"], kept["_id"])
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+from app.repositories import bookings_repository, booking_series_repository, spaces_repository
+from app.services.chat_intent_router import chat_intent_router
+from app.services.openai_agent_service import ai_agent_service
+
+# Lunedì 3 giugno 2024, ore 10
+NOW = datetime(2024, 6, 3, 10, 0)
+
+def test_my_bookings_intent():
+    """Test riconoscimento richiesta prenotazioni utente"""
+    parsed = chat_intent_router.parse("Mostrami le mie prenotazioni", now=NOW)
+    assert parsed == {"intent": "my_bookings", "slots": {"status": "all"}}
+
+    parsed = chat_intent_router.parse("quali sono le mie prossime prenotazioni?", now=NOW)
+    assert parsed["slots"]["status"] == "upcoming"
+
+def test_search_spaces_with_slots():
+    """Test estrazione slot da ricerca spazi"""
+    parsed = chat_intent_router.parse("aule libere domani alle 14 per 30 persone", now=NOW)
+    assert parsed["intent"] == "search_spaces"
+    assert parsed["slots"] == {
+        "space_type": "aula",
+        "capacity": 30,
+        "date": "2024-06-04",
+        "start_time": "14:00"
+    }
+
+def test_search_spaces_interval_and_materials():
+    """Test intervallo orario, giorno della settimana e materiali"""
+    parsed = chat_intent_router.parse(
+        "C'è un laboratorio libero venerdì dalle 9:30 alle 11 con proiettore?", now=NOW
+    )
+    assert parsed["intent"] == "search_spaces"
+    slots = parsed["slots"]
+    assert slots["space_type"] == "laboratorio"
+    assert slots["date"] == "2024-06-07"
+    assert slots["start_time"] == "09:30"
+    assert slots["duration_hours"] == 1.5
+    assert slots["materials"] == ["Proiettore"]
+
+def test_checklist_intent():
+    """Test riconoscimento checklist"""
+    parsed = chat_intent_router.parse("Cosa serve per la laurea?", now=NOW)
+    assert parsed == {"intent": "checklist", "slots": {"activity_type": "laurea", "space_type": None}}
+
+def test_ambiguous_messages_go_to_ai():
+    """Test messaggi di scrittura o ambigui delegati all'AI"""
+    assert chat_intent_router.parse("Prenota l'aula magna domani alle 10", now=NOW) is None
+    assert chat_intent_router.parse("Cancella le mie prenotazioni", now=NOW) is None
+    assert chat_intent_router.parse("Ciao, come stai?", now=NOW) is None
+
+def test_search_filters_availability_before_limit(monkeypatch):
+    """Con i primi spazi occupati si restituiscono quelli liberi oltre i primi 5, con una query per tipo"""
+    spaces = [{"_id": ObjectId(), "name": f"Aula {n}", "type": "aula", "capacity": 40, "location": "Polo"}
+              for n in range(8)]
+    busy_ids = {str(space["_id"]) for space in spaces[:6]}
+    calls = {"bookings": 0, "series": 0}
+
+    async def list_active(*args, **kwargs):
+        return spaces
+
+    async def busy_space_ids(space_ids, start, end):
+        calls["bookings"] += 1
+        return busy_ids & set(space_ids)
+
+    async def list_overlapping(start, end, space_id=None, projection=None, user_id=None, space_ids=None):
+        calls["series"] += 1
+        return []
+
+    monkeypatch.setattr(spaces_repository, "list_active", list_active)
+    monkeypatch.setattr(bookings_repository, "busy_space_ids", busy_space_ids)
+    monkeypatch.setattr(booking_series_repository, "list_overlapping", list_overlapping)
+
+    result = asyncio.run(ai_agent_service._search_available_spaces(
+        {"space_type": "aula", "date": "2024-06-04", "start_time": "14:00"}
+    ))
+
+    assert [space["name"] for space in result["spaces"]] == ["Aula 6", "Aula 7"]
+    assert calls == {"bookings": 1, "series": 1}
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from app.services.chat_response_cache import ChatResponseCache, CATALOG_TAG, chat_response_cache
+from app.services.openai_agent_service import ai_agent_service
+
+def _cache():
+    cache = ChatResponseCache()
+    # Nessun controllo del catalogo su database durante i test
+    cache.catalog_check_interval = float("inf")
+    cache._catalog_checked_at = float("inf")
+    return cache
+
+def test_paraphrase_hit_and_metrics():
+    """Test hit su parafrasi e metriche di risparmio"""
+    cache = _cache()
+    response = {"response": "Checklist laurea", "action": "todo_list", "data": {"checklist": ["A"]}, "thread_id": "t1"}
+    cache.set("Cosa serve per la laurea?", "student", response, compute_seconds=2.5)
+
+    hit = asyncio.run(cache.get("cosa mi serve per la laurea", "student"))
+    assert hit["response"] == "Checklist laurea"
+    assert hit["data"]["cached"] is True
+    assert "thread_id" not in hit
+
+    # La copia restituita non modifica la voce in cache
+    hit["data"]["checklist"].append("B")
+    again = asyncio.run(cache.get("Cosa serve per la laurea?", "student"))
+    assert again["data"]["checklist"] == ["A"]
+
+    metrics = cache.get_metrics()
+    assert metrics["hits"] == 2
+    assert metrics["saved_latency_seconds"] == 5.0
+
+def test_role_and_numbers_are_part_of_the_key():
+    """Test che ruolo e numeri distinguano le voci"""
+    cache = _cache()
+    cache.set("aule per 30 persone", "student", {"response": "30", "data": {}}, compute_seconds=1)
+
+    assert asyncio.run(cache.get("aule per 30 persone", "professor")) is None
+    assert asyncio.run(cache.get("aule per 300 persone", "student")) is None
+    assert cache.get_metrics()["misses"] == 2
+
+def test_catalog_invalidation():
+    """Test invalidazione delle voci legate al catalogo"""
+    cache = _cache()
+    cache.set("che aule ci sono?", "student", {"response": "aule", "data": {}}, 1, {CATALOG_TAG})
+    cache.set("cosa serve per la tesi?", "student", {"response": "tesi", "data": {}}, 1)
+
+    cache.invalidate(CATALOG_TAG)
+
+    assert asyncio.run(cache.get("che aule ci sono?", "student")) is None
+    assert asyncio.run(cache.get("cosa serve per la tesi?", "student")) is not None
+
+def test_write_requests_skip_the_cache(monkeypatch):
+    """Una prenotazione scritta come una ricerca in cache arriva sempre all'assistente"""
+    lookups, stored = [], []
+
+    async def get(message, user_role):
+        lookups.append(message)
+        return {"response": "ricerca in cache", "data": {}}
+
+    async def process(message, user_id, context=None):
+        return {"response": "prenotazione creata", "data": {}, "_cache_tags": {CATALOG_TAG}}
+
+    monkeypatch.setattr(chat_response_cache, "get", get)
+    monkeypatch.setattr(chat_response_cache, "set", lambda *args: stored.append(args))
+    monkeypatch.setattr(ai_agent_service, "_process_message", process)
+
+    response = asyncio.run(ai_agent_service.process_user_message(
+        "Prenota laboratori con proiettore e microfono disponibili", "u1"
+    ))
+
+    assert response["response"] == "prenotazione creata"
+    assert lookups == [] and stored == []
+
+    asyncio.run(ai_agent_service.process_user_message("laboratori con proiettore e microfono", "u1"))
+    assert lookups == ["laboratori con proiettore e microfono"]
+
+def _assistant_run(monkeypatch, arguments):
+    """Run dell'assistente con una sola chiamata a search_available_spaces (client finto)"""
+    tool_call = SimpleNamespace(id="c1", function=SimpleNamespace(
+        name="search_available_spaces", arguments=json.dumps(arguments)
+    ))
+    runs = iter([
+        SimpleNamespace(id="r1", status="requires_action", usage=None, required_action=SimpleNamespace(
+            submit_tool_outputs=SimpleNamespace(tool_calls=[tool_call])
+        )),
+        SimpleNamespace(id="r1", status="completed", usage=None)
+    ])
+
+    async def returns(value):
+        return value
+
+    message = SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value="Ecco gli spazi"))])
+    threads = SimpleNamespace(
+        create=lambda: returns(SimpleNamespace(id="t1")),
+        messages=SimpleNamespace(
+            create=lambda **kwargs: returns(None),
+            list=lambda **kwargs: returns(SimpleNamespace(data=[message]))
+        ),
+        runs=SimpleNamespace(
+            create=lambda **kwargs: returns(SimpleNamespace(id="r1", status="queued")),
+            retrieve=lambda **kwargs: returns(next(runs)),
+            submit_tool_outputs=lambda **kwargs: returns(next(runs))
+        )
+    )
+
+    async def search(criteria):
+        return {"spaces": [], "count": 0, "criteria": criteria}
+
+    async def not_superseded(seconds):
+        return False
+
+    monkeypatch.setattr(ai_agent_service, "client", SimpleNamespace(beta=SimpleNamespace(threads=threads)))
+    monkeypatch.setattr(ai_agent_service, "assistant_id", "a1")
+    monkeypatch.setattr(ai_agent_service, "_search_available_spaces", search)
+    lease = SimpleNamespace(wait_superseded=not_superseded, tokens_used=0)
+    return asyncio.run(ai_agent_service._run_assistant("aule libere", "u1", {}, lease))
+
+def test_assistant_searches_with_date_or_time_are_not_cached(monkeypatch):
+    """Le ricerche con data o ora dipendono dalle prenotazioni: solo quelle sul catalogo vanno in cache"""
+    assert _assistant_run(monkeypatch, {"space_type": "aula"})["_cache_tags"] == {CATALOG_TAG}
+    assert "_cache_tags" not in _assistant_run(monkeypatch, {"space_type": "aula", "date": "2024-06-04"})
+    assert "_cache_tags" not in _assistant_run(monkeypatch, {"start_time": "14:00"})
@@ -0,0 +1,56 @@
+from starlette.requests import Request
+from fastapi import Response
+import asyncio
+from app.repositories import bookings_repository, spaces_repository
+from app.services.etag_service import ETagService
+
+def make_request(path="/spaces/", query="", if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": headers})
+
+def fake_watermarks(monkeypatch):
+    """Watermark in memoria, modificabili come farebbe una scrittura di un altro processo"""
+    marks = {"spaces": "t1:a:3", "bookings": "t1:b:10"}
+    for repository in (spaces_repository, bookings_repository):
+        async def watermark(name=repository.collection_name):
+            return marks[name]
+        monkeypatch.setattr(repository, "watermark", watermark)
+    return marks
+
+def test_not_modified_until_collection_is_written(monkeypatch):
+    """Test 304 con ETag valido e nuova risposta dopo una scrittura, anche di un'altra istanza"""
+    marks = fake_watermarks(monkeypatch)
+    service = ETagService()
+    response = Response()
+    assert asyncio.run(service.check(make_request(), response, ["spaces"], "authenticated")) is None
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    not_modified = asyncio.run(service.check(make_request(if_none_match=etag), Response(), ["spaces"], "authenticated"))
+    assert not_modified.status_code == 304
+
+    # Nessun contatore di questo processo è cambiato: la scrittura si vede dal database
+    marks["spaces"] = "t2:a:3"
+    assert asyncio.run(service.check(make_request(if_none_match=etag), Response(), ["spaces"], "authenticated")) is None
+
+def test_etag_depends_on_query_and_scope(monkeypatch):
+    """Test ETag distinti per parametri e per utente, indipendenti dall'ordine dei parametri"""
+    fake_watermarks(monkeypatch)
+    service = ETagService()
+
+    def etag(query, scope):
+        return asyncio.run(service.make_etag(make_request(query=query), ["bookings"], scope))
+
+    base = etag("a=1&b=2", "user:1")
+    assert base == etag("b=2&a=1", "user:1")
+    assert base != etag("a=1&b=3", "user:1")
+    assert base != etag("a=1&b=2", "user:2")
+
+def test_weak_comparison_of_if_none_match_lists():
+    """Test confronto debole con liste di ETag e con *"""
+    service = ETagService()
+
+    assert service.matches('"x", W/"abc"', 'W/"abc"')
+    assert service.matches('"abc"', 'W/"abc"')
+    assert service.matches("*", 'W/"abc"')
+    assert not service.matches(None, 'W/"abc"')
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+from app.services import export_service as export_module
+from app.services.export_service import (
+    ExportService, format_csv, occupancy_row, parse_occupancy_cursor, BOOKING_COLUMNS
+)
+
+def test_csv_block_formats_lists_dates_and_quotes():
+    """Test riga CSV: liste con ';', datetime ISO, virgolette dove servono"""
+    row = {
+        "id": "b1", "start_datetime": datetime(2025, 9, 1, 8, 30), "purpose": "Lezione, gruppo A",
+        "materials_requested": ["PC", "Proiettore"], "notes": None
+    }
+
+    block = format_csv([row], BOOKING_COLUMNS, header=True).decode().splitlines()
+
+    assert block[0].startswith("id,start_datetime,end_datetime")
+    assert block[1].startswith("b1,2025-09-01T08:30:00,,")
+    assert '"Lezione, gruppo A"' in block[1]
+    assert "PC;Proiettore" in block[1]
+
+def test_occupancy_row_and_resume_cursor():
+    """Test percentuale di occupazione sulle ore disponibili e cursore di ripresa"""
+    group = {"_id": {"space_id": "s1", "day": "2025-09-01"}, "bookings": 3, "booked_minutes": 180.0}
+    space = {"name": "Aula 101", "available_hours": {"start_time": "08:00", "end_time": "20:00"}}
+
+    row = occupancy_row(group, space)
+
+    assert row["occupancy_pct"] == 25.0
+    assert parse_occupancy_cursor(row["resume_cursor"]) == ("s1", "2025-09-01")
+
+def test_encode_streams_one_chunk_per_batch():
+    """Test streaming: intestazione e poi un blocco per batch, senza accumulare"""
+    async def batches():
+        yield [{"id": "b1"}]
+        yield [{"id": "b2"}, {"id": "b3"}]
+
+    async def scenario():
+        return [chunk async for chunk in ExportService().encode(batches(), ["id"], "csv")]
+
+    assert asyncio.run(scenario()) == [b"id\r\n", b"b1\r\n", b"b2\r\nb3\r\n"]
+
+def test_occupancy_includes_series_occurrences(monkeypatch):
+    """Test occupazione: le occorrenze delle serie si sommano alle prenotazioni dello stesso giorno"""
+    series = {
+        "space_id": "lab", "rrule": "FREQ=WEEKLY;COUNT=4", "timezone": "UTC",
+        "start_datetime": datetime(2025, 9, 1, 9), "end_datetime": datetime(2025, 9, 1, 11), "exdates": []
+    }
+
+    async def list_overlapping(start, end, space_id=None, projection=None):
+        return [series]
+
+    class Cursor:
+        def __init__(self, groups):
+            self.groups = groups
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            for group in self.groups:
+                yield group
+
+    async def occupancy_cursor(start, end, space_id, after, batch_size):
+        return Cursor([{"_id": {"space_id": "lab", "day": "2025-09-08"}, "bookings": 1, "booked_minutes": 60.0}])
+
+    async def get_many(ids, projection):
+        return {"lab": {"name": "Lab", "available_hours": {"start_time": "08:00", "end_time": "18:00"}}}
+
+    monkeypatch.setattr(export_module.booking_series_repository, "list_overlapping", list_overlapping)
+    monkeypatch.setattr(export_module.bookings_repository, "occupancy_cursor", occupancy_cursor)
+    monkeypatch.setattr(export_module.spaces_repository, "get_many", get_many)
+
+    async def scenario():
+        batches = ExportService().occupancy_batches(datetime(2025, 9, 1), datetime(2025, 9, 16), after=("lab", "2025-09-01"))
+        return [row for rows in [batch async for batch in batches] for row in rows]
+
+    rows = asyncio.run(scenario())
+
+    assert [(row["date"], row["bookings"], row["booked_minutes"]) for row in rows] == [
+        ("2025-09-08", 2, 180), ("2025-09-15", 1, 120)
+    ]
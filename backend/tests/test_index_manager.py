@@ -0,0 +1,75 @@
+import asyncio
+from app.services.index_manager import plan_stages, INDEX_REGISTRY, known_query_shapes, IndexManager
+
+def test_collect_stages_ignores_rejected_plans():
+    """Test raccolta degli stage del solo winning plan"""
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "bookings_user_start"}},
+            "rejectedPlans": [{"stage": "COLLSCAN"}]
+        }
+    }
+
+    stages = plan_stages(explain)
+
+    assert stages == {"FETCH", "IXSCAN"}
+
+def test_collect_stages_inside_aggregate_cursor():
+    """Test stage annidati nel $cursor di una pipeline"""
+    explain = {
+        "stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}},
+            {"$group": {"_id": "$type"}}
+        ]
+    }
+
+    assert "COLLSCAN" in plan_stages(explain)
+
+def test_every_known_query_has_indexed_collection():
+    """Test che ogni query nota abbia almeno un indice sulla sua collection"""
+    indexed = {spec["collection"] for spec in INDEX_REGISTRY}
+    names = [spec["name"] for spec in INDEX_REGISTRY]
+
+    assert len(names) == len(set(names))
+    for shape in known_query_shapes():
+        assert shape["collection"] in indexed, shape["name"]
+
+class FakeCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.created = []
+        self.dropped = []
+
+    async def index_information(self):
+        return self.indexes
+
+    async def create_indexes(self, models):
+        self.created += [model.document["name"] for model in models]
+
+    async def drop_index(self, name):
+        self.dropped.append(name)
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        return FakeCollection({})
+
+
+def test_index_with_different_options_is_reported_or_rebuilt():
+    """Un indice con le stesse chiavi ma senza unique non conta come presente"""
+    users = FakeCollection({"email_1": {"key": [("email", 1)]}})
+    db = FakeDatabase(users=users)
+
+    summary = asyncio.run(IndexManager().ensure_indexes(db))
+    assert "users_email_unique" in summary["mismatched"]
+    assert "users_email_unique" not in summary["existing"]
+    assert users.created == [] and users.dropped == []
+
+    summary = asyncio.run(IndexManager().ensure_indexes(db, rebuild=True))
+    assert "users_email_unique" in summary["rebuilt"]
+    assert users.dropped == ["email_1"]
+    assert users.created == ["users_email_unique"]
+
+    users.indexes = {"users_email_unique": {"key": [("email", 1)], "unique": True}}
+    summary = asyncio.run(IndexManager().ensure_indexes(db))
+    assert "users_email_unique" in summary["existing"]
@@ -0,0 +1,51 @@
+import asyncio
+from app.repositories.loaders import BatchLoader, loader_scope
+
+def make_loader(calls):
+    async def fetch_many(ids):
+        calls.append(list(ids))
+        return {space_id: {"_id": space_id, "name": f"Aula {space_id}"} for space_id in ids if space_id != "missing"}
+    return BatchLoader("test_spaces", fetch_many)
+
+def test_loads_in_same_tick_share_one_query():
+    """Test raggruppamento degli ID richiesti nello stesso giro dell'event loop"""
+    calls = []
+    loader = make_loader(calls)
+
+    async def scenario():
+        with loader_scope():
+            spaces = await asyncio.gather(loader.load("1"), loader.load("2"), loader.load("1"), loader.load("missing"))
+            again = await loader.load("2")
+            return spaces, again
+
+    spaces, again = asyncio.run(scenario())
+
+    assert [s["name"] if s else None for s in spaces] == ["Aula 1", "Aula 2", "Aula 1", None]
+    assert again["name"] == "Aula 2"
+    assert calls == [["1", "2", "missing"]]
+
+def test_prefetch_serves_sequential_loop():
+    """Test ciclo sequenziale servito da un'unica query dopo il prefetch"""
+    calls = []
+    loader = make_loader(calls)
+
+    async def scenario():
+        with loader_scope():
+            loader.prefetch(["1", "2", "3"])
+            return [(await loader.load(space_id))["name"] for space_id in ["1", "2", "3"]]
+
+    assert asyncio.run(scenario()) == ["Aula 1", "Aula 2", "Aula 3"]
+    assert calls == [["1", "2", "3"]]
+
+def test_outside_scope_queries_directly():
+    """Test fuori da una richiesta: nessuna memoizzazione"""
+    calls = []
+    loader = make_loader(calls)
+
+    async def scenario():
+        await loader.load("1")
+        await loader.load("1")
+
+    asyncio.run(scenario())
+
+    assert calls == [["1"], ["1"]]
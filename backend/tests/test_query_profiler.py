@@ -0,0 +1,178 @@
+import asyncio
+import pytest
+from pymongo import UpdateOne, DeleteOne
+from app.services.query_profiler import (
+    ProfiledCollection, NPlusOneQueryError, operation_query, query_profiler, query_shape
+)
+from app.services.slow_query_log import SlowQueryLog, slow_query_log
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs
+
+    async def __anext__(self):
+        if not self.docs:
+            raise StopAsyncIteration
+        return self.docs.pop(0)
+
+class FakeCollection:
+    name = "spaces"
+
+    async def find_one(self, query):
+        return {"_id": query.get("_id")}
+
+    def find(self, query=None):
+        return FakeCursor([{"_id": 1}, {"_id": 2}])
+
+def test_query_shape_ignores_values():
+    """Test forma della query indipendente dai valori"""
+    first = query_shape("find_one", "spaces", {"_id": "a", "status": {"$in": ["x", "y"]}})
+    second = query_shape("find_one", "spaces", {"_id": "b", "status": {"$in": ["z"]}})
+
+    assert first == second
+
+def test_profile_counts_operations_and_cursors():
+    """Test conteggio di find_one e find nel profilo della richiesta"""
+    async def run():
+        collection = ProfiledCollection(FakeCollection())
+        with query_profiler.profile("test") as profile:
+            await collection.find_one({"_id": 1})
+            docs = await collection.find({"is_active": True}).sort("name", 1).to_list(None)
+        return profile, docs
+
+    profile, docs = asyncio.run(run())
+
+    assert profile.count == 2
+    assert len(docs) == 2
+    assert not profile.n_plus_one
+
+def test_repeated_shape_raises_in_strict_mode(monkeypatch):
+    """Test rilevamento N+1 in modalità strict"""
+    monkeypatch.setattr(query_profiler, "strict", True)
+    monkeypatch.setattr(query_profiler, "n_plus_one_threshold", 3)
+
+    async def run():
+        collection = ProfiledCollection(FakeCollection())
+        with query_profiler.profile("test"):
+            for i in range(5):
+                await collection.find_one({"_id": i})
+
+    with pytest.raises(NPlusOneQueryError):
+        asyncio.run(run())
+
+def test_no_profile_outside_requests():
+    """Test nessuna registrazione fuori da un profilo attivo"""
+    collection = ProfiledCollection(FakeCollection())
+
+    result = asyncio.run(collection.find_one({"_id": 1}))
+
+    assert result == {"_id": 1}
+    assert query_profiler.current() is None
+
+def test_slow_operation_reported(monkeypatch):
+    """Test segnalazione al log delle query lente oltre la soglia"""
+    reported = []
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+    monkeypatch.setattr(slow_query_log, "report", lambda *args: reported.append(args))
+
+    collection = ProfiledCollection(FakeCollection())
+    asyncio.run(collection.find({"is_active": True}).to_list(None))
+
+    operation, collection_name, query, shape, duration_ms = reported[0]
+    assert (operation, collection_name, query) == ("find", "spaces", {"is_active": True})
+    assert shape == 'spaces.find {"is_active": "?"}'
+
+def test_slow_query_rate_limited(monkeypatch):
+    """Test limite di scritture al minuto del log delle query lente"""
+    log = SlowQueryLog()
+    log.threshold_ms = 10
+    log.max_writes_per_minute = 2
+    recorded = []
+
+    async def fake_record(*args):
+        recorded.append(args)
+    monkeypatch.setattr(log, "_record", fake_record)
+
+    async def run():
+        for _ in range(5):
+            log.report("find", "materials", {}, "materials.find {}", 50)
+        log.report("find", "materials", {}, "materials.find {}", 5)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+    assert len(recorded) == 2
+    assert log.get_metrics()["rate_limited"] == 3
+
+def test_summarize_aggregate_explain():
+    """Test riepilogo explain con executionStats annidato nella pipeline"""
+    explain = {"stages": [{"$cursor": {
+        "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+        "executionStats": {"nReturned": 40, "executionTimeMillis": 12, "totalKeysExamined": 0, "totalDocsExamined": 900}
+    }}]}
+
+    summary = SlowQueryLog().summarize_explain(explain)
+
+    assert summary["stages"] == ["COLLSCAN"]
+    assert summary["docs_examined"] == 900
+
+def test_write_shapes_do_not_include_documents():
+    """Inserimenti senza forma di filtro; bulk_write descritto dai soli tipi di operazione"""
+    documents = [{"name": f"Aula {i}", "capacity": i} for i in range(1000)]
+    assert operation_query("insert_many", (documents,), {}) is None
+    assert operation_query("update_many", ({"status": "x"}, {"$set": {"a": 1}}), {}) == {"status": "x"}
+
+    requests = [UpdateOne({"_id": i}, {"$set": {"a": i}}) for i in range(100)] + [DeleteOne({"_id": 1})]
+    shape = query_shape("bulk_write", "bookings", operation_query("bulk_write", (requests,), {}))
+    assert shape == 'bookings.bulk_write {"DeleteOne": null, "UpdateOne": null}'
+
+def test_partially_read_cursor_is_recorded(monkeypatch):
+    """Un async for interrotto con break registra comunque il tempo del cursore"""
+    observed = []
+    monkeypatch.setattr(query_profiler, "observe", lambda *args: observed.append(args[1]))
+
+    async def run():
+        cursor = ProfiledCollection(FakeCollection()).find({"is_active": True})
+        async for _ in cursor:
+            break
+        del cursor
+
+    asyncio.run(run())
+
+    assert observed == ["find"]
+
+def test_distinct_explains_its_filter(monkeypatch):
+    """distinct(key, filter): al log arriva il filtro, non il nome del campo"""
+    reported = []
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+    monkeypatch.setattr(slow_query_log, "report", lambda *args: reported.append(args))
+
+    class DistinctCollection:
+        name = "bookings"
+
+        async def distinct(self, key, filter=None):
+            return ["a"]
+
+    collection = ProfiledCollection(DistinctCollection())
+    asyncio.run(collection.distinct("space_id", {"status": "confirmed"}))
+    asyncio.run(collection.distinct("space_id", filter={"user_id": "u1"}))
+
+    assert [args[2] for args in reported] == [{"status": "confirmed"}, {"user_id": "u1"}]
+
+    commands = []
+
+    class FakeDatabase:
+        async def command(self, command):
+            commands.append(command)
+            return {"queryPlanner": {"winningPlan": {"stage": "IXSCAN"}}}
+
+    summary = asyncio.run(SlowQueryLog()._explain(FakeDatabase(), "distinct", "bookings", reported[0][2]))
+
+    assert commands[0]["explain"] == {"find": "bookings", "filter": {"status": "confirmed"}}
+    assert summary["stages"] == ["IXSCAN"]
@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.repositories import bookings_repository, booking_series_repository
+from app.services.booking_series_service import booking_series_service
+from app.services.calendar_feeds import feed_event, feed_timezones
+from app.services.recurrence import normalize_rule, expand_all, occurrences, find_conflicts
+
+
+START = datetime(2025, 10, 7, 9, 0)  # Martedì
+
+
+def make_series(rule="FREQ=WEEKLY;COUNT=15", exdates=(), tz="UTC", start=START):
+    # In UTC le occorrenze sono equidistanti: il cambio d'ora si verifica a parte
+    return {
+        "rrule": normalize_rule(rule),
+        "start_datetime": start,
+        "end_datetime": start + timedelta(hours=2),
+        "exdates": list(exdates),
+        "timezone": tz,
+        "purpose": "Laboratorio"
+    }
+
+
+def test_normalize_rule_requires_an_end_and_converts_until_to_utc():
+    """Le regole senza fine o non valide sono rifiutate; UNTIL diventa UTC"""
+    assert normalize_rule("RRULE:FREQ=WEEKLY;COUNT=3") == "FREQ=WEEKLY;COUNT=3"
+    assert normalize_rule("FREQ=WEEKLY;UNTIL=20251231") == "FREQ=WEEKLY;UNTIL=20251231T235959Z"
+    assert normalize_rule("FREQ=DAILY;UNTIL=20251231T100000Z") == "FREQ=DAILY;UNTIL=20251231T100000Z"
+    for rule in ("FREQ=WEEKLY", "COUNT=3", "non una regola"):
+        with pytest.raises(ValueError):
+            normalize_rule(rule)
+
+
+def test_expand_all_skips_exdates_and_enforces_the_limit():
+    """Espansione completa alla creazione, senza le date escluse e con un tetto"""
+    series = make_series("FREQ=WEEKLY;COUNT=4")
+    slots = expand_all(series["rrule"], START, START + timedelta(hours=2), [START + timedelta(weeks=1)], 10, "UTC")
+
+    assert [slot[0] for slot in slots] == [START, START + timedelta(weeks=2), START + timedelta(weeks=3)]
+    with pytest.raises(ValueError):
+        expand_all(series["rrule"], START, START + timedelta(hours=2), [], 3, "UTC")
+
+
+def test_weekly_series_keeps_local_time_across_dst_end():
+    """Martedì alle 9 ora di Roma: 07:00 UTC con l'ora legale, 08:00 UTC dopo il 25/10/2026"""
+    start = datetime(2026, 10, 6, 7, 0)
+    series = make_series("FREQ=WEEKLY;UNTIL=20261110", tz="Europe/Rome", start=start)
+
+    slots = expand_all(series["rrule"], start, start + timedelta(hours=2), [], 10, "Europe/Rome")
+    assert [slot[0] for slot in slots] == [
+        datetime(2026, 10, 6, 7), datetime(2026, 10, 13, 7), datetime(2026, 10, 20, 7),
+        datetime(2026, 10, 27, 8), datetime(2026, 11, 3, 8), datetime(2026, 11, 10, 8)
+    ]
+    assert slots[3][1] == datetime(2026, 10, 27, 10)
+
+    # Stesso risultato con l'espansione pigra nella finestra dopo il cambio d'ora
+    window = list(occurrences(series, datetime(2026, 10, 26), datetime(2026, 11, 4)))
+    assert window == [(datetime(2026, 10, 27, 8), datetime(2026, 10, 27, 10)),
+                      (datetime(2026, 11, 3, 8), datetime(2026, 11, 3, 10))]
+
+    # Serie salvate prima del fuso: ora del campus e UNTIL senza Z
+    legacy = {**series, "rrule": "FREQ=WEEKLY;UNTIL=20261110T235959"}
+    del legacy["timezone"]
+    assert [start for start, _ in occurrences(legacy, datetime(2026, 10, 26), datetime(2026, 11, 4))] == [
+        datetime(2026, 10, 27, 8), datetime(2026, 11, 3, 8)
+    ]
+
+
+def test_feed_event_writes_series_in_local_time_with_tzid():
+    """Nel feed la serie ha DTSTART;TZID in ora locale, UNTIL ed EXDATE coerenti"""
+    start = datetime(2026, 10, 6, 7, 0)
+    series = {
+        **make_series("FREQ=WEEKLY;UNTIL=20261110", exdates=[datetime(2026, 10, 27, 8)], tz="Europe/Rome", start=start),
+        "_id": "abc", "status": "confirmed"
+    }
+
+    text = feed_event(series, {"name": "Lab"}, private=False).to_ical().decode()
+
+    assert "DTSTART;TZID=Europe/Rome:20261006T090000" in text
+    assert "DTEND;TZID=Europe/Rome:20261006T110000" in text
+    assert "EXDATE;TZID=Europe/Rome:20261027T090000" in text
+    assert "UNTIL=20261110T235959Z" in text
+
+    # VTIMEZONE con i due cambi d'ora dell'anno della serie
+    timezones = feed_timezones([series, {"_id": "b", "start_datetime": start}])
+    assert [str(component["TZID"]) for component in timezones] == ["Europe/Rome"]
+    assert "DTSTART:20261025T030000" in timezones[0].to_ical().decode()
+
+
+def test_occurrences_are_expanded_only_inside_the_window():
+    """Occorrenze che si sovrappongono alla finestra; le escluse compaiono solo se richieste"""
+    skipped = START + timedelta(weeks=5)
+    series = make_series(exdates=[skipped])
+    window_start = START + timedelta(weeks=4, hours=10)  # Dopo la fine della quinta occorrenza
+    window_end = START + timedelta(weeks=6, hours=1)      # Durante la settima
+
+    found = [start for start, _ in occurrences(series, window_start, window_end)]
+    assert found == [START + timedelta(weeks=6)]
+    assert [start for start, _ in occurrences(series, window_start, window_end, include_skipped=True)] == [skipped, START + timedelta(weeks=6)]
+    # Un'occorrenza già iniziata si sovrappone alla finestra
+    assert next(occurrences(series, START + timedelta(hours=1), START + timedelta(hours=3)))[0] == START
+
+
+def test_find_conflicts_with_nested_and_adjacent_busy_intervals():
+    """Una passata sugli intervalli occupati uniti: i contigui non sono conflitti"""
+    candidates = [(START + timedelta(days=day), START + timedelta(days=day, hours=2)) for day in range(4)]
+    busy = [
+        (START - timedelta(hours=2), START),                                           # Contiguo
+        (START + timedelta(days=1), START + timedelta(days=1, hours=8)),
+        (START + timedelta(days=1, hours=1), START + timedelta(days=1, hours=2)),      # Annidato
+        (START + timedelta(days=3, hours=1), START + timedelta(days=3, hours=3))
+    ]
+
+    assert find_conflicts(candidates, busy) == [candidates[1], candidates[3]]
+
+
+def test_availability_checks_series_occurrences_and_accepts_aware_datetimes(monkeypatch):
+    """Le occorrenze delle serie occupano lo spazio anche senza documenti in bookings"""
+    async def list_overlapping(start, end, space_id=None, projection=None):
+        return [make_series()]
+
+    monkeypatch.setattr(booking_series_repository, "list_overlapping", list_overlapping)
+
+    week_two = START + timedelta(weeks=2)
+    aware = week_two.replace(tzinfo=timezone.utc)
+    assert asyncio.run(booking_series_service.has_conflict("s1", aware + timedelta(hours=1), aware + timedelta(hours=3)))
+    assert not asyncio.run(booking_series_service.has_conflict("s1", week_two + timedelta(hours=2), week_two + timedelta(hours=4)))
+
+
+def test_busy_intervals_read_bookings_and_series_once(monkeypatch):
+    """Intervalli occupati per la verifica di una serie: una query per collection"""
+    calls = []
+
+    async def bookings_overlapping(space_id, start, end, projection=None):
+        calls.append("bookings")
+        return [{"start_datetime": START + timedelta(days=1), "end_datetime": START + timedelta(days=1, hours=1)}]
+
+    async def series_overlapping(start, end, space_id=None, projection=None):
+        calls.append("booking_series")
+        return [make_series("FREQ=WEEKLY;COUNT=3")]
+
+    monkeypatch.setattr(bookings_repository, "list_overlapping", bookings_overlapping)
+    monkeypatch.setattr(booking_series_repository, "list_overlapping", series_overlapping)
+
+    busy = asyncio.run(booking_series_service.busy_intervals("s1", START, START + timedelta(weeks=4)))
+
+    assert calls == ["bookings", "booking_series"]
+    assert len(busy) == 4
@@ -0,0 +1,82 @@
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from app.repositories.base import with_id
+from app.repositories.spaces import spaces_repository
+from app.repositories.users import USER_SESSION
+from app.repositories.bookings import encode_cursor, decode_cursor, search_filter, keyset_filter
+from app.repositories.changes import encode_watermark, decode_watermark, changes_filter
+
+def test_active_filter_builds_optional_criteria():
+    """Test filtro spazi attivi con criteri opzionali"""
+    assert spaces_repository.active_filter() == {"is_active": True}
+
+    filter_query = spaces_repository.active_filter("aula", 30, ["Proiettore"])
+
+    assert filter_query == {
+        "is_active": True,
+        "type": "aula",
+        "capacity": {"$gte": 30},
+        "materials.name": {"$in": ["Proiettore"]}
+    }
+
+def test_with_id_replaces_object_id():
+    """Test conversione di _id nel campo id stringa"""
+    object_id = ObjectId()
+
+    document = with_id({"_id": object_id, "name": "Aula 101"})
+
+    assert document == {"id": str(object_id), "name": "Aula 101"}
+    assert with_id(None) is None
+
+def test_session_projection_excludes_password():
+    """Test che l'utente di sessione non includa la password hashata"""
+    assert "hashed_password" not in USER_SESSION
+
+def test_cursor_roundtrip_and_invalid_cursor():
+    """Test cursore opaco con la chiave (start_datetime, _id)"""
+    booking = {"_id": ObjectId(), "start_datetime": datetime(2025, 9, 1, 8, 30, 0, 123000)}
+
+    assert decode_cursor(encode_cursor(booking)) == (booking["start_datetime"], booking["_id"])
+    with pytest.raises(ValueError):
+        decode_cursor("non-un-cursore")
+
+def test_keyset_filter_continues_after_last_key():
+    """Test filtro keyset: pagina successiva senza skip, con spareggio su _id"""
+    start, object_id = datetime(2025, 9, 1, 8, 30), ObjectId()
+    base = search_filter(user_id="u1", statuses=["confirmed"], material="Proiettore")
+
+    assert base == {"user_id": "u1", "status": "confirmed", "materials_requested": "Proiettore"}
+    assert keyset_filter(base, (start, object_id), -1) == {"$and": [base, {"$or": [
+        {"start_datetime": {"$lt": start}},
+        {"start_datetime": start, "_id": {"$lt": object_id}}
+    ]}]}
+
+def test_watermark_roundtrip_and_invalid_token():
+    """Test token di sincronizzazione con la chiave (updated_at, _id) per collection"""
+    marks = {
+        "bookings": (datetime(2025, 10, 3, 9, 15, 30, 123000), ObjectId()),
+        "calendar_events": (datetime(2025, 9, 1, 8, 0), ObjectId())
+    }
+
+    assert decode_watermark(encode_watermark(marks)) == marks
+    with pytest.raises(ValueError):
+        decode_watermark("non-un-token")
+
+def test_changes_filter_excludes_unsettled_writes_and_continues_after_token():
+    """Test filtro delta: solo scritture assestate, dopo (updated_at, _id), con filtri opzionali"""
+    settled = datetime(2025, 10, 3, 12, 0)
+
+    assert changes_filter(None, settled) == {"updated_at": {"$lt": settled}}
+
+    after = (datetime(2025, 10, 3, 11, 0), ObjectId())
+    filter_query = changes_filter(after, settled, datetime(2025, 10, 1), datetime(2025, 11, 1), "s1")
+
+    assert filter_query == {"$and": [
+        {"updated_at": {"$lt": settled}, "space_id": "s1",
+         "start_datetime": {"$gte": datetime(2025, 10, 1), "$lt": datetime(2025, 11, 1)}},
+        {"$or": [
+            {"updated_at": {"$gt": after[0]}},
+            {"updated_at": after[0], "_id": {"$gt": after[1]}}
+        ]}
+    ]}
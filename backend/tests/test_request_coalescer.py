@@ -0,0 +1,51 @@
+import asyncio
+from app.services.request_coalescer import RequestCoalescer
+
+def test_concurrent_identical_requests_share_one_computation():
+    """Test thundering herd: richieste identiche concorrenti eseguono un solo calcolo"""
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [{"type": "aula", "count": 2}]
+
+    async def scenario():
+        return await asyncio.gather(*(
+            coalescer.run("spaces.types", None, "authenticated", compute, ttl=0) for _ in range(20)
+        ))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert all(result == [{"type": "aula", "count": 2}] for result in results)
+    assert coalescer.get_metrics()["coalesced"] == 19
+
+def test_key_normalizes_params_and_separates_scopes():
+    """Test chiave: parametri nulli ignorati, liste ordinate, ambito distinto"""
+    coalescer = RequestCoalescer()
+
+    a = coalescer.make_key("spaces.list", {"materials": ["PC", "Proiettore"], "capacity_min": None}, "authenticated")
+    b = coalescer.make_key("spaces.list", {"materials": ["Proiettore", "PC"]}, "authenticated")
+
+    assert a == b
+    assert coalescer.make_key("calendar.stats.user", None, "user:1") != coalescer.make_key("calendar.stats.user", None, "user:2")
+
+def test_short_ttl_cache_and_invalidation():
+    """Test cache breve del risultato e invalidazione per prefisso"""
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        first = await coalescer.run("spaces.list", None, "authenticated", compute, ttl=60)
+        cached = await coalescer.run("spaces.list", None, "authenticated", compute, ttl=60)
+        coalescer.invalidate("spaces")
+        fresh = await coalescer.run("spaces.list", None, "authenticated", compute, ttl=60)
+        return first, cached, fresh
+
+    assert asyncio.run(scenario()) == (1, 1, 2)
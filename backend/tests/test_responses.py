@@ -0,0 +1,47 @@
+import gzip
+from datetime import datetime
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.responses import FastJSONResponse, trusted_response
+from app.middleware.compression import CompressionMiddleware, choose_encoding
+
+def make_app():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/large")
+    async def large():
+        return trusted_response([{"id": ObjectId(), "start": datetime(2025, 9, 1, 8, 30)} for _ in range(100)])
+
+    return app
+
+def test_native_datetime_and_object_id():
+    """Test serializzazione orjson di datetime e ObjectId"""
+    object_id = ObjectId()
+
+    body = FastJSONResponse({"id": object_id, "start": datetime(2025, 9, 1, 8, 30)}).body
+
+    assert body == f'{{"id":"{object_id}","start":"2025-09-01T08:30:00"}}'.encode()
+
+def test_compression_only_above_threshold():
+    """Test gzip negoziato solo per risposte sopra la soglia"""
+    client = TestClient(make_app())
+
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    large = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in small.headers
+    assert large.headers["content-encoding"] == "gzip"
+    assert large.headers["vary"] == "Accept-Encoding"
+    assert len(large.json()) == 100
+
+def test_accept_encoding_negotiation():
+    """Test negoziazione: q=0 esclude, senza gzip accettato nessuna compressione"""
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("identity") is None
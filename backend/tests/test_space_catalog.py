@@ -0,0 +1,57 @@
+from bson import ObjectId
+from app.repositories.space_catalog import SpaceCatalog, project
+
+def make_space(name, space_type, capacity, materials, is_active=True):
+    return {
+        "_id": ObjectId(),
+        "name": name,
+        "type": space_type,
+        "capacity": capacity,
+        "materials": [{"name": m, "quantity": 1} for m in materials],
+        "location": "Edificio A",
+        "is_active": is_active
+    }
+
+def make_catalog(*spaces):
+    catalog = SpaceCatalog()
+    catalog._spaces = {str(space["_id"]): space for space in spaces}
+    catalog._rebuild_indexes()
+    catalog.ready = True
+    return catalog
+
+def test_list_active_uses_secondary_indexes():
+    """Test filtri per tipo, capacità minima e materiali come nella query Mongo"""
+    magna = make_space("Aula Magna", "aula", 200, ["Proiettore", "Microfono"])
+    lab = make_space("Lab 1", "laboratorio", 30, ["PC", "Proiettore"])
+    small = make_space("Aula 101", "aula", 20, ["Lavagna"])
+    closed = make_space("Aula Chiusa", "aula", 300, ["Proiettore"], is_active=False)
+    catalog = make_catalog(magna, lab, small, closed)
+
+    assert [s["name"] for s in catalog.list_active()] == ["Aula Magna", "Lab 1", "Aula 101"]
+    assert [s["name"] for s in catalog.list_active(space_type="aula", capacity_min=50)] == ["Aula Magna"]
+    assert [s["name"] for s in catalog.list_active(materials=["PC", "Lavagna"])] == ["Lab 1", "Aula 101"]
+    assert catalog.count_by_type() == [{"type": "aula", "count": 2}, {"type": "laboratorio", "count": 1}]
+
+def test_change_events_update_catalog_and_notify():
+    """Test applicazione degli eventi del change stream e notifica ai listener"""
+    lab = make_space("Lab 1", "laboratorio", 30, ["PC"])
+    catalog = make_catalog(lab)
+    notified = []
+    catalog.add_listener(lambda: notified.append(catalog.version))
+
+    renamed = dict(lab, name="Lab Informatica")
+    catalog._apply_change({"operationType": "update", "documentKey": {"_id": lab["_id"]}, "fullDocument": renamed})
+    assert catalog.get(str(lab["_id"]))["name"] == "Lab Informatica"
+
+    catalog._apply_change({"operationType": "delete", "documentKey": {"_id": lab["_id"]}})
+    assert catalog.get(str(lab["_id"])) is None
+    assert catalog.list_active() == []
+    assert len(notified) == 2
+
+def test_project_keeps_id_and_requested_fields():
+    """Test proiezione in memoria"""
+    space = make_space("Aula Magna", "aula", 200, ["Proiettore"])
+
+    projected = project(space, {"name": 1, "materials.name": 1})
+
+    assert set(projected) == {"_id", "name", "materials"}
@@ -0,0 +1,177 @@
+import asyncio
+
+from bson import ObjectId
+
+from app.repositories import bookings_repository, booking_series_repository, spaces_repository, spaces_loader
+from app.repositories.space_catalog import space_catalog
+from app.services.space_snapshots import SpaceSnapshotService, space_snapshot
+
+
+def test_space_snapshot_keeps_only_displayed_fields():
+    """Lo snapshot copia solo nome e posizione; None se lo spazio non esiste più"""
+    space = {"_id": ObjectId(), "name": "Aula 1", "location": "Piano terra", "capacity": 30}
+
+    assert space_snapshot(space) == {"name": "Aula 1", "location": "Piano terra"}
+    assert space_snapshot(None) == {"name": None, "location": None}
+
+
+def test_resolve_reads_spaces_only_for_bookings_without_snapshot(monkeypatch):
+    """Le prenotazioni con snapshot non leggono spaces; le legacy ricadono sul loader"""
+    service = SpaceSnapshotService()
+    loaded = []
+
+    async def load(space_id):
+        loaded.append(space_id)
+        return {"name": "Lab", "location": "Primo piano"}
+
+    monkeypatch.setattr(spaces_loader, "load", load)
+    bookings = [
+        {"space_id": "s1", "space_snapshot": {"name": "Aula 1", "location": "Piano terra"}},
+        {"space_id": "s2"}
+    ]
+
+    spaces = asyncio.run(service.resolve(bookings))
+
+    assert [space["name"] for space in spaces] == ["Aula 1", "Lab"]
+    assert loaded == ["s2"]
+    assert service.get_metrics()["fallback_lookups"] == 1
+
+
+def test_catalog_change_propagates_only_renamed_spaces(monkeypatch):
+    """Dopo il primo caricamento si aggiornano solo prenotazioni e serie degli spazi rinominati"""
+    service = SpaceSnapshotService()
+    catalog = {"s1": {"name": "Aula 1", "location": "A"}, "s2": {"name": "Lab", "location": "B"}}
+    refreshed, series_refreshed = [], []
+
+    async def refresh(space_id, snapshot):
+        refreshed.append((space_id, snapshot))
+        return 3
+
+    async def refresh_series(space_id, snapshot):
+        series_refreshed.append(space_id)
+        return 1
+
+    monkeypatch.setattr(space_catalog, "items", lambda: catalog.items())
+    monkeypatch.setattr(bookings_repository, "refresh_space_snapshot", refresh)
+    monkeypatch.setattr(booking_series_repository, "refresh_space_snapshot", refresh_series)
+
+    async def scenario():
+        service.catalog_changed()
+        catalog["s1"] = {"name": "Aula Magna", "location": "A"}
+        service.catalog_changed()
+        await service._task
+
+    asyncio.run(scenario())
+
+    assert refreshed == [("s1", {"name": "Aula Magna", "location": "A"})]
+    assert service.get_metrics()["propagated_bookings"] == 3
+    assert series_refreshed == ["s1"]
+    assert service.get_metrics()["propagated_series"] == 1
+
+
+def test_update_space_propagates_without_catalog(monkeypatch):
+    """La modifica di uno spazio aggiorna subito prenotazioni e serie, anche a catalogo spento"""
+    service = SpaceSnapshotService()
+    space_id = ObjectId()
+    refreshed = []
+
+    async def update(target, fields):
+        return {"_id": space_id, "name": fields.get("name", "Aula 1"), "location": "A", "capacity": 30}
+
+    def refresh(collection, modified):
+        async def run(target, snapshot):
+            refreshed.append((collection, target, snapshot))
+            return modified
+        return run
+
+    monkeypatch.setattr(spaces_repository, "update", update)
+    monkeypatch.setattr(bookings_repository, "refresh_space_snapshot", refresh("bookings", 4))
+    monkeypatch.setattr(booking_series_repository, "refresh_space_snapshot", refresh("series", 2))
+
+    asyncio.run(service.update_space(str(space_id), {"name": "Aula Magna"}))
+    asyncio.run(service.update_space(str(space_id), {"capacity": 40}))
+
+    snapshot = {"name": "Aula Magna", "location": "A"}
+    assert refreshed == [("bookings", str(space_id), snapshot), ("series", str(space_id), snapshot)]
+    assert service.get_metrics()["propagated_bookings"] == 4
+    assert service.get_metrics()["propagated_series"] == 2
+
+
+def test_start_refreshes_all_snapshots_in_background(monkeypatch):
+    """All'avvio si riallineano prenotazioni e serie di tutti gli spazi"""
+    service = SpaceSnapshotService()
+    spaces = [{"_id": ObjectId(), "name": "Aula 1", "location": "A"}, {"_id": ObjectId(), "name": "Lab", "location": "B"}]
+    refreshed = []
+
+    async def list_all(projection):
+        return spaces
+
+    async def refresh(space_id, snapshot):
+        refreshed.append(space_id)
+        return 1
+
+    monkeypatch.setattr(spaces_repository, "list_all", list_all)
+    monkeypatch.setattr(bookings_repository, "refresh_space_snapshot", refresh)
+    monkeypatch.setattr(booking_series_repository, "refresh_space_snapshot", refresh)
+
+    async def scenario():
+        await service.start()
+        await service.start()
+        await service._startup_task
+
+    asyncio.run(scenario())
+
+    assert sorted(refreshed) == sorted([str(space["_id"]) for space in spaces] * 2)
+
+
+def test_backfill_groups_each_batch_by_space_and_resumes_after_last_id(monkeypatch):
+    """Backfill a batch: un bulk_write per batch, ripresa dall'ultimo _id"""
+    service = SpaceSnapshotService()
+    bookings = [{"_id": ObjectId(), "space_id": space_id} for space_id in ["s1", "s2", "s1", "s3"]]
+    afters, writes = [], []
+
+    async def missing(after, limit):
+        afters.append(after)
+        start = 0 if after is None else [b["_id"] for b in bookings].index(after) + 1
+        return bookings[start:start + limit]
+
+    async def get_many(ids, projection=None):
+        return {"s1": {"name": "Aula 1", "location": "A"}, "s2": {"name": "Lab", "location": "B"}}
+
+    async def set_snapshots(updates):
+        writes.append(updates)
+        return sum(len(ids) for ids, _ in updates.values())
+
+    monkeypatch.setattr(bookings_repository, "missing_snapshot_batch", missing)
+    monkeypatch.setattr(bookings_repository, "set_space_snapshots", set_snapshots)
+    monkeypatch.setattr(spaces_repository, "get_many", get_many)
+
+    async def scenario():
+        return [progress async for progress in service.backfill(batch_size=3)]
+
+    progress = asyncio.run(scenario())
+
+    assert [p["modified"] for p in progress] == [3, 1]
+    assert afters == [None, bookings[2]["_id"], bookings[3]["_id"]]
+    assert writes[0]["s1"] == ([bookings[0]["_id"], bookings[2]["_id"]], {"name": "Aula 1", "location": "A"})
+    assert writes[1]["s3"][1] == {"name": None, "location": None}
+
+
+def test_refresh_leaves_bookings_without_snapshot_to_backfill(monkeypatch):
+    """Il riallineamento non tocca i documenti senza snapshot: $ne da solo li includerebbe"""
+    filters = []
+
+    class FakeCollection:
+        async def update_many(self, filter_query, update):
+            filters.append(filter_query)
+            return type("Result", (), {"modified_count": 0})()
+
+    async def collection(profiled=True):
+        return FakeCollection()
+
+    snapshot = {"name": "Aula 1", "location": "A"}
+    for repository in (bookings_repository, booking_series_repository):
+        monkeypatch.setattr(repository, "collection", collection)
+        asyncio.run(repository.refresh_space_snapshot("s1", snapshot))
+
+    assert filters == [{"space_id": "s1", "space_snapshot": {"$exists": True, "$ne": snapshot}}] * 2
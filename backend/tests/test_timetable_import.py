@@ -0,0 +1,196 @@
+import asyncio
+import io
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.repositories import bookings_repository, booking_series_repository, spaces_repository, users_repository
+from app.services.classrent_email_service import classrent_email_service
+from app.services.timetable_import import timetable_import, sweep_conflicts
+
+
+AULA = {"_id": ObjectId(), "name": "Aula Magna", "location": "Piano terra",
+        "available_hours": {"start_time": "08:00", "end_time": "20:00"}}
+LAB = {"_id": ObjectId(), "name": "Lab 1", "location": "Piano 1"}
+START = datetime(2031, 10, 7, 9, 0)
+
+
+def patch_repositories(monkeypatch, existing=()):
+    """Spazi, utenti e prenotazioni in memoria; restituisce inserimenti ed email"""
+    calls = {"bookings": [], "booking_series": [], "emails": []}
+
+    async def list_active(*args, **kwargs):
+        return [AULA, LAB]
+
+    async def get_many_by_email(emails):
+        return {email: {"_id": ObjectId(), "email": email, "full_name": email.split("@")[0]}
+                for email in emails if email.endswith("@uni.it")}
+
+    async def bookings_overlapping(space_id, start, end, projection=None):
+        return [booking for booking in existing if booking["space_id"] == space_id]
+
+    async def series_overlapping(start, end, space_id=None, projection=None):
+        return []
+
+    def inserter(name):
+        async def insert_many(documents):
+            calls[name].append(len(documents))
+            return [ObjectId() for _ in documents]
+        return insert_many
+
+    async def send_import_summary(user_email, bookings, user_name="Utente"):
+        calls["emails"].append((user_email, len(bookings)))
+        return True
+
+    monkeypatch.setattr(spaces_repository, "list_active", list_active)
+    monkeypatch.setattr(users_repository, "get_many_by_email", get_many_by_email)
+    monkeypatch.setattr(bookings_repository, "list_overlapping", bookings_overlapping)
+    monkeypatch.setattr(booking_series_repository, "list_overlapping", series_overlapping)
+    monkeypatch.setattr(bookings_repository, "insert_many", inserter("bookings"))
+    monkeypatch.setattr(booking_series_repository, "insert_many", inserter("booking_series"))
+    monkeypatch.setattr(classrent_email_service, "send_import_summary", send_import_summary)
+    return calls
+
+
+def csv_file(rows):
+    lines = ["space,owner_email,start_datetime,end_datetime,purpose,rrule"] + rows
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def test_sweep_conflicts_first_row_by_start_wins():
+    """La sweep line scarta le righe che toccano intervalli occupati o righe già accettate"""
+    entries = [
+        {"row": 2, "slots": [(START, START + timedelta(hours=2))]},
+        {"row": 3, "slots": [(START + timedelta(hours=1), START + timedelta(hours=3))]},
+        {"row": 4, "slots": [(START + timedelta(hours=2), START + timedelta(hours=4))]},
+        {"row": 5, "slots": [(START + timedelta(days=1), START + timedelta(days=1, hours=1))]}
+    ]
+    busy = [(START + timedelta(days=1), START + timedelta(days=1, hours=2))]
+
+    conflicts = sweep_conflicts(entries, busy)
+
+    assert sorted(conflicts) == [3, 5]
+    assert conflicts[3].startswith("Si sovrappone alla riga 2")
+    assert conflicts[5].startswith("Spazio già occupato")
+
+
+def test_sweep_conflicts_rejected_series_does_not_block_later_rows():
+    """Una serie scartata per un conflitto il 12/01 non occupa il 05/01 per le altre righe"""
+    first = datetime(2032, 1, 5, 9, 0)
+    series = [(first + timedelta(weeks=week), first + timedelta(weeks=week, hours=2)) for week in range(4)]
+    entries = [
+        {"row": 2, "slots": series},
+        {"row": 3, "slots": [(first + timedelta(hours=1), first + timedelta(hours=3))]}
+    ]
+    busy = [(first + timedelta(weeks=1), first + timedelta(weeks=1, hours=1))]
+
+    conflicts = sweep_conflicts(entries, busy)
+
+    assert list(conflicts) == [2]
+    assert conflicts[2] == "Spazio già occupato il 12/01/2032 09:00"
+
+
+def test_csv_import_reports_errors_per_row_and_inserts_in_batches(monkeypatch):
+    """Righe non valide scartate con il motivo; le valide inserite in lotti con un'email per titolare"""
+    existing = [{"space_id": str(AULA["_id"]), "start_datetime": START + timedelta(days=1),
+                 "end_datetime": START + timedelta(days=1, hours=2)}]
+    calls = patch_repositories(monkeypatch, existing)
+    monkeypatch.setattr(timetable_import, "batch_size", 2)
+
+    day = timedelta(days=2)
+    stream = csv_file([
+        f"Aula Magna,rossi@uni.it,{START.isoformat()},{(START + timedelta(hours=2)).isoformat()},Analisi,",
+        f"aula magna,rossi@uni.it,{(START + day).isoformat()},{(START + day + timedelta(hours=2)).isoformat()},Fisica,",
+        f"{LAB['_id']},bianchi@uni.it,{START.isoformat()},{(START + timedelta(hours=2)).isoformat()},Reti,FREQ=WEEKLY;COUNT=10",
+        f"Aula Magna,verdi@uni.it,{(START + timedelta(days=3)).isoformat()},{(START + timedelta(days=3, hours=2)).isoformat()},Chimica,",
+        f"Aula 404,rossi@uni.it,{START.isoformat()},{(START + timedelta(hours=2)).isoformat()},Storia,",
+        f"Aula Magna,ignoto@altro.it,{(START + timedelta(days=4)).isoformat()},{(START + timedelta(days=4, hours=2)).isoformat()},Logica,",
+        f"Aula Magna,rossi@uni.it,{(START + timedelta(days=1)).isoformat()},{(START + timedelta(days=1, hours=1)).isoformat()},Occupata,",
+        f"Aula Magna,rossi@uni.it,{(START + timedelta(hours=21)).isoformat()},{(START + timedelta(hours=22)).isoformat()},Sera,",
+        f"Aula Magna,rossi@uni.it,domani,{START.isoformat()},Data,"
+    ])
+
+    report = asyncio.run(timetable_import.run(stream, "orario.csv"))
+
+    assert report["rows"] == 9
+    assert [error["row"] for error in report["errors"]] == [6, 7, 8, 9, 10]
+    assert report["errors"][0]["error"] == "Spazio non trovato: Aula 404"
+    assert report["valid"] == 4
+    assert report["occurrences"] == 13
+    assert calls["bookings"] == [2, 1]
+    assert calls["booking_series"] == [1]
+    assert sorted(calls["emails"]) == [("bianchi@uni.it", 1), ("rossi@uni.it", 2), ("verdi@uni.it", 1)]
+    assert report["created_bookings"] == 3 and report["created_series"] == 1 and report["notified"] == 3
+
+
+def test_ics_events_with_rrule_become_series_and_dry_run_writes_nothing(monkeypatch):
+    """Eventi ICS: LOCATION e ORGANIZER identificano spazio e titolare, RRULE ed EXDATE la serie"""
+    calls = patch_repositories(monkeypatch)
+    ics = (
+        "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Ateneo//Orario//IT\r\n"
+        "BEGIN:VEVENT\r\nUID:1\r\nSUMMARY:Basi di dati\r\nLOCATION:Lab 1\r\n"
+        "ORGANIZER:mailto:Neri@uni.it\r\nDTSTART:20311007T090000Z\r\nDURATION:PT2H\r\n"
+        "RRULE:FREQ=WEEKLY;UNTIL=20311028\r\nEXDATE:20311014T090000Z\r\nEND:VEVENT\r\n"
+        "BEGIN:VEVENT\r\nUID:2\r\nSUMMARY:Open day\r\nLOCATION:Aula Magna\r\n"
+        "ORGANIZER:mailto:neri@uni.it\r\nDTSTART;VALUE=DATE:20311010\r\nEND:VEVENT\r\n"
+        "END:VCALENDAR\r\n"
+    )
+
+    report = asyncio.run(timetable_import.run(io.BytesIO(ics.encode()), "semestre.ICS", dry_run=True))
+
+    assert report["format"] == "ics"
+    assert report["valid"] == 1
+    assert report["occurrences"] == 3
+    assert report["errors"] == [{"row": 2, "error": "Formato data/ora non valido"}]
+    assert calls["bookings"] == calls["booking_series"] == calls["emails"] == []
+
+
+def test_failed_insert_removes_the_import_and_reports_what_was_created(monkeypatch):
+    """Errore a metà inserimento: i documenti marcati con l'ID dell'import si rimuovono, niente email"""
+    calls = patch_repositories(monkeypatch)
+    inserted, removed = [], []
+
+    async def insert_bookings(documents):
+        inserted.extend(documents)
+        return [ObjectId() for _ in documents]
+
+    async def insert_series(documents):
+        inserted.append(documents[0])
+        raise BulkWriteError({"nInserted": 1, "writeErrors": [{"index": 1, "code": 11000}]})
+
+    def deleter(name, count):
+        async def delete_imported(import_id):
+            removed.append((name, import_id))
+            return count
+        return delete_imported
+
+    monkeypatch.setattr(bookings_repository, "insert_many", insert_bookings)
+    monkeypatch.setattr(booking_series_repository, "insert_many", insert_series)
+    monkeypatch.setattr(bookings_repository, "delete_imported", deleter("bookings", 1))
+    monkeypatch.setattr(booking_series_repository, "delete_imported", deleter("booking_series", 1))
+
+    day = timedelta(days=1)
+    stream = csv_file([
+        f"Aula Magna,rossi@uni.it,{START.isoformat()},{(START + timedelta(hours=2)).isoformat()},Analisi,",
+        f"Lab 1,bianchi@uni.it,{START.isoformat()},{(START + timedelta(hours=2)).isoformat()},Reti,FREQ=WEEKLY;COUNT=3",
+        f"Lab 1,bianchi@uni.it,{(START + day).isoformat()},{(START + day + timedelta(hours=2)).isoformat()},Reti,FREQ=WEEKLY;COUNT=3"
+    ])
+
+    report = asyncio.run(timetable_import.run(stream, "orario.csv"))
+
+    import_ids = {document["import_id"] for document in inserted}
+    assert len(import_ids) == 1
+    assert removed == [("bookings", report["import_id"]), ("booking_series", report["import_id"])]
+    assert report["import_id"] in import_ids
+    assert report["rolled_back"] and report["removed_bookings"] == 1 and report["removed_series"] == 1
+    assert report["created_bookings"] == report["created_series"] == report["notified"] == 0
+    assert report["insert_error"].startswith("Errore durante l'inserimento")
+    assert calls["emails"] == []
+
+
+def test_csv_without_required_columns_is_rejected(monkeypatch):
+    """Un CSV senza le colonne obbligatorie non viene importato"""
+    patch_repositories(monkeypatch)
+    result = asyncio.run(timetable_import.run(io.BytesIO(b"aula,inizio\nA,2031-10-07\n"), "orario.csv"))
+    assert result["error"].startswith("File non leggibile: Colonne mancanti")
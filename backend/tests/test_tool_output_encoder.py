@@ -0,0 +1,81 @@
+import asyncio
+import json
+from bson import ObjectId
+from app.repositories import spaces_repository
+from app.services.openai_agent_service import ai_agent_service
+from app.services.tool_output_encoder import ToolOutputEncoder
+
+def test_search_spaces_projection_and_truncation():
+    """Test proiezione dei campi e troncamento delle liste"""
+    encoder = ToolOutputEncoder()
+    encoder.max_list_items = 2
+    output = {
+        "spaces": [
+            {
+                "id": str(i),
+                "name": f"Aula {i}",
+                "type": "aula",
+                "capacity": 30,
+                "location": "Edificio A",
+                "materials": [{"name": "Proiettore", "description": "HD", "quantity": 1}],
+                "available_hours": {"start_time": "08:00", "end_time": "20:00"},
+                "description": "Descrizione lunga " * 10
+            }
+            for i in range(3)
+        ],
+        "count": 3,
+        "criteria": {"space_type": "aula"}
+    }
+
+    encoded = json.loads(encoder.encode("search_available_spaces", output))
+
+    assert encoded["count"] == 3
+    assert "criteria" not in encoded
+    assert encoded["spaces_more_available"] == 1
+    assert encoded["spaces"][0] == {
+        "id": "0", "name": "Aula 0", "type": "aula", "capacity": 30,
+        "location": "Edificio A", "materials": ["Proiettore"]
+    }
+
+    metrics = encoder.get_metrics()["search_available_spaces"]
+    assert metrics["calls"] == 1
+    assert metrics["compact_tokens"] < metrics["raw_tokens"]
+
+def test_errors_pass_through():
+    """Test che gli errori non vengano alterati"""
+    encoder = ToolOutputEncoder()
+    assert json.loads(encoder.encode("get_user_bookings", {"error": "x"})) == {"error": "x"}
+
+def test_content_lists_are_not_truncated():
+    """Checklist e prenotazioni arrivano intere al modello: si troncano solo i risultati di ricerca"""
+    encoder = ToolOutputEncoder()
+    encoder.max_list_items = 5
+    checklist = [f"Passo {i}" for i in range(9)]
+
+    encoded = json.loads(encoder.encode("generate_activity_checklist", {
+        "activity_type": "laurea", "checklist": checklist
+    }))
+    assert encoded["checklist"] == checklist
+    assert "checklist_more_available" not in encoded
+
+    bookings = [{"id": str(i), "purpose": f"Lezione {i}", "status": "confirmed"} for i in range(9)]
+    encoded = json.loads(encoder.encode("get_user_bookings", {"bookings": bookings, "count": 9}))
+    assert len(encoded["bookings"]) == 9
+
+def test_search_results_are_capped_by_the_encoder(monkeypatch):
+    """Test ricerca: la funzione restituisce tutti gli spazi, l'encoder ne manda 5 con il totale vero"""
+    spaces = [{"_id": ObjectId(), "name": f"Aula {n}", "type": "aula", "capacity": 40, "location": "Polo"}
+              for n in range(8)]
+
+    async def list_active(*args, **kwargs):
+        return spaces
+
+    monkeypatch.setattr(spaces_repository, "list_active", list_active)
+
+    result = asyncio.run(ai_agent_service._search_available_spaces({"space_type": "aula"}))
+    encoded = json.loads(ToolOutputEncoder().encode("search_available_spaces", result))
+
+    assert result["count"] == 8 and len(result["spaces"]) == 8
+    assert encoded["count"] == 8
+    assert len(encoded["spaces"]) == 5
+    assert encoded["spaces_more_available"] == 3
@@ -0,0 +1,54 @@
+from datetime import datetime
+import pytest
+from pydantic import ValidationError
+from bson import ObjectId
+from app.models.booking import BookingResponse
+from app.models.material import MaterialResponse
+from app.models.trusted import trusted_row, trusted_rows
+
+def test_trusted_rows_match_validated_models():
+    """Test righe fidate uguali al dump del modello validato"""
+    document = {
+        "_id": ObjectId(), "name": "Proiettore", "description": None, "quantity": 3,
+        "category": "elettronica", "is_available": True, "maintenance_notes": None,
+        "internal_code": "INV-0042"
+    }
+
+    row = trusted_rows(MaterialResponse, [document])[0]
+    validated = MaterialResponse(id=str(document["_id"]), **{k: v for k, v in document.items() if k != "_id"})
+
+    assert row == validated.model_dump()
+    assert "internal_code" not in row
+
+def test_trusted_row_overrides_and_missing_optional_fields():
+    """Test valori espliciti, default del modello e campi Optional assenti"""
+    start = datetime(2025, 9, 1, 8, 30)
+    booking = {
+        "_id": ObjectId(), "user_id": "u1", "space_id": "s1", "start_datetime": start,
+        "end_datetime": start, "purpose": "Lezione", "status": "confirmed",
+        "materials_requested": [], "created_at": start
+    }
+
+    row = trusted_row(BookingResponse, booking, id="b1", space_name="Aula 101")
+
+    assert row["id"] == "b1"
+    assert row["space_name"] == "Aula 101"
+    assert row["notes"] is None
+    assert set(row) == set(BookingResponse.model_fields)
+
+def test_missing_required_field_is_not_filled_with_none():
+    """Campo obbligatorio non nullo assente: validazione completa, e la riga si salta negli elenchi"""
+    start = datetime(2025, 9, 1, 8, 30)
+    booking = {
+        "_id": ObjectId(), "user_id": "u1", "space_id": "s1", "space_name": "Aula 101", "start_datetime": start,
+        "end_datetime": start, "purpose": "Lezione", "status": "confirmed", "materials_requested": []
+    }
+
+    with pytest.raises(ValidationError):
+        trusted_row(BookingResponse, booking, id="b1")
+
+    complete = {**booking, "_id": ObjectId(), "created_at": start}
+    rows = trusted_rows(BookingResponse, [booking, complete])
+
+    assert [row["id"] for row in rows] == [str(complete["_id"])]
+    assert rows[0]["notes"] is None
@@ -37,7 +37,8 @@ function BookingForm({ open, onClose, preselectedSpace = null, preselectedDate =
     end_datetime: preselectedDate ? dayjs(preselectedDate).hour(11).minute(0) : dayjs().add(1, 'day').hour(11).minute(0),
     purpose: '',
     materials_requested: [],
-    notes: ''
+    notes: '',
+    repeat_until: ''
   });
   const [errors, setErrors] = useState({});
 
@@ -52,12 +53,18 @@ function BookingForm({ open, onClose, preselectedSpace = null, preselectedDate =
 
   // Mutation per creare prenotazione
   const createBookingMutation = useMutation(
-    async (bookingData) => {
+    async ({ repeat_until: repeatUntil, ...bookingData }) => {
       const dataToSend = {
         ...bookingData,
         start_datetime: bookingData.start_datetime.toISOString(),
         end_datetime: bookingData.end_datetime.toISOString()
       };
+      if (repeatUntil) {
+        // Prenotazione ricorrente: una sola serie settimanale fino alla data indicata
+        const rrule = `FREQ=WEEKLY;UNTIL=${dayjs(repeatUntil).format('YYYYMMDD')}`;
+        const response = await axios.post(`${API_URL}/bookings/series`, { ...dataToSend, rrule });
+        return response.data;
+      }
       const response = await axios.post(`${API_URL}/bookings/`, dataToSend);
       return response.data;
     },
@@ -69,7 +76,9 @@ function BookingForm({ open, onClose, preselectedSpace = null, preselectedDate =
         resetForm();
       },
       onError: (error) => {
-        const errorMessage = error.response?.data?.detail || 'Errore nella creazione della prenotazione';
+        const detail = error.response?.data?.detail;
+        // Conflitti di una serie: messaggio con il numero di occorrenze occupate
+        const errorMessage = detail?.error || detail || 'Errore nella creazione della prenotazione';
         toast.error(errorMessage);
       }
     }
@@ -92,7 +101,8 @@ function BookingForm({ open, onClose, preselectedSpace = null, preselectedDate =
       end_datetime: dayjs().add(1, 'day').hour(11).minute(0),
       purpose: '',
       materials_requested: [],
-      notes: ''
+      notes: '',
+      repeat_until: ''
     });
     setErrors({});
   };
@@ -318,6 +328,20 @@ function BookingForm({ open, onClose, preselectedSpace = null, preselectedDate =
               />
             </Grid>
 
+            {/* Ricorrenza settimanale */}
+            <Grid item xs={12} md={6}>
+              <TextField
+                fullWidth
+                type="date"
+                label="Ripeti ogni settimana fino al (opzionale)"
+                value={formData.repeat_until}
+                onChange={(e) => handleChange('repeat_until', e.target.value)}
+                InputLabelProps={{ shrink: true }}
+                inputProps={{ min: formData.start_datetime?.format('YYYY-MM-DD') }}
+                helperText="Crea una prenotazione ricorrente nello stesso giorno e orario"
+              />
+            </Grid>
+
             {/* Durata Calcolata */}
             {formData.start_datetime && formData.end_datetime && (
               <Grid item xs={12}>
@@ -32,6 +32,7 @@ import { useQuery } from 'react-query';
 import axios from 'axios';
 import dayjs from 'dayjs';
 import BookingForm from './BookingForm';
+import { useCalendarLive } from '../hooks/useCalendarLive';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
@@ -43,15 +44,19 @@ function CalendarView() {
   const [bookingFormOpen, setBookingFormOpen] = useState(false);
   const [viewMode, setViewMode] = useState('month'); // month, week, day
 
+  const month = currentDate.format('YYYY-MM');
+  const monthStart = currentDate.startOf('month').format('YYYY-MM-DD');
+  const monthEnd = currentDate.endOf('month').format('YYYY-MM-DD');
+
+  // Aggiornamenti in tempo reale del mese (sincronizzazione delta se il canale live non è disponibile)
+  useCalendarLive(month, monthStart, monthEnd);
+
   // Query per ottenere tutte le prenotazioni del mese
   const { data: monthBookings = [], isLoading } = useQuery(
-    ['calendar-bookings', currentDate.format('YYYY-MM')],
+    ['calendar-bookings', month],
     async () => {
-      const startDate = currentDate.startOf('month').format('YYYY-MM-DD');
-      const endDate = currentDate.endOf('month').format('YYYY-MM-DD');
-      
       const response = await axios.get(`${API_URL}/calendar/bookings`, {
-        params: { start_date: startDate, end_date: endDate }
+        params: { start_date: monthStart, end_date: monthEnd }
       });
       return response.data;
     }
@@ -1,13 +1,14 @@
-import { useQuery, useMutation, useQueryClient } from 'react-query';
+import { useQuery, useInfiniteQuery, useMutation, useQueryClient } from 'react-query';
 import { bookingsAPI } from '../services/api';
 import toast from 'react-hot-toast';
 
-export const useBookings = () => {
-  return useQuery(
-    'bookings',
-    bookingsAPI.getAll,
+export const useBookings = (filters = {}, pageSize = 50) => {
+  return useInfiniteQuery(
+    ['bookings', filters],
+    ({ pageParam }) => bookingsAPI.search({ ...filters, limit: pageSize, cursor: pageParam })
+      .then((response) => response.data),
     {
-      select: (response) => response.data,
+      getNextPageParam: (lastPage) => lastPage.next_cursor || undefined,
       staleTime: 5 * 60 * 1000, // 5 minuti
       cacheTime: 10 * 60 * 1000, // 10 minuti
     }
@@ -68,12 +69,13 @@ export const useCancelBooking = () => {
   );
 };
 
-export const useBookingHistory = () => {
-  return useQuery(
+export const useBookingHistory = (pageSize = 50) => {
+  return useInfiniteQuery(
     'booking-history',
-    bookingsAPI.getHistory,
+    ({ pageParam }) => bookingsAPI.search({ limit: pageSize, cursor: pageParam })
+      .then((response) => response.data),
     {
-      select: (response) => response.data,
+      getNextPageParam: (lastPage) => lastPage.next_cursor || undefined,
       staleTime: 10 * 60 * 1000, // 10 minuti
     }
   );
@@ -0,0 +1,144 @@
+import { useEffect } from 'react';
+import { useQueryClient } from 'react-query';
+import { calendarAPI } from '../services/api';
+
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+const RECONNECT_DELAY = 3000;
+const DELTA_POLL_INTERVAL = 30 * 1000;
+
+// Applica le modifiche alla copia locale: upsert per id, annullate rimosse.
+// Un annullamento con id della serie rimuove tutte le sue occorrenze: le
+// occorrenze correnti seguono nello stesso elenco di modifiche.
+export const mergeChanges = (bookings = [], changes = []) => {
+  const byId = new Map(bookings.map((booking) => [booking.id, booking]));
+  changes.forEach((change) => {
+    if (change.status === 'cancelled' && change.series_id && change.id === change.series_id) {
+      byId.forEach((booking, id) => {
+        if (booking.series_id === change.series_id) byId.delete(id);
+      });
+    } else if (change.status === 'cancelled') byId.delete(change.id);
+    else byId.set(change.id, change);
+  });
+  return [...byId.values()].sort((a, b) => (a.start_datetime < b.start_datetime ? -1 : 1));
+};
+
+// Divide il buffer SSE in eventi completi (separati da una riga vuota)
+const parseEvents = (buffer) => {
+  const blocks = buffer.split('\n\n');
+  const rest = blocks.pop();
+  const events = blocks.map((block) => {
+    const event = { event: 'message', data: '', id: null };
+    block.split('\n').forEach((line) => {
+      if (line.startsWith(':')) return; // heartbeat
+      const separator = line.indexOf(':');
+      const field = separator === -1 ? line : line.slice(0, separator);
+      const value = separator === -1 ? '' : line.slice(separator + 1).replace(/^ /, '');
+      if (field === 'event') event.event = value;
+      if (field === 'data') event.data += value;
+      if (field === 'id') event.id = value;
+    });
+    return event;
+  });
+  return { events, rest };
+};
+
+/**
+ * Aggiornamenti in tempo reale del calendario del mese indicato.
+ * Usa fetch (non EventSource) per inviare il token Bearer; alla
+ * riconnessione invia Last-Event-ID per ricevere gli eventi persi.
+ * Se il server non ha il canale live si passa alla sincronizzazione delta:
+ * si scaricano solo le modifiche dopo l'ultimo token.
+ */
+export const useCalendarLive = (month, startDate, endDate) => {
+  const queryClient = useQueryClient();
+
+  useEffect(() => {
+    const controller = new AbortController();
+    const queryKey = ['calendar-bookings', month];
+    let lastEventId = null;
+    let reconnectTimer = null;
+    let pollTimer = null;
+    let syncToken = null;
+    let stopped = false;
+
+    const refresh = () => queryClient.invalidateQueries(queryKey);
+
+    // Prima chiamata senza token: copia completa dell'intervallo, poi solo delta
+    const pullChanges = async () => {
+      try {
+        let changes = [];
+        let hasMore = true;
+        while (hasMore) {
+          const { data } = await calendarAPI.getChanges({
+            since: syncToken || undefined,
+            start_date: startDate,
+            end_date: endDate,
+          });
+          changes = changes.concat(data.changes);
+          syncToken = data.next_token;
+          hasMore = data.has_more;
+        }
+        if (changes.length) {
+          queryClient.setQueryData(queryKey, (bookings) => mergeChanges(bookings, changes));
+        }
+      } catch (error) {
+        // Token non più valido: sincronizzazione completa; altrimenti si riprova con lo stesso token
+        if (error.response?.status === 400) syncToken = null;
+      }
+      if (!controller.signal.aborted) {
+        pollTimer = setTimeout(pullChanges, DELTA_POLL_INTERVAL);
+      }
+    };
+
+    const handleEvent = ({ event, id }) => {
+      if (id) lastEventId = id;
+      if (event === 'change' || event === 'resync') {
+        refresh();
+      } else if (event === 'unavailable') {
+        // Nessun change stream sul server: si passa alla sincronizzazione delta
+        stopped = true;
+        pollTimer = setTimeout(pullChanges, DELTA_POLL_INTERVAL);
+      }
+    };
+
+    const connect = async () => {
+      const headers = { Accept: 'text/event-stream' };
+      const token = localStorage.getItem('token');
+      if (token) headers.Authorization = `Bearer ${token}`;
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+      const params = new URLSearchParams({ start_date: startDate, end_date: endDate });
+      try {
+        const response = await fetch(`${API_URL}/calendar/live?${params}`, {
+          headers,
+          signal: controller.signal,
+        });
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const { events, rest } = parseEvents(buffer);
+          buffer = rest;
+          events.forEach(handleEvent);
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+      }
+      if (!stopped && !controller.signal.aborted) {
+        reconnectTimer = setTimeout(connect, RECONNECT_DELAY);
+      }
+    };
+
+    connect();
+    return () => {
+      controller.abort();
+      clearTimeout(reconnectTimer);
+      clearTimeout(pollTimer);
+    };
+  }, [queryClient, month, startDate, endDate]);
+};
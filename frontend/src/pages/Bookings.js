@@ -43,7 +43,7 @@ import {
 import { DateTimePicker } from '@mui/x-date-pickers/DateTimePicker';
 import { AdapterDayjs } from '@mui/x-date-pickers/AdapterDayjs';
 import { LocalizationProvider } from '@mui/x-date-pickers/LocalizationProvider';
-import { useQuery, useMutation, useQueryClient } from 'react-query';
+import { useQuery, useInfiniteQuery, useMutation, useQueryClient } from 'react-query';
 import axios from 'axios';
 import toast from 'react-hot-toast';
 import dayjs from 'dayjs';
@@ -71,14 +71,26 @@ function Bookings() {
   const [selectedBooking, setSelectedBooking] = useState(null);
   const [editMode, setEditMode] = useState(false);
 
-  // Query per ottenere le prenotazioni
-  const { data: bookings = [], isLoading } = useQuery(
+  // Prenotazioni a pagine (paginazione a cursore): le successive si caricano su richiesta
+  const {
+    data: bookingPages,
+    isLoading,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage
+  } = useInfiniteQuery(
     'bookings',
-    async () => {
-      const response = await axios.get(`${API_URL}/bookings/`);
+    async ({ pageParam }) => {
+      const response = await axios.get(`${API_URL}/bookings/search`, {
+        params: { limit: 50, cursor: pageParam }
+      });
       return response.data;
+    },
+    {
+      getNextPageParam: (lastPage) => lastPage.next_cursor || undefined
     }
   );
+  const bookings = bookingPages ? bookingPages.pages.flatMap((page) => page.bookings) : [];
 
   // Query per ottenere gli spazi disponibili
   const { data: spaces = [] } = useQuery(
@@ -425,6 +437,18 @@ function Bookings() {
               <BookingCard key={booking.id} booking={booking} />
             ))}
           </TabPanel>
+
+          {hasNextPage && (
+            <Box sx={{ textAlign: 'center', mt: 2 }}>
+              <Button
+                variant="outlined"
+                onClick={() => fetchNextPage()}
+                disabled={isFetchingNextPage}
+              >
+                {isFetchingNextPage ? 'Caricamento...' : 'Carica altre prenotazioni'}
+              </Button>
+            </Box>
+          )}
         </>
       )}
 
@@ -32,8 +32,8 @@ function Dashboard() {
   const { data: recentBookings = [] } = useQuery(
     'recent-bookings',
     async () => {
-      const response = await axios.get(`${API_URL}/bookings/`);
-      return response.data.slice(0, 5); // Ultime 5 prenotazioni
+      const response = await axios.get(`${API_URL}/bookings/search`, { params: { limit: 5 } });
+      return response.data.bookings; // Ultime 5 prenotazioni
     }
   );
 
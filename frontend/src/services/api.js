@@ -40,10 +40,17 @@ export const authAPI = {
 
 export const bookingsAPI = {
   getAll: () => axios.get('/bookings/'),
+  // Ricerca paginata: params = { cursor, limit, status, space_id, date_from, date_to, material, order }
+  search: (params = {}) => axios.get('/bookings/search', { params }),
   create: (data) => axios.post('/bookings/', data),
   update: (id, data) => axios.put(`/bookings/${id}`, data),
   delete: (id) => axios.delete(`/bookings/${id}`),
-  getHistory: () => axios.get('/bookings/history')
+  getHistory: () => axios.get('/bookings/history'),
+  // Prenotazioni ricorrenti: data = { space_id, start_datetime, end_datetime, rrule, exdates, purpose }
+  createSeries: (data) => axios.post('/bookings/series', data),
+  getSeries: () => axios.get('/bookings/series'),
+  cancelSeries: (id) => axios.delete(`/bookings/series/${id}`),
+  skipOccurrence: (id, start) => axios.delete(`/bookings/series/${id}/occurrences/${encodeURIComponent(start)}`)
 };
 
 export const spacesAPI = {
@@ -54,6 +61,13 @@ export const spacesAPI = {
   getMaterials: (id) => axios.get(`/spaces/${id}/materials`)
 };
 
+export const calendarAPI = {
+  // Sincronizzazione delta: params = { since, start_date, end_date, space_id, limit }
+  getChanges: (params = {}) => axios.get('/calendar/changes', { params }),
+  // URL dei feed ICS da aggiungere alle app calendario (personale e, se indicato, dello spazio)
+  getFeeds: (spaceId) => axios.get('/calendar/feeds', { params: { space_id: spaceId } })
+};
+
 export const chatAPI = {
   sendMessage: (message) => axios.post('/chat/', { message }),
   getSpaces: () => axios.get('/chat/spaces')